@@ -6,7 +6,7 @@ import hashlib
 import requests
 import jinja2
 import werkzeug.exceptions
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
 from datetime import datetime, timedelta
 from functools import wraps
 from dotenv import load_dotenv
@@ -40,6 +40,13 @@ from slack_auth import slack_auth_bp
 from routes.hackatime_routes import hackatime_bp
 from routes.pizza_grants_routes import pizza_grants_bp
 from routes.cdn_routes import cdn_bp
+from routes.club_chat_routes import club_chat_bp
+from club_dashboard_service import club_dashboard_service, SECTIONS as DASHBOARD_SECTIONS
+from club_counter_service import club_counter_service
+from club_calendar_service import club_calendar_service
+from club_ledger_service import club_ledger_service, InsufficientBalanceError
+from deletion_service import deletion_service
+from club_auth import club_auth, club_auth_for, register_events as register_club_auth_events
 from groq import Groq
 
 load_dotenv()
@@ -649,6 +656,12 @@ app.register_blueprint(slack_auth_bp)
 app.register_blueprint(hackatime_bp)
 app.register_blueprint(pizza_grants_bp)
 app.register_blueprint(cdn_bp)
+app.register_blueprint(club_chat_bp)
+
+# Keep Club's member/project/assignment/post counters current on every write
+club_counter_service.register_events()
+# Forget cached club roles when memberships or club leaders change mid-request
+register_club_auth_events()
 
 
 def check_db_connection():
@@ -700,10 +713,7 @@ def join_club_redirect():
                 return redirect(url_for('welcome'))
 
             # Check if user is already a member
-            existing_membership = ClubMembership.query.filter_by(
-                user_id=current_user.id, club_id=club.id).first()
-
-            if existing_membership:
+            if club_auth().is_member(club.id):
                 flash(f"You are already a member of {club.name}", 'info')
                 return redirect(url_for('club_dashboard', club_id=club.id))
 
@@ -1050,10 +1060,7 @@ def welcome():
         club = Club.query.filter_by(join_code=join_code).first()
         if club:
             # Check if user is already a member
-            existing_membership = ClubMembership.query.filter_by(
-                user_id=current_user.id, club_id=club.id).first()
-            
-            if existing_membership:
+            if club_auth().is_member(club.id):
                 # If already a member, redirect directly to the club dashboard
                 flash(f"Welcome back to {club.name}!", 'info')
                 return redirect(url_for('club_dashboard', club_id=club.id))
@@ -1704,10 +1711,12 @@ def toggle_gallery_feature(entry_id):
         
     try:
         from models import GalleryEntry
+        from gallery_trending_service import gallery_trending_service
         entry = GalleryEntry.query.get_or_404(entry_id)
         
         # Toggle featured status
         entry.is_featured = not entry.is_featured
+        gallery_trending_service.score_entry(entry)
         db.session.commit()
         
         activity = UserActivity(
@@ -1740,8 +1749,9 @@ def remove_gallery_entry(entry_id):
             flash('You do not have permission to remove this entry', 'error')
             return redirect(url_for('gallery'))
         
+        from gallery_service import gallery_service
         title = entry.title
-        db.session.delete(entry)
+        removed_tags = gallery_service.remove_entry(entry)
         
         activity = UserActivity(
             activity_type="gallery_removal",
@@ -1751,6 +1761,7 @@ def remove_gallery_entry(entry_id):
         )
         db.session.add(activity)
         db.session.commit()
+        gallery_service.tags_changed(removed=removed_tags)
         
         flash('Entry successfully removed from the gallery', 'success')
         return redirect(url_for('gallery'))
@@ -1761,54 +1772,109 @@ def remove_gallery_entry(entry_id):
         return redirect(url_for('gallery'))
 
 
+def gallery_thumbnail_srcsets(rows):
+    """Resized thumbnails for a page of gallery rows; queues any that have none yet."""
+    from image_variant_service import image_variant_service
+    thumbnail_urls = [entry.thumbnail_url for entry, _, _ in rows if entry.thumbnail_url]
+    thumbnail_srcsets = image_variant_service.srcsets(thumbnail_urls)
+    image_variant_service.enqueue_missing(url for url in thumbnail_urls if url not in thumbnail_srcsets)
+    return thumbnail_srcsets
+
+
 @app.route('/gallery')
 @app.route('/gallery/tag/<tag>')
 def gallery(tag=None):
-    from models import GalleryEntry, Site, User
+    from gallery_service import gallery_service, normalize_tag, SORTS
     
-    # Get featured entries
-    featured_query = db.session.query(GalleryEntry, Site, User)\
-        .join(Site, GalleryEntry.site_id == Site.id)\
-        .join(User, GalleryEntry.user_id == User.id)\
-        .filter(GalleryEntry.is_featured == True)
+    tag = normalize_tag(tag) if tag else None
+    sort = request.args.get('sort', 'recent')
+    if sort not in SORTS:
+        sort = 'recent'
     
-    # Apply tag filter to featured entries if tag is provided
-    if tag:
-        featured_query = featured_query.filter(GalleryEntry.tags.like(f'%{tag}%'))
+    # Featured entries only on the first page; the rest is loaded by infinite scroll
+    featured_entries, _ = gallery_service.page(tag=tag, featured=True, limit=gallery_service.featured_limit)
+    entries, next_cursor = gallery_service.page(tag=tag, sort=sort)
     
-    featured_entries = featured_query.order_by(GalleryEntry.added_at.desc()).all()
-    
-    # Get all entries
-    entries_query = db.session.query(GalleryEntry, Site, User)\
-        .join(Site, GalleryEntry.site_id == Site.id)\
-        .join(User, GalleryEntry.user_id == User.id)
+    return render_template(
+        'gallery.html', 
+        featured_entries=featured_entries, 
+        entries=entries,
+        next_cursor=next_cursor,
+        all_tags=gallery_service.tag_cloud(),
+        current_tag=tag,
+        current_sort=sort,
+        thumbnail_srcsets=gallery_thumbnail_srcsets(entries + featured_entries)
+    )
+
+@app.route('/gallery/entries')
+def gallery_entries():
+    """Next page of gallery cards as HTML, for infinite scroll"""
+    from gallery_service import gallery_service
     
-    # Apply tag filter to all entries if tag is provided
-    if tag:
-        entries_query = entries_query.filter(GalleryEntry.tags.like(f'%{tag}%'))
+    tag = request.args.get('tag') or None
+    try:
+        entries, next_cursor = gallery_service.page(tag=tag, cursor=request.args.get('cursor'),
+                                                    sort=request.args.get('sort', 'recent'))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     
-    entries = entries_query.order_by(GalleryEntry.added_at.desc()).all()
+    html = render_template('gallery_cards.html',
+                           entries=entries,
+                           featured_section=False,
+                           current_tag=tag,
+                           thumbnail_srcsets=gallery_thumbnail_srcsets(entries))
+    return jsonify({'success': True, 'html': html, 'next_cursor': next_cursor})
+
+@app.route('/gallery/search')
+def gallery_search():
+    """Ranked gallery search with highlighted titles and descriptions"""
+    from models import GalleryEntry, Site, User
+    from gallery_search_service import gallery_search_service, query_terms, highlight
     
-    # Get all unique tags for the filter dropdown
-    all_tags_query = db.session.query(GalleryEntry.tags).filter(GalleryEntry.tags != None, GalleryEntry.tags != '')
-    all_tags_raw = all_tags_query.all()
+    q = request.args.get('q', '')[:200]
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 50)
+    ranked = gallery_search_service.search(q, limit=limit)
+    if not ranked:
+        return jsonify({'success': True, 'html': '', 'count': 0, 'results': []})
     
-    # Process tags into a unique list
-    all_tags = set()
-    for tags_str in all_tags_raw:
-        if tags_str[0]:
-            tags_list = [t.strip() for t in tags_str[0].split(',')]
-            all_tags.update(tag for tag in tags_list if tag)
+    ids = [entry_id for entry_id, _ in ranked]
+    rows = db.session.query(GalleryEntry, Site, User)\
+        .join(Site, GalleryEntry.site_id == Site.id)\
+        .join(User, GalleryEntry.user_id == User.id)\
+        .filter(GalleryEntry.id.in_(ids))\
+        .all()
+    by_id = {row[0].id: row for row in rows}
+    entries = [by_id[entry_id] for entry_id in ids if entry_id in by_id]
     
-    all_tags = sorted(list(all_tags))
+    terms = query_terms(q)
+    highlights = {
+        entry.id: {
+            'title': highlight(entry.title, terms),
+            'description': highlight(entry.description, terms, snippet=True)
+        }
+        for entry, _, _ in entries
+    }
+    scores = dict(ranked)
     
-    return render_template(
-        'gallery.html', 
-        featured_entries=featured_entries, 
-        entries=entries,
-        all_tags=all_tags,
-        current_tag=tag
-    )
+    html = render_template('gallery_cards.html',
+                           entries=entries,
+                           featured_section=False,
+                           current_tag=None,
+                           highlights=highlights,
+                           thumbnail_srcsets=gallery_thumbnail_srcsets(entries))
+    return jsonify({
+        'success': True,
+        'html': html,
+        'count': len(entries),
+        'results': [{
+            'id': entry.id,
+            'score': scores[entry.id],
+            'title': highlights[entry.id]['title'],
+            'description': highlights[entry.id]['description'],
+            'site_slug': site.slug,
+            'username': user.username
+        } for entry, site, user in entries]
+    })
 
 @app.route('/gallery/tag/<tag>')
 def gallery_filter_by_tag(tag):
@@ -1841,17 +1907,22 @@ def gallery_submit():
             return redirect(url_for('gallery_submit'))
         
         try:
+            from gallery_service import gallery_service
+            from gallery_trending_service import gallery_trending_service
+            
             # Create new gallery entry
             entry = GalleryEntry(
                 site_id=site_id,
                 user_id=current_user.id,
                 title=title,
-                description=description,
-                tags=tags
+                description=description
             )
             
             db.session.add(entry)
+            added_tags, _ = gallery_service.set_tags(entry, tags)
+            gallery_trending_service.score_entry(entry)
             db.session.commit()
+            gallery_service.tags_changed(added=added_tags)
             
             # Record activity
             activity = UserActivity(
@@ -1959,58 +2030,28 @@ def admin_panel():
 @admin_required
 # Keep CSRF protection on this sensitive route
 def delete_user(user_id):
-    from models import ClubPost, ClubPostLike, ClubChatChannel, ClubChatMessage, ClubResource, ClubAssignment
-    
     if user_id == current_user.id:
         return jsonify({'message': 'Cannot delete yourself'}), 400
 
     user = User.query.get_or_404(user_id)
+    username = user.username
 
     try:
-        # Delete user activities
-        UserActivity.query.filter_by(user_id=user.id).delete()
-        
-        # If the user is a club leader, we need to handle club relationships
-        clubs_led = Club.query.filter_by(leader_id=user.id).all()
-        for club in clubs_led:
-            # Delete club memberships
-            ClubMembership.query.filter_by(club_id=club.id).delete()
-            # Delete club posts
-            ClubPost.query.filter_by(club_id=club.id).delete()
-            # Delete club assignments
-            ClubAssignment.query.filter_by(club_id=club.id).delete()
-            # Delete club resources
-            ClubResource.query.filter_by(club_id=club.id).delete()
-            # Delete club chat channels and messages
-            channels = ClubChatChannel.query.filter_by(club_id=club.id).all()
-            for channel in channels:
-                ClubChatMessage.query.filter_by(channel_id=channel.id).delete()
-            ClubChatChannel.query.filter_by(club_id=club.id).delete()
-            # Finally delete the club
-            db.session.delete(club)
-        
-        # Delete user's club memberships elsewhere
-        ClubMembership.query.filter_by(user_id=user.id).delete()
-        
-        # Delete user's sites and related pages
-        sites = Site.query.filter_by(user_id=user.id).all()
-        for site in sites:
-            SitePage.query.filter_by(site_id=site.id).delete()
-            db.session.delete(site)
-        
-        # Finally delete the user
-        db.session.delete(user)
-        db.session.commit()
+        # Clubs they lead, their sites, uploads, posts, messages and activity
+        # all go; prolific users are deleted in the background
+        job = deletion_service.submit('user', user.id, requested_by=current_user.id)
         
         # Log this admin action
         activity = UserActivity(
             activity_type="admin_action",
-            message=f'Admin deleted user "{user.username}"',
+            message=f'Admin deleted user "{username}"',
             username=current_user.username,
             user_id=current_user.id)
         db.session.add(activity)
         db.session.commit()
         
+        if job:
+            return jsonify({'message': 'User deletion started', 'job': job.to_dict()}), 202
         return jsonify({'message': 'User deleted successfully'})
     except Exception as e:
         db.session.rollback()
@@ -2215,12 +2256,10 @@ def delete_user_sites(user_id):
     user = User.query.get_or_404(user_id)
 
     try:
-        for site in user.sites:
-            if hasattr(site, 'github_repo') and site.github_repo:
-                db.session.delete(site.github_repo)
-
-        Site.query.filter_by(user_id=user.id).delete()
-        db.session.commit()
+        site_ids = [row[0] for row in db.session.query(Site.id).filter(Site.user_id == user.id)]
+        job = deletion_service.submit('sites', user.id, {'site_ids': site_ids}, requested_by=current_user.id)
+        if job:
+            return jsonify({'message': 'Site deletion started', 'job': job.to_dict()}), 202
         return jsonify({'message': 'All user sites deleted successfully'})
     except Exception as e:
         db.session.rollback()
@@ -2672,7 +2711,7 @@ def search_clubs():
 
         clubs = db.session.query(
             Club.id, Club.name, Club.description, Club.location,
-            Club.join_code, Club.created_at, Club.leader_id,
+            Club.join_code, Club.created_at, Club.leader_id, Club.member_count,
             User.username.label('leader_username')).join(
                 User, Club.leader_id == User.id).filter(
                     db.or_(Club.name.ilike(f'%{search_term}%'),
@@ -2682,10 +2721,6 @@ def search_clubs():
 
         result = []
         for club in clubs:
-            # Count club members
-            member_count = ClubMembership.query.filter_by(
-                club_id=club.id).count()
-
             result.append({
                 'id': club.id,
                 'name': club.name,
@@ -2695,7 +2730,7 @@ def search_clubs():
                 'created_at': club.created_at.strftime('%Y-%m-%d'),
                 'leader_id': club.leader_id,
                 'leader_username': club.leader_username,
-                'member_count': member_count
+                'member_count': club.member_count
             })
 
         return jsonify({'clubs': result})
@@ -2759,22 +2794,21 @@ def get_club_details(club_id):
 def delete_club(club_id):
     try:
         club = Club.query.get_or_404(club_id)
+        club_name = club.name
 
-        # Delete all memberships first
-        ClubMembership.query.filter_by(club_id=club_id).delete()
-
-        # Delete the club itself
-        db.session.delete(club)
+        job = deletion_service.submit('club', club.id, requested_by=current_user.id)
 
         # Record the activity
         activity = UserActivity(
             activity_type="admin_action",
-            message=f'Admin {{username}} deleted club "{club.name}"',
+            message=f'Admin {{username}} deleted club "{club_name}"',
             username=current_user.username,
             user_id=current_user.id)
         db.session.add(activity)
         db.session.commit()
 
+        if job:
+            return jsonify({'message': 'Club deletion started', 'job': job.to_dict()}), 202
         return jsonify({'message': 'Club deleted successfully'})
 
     except Exception as e:
@@ -2897,6 +2931,7 @@ def admin_remove_club_member(membership_id):
 @login_required
 @admin_required
 def update_club_balance(club_id):
+    """Set a club's balance; the difference is recorded as a ledger adjustment."""
     try:
         club = Club.query.get_or_404(club_id)
         data = request.get_json()
@@ -2905,24 +2940,23 @@ def update_club_balance(club_id):
         if new_balance is None:
             return jsonify({'error': 'Balance is required'}), 400
         
-        try:
-            new_balance = float(new_balance)
-            if new_balance < 0:
-                return jsonify({'error': 'Balance cannot be negative'}), 400
-        except (ValueError, TypeError):
-            return jsonify({'error': 'Invalid balance amount'}), 400
-        
         old_balance = float(club.balance) if club.balance else 0.00
-        club.balance = new_balance
+        try:
+            entry = club_ledger_service.set_balance(club_id, new_balance, created_by=current_user.id,
+                                                    description=data.get('description'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        new_balance = float(club.balance)
         
         # Record the activity
-        activity = UserActivity(
-            activity_type="admin_action",
-            message=f'Admin {{username}} updated club "{club.name}" balance from ${old_balance:.2f} to ${new_balance:.2f}',
-            username=current_user.username,
-            user_id=current_user.id
-        )
-        db.session.add(activity)
+        if entry:
+            activity = UserActivity(
+                activity_type="admin_action",
+                message=f'Admin {{username}} updated club "{club.name}" balance from ${old_balance:.2f} to ${new_balance:.2f}',
+                username=current_user.username,
+                user_id=current_user.id
+            )
+            db.session.add(activity)
         db.session.commit()
         
         return jsonify({
@@ -2936,6 +2970,76 @@ def update_club_balance(club_id):
         return jsonify({'error': 'Failed to update club balance'}), 500
 
 
+@app.route('/api/admin/clubs/<int:club_id>/balance/entries', methods=['POST'])
+@login_required
+@admin_required
+def add_club_balance_entry(club_id):
+    """
+    Record a grant, adjustment or spend against a club's balance.
+    {"type": "grant" | "adjustment" | "spend", "amount": ..., "description": ..., "reference": ...}
+    Grants and spends take a positive amount; adjustments are signed.
+    """
+    try:
+        club = Club.query.get_or_404(club_id)
+        data = request.get_json() or {}
+
+        try:
+            entry = club_ledger_service.post(club_id, data.get('type'), data.get('amount'),
+                                             created_by=current_user.id,
+                                             description=data.get('description'),
+                                             reference=data.get('reference'))
+        except InsufficientBalanceError as e:
+            return jsonify({'error': str(e)}), 409
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        activity = UserActivity(
+            activity_type="admin_action",
+            message=f'Admin {{username}} recorded a {entry.entry_type} of ${abs(entry.amount):.2f} for club "{club.name}"',
+            username=current_user.username,
+            user_id=current_user.id
+        )
+        db.session.add(activity)
+        db.session.commit()
+
+        return jsonify({
+            'message': f'{entry.entry_type.capitalize()} recorded',
+            'entry_id': entry.id,
+            'balance': float(entry.balance_after)
+        }), 201
+
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f'Error recording club balance entry: {str(e)}')
+        return jsonify({'error': 'Failed to record balance entry'}), 500
+
+
+@app.route('/api/clubs/<int:club_id>/balance', methods=['GET'])
+@login_required
+def get_club_balance(club_id):
+    """
+    A club's balance and a page of its ledger, newest first, for its
+    leaders and admins. Pass the returned next_cursor as ?cursor= for older
+    entries.
+    """
+    club = Club.query.get_or_404(club_id)
+    if not (club_auth().can_manage(club_id) or current_user.is_admin):
+        return jsonify({'error': 'Only club leaders can view the balance history'}), 403
+
+    try:
+        entries, next_cursor = club_ledger_service.history(club_id,
+                                                           cursor=request.args.get('cursor'),
+                                                           limit=request.args.get('limit', type=int))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({
+        'balance': float(club.balance),
+        'entries': entries,
+        'has_more': next_cursor is not None,
+        'next_cursor': next_cursor
+    })
+
+
 @app.route('/api/clubs/<int:club_id>/projects', methods=['GET'])
 @login_required
 def get_club_projects(club_id):
@@ -2943,42 +3047,11 @@ def get_club_projects(club_id):
     try:
         club = Club.query.get_or_404(club_id)
         
-        # Check if user is a member of the club
-        is_member = ClubMembership.query.filter_by(club_id=club_id, user_id=current_user.id).first()
-        if not is_member and club.leader_id != current_user.id:
+        if not club_auth().is_member(club_id):
             return jsonify({'error': 'You are not a member of this club'}), 403
             
-        # Get all sites from club members
-        members = ClubMembership.query.filter_by(club_id=club_id).all()
-        member_ids = [m.user_id for m in members]
-        member_ids.append(club.leader_id)  # Include the leader
-        
-        # Get projects (sites) by these members
-        sites = Site.query.filter(Site.user_id.in_(member_ids)).all()
-        
-        # Get featured projects
-        featured_projects = ClubFeaturedProject.query.filter_by(club_id=club_id).all()
-        featured_site_ids = [p.site_id for p in featured_projects]
-        
-        # Format response
-        projects = []
-        for site in sites:
-            user = User.query.get(site.user_id)
-            projects.append({
-                'id': site.id,
-                'name': site.name,
-                'slug': site.slug,
-                'description': '',  # Sites don't have descriptions in current schema
-                'owner': {
-                    'id': user.id,
-                    'username': user.username
-                },
-                'featured': site.id in featured_site_ids,
-                'updated_at': site.updated_at.isoformat(),
-                'created_at': site.created_at.isoformat()
-            })
-            
-        return jsonify({'projects': projects})
+        _, data = club_dashboard_service.section(club, 'projects')
+        return jsonify(data)
         
     except Exception as e:
         app.logger.error(f'Error getting club projects: {str(e)}')
@@ -2992,8 +3065,7 @@ def toggle_project_featured(club_id, project_id):
         club = Club.query.get_or_404(club_id)
         
         # Only club leader and co-leaders can feature projects
-        membership = ClubMembership.query.filter_by(club_id=club_id, user_id=current_user.id).first()
-        if club.leader_id != current_user.id and (not membership or membership.role != 'co-leader'):
+        if not club_auth().can_manage(club_id):
             return jsonify({'error': 'Only club leaders can feature projects'}), 403
             
         site = Site.query.get_or_404(project_id)
@@ -3036,35 +3108,61 @@ def get_club_stats(club_id):
     try:
         club = Club.query.get_or_404(club_id)
         
-        # Check if user is a member of the club
-        is_member = ClubMembership.query.filter_by(club_id=club_id, user_id=current_user.id).first()
-        if not is_member and club.leader_id != current_user.id:
+        if not club_auth().is_member(club_id):
             return jsonify({'error': 'You are not a member of this club'}), 403
             
-        # Get member count
-        member_count = ClubMembership.query.filter_by(club_id=club_id).count() + 1  # +1 for the leader
-        
-        # Get active assignments count
-        active_assignments = ClubAssignment.query.filter_by(club_id=club_id, is_active=True).count()
-        
-        # Get all sites from club members
-        members = ClubMembership.query.filter_by(club_id=club_id).all()
-        member_ids = [m.user_id for m in members]
-        member_ids.append(club.leader_id)  # Include the leader
-        
-        # Get projects (sites) by these members
-        project_count = Site.query.filter(Site.user_id.in_(member_ids)).count()
-        
-        return jsonify({
-            'member_count': member_count,
-            'active_assignments': active_assignments,
-            'project_count': project_count
-        })
+        _, data = club_dashboard_service.section(club, 'stats')
+        return jsonify(data)
         
     except Exception as e:
         app.logger.error(f'Error getting club stats: {str(e)}')
         return jsonify({'error': f'Failed to get club stats: {str(e)}'}), 500
 
+@app.route('/api/clubs/<int:club_id>/dashboard', methods=['GET'])
+@login_required
+def get_club_dashboard(club_id):
+    """
+    Everything the club dashboard loads, in one response.
+
+    ?sections=stats,posts limits the response to those sections (default:
+    all). ?versions=stats:<version>,posts:<version> lists the versions the
+    client already holds; those sections are left out of 'sections' when
+    they have not changed, so a refresh only transfers what changed.
+    'versions' always lists the current version of every requested section.
+    """
+    try:
+        club = Club.query.get_or_404(club_id)
+
+        role = club_auth().role(club_id)
+        if not role:
+            return jsonify({'error': 'You are not a member of this club'}), 403
+
+        requested = request.args.get('sections')
+        names = [name for name in requested.split(',') if name in DASHBOARD_SECTIONS] \
+            if requested else list(DASHBOARD_SECTIONS)
+        known = dict(item.split(':', 1) for item in request.args.get('versions', '').split(',') if ':' in item)
+
+        versions = {}
+        sections = {}
+        for name, (version, data) in club_dashboard_service.sections(club, names).items():
+            versions[name] = version
+            if known.get(name) != version:
+                sections[name] = club_dashboard_service.with_viewer(name, data, current_user.id)
+
+        return jsonify({
+            'club': {'id': club.id, 'name': club.name},
+            'viewer': {
+                'is_leader': role == 'leader',
+                'is_co_leader': role == 'co-leader'
+            },
+            'versions': versions,
+            'sections': sections
+        })
+
+    except Exception as e:
+        app.logger.error(f'Error getting club dashboard: {str(e)}')
+        return jsonify({'error': f'Failed to get club dashboard: {str(e)}'}), 500
+
 @app.route('/api/admin/stats/counts')
 @login_required
 @admin_required
@@ -4320,6 +4418,10 @@ def hackatime_connect():
         db.session.add(activity)
         db.session.commit()
 
+        # Populate the local stats snapshot without waiting for the next sync pass
+        from hackatime_sync_service import hackatime_sync_service
+        hackatime_sync_service.request_sync(current_user.id)
+
         return jsonify({
             'success': True,
             'message': 'Hackatime account connected successfully'
@@ -4345,6 +4447,10 @@ def hackatime_disconnect():
                 db.text(
                     "UPDATE \"user\" SET wakatime_api_key = NULL WHERE id = :user_id"
                 ), {"user_id": current_user.id})
+            conn.execute(
+                db.text(
+                    "DELETE FROM hackatime_snapshot WHERE user_id = :user_id"
+                ), {"user_id": current_user.id})
             conn.commit()
 
         # Record activity
@@ -4547,6 +4653,33 @@ def groq_status():
         })
 
 
+HACKATIME_SERVICE_URL = os.environ.get('HACKATIME_SERVICE_URL', 'http://127.0.0.1:3001')
+# Keep-alive session to the local relay, shared by all requests in this worker
+hackatime_relay_session = requests.Session()
+
+
+def forward_to_hackatime_relay(api_key, heartbeats, user_agent):
+    """Queue heartbeats on the Hackatime relay service. Returns None if it is unreachable."""
+    try:
+        response = hackatime_relay_session.post(
+            f"{HACKATIME_SERVICE_URL}/heartbeat",
+            headers={
+                'X-Hackatime-Key': api_key,
+                'User-Agent': user_agent
+            },
+            json=heartbeats,
+            timeout=2)
+    except requests.RequestException as e:
+        app.logger.warning(f"Hackatime relay unavailable: {str(e)}")
+        return None
+
+    if response.status_code == 202 or response.status_code == 429:
+        return response
+
+    app.logger.warning(f"Hackatime relay returned {response.status_code}, sending directly")
+    return None
+
+
 @app.route('/hackatime/heartbeat', methods=['POST'])
 @login_required
 def hackatime_heartbeat():
@@ -4639,11 +4772,15 @@ def hackatime_heartbeat():
             f"Sending heartbeat to Hackatime for user {current_user.username}")
         app.logger.debug(f"Heartbeat payload: {heartbeat_payload}")
 
-        # Make the request to Hackatime API
-        response = requests.post(api_url,
-                                 headers=headers,
-                                 json=heartbeat_payload,
-                                 timeout=10)
+        # Hand the batch to the local relay so this worker never waits on Hackatime
+        response = forward_to_hackatime_relay(current_user.wakatime_api_key,
+                                              heartbeat_payload, user_agent)
+        if response is None:
+            # Relay unavailable - fall back to calling the Hackatime API directly
+            response = requests.post(api_url,
+                                     headers=headers,
+                                     json=heartbeat_payload,
+                                     timeout=10)
 
         app.logger.info(
             f"Hackatime API response status: {response.status_code}")
@@ -4985,17 +5122,11 @@ def club_dashboard(club_id=None):
         club = Club.query.get_or_404(club_id)
         
         # Verify user is a member or leader of this club
-        if club.leader_id != current_user.id:
-            membership = ClubMembership.query.filter_by(
-                user_id=current_user.id,
-                club_id=club_id
-            ).first()
-            
-            if not membership:
-                flash('You are not a member of this club.', 'error')
-                return render_template('club_dashboard.html', 
-                                    club=None, 
-                                    show_join_modal=True)
+        if not club_auth().is_member(club_id):
+            flash('You are not a member of this club.', 'error')
+            return render_template('club_dashboard.html', 
+                                club=None, 
+                                show_join_modal=True)
     
     # Get all memberships for the club
     memberships = []
@@ -5020,17 +5151,9 @@ def club_dashboard(club_id=None):
             db.session.commit()
     
     # Check if user is a leader or co-leader
-    is_leader = (club and club.leader_id == current_user.id)
-    is_co_leader = False
-    
-    if club and not is_leader:
-        membership = ClubMembership.query.filter_by(
-            user_id=current_user.id,
-            club_id=club.id,
-            role='co-leader'
-        ).first()
-        
-        is_co_leader = (membership is not None)
+    role = club_auth().role(club.id) if club else None
+    is_leader = role == 'leader'
+    is_co_leader = role == 'co-leader'
     
     # Get ImgBB API key from environment variables
     imgbb_api_key = os.environ.get('IMGBB_API_KEY', '')
@@ -5168,48 +5291,22 @@ def manage_current_club():
 
     elif request.method == 'DELETE':
         try:
-            # First delete all related ClubAssignment records
-            from models import ClubAssignment
-            ClubAssignment.query.filter_by(club_id=club.id).delete()
-            
-            # Delete all club memberships
-            ClubMembership.query.filter_by(club_id=club.id).delete()
-            
-            # Delete club chat channels and messages
-            from models import ClubChatChannel, ClubChatMessage
-            
-            # Get all channel IDs for this club
-            channels = ClubChatChannel.query.filter_by(club_id=club.id).all()
-            for channel in channels:
-                # Delete messages in each channel
-                ClubChatMessage.query.filter_by(channel_id=channel.id).delete()
-            
-            # Delete all channels
-            ClubChatChannel.query.filter_by(club_id=club.id).delete()
-            
-            # Delete club resources
-            from models import ClubResource
-            ClubResource.query.filter_by(club_id=club.id).delete()
-            
-            # Delete club posts and likes
-            from models import ClubPost, ClubPostLike
-            posts = ClubPost.query.filter_by(club_id=club.id).all()
-            for post in posts:
-                ClubPostLike.query.filter_by(post_id=post.id).delete()
-            ClubPost.query.filter_by(club_id=club.id).delete()
-
-            # Finally delete the club itself
-            db.session.delete(club)
-            db.session.commit()
+            club_name = club.name
+
+            # Posts, likes, chat, assignments and the rest go with the club;
+            # big clubs are deleted in the background
+            job = deletion_service.submit('club', club.id, requested_by=current_user.id)
 
             activity = UserActivity(
                 activity_type="club_deletion",
-                message=f'Club "{club.name}" deleted by {{username}}',
+                message=f'Club "{club_name}" deleted by {{username}}',
                 username=current_user.username,
                 user_id=current_user.id)
             db.session.add(activity)
             db.session.commit()
 
+            if job:
+                return jsonify({'message': 'Club deletion started', 'job': job.to_dict()}), 202
             return jsonify({'message': 'Club deleted successfully'})
         except Exception as e:
             db.session.rollback()
@@ -5225,14 +5322,7 @@ def generate_club_join_code(club_id):
         club = Club.query.get_or_404(club_id)
         
         # Check if user is club leader or co-leader
-        is_leader = club.leader_id == current_user.id
-        is_co_leader = ClubMembership.query.filter_by(
-            club_id=club_id, 
-            user_id=current_user.id, 
-            role='co-leader'
-        ).first() is not None
-        
-        if not (is_leader or is_co_leader or current_user.is_admin):
+        if not (club_auth().can_manage(club_id) or current_user.is_admin):
             return jsonify({
                 'error': 'Only club leaders and co-leaders can generate join codes'
             }), 403
@@ -5306,10 +5396,7 @@ def join_club():
         if not club:
             return jsonify({'error': 'Invalid join code'}), 404
 
-        existing_membership = ClubMembership.query.filter_by(
-            user_id=current_user.id, club_id=club.id).first()
-
-        if existing_membership:
+        if club_auth().is_member(club.id):
             return jsonify({'error':
                             'You are already a member of this club'}), 400
 
@@ -5343,10 +5430,7 @@ def club_join_qr(join_code):
             flash('Invalid join code', 'error')
             return redirect(url_for('club_dashboard'))
             
-        existing_membership = ClubMembership.query.filter_by(
-            user_id=current_user.id, club_id=club.id).first()
-            
-        if existing_membership:
+        if club_auth().is_member(club.id):
             flash('You are already a member of this club', 'info')
             return redirect(url_for('club_dashboard', club_id=club.id))
             
@@ -5386,7 +5470,7 @@ def leave_club(membership_id):
             return jsonify({'error': 'Unauthorized'}), 403
 
         # Prevent club leaders from leaving their own club
-        if membership.club.leader_id == current_user.id:
+        if club_auth().is_leader(membership.club_id):
             return jsonify({
                 'error':
                 'Club leaders cannot leave. Delete the club instead.'
@@ -5421,8 +5505,7 @@ def change_member_role(membership_id):
         membership = ClubMembership.query.get_or_404(membership_id)
 
         # Check if the current user is the club leader
-        club = membership.club
-        if club.leader_id != current_user.id:
+        if not club_auth().is_leader(membership.club_id):
             return jsonify(
                 {'error': 'Only club leaders can change member roles'}), 403
 
@@ -5454,8 +5537,7 @@ def remove_member(membership_id):
         membership = ClubMembership.query.get_or_404(membership_id)
 
         # Check if the current user is the club leader
-        club = membership.club
-        if club.leader_id != current_user.id:
+        if not club_auth().is_leader(membership.club_id):
             return jsonify({'error':
                             'Only club leaders can remove members'}), 403
 
@@ -5465,6 +5547,7 @@ def remove_member(membership_id):
                 {'error': 'You cannot remove yourself from the club'}), 400
 
         member_name = membership.user.username
+        club = membership.club
 
         # Delete the membership
         db.session.delete(membership)
@@ -5496,40 +5579,24 @@ def club_posts(club_id):
     
     # Verify user is a member of the club
     club = Club.query.get_or_404(club_id)
-    membership = ClubMembership.query.filter_by(user_id=current_user.id, club_id=club_id).first()
-    if not membership and club.leader_id != current_user.id:
+    if not club_auth().is_member(club_id):
         return jsonify({'error': 'You are not a member of this club'}), 403
         
     if request.method == 'GET':
-        posts = db.session.query(ClubPost, User).join(User, ClubPost.user_id == User.id) \
-                .filter(ClubPost.club_id == club_id) \
-                .order_by(ClubPost.created_at.desc()).all()
-                
-        result = []
-        for post, user in posts:
-            # Get likes information
-            from models import ClubPostLike
-            post_likes = ClubPostLike.query.filter_by(post_id=post.id).all()
-            liked_by = [like.user_id for like in post_likes]
-            
-            # Check if current user liked this post
-            user_liked = current_user.id in liked_by
-            
-            result.append({
-                'id': post.id,
-                'content': post.content,
-                'created_at': post.created_at.isoformat(),
-                'updated_at': post.updated_at.isoformat(),
-                'likes': post.likes or len(post_likes),  # Use stored count or calculate
-                'liked_by': liked_by,
-                'user_liked': user_liked,
-                'user': {
-                    'id': user.id,
-                    'username': user.username
-                }
-            })
-            
-        return jsonify({'posts': result})
+        # Keyset on (created_at, id) so a long-lived club's feed costs the same per page
+        cursor = request.args.get('cursor')
+        limit = request.args.get('limit', type=int)
+        if cursor or limit:
+            try:
+                posts, next_cursor = club_dashboard_service.feed_page(club_id, cursor=cursor, limit=limit)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            data = {'posts': posts, 'has_more': next_cursor is not None, 'next_cursor': next_cursor}
+        else:
+            # The first page is shared with the dashboard bootstrap cache
+            _, data = club_dashboard_service.section(club, 'posts')
+
+        return jsonify(club_dashboard_service.with_viewer('posts', data, current_user.id))
         
     elif request.method == 'POST':
         data = request.get_json()
@@ -5573,15 +5640,8 @@ def manage_club_post(club_id, post_id):
         return jsonify({'error': 'Post not found in this club'}), 404
         
     # Check if user is authorized (post creator or club leader)
-    if post.user_id != current_user.id and post.club.leader_id != current_user.id:
-        membership = ClubMembership.query.filter_by(
-            user_id=current_user.id, 
-            club_id=club_id, 
-            role='co-leader'
-        ).first()
-        
-        if not membership:
-            return jsonify({'error': 'You are not authorized to manage this post'}), 403
+    if post.user_id != current_user.id and not club_auth().can_manage(club_id):
+        return jsonify({'error': 'You are not authorized to manage this post'}), 403
     
     if request.method == 'PUT':
         data = request.get_json()
@@ -5635,28 +5695,40 @@ def toggle_post_like(club_id, post_id):
         return jsonify({'error': 'Post not found in this club'}), 404
         
     # Check if user is a club member
-    membership = ClubMembership.query.filter_by(user_id=current_user.id, club_id=club_id).first()
-    if not membership and post.club.leader_id != current_user.id:
+    if not club_auth().is_member(club_id):
         return jsonify({'error': 'You are not a member of this club'}), 403
     
     # Check if user already liked this post
     existing_like = ClubPostLike.query.filter_by(post_id=post_id, user_id=current_user.id).first()
     
     if existing_like:
-        # Unlike
-        db.session.delete(existing_like)
+        # Unlike; only the request that actually removed the row decrements
+        changed = -db.session.execute(
+            db.delete(ClubPostLike).where(ClubPostLike.id == existing_like.id)
+        ).rowcount
         liked = False
     else:
-        # Like
-        new_like = ClubPostLike(post_id=post_id, user_id=current_user.id)
-        db.session.add(new_like)
+        # Like; a concurrent duplicate fails the unique constraint and counts nothing
+        try:
+            with db.session.begin_nested():
+                db.session.add(ClubPostLike(post_id=post_id, user_id=current_user.id))
+            changed = 1
+        except IntegrityError:
+            changed = 0
         liked = True
     
-    # Update likes count
-    like_count = ClubPostLike.query.filter_by(post_id=post_id).count()
-    post.likes = like_count
-    
+    # Relative update of the counter by the rows this request inserted or deleted;
+    # the row lock it takes serialises concurrent toggles, so none is lost
+    like_count = db.session.execute(
+        db.update(ClubPost)
+        .where(ClubPost.id == post_id)
+        .values(likes=db.func.coalesce(ClubPost.likes, 0) + changed)
+        .returning(ClubPost.likes)
+    ).scalar()
     db.session.commit()
+    if changed:
+        # Core statements skip the mapper events that invalidate the dashboard
+        club_dashboard_service.invalidate(club_id, ('posts',))
     
     return jsonify({
         'message': 'Like toggled successfully',
@@ -5672,44 +5744,17 @@ def club_assignments(club_id):
     
     # Verify user is a member of the club
     club = Club.query.get_or_404(club_id)
-    membership = ClubMembership.query.filter_by(user_id=current_user.id, club_id=club_id).first()
-    if not membership and club.leader_id != current_user.id:
+    if not club_auth().is_member(club_id):
         return jsonify({'error': 'You are not a member of this club'}), 403
         
     if request.method == 'GET':
-        assignments = db.session.query(ClubAssignment, User) \
-            .join(User, ClubAssignment.created_by == User.id) \
-            .filter(ClubAssignment.club_id == club_id) \
-            .order_by(ClubAssignment.created_at.desc()).all()
-                
-        result = []
-        for assignment, user in assignments:
-            result.append({
-                'id': assignment.id,
-                'title': assignment.title,
-                'description': assignment.description,
-                'due_date': assignment.due_date.isoformat() if assignment.due_date else None,
-                'created_at': assignment.created_at.isoformat(),
-                'is_active': assignment.is_active,
-                'creator': {
-                    'id': user.id,
-                    'username': user.username
-                }
-            })
-            
-        return jsonify({'assignments': result})
+        _, data = club_dashboard_service.section(club, 'assignments')
+        return jsonify(data)
         
     elif request.method == 'POST':
         # Only leaders and co-leaders can create assignments
-        if club.leader_id != current_user.id:
-            membership = ClubMembership.query.filter_by(
-                user_id=current_user.id, 
-                club_id=club_id, 
-                role='co-leader'
-            ).first()
-            
-            if not membership:
-                return jsonify({'error': 'Only club leaders can create assignments'}), 403
+        if not club_auth().can_manage(club_id):
+            return jsonify({'error': 'Only club leaders can create assignments'}), 403
                 
         data = request.get_json()
         title = data.get('title')
@@ -5762,8 +5807,7 @@ def manage_club_assignment(club_id, assignment_id):
         return jsonify({'error': 'Assignment not found in this club'}), 404
         
     # Check if user is a member of the club
-    membership = ClubMembership.query.filter_by(user_id=current_user.id, club_id=club_id).first()
-    if not membership and assignment.club.leader_id != current_user.id:
+    if not club_auth().is_member(club_id):
         return jsonify({'error': 'You are not a member of this club'}), 403
     
     if request.method == 'GET':
@@ -5787,18 +5831,7 @@ def manage_club_assignment(club_id, assignment_id):
         })
     
     # For PUT and DELETE methods, check for additional authorization
-    is_authorized = False
-    if assignment.created_by == current_user.id or assignment.club.leader_id == current_user.id:
-        is_authorized = True
-    else:
-        co_leader_membership = ClubMembership.query.filter_by(
-            user_id=current_user.id, 
-            club_id=club_id, 
-            role='co-leader'
-        ).first()
-        
-        if co_leader_membership:
-            is_authorized = True
+    is_authorized = assignment.created_by == current_user.id or club_auth().can_manage(club_id)
     
     if not is_authorized:
         return jsonify({'error': 'You are not authorized to manage this assignment'}), 403
@@ -5847,32 +5880,12 @@ def club_resources(club_id):
     
     # Verify user is a member of the club
     club = Club.query.get_or_404(club_id)
-    membership = ClubMembership.query.filter_by(user_id=current_user.id, club_id=club_id).first()
-    if not membership and club.leader_id != current_user.id:
+    if not club_auth().is_member(club_id):
         return jsonify({'error': 'You are not a member of this club'}), 403
         
     if request.method == 'GET':
-        resources = db.session.query(ClubResource, User) \
-            .join(User, ClubResource.created_by == User.id) \
-            .filter(ClubResource.club_id == club_id) \
-            .order_by(ClubResource.created_at.desc()).all()
-                
-        result = []
-        for resource, user in resources:
-            result.append({
-                'id': resource.id,
-                'title': resource.title,
-                'url': resource.url,
-                'description': resource.description,
-                'icon': resource.icon,
-                'created_at': resource.created_at.isoformat(),
-                'creator': {
-                    'id': user.id,
-                    'username': user.username
-                }
-            })
-            
-        return jsonify({'resources': result})
+        _, data = club_dashboard_service.section(club, 'resources')
+        return jsonify(data)
         
     elif request.method == 'POST':
         data = request.get_json()
@@ -5921,8 +5934,7 @@ def manage_club_resource(club_id, resource_id):
         return jsonify({'error': 'Resource not found in this club'}), 404
         
     # Check if user is a member of the club
-    membership = ClubMembership.query.filter_by(user_id=current_user.id, club_id=club_id).first()
-    if not membership and resource.club.leader_id != current_user.id:
+    if not club_auth().is_member(club_id):
         return jsonify({'error': 'You are not a member of this club'}), 403
     
     if request.method == 'GET':
@@ -5945,18 +5957,7 @@ def manage_club_resource(club_id, resource_id):
         })
     
     # For PUT and DELETE methods, check for additional authorization
-    is_authorized = False
-    if resource.created_by == current_user.id or resource.club.leader_id == current_user.id:
-        is_authorized = True
-    else:
-        co_leader_membership = ClubMembership.query.filter_by(
-            user_id=current_user.id, 
-            club_id=club_id, 
-            role='co-leader'
-        ).first()
-        
-        if co_leader_membership:
-            is_authorized = True
+    is_authorized = resource.created_by == current_user.id or club_auth().can_manage(club_id)
     
     if not is_authorized:
         return jsonify({'error': 'You are not authorized to manage this resource'}), 403
@@ -6006,47 +6007,17 @@ def club_meetings(club_id):
     
     # Verify user is a member of the club
     club = Club.query.get_or_404(club_id)
-    membership = ClubMembership.query.filter_by(user_id=current_user.id, club_id=club_id).first()
-    if not membership and club.leader_id != current_user.id:
+    if not club_auth().is_member(club_id):
         return jsonify({'error': 'You are not a member of this club'}), 403
         
     if request.method == 'GET':
-        meetings = db.session.query(ClubMeeting, User) \
-            .join(User, ClubMeeting.created_by == User.id) \
-            .filter(ClubMeeting.club_id == club_id) \
-            .order_by(ClubMeeting.meeting_date, ClubMeeting.start_time).all()
-                
-        result = []
-        for meeting, user in meetings:
-            result.append({
-                'id': meeting.id,
-                'title': meeting.title,
-                'description': meeting.description,
-                'meeting_date': meeting.meeting_date.isoformat(),
-                'start_time': meeting.start_time.strftime('%H:%M'),
-                'end_time': meeting.end_time.strftime('%H:%M') if meeting.end_time else None,
-                'location': meeting.location,
-                'meeting_link': meeting.meeting_link,
-                'created_at': meeting.created_at.isoformat(),
-                'creator': {
-                    'id': user.id,
-                    'username': user.username
-                }
-            })
-            
-        return jsonify({'meetings': result})
+        _, data = club_dashboard_service.section(club, 'meetings')
+        return jsonify(data)
         
     elif request.method == 'POST':
         # Only leaders and co-leaders can create meetings
-        if club.leader_id != current_user.id:
-            membership = ClubMembership.query.filter_by(
-                user_id=current_user.id, 
-                club_id=club_id, 
-                role='co-leader'
-            ).first()
-            
-            if not membership:
-                return jsonify({'error': 'Only club leaders can create meetings'}), 403
+        if not club_auth().can_manage(club_id):
+            return jsonify({'error': 'Only club leaders can create meetings'}), 403
                 
         data = request.get_json()
         title = data.get('title')
@@ -6110,8 +6081,7 @@ def manage_club_meeting(club_id, meeting_id):
         return jsonify({'error': 'Meeting not found in this club'}), 404
         
     # Check if user is a member of the club
-    membership = ClubMembership.query.filter_by(user_id=current_user.id, club_id=club_id).first()
-    if not membership and meeting.club.leader_id != current_user.id:
+    if not club_auth().is_member(club_id):
         return jsonify({'error': 'You are not a member of this club'}), 403
     
     if request.method == 'GET':
@@ -6138,18 +6108,7 @@ def manage_club_meeting(club_id, meeting_id):
         })
     
     # For PUT and DELETE methods, check for additional authorization
-    is_authorized = False
-    if meeting.created_by == current_user.id or meeting.club.leader_id == current_user.id:
-        is_authorized = True
-    else:
-        co_leader_membership = ClubMembership.query.filter_by(
-            user_id=current_user.id, 
-            club_id=club_id, 
-            role='co-leader'
-        ).first()
-        
-        if co_leader_membership:
-            is_authorized = True
+    is_authorized = meeting.created_by == current_user.id or club_auth().can_manage(club_id)
     
     if not is_authorized:
         return jsonify({'error': 'You are not authorized to manage this meeting'}), 403
@@ -6205,110 +6164,141 @@ def manage_club_meeting(club_id, meeting_id):
         
         return jsonify({'message': 'Meeting deleted successfully'})
 
+@app.route('/api/clubs/<int:club_id>/calendar', methods=['GET'])
+@login_required
+def get_club_calendar_url(club_id):
+    """Subscription URLs for the club's meeting calendar."""
+    club = Club.query.get_or_404(club_id)
+    if not club_auth().is_member(club_id):
+        return jsonify({'error': 'You are not a member of this club'}), 403
+
+    return jsonify(club_calendar_urls(club))
+
+@app.route('/api/clubs/<int:club_id>/calendar/regenerate', methods=['POST'])
+@login_required
+def regenerate_club_calendar_url(club_id):
+    """Issue a new calendar URL for the club; every previous one stops working."""
+    club = Club.query.get_or_404(club_id)
+    if not club_auth().can_manage(club_id):
+        return jsonify({'error': 'Only club leaders can reset the calendar link'}), 403
+
+    try:
+        club_calendar_service.regenerate_secret(club)
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f'Error regenerating calendar secret: {str(e)}')
+        return jsonify({'error': 'Failed to reset calendar link'}), 500
+    return jsonify(club_calendar_urls(club))
+
+def club_calendar_urls(club):
+    token = club_calendar_service.token(app.config['SECRET_KEY'], club.id, club.calendar_secret)
+    url = url_for('club_calendar_feed', club_id=club.id, token=token, _external=True)
+    return {
+        'url': url,
+        'webcal_url': 'webcal://' + url.split('://', 1)[1]
+    }
+
+@app.route('/clubs/<int:club_id>/calendar/<token>.ics')
+def club_calendar_feed(club_id, token):
+    """
+    iCalendar feed of a club's meetings for calendar apps. No login: the
+    token in the URL is the credential. Supports If-None-Match.
+    """
+    if not club_calendar_service.verify_token(app.config['SECRET_KEY'], club_id, token):
+        abort(404)
+
+    # Unchanged meetings: answer from memory without touching the database
+    etag = club_calendar_service.current_etag(club_id)
+    if etag and request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    club = Club.query.get_or_404(club_id)
+    etag, body = club_calendar_service.feed(club, request.host)
+    response = Response(body, mimetype='text/calendar')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, max-age=300'
+    response.headers['Content-Disposition'] = f'inline; filename="club-{club_id}.ics"'
+    return response.make_conditional(request)
+
+MEMBER_SITES_PAGE_SIZE = 50
+MAX_MEMBER_SITES_PAGE_SIZE = 200
+
 @app.route('/api/clubs/members/sites', methods=['GET'])
 @login_required
 def get_member_sites():
-    """Get all sites from members of the current user's club."""
+    """
+    Get a page of sites from members of the current user's club, newest first.
+
+    Paged by keyset on the site id: pass the returned next_cursor as
+    ?cursor= to continue. ?type=web (or python, code) filters by site type.
+    """
     try:
         # Check if the user is a club leader, co-leader, or member
-        club_id = request.args.get('club_id')
+        club_id = request.args.get('club_id', type=int)
         if club_id:
-            # If club_id is provided, check if user is a member of that club
-            membership = ClubMembership.query.filter_by(
-                user_id=current_user.id, club_id=club_id).first()
-            if not membership:
-                return jsonify({'error': 'Not a member of this club'}), 403
+            # If club_id is provided, check if user is a member or the leader of that club
             club = Club.query.get(club_id)
-        else:
-            # Otherwise get user's club (if leader)
-            club = Club.query.filter_by(leader_id=current_user.id).first()
             if not club:
-                # Check if they are a co-leader
-                membership = ClubMembership.query.filter_by(
-                    user_id=current_user.id, role='co-leader').first()
-                if not membership:
-                    # Check if they are a member
-                    membership = ClubMembership.query.filter_by(
-                        user_id=current_user.id).first()
-                    if not membership:
-                        return jsonify({'error': 'No club membership found'}), 404
-                club = membership.club
-
-        app.logger.info(f"Getting sites for club {club.id} ({club.name})")
-
-        # Get all members of the club
-        memberships = ClubMembership.query.filter_by(club_id=club.id).all()
-        member_ids = [m.user_id for m in memberships]
-
-        # Log member details for debugging
-        for membership in memberships:
-            app.logger.info(
-                f"Club member: {membership.user.username} (ID: {membership.user_id})"
-            )
-
-        app.logger.info(f"Found {len(member_ids)} club members")
-
-        # If no members, return empty list immediately
-        if not member_ids:
-            app.logger.warning(
-                "No club members found, returning empty sites list")
-            return jsonify({'sites': []})
+                return jsonify({'error': 'Club not found'}), 404
+            if not club_auth().is_member(club_id):
+                return jsonify({'error': 'Not a member of this club'}), 403
+        else:
+            # Otherwise the club they lead, then one they co-lead, then any club they belong to
+            club_id = club_auth().primary_club_id()
+            if club_id is None:
+                return jsonify({'error': 'No club membership found'}), 404
+            club = Club.query.get(club_id)
 
-        # Get all sites from these members
-        sites = []
-        try:
-            # Use a direct query to get sites
-            sites = db.session.query(Site).filter(
-                Site.user_id.in_(member_ids)).all()
-            app.logger.info(f"Found {len(sites)} member sites")
+        limit = min(max(request.args.get('limit', MEMBER_SITES_PAGE_SIZE, type=int), 1), MAX_MEMBER_SITES_PAGE_SIZE)
+        member_ids = db.union(
+            db.select(ClubMembership.user_id).where(ClubMembership.club_id == club.id),
+            db.select(db.literal(club.leader_id))
+        )
+        # Only the columns in the response; html_content and friends stay in the database
+        query = db.session.query(Site.id, Site.name, Site.site_type, Site.updated_at, User.id, User.username) \
+            .join(User, Site.user_id == User.id) \
+            .filter(Site.user_id.in_(member_ids))
 
-            # Additional debug logging - list all sites found
-            for site in sites:
-                app.logger.info(
-                    f"Site found: {site.id} - {site.name} (Owner: {site.user_id})"
-                )
-                
-            # Get all featured projects for this club
-            featured_projects = ClubFeaturedProject.query.filter_by(
-                club_id=club.id).all()
-            featured_site_ids = [fp.site_id for fp in featured_projects]
-            app.logger.info(f"Found {len(featured_site_ids)} featured projects")
-            
-        except Exception as query_error:
-            app.logger.error(f"Error querying sites: {str(query_error)}")
-            return jsonify({'error':
-                            f'Database error: {str(query_error)}'}), 500
+        site_type = request.args.get('type', '').strip()
+        if site_type:
+            query = query.filter(Site.site_type == site_type)
 
-        # Format the result with error handling
-        result = []
-        for site in sites:
+        cursor = request.args.get('cursor')
+        if cursor:
             try:
-                # Make sure user reference exists
-                user = User.query.get(site.user_id)
-                if not user:
-                    app.logger.warning(
-                        f"Site {site.id} has invalid user_id {site.user_id}")
-                    continue
-
-                site_data = {
-                    'id': site.id,
-                    'name': site.name,
-                    'type': site.site_type,
-                    'updated_at': site.updated_at.isoformat() if site.updated_at else None,
-                    'featured': site.id in featured_site_ids,
-                    'owner': {
-                        'id': user.id,
-                        'username': user.username
-                    }
-                }
-                result.append(site_data)
-            except Exception as site_error:
-                app.logger.error(
-                    f"Error processing site {site.id}: {str(site_error)}")
-                # Continue with other sites instead of failing completely
-
-        app.logger.info(f"Returning {len(result)} formatted sites")
-        return jsonify({'sites': result, 'club': {'id': club.id, 'name': club.name}})
+                query = query.filter(Site.id < int(cursor))
+            except ValueError:
+                return jsonify({'error': 'Invalid cursor'}), 400
+
+        rows = query.order_by(Site.id.desc()).limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        featured_site_ids = {row[0] for row in db.session.query(ClubFeaturedProject.site_id).filter(
+            ClubFeaturedProject.club_id == club.id,
+            ClubFeaturedProject.site_id.in_([row[0] for row in rows]))} if rows else set()
+
+        result = [{
+            'id': site_id,
+            'name': name,
+            'type': site_type_value,
+            'updated_at': updated_at.isoformat() if updated_at else None,
+            'featured': site_id in featured_site_ids,
+            'owner': {
+                'id': owner_id,
+                'username': username
+            }
+        } for site_id, name, site_type_value, updated_at, owner_id, username in rows]
+
+        app.logger.debug(f"Returning {len(result)} member sites for club {club.id}")
+        return jsonify({
+            'sites': result,
+            'club': {'id': club.id, 'name': club.name},
+            'has_more': has_more,
+            'next_cursor': str(rows[-1][0]) if has_more else None
+        })
     except Exception as e:
         app.logger.error(f'Error getting member sites: {str(e)}')
         return jsonify({'error': f'Failed to get member sites: {str(e)}'}), 500
@@ -6323,21 +6313,14 @@ def feature_project(club_id, site_id):
         club = Club.query.get_or_404(club_id)
         
         # Check if user is a club leader or co-leader
-        is_leader = club.leader_id == current_user.id
-        is_coleader = ClubMembership.query.filter_by(
-            user_id=current_user.id, club_id=club_id, role='co-leader').first() is not None
-            
-        if not (is_leader or is_coleader):
+        if not club_auth().can_manage(club_id):
             return jsonify({'error': 'Only club leaders can feature projects'}), 403
             
         # Verify site exists and belongs to a club member
         site = Site.query.get_or_404(site_id)
         
         # Check if site owner is club member
-        is_member = ClubMembership.query.filter_by(
-            user_id=site.user_id, club_id=club_id).first() is not None
-            
-        if not is_member:
+        if not club_auth_for(site.user_id).is_member(club_id):
             return jsonify({'error': 'This project does not belong to a club member'}), 400
             
         # Check if project is already featured
@@ -6378,11 +6361,7 @@ def unfeature_project(club_id, site_id):
         club = Club.query.get_or_404(club_id)
         
         # Check if user is a club leader or co-leader
-        is_leader = club.leader_id == current_user.id
-        is_coleader = ClubMembership.query.filter_by(
-            user_id=current_user.id, club_id=club_id, role='co-leader').first() is not None
-            
-        if not (is_leader or is_coleader):
+        if not club_auth().can_manage(club_id):
             return jsonify({'error': 'Only club leaders can unfeature projects'}), 403
             
         # Find and delete the featured project
@@ -6560,28 +6539,36 @@ def bulk_delete_sites():
         if not site_ids:
             return jsonify({'success': False, 'message': 'No site IDs provided'}), 400
         
-        deleted_count = 0
-        for site_id in site_ids:
-            site = Site.query.filter_by(id=site_id, user_id=current_user.id).first()
-            if site:
-                # Delete related site pages
-                SitePage.query.filter_by(site_id=site.id).delete()
-                
-                # Delete the site
-                db.session.delete(site)
-                deleted_count += 1
-        
-        if deleted_count > 0:
-            db.session.commit()
-            return jsonify({'success': True, 'message': f'Successfully deleted {deleted_count} sites'})
-        else:
+        # Only the caller's own sites, found with one query
+        owned_ids = [row[0] for row in db.session.query(Site.id).filter(
+            Site.id.in_(site_ids), Site.user_id == current_user.id)]
+        if not owned_ids:
             return jsonify({'success': False, 'message': 'No sites found or permission denied'}), 404
+
+        job = deletion_service.submit('sites', current_user.id, {'site_ids': owned_ids},
+                                      requested_by=current_user.id)
+        if job:
+            return jsonify({'success': True, 'message': f'Deleting {len(owned_ids)} sites',
+                            'job': job.to_dict()}), 202
+        return jsonify({'success': True, 'message': f'Successfully deleted {len(owned_ids)} sites'})
             
     except Exception as e:
         db.session.rollback()
         app.logger.error(f"Error in bulk delete: {str(e)}")
         return jsonify({'success': False, 'message': f'Error: {str(e)}'}), 500
 
+
+@app.route('/api/deletion-jobs/<job_id>')
+@login_required
+def get_deletion_job(job_id):
+    """Report the status and progress of a background user, club or site deletion."""
+    from models import DeletionJob
+
+    job = DeletionJob.query.get(job_id)
+    if not job or (job.requested_by != current_user.id and not current_user.is_admin):
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
 if __name__ == '__main__':
     # Configure more detailed logging
     import logging
@@ -6596,9 +6583,39 @@ if __name__ == '__main__':
         app.logger.info("Database initialization complete")
     except Exception as e:
         app.logger.warning(f"Database initialization error: {e}")
+
+    # With the reloader, this module runs in a watcher process and again in
+    # the process that serves; start the background workers only in the latter
+    debug = True
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        # Keep local Hackatime snapshots fresh in the background
+        from hackatime_sync_service import hackatime_sync_service
+        hackatime_sync_service.start(app)
+
+        # Run GitHub push/pull/create-repo jobs off the request thread
+        from github_sync_service import github_sync_service
+        github_sync_service.start(app)
+
+        # Resize uploaded images and gallery thumbnails in a process pool
+        from image_variant_service import image_variant_service
+        image_variant_service.start(app)
+
+        # Recompute gallery trending scores periodically
+        from gallery_trending_service import gallery_trending_service
+        gallery_trending_service.start(app)
+
+        # Batch club chat writes and fan messages out to open streams
+        from club_chat_service import club_chat_service
+        club_chat_service.start(app)
+
+        # Correct any drift in the club counter columns
+        club_counter_service.start(app)
+
+        # Run large user, club and site deletions in chunks
+        deletion_service.start(app)
         
     app.logger.info("Server running on http://0.0.0.0:3000")
-    app.run(host='0.0.0.0', port=3000, debug=True)
+    app.run(host='0.0.0.0', port=3000, debug=debug)
 
 
 @app.route('/api/admin/error-lookup/<error_id>', methods=['GET'])
@@ -0,0 +1,508 @@
+import os
+import time
+import uuid
+import heapq
+import hashlib
+import logging
+import tempfile
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.utils import secure_filename
+
+logger = logging.getLogger('cdn')
+
+CDN_API_URL = 'https://cdn.hackclub.com/api/v3/new'
+STAGING_DIR = os.path.join(tempfile.gettempdir(), 'hc_cdn_temp')
+CHUNK_SIZE = 1024 * 1024
+PARTIAL_SUFFIX = '.part'
+
+
+class StagedFile:
+    """A file written to the staging directory, with the hash computed while it was written."""
+
+    def __init__(self, original_filename, staged_name, path, size, content_hash):
+        self.original_filename = original_filename
+        self.staged_name = staged_name
+        self.path = path
+        self.size = size
+        self.content_hash = content_hash
+
+    def __repr__(self):
+        return f'<StagedFile {self.staged_name} {self.size}b>'
+
+
+class StagingFull(Exception):
+    """Raised when staging a file would exceed the staging space cap."""
+
+
+class StagingJanitor:
+    """
+    Owns the CDN staging directory.
+
+    Staged files are tracked in a heap ordered by expiry time, so expiring
+    old files only looks at the oldest entries instead of listing and
+    stat-ing the whole directory. Files are released (deleted) as soon as the
+    CDN has confirmed fetching them; a background thread removes anything
+    that was never released once it expires (max_age, or partial_max_age for
+    resumable uploads still being assembled). Space is reserved while a file
+    is being written, and staging refuses new bytes past the hard cap.
+    """
+
+    def __init__(self):
+        self.max_age = int(os.environ.get('HC_CDN_STAGING_MAX_AGE', 300))  # seconds
+        self.partial_max_age = int(os.environ.get('HC_CDN_UPLOAD_SESSION_TTL', 24 * 3600))  # seconds
+        self.max_bytes = int(os.environ.get('HC_CDN_STAGING_MAX_BYTES', 2 * 1024 * 1024 * 1024))
+        self.interval = 30
+
+        self._lock = threading.Lock()
+        self._thread = None
+        self._heap = []  # (expires_at, path)
+        self._sizes = {}  # path -> bytes, only for files still on disk
+        self._used = 0
+        self._reserved = 0
+        self._metrics = {'staged': 0, 'released': 0, 'expired': 0, 'rejected': 0, 'bytes_freed': 0}
+
+    def start(self):
+        """Index files left over from a previous run and start the expiry thread (idempotent)."""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            os.makedirs(STAGING_DIR, exist_ok=True)
+            for entry in os.scandir(STAGING_DIR):
+                if entry.is_file() and entry.path not in self._sizes:
+                    stat = entry.stat()
+                    self._sizes[entry.path] = stat.st_size
+                    self._used += stat.st_size
+                    ttl = self.partial_max_age if entry.name.endswith(PARTIAL_SUFFIX) else self.max_age
+                    heapq.heappush(self._heap, (stat.st_mtime + ttl, entry.path))
+            self._thread = threading.Thread(target=self._run, name='cdn-staging-janitor', daemon=True)
+            self._thread.start()
+
+    @property
+    def used_bytes(self):
+        return self._used + self._reserved
+
+    def reserve(self, size):
+        """Claim staging space for bytes about to be written."""
+        with self._lock:
+            if self.used_bytes + size > self.max_bytes:
+                # Make room from expired files before refusing
+                self._expire(time.time())
+                if self.used_bytes + size > self.max_bytes:
+                    self._metrics['rejected'] += 1
+                    raise StagingFull('CDN staging space is full, please try again shortly')
+            self._reserved += size
+
+    def unreserve(self, size):
+        with self._lock:
+            self._reserved -= size
+
+    def register(self, path, size, reserved=0, ttl=None):
+        """Track a written file, converting its reservation into usage."""
+        self.start()
+        with self._lock:
+            self._reserved -= reserved
+            self._sizes[path] = size
+            self._used += size
+            heapq.heappush(self._heap, (time.time() + (ttl or self.max_age), path))
+            self._metrics['staged'] += 1
+
+    def grow(self, path, size, reserved=0):
+        """Account for bytes appended to a tracked file (a resumable upload chunk)."""
+        with self._lock:
+            self._reserved -= reserved
+            if path in self._sizes:
+                self._sizes[path] += size
+                self._used += size
+
+    def is_tracked(self, path):
+        with self._lock:
+            return path in self._sizes
+
+    def promote(self, path, new_path):
+        """Rename a fully assembled partial file and give it the normal staging lifetime."""
+        os.replace(path, new_path)
+        with self._lock:
+            size = self._sizes.pop(path, 0)
+            self._sizes[new_path] = size
+            heapq.heappush(self._heap, (time.time() + self.max_age, new_path))
+
+    def release(self, path):
+        """Delete a staged file right away, e.g. once the CDN has fetched it."""
+        with self._lock:
+            size = self._sizes.pop(path, None)
+            if size is None:
+                return
+            self._used -= size
+        self._remove(path)
+        with self._lock:
+            self._metrics['released'] += 1
+            self._metrics['bytes_freed'] += size
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"Error removing staged file {path}: {str(e)}")
+
+    def _expire(self, now):
+        """Pop and delete expired entries. Caller holds the lock."""
+        expired = 0
+        while self._heap and self._heap[0][0] <= now:
+            _, path = heapq.heappop(self._heap)
+            size = self._sizes.pop(path, None)
+            if size is None:
+                continue  # Already released
+            self._used -= size
+            self._remove(path)
+            self._metrics['expired'] += 1
+            self._metrics['bytes_freed'] += size
+            expired += 1
+        return expired
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                with self._lock:
+                    expired = self._expire(time.time())
+                if expired:
+                    logger.info(f"Removed {expired} expired staged files")
+            except Exception as e:
+                logger.error(f"Staging janitor pass failed: {str(e)}")
+
+    def stats(self):
+        """Disk usage and activity counters for the staging directory."""
+        with self._lock:
+            next_expiry = self._heap[0][0] if self._heap else None
+            return {
+                'files': len(self._sizes),
+                'used_bytes': self._used,
+                'reserved_bytes': self._reserved,
+                'max_bytes': self.max_bytes,
+                'usage_percent': round(100.0 * self.used_bytes / self.max_bytes, 2),
+                'next_expiry_seconds': round(next_expiry - time.time(), 1) if next_expiry else None,
+                **self._metrics
+            }
+
+
+staging_janitor = StagingJanitor()
+
+
+def stage_stream(stream, filename):
+    """
+    Copy an upload stream into the staging directory in fixed-size chunks,
+    hashing each chunk as it is written, so the file is never held in memory
+    or read a second time.
+    """
+    staging_janitor.start()
+    staged_name = f"{uuid.uuid4()}_{secure_filename(filename) or 'upload'}"
+    path = os.path.join(STAGING_DIR, staged_name)
+
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(path, 'wb') as out:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                staging_janitor.reserve(len(chunk))
+                size += len(chunk)
+                digest.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        staging_janitor.unreserve(size)
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+
+    staging_janitor.register(path, size, reserved=size)
+    return StagedFile(filename, staged_name, path, size, digest.hexdigest())
+
+
+class UploadOffsetMismatch(Exception):
+    """A chunk was sent for an offset past what the server has received."""
+
+    def __init__(self, received_bytes):
+        super().__init__(f'Expected offset {received_bytes}')
+        self.received_bytes = received_bytes
+
+
+class ResumableUploads:
+    """
+    Chunked, resumable uploads: init, PUT chunks at offsets, finalize.
+
+    Chunks are appended to a partial file in the staging directory, so a
+    file is never held in memory and a client on a flaky network resumes
+    from the last offset the server acknowledged instead of from zero.
+    Chunks must be contiguous; a retransmitted chunk overlapping what was
+    already received is trimmed. The SHA-256 is updated as chunks arrive; if
+    this process did not see every chunk (restart, another worker) the
+    assembled file is re-hashed from disk at finalize.
+    """
+
+    def __init__(self):
+        self.max_upload_bytes = int(os.environ.get('HC_CDN_MAX_UPLOAD_BYTES', 1024 * 1024 * 1024))
+        self.chunk_size = 5 * 1024 * 1024  # Suggested to clients
+        self.max_chunk_bytes = 16 * 1024 * 1024
+
+        self._lock = threading.Lock()
+        self._hashers = {}  # session id -> (offset hashed up to, sha256)
+
+    def partial_path(self, session_id):
+        return os.path.join(STAGING_DIR, f'{session_id}{PARTIAL_SUFFIX}')
+
+    def create(self, user_id, filename, total_size, content_type=None):
+        """Start a session and create its empty partial file."""
+        from models import db, CDNUploadSession
+
+        if total_size <= 0 or total_size > self.max_upload_bytes:
+            raise ValueError(f'File size must be between 1 byte and {self.max_upload_bytes} bytes')
+
+        session = CDNUploadSession(id=uuid.uuid4().hex,
+                                   user_id=user_id,
+                                   filename=filename[:255],
+                                   content_type=content_type,
+                                   total_size=total_size,
+                                   received_bytes=0,
+                                   status='uploading')
+        staging_janitor.start()
+        path = self.partial_path(session.id)
+        open(path, 'wb').close()
+        staging_janitor.register(path, 0, ttl=staging_janitor.partial_max_age)
+
+        with self._lock:
+            self._hashers[session.id] = (0, hashlib.sha256())
+
+        db.session.add(session)
+        db.session.commit()
+        return session
+
+    def write_chunk(self, session, offset, stream):
+        """
+        Append a chunk sent for offset. Bytes already received are skipped, so
+        retrying a chunk whose acknowledgement was lost is harmless.
+        """
+        from models import db
+
+        received = session.received_bytes
+        if offset > received:
+            raise UploadOffsetMismatch(received)
+
+        path = self.partial_path(session.id)
+        if not staging_janitor.is_tracked(path) or not os.path.exists(path):
+            raise FileNotFoundError('Upload session expired')
+
+        skip = received - offset
+        limit = min(self.max_chunk_bytes, session.total_size - offset)
+        with self._lock:
+            hashed_to, hasher = self._hashers.get(session.id, (None, None))
+        if hashed_to != received:
+            hasher = None  # Missed earlier chunks; re-hash from disk at finalize
+
+        written = 0
+        read = 0
+        with open(path, 'r+b') as out:
+            out.seek(received)
+            while read < limit:
+                chunk = stream.read(min(CHUNK_SIZE, limit - read))
+                if not chunk:
+                    break
+                read += len(chunk)
+                if skip >= len(chunk):
+                    skip -= len(chunk)
+                    continue
+                chunk = chunk[skip:]
+                skip = 0
+                staging_janitor.reserve(len(chunk))
+                out.write(chunk)
+                staging_janitor.grow(path, len(chunk), reserved=len(chunk))
+                if hasher is not None:
+                    hasher.update(chunk)
+                written += len(chunk)
+
+        session.received_bytes = received + written
+        with self._lock:
+            if hasher is not None:
+                self._hashers[session.id] = (session.received_bytes, hasher)
+            else:
+                self._hashers.pop(session.id, None)
+        db.session.commit()
+        return session
+
+    def assemble(self, session):
+        """Turn a complete partial file into a StagedFile ready for the CDN."""
+        from models import db
+
+        if session.received_bytes != session.total_size:
+            raise ValueError(f'Upload incomplete: {session.received_bytes} of {session.total_size} bytes received')
+
+        if session.staged_name and session.content_hash:
+            # Finalize is being retried after the file was already assembled
+            path = os.path.join(STAGING_DIR, session.staged_name)
+            if not os.path.exists(path):
+                raise FileNotFoundError('Upload session expired')
+            return StagedFile(session.filename, session.staged_name, path, session.total_size, session.content_hash)
+
+        with self._lock:
+            hashed_to, hasher = self._hashers.pop(session.id, (None, None))
+        partial = self.partial_path(session.id)
+        if hashed_to != session.total_size:
+            hasher = hashlib.sha256()
+            with open(partial, 'rb') as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                    hasher.update(chunk)
+
+        staged_name = f"{uuid.uuid4()}_{secure_filename(session.filename) or 'upload'}"
+        path = os.path.join(STAGING_DIR, staged_name)
+        staging_janitor.promote(partial, path)
+
+        session.staged_name = staged_name
+        session.content_hash = hasher.hexdigest()
+        session.status = 'assembled'
+        db.session.commit()
+        return StagedFile(session.filename, staged_name, path, session.total_size, session.content_hash)
+
+    def abort(self, session):
+        from models import db
+
+        with self._lock:
+            self._hashers.pop(session.id, None)
+        staging_janitor.release(self.partial_path(session.id))
+        if session.staged_name:
+            staging_janitor.release(os.path.join(STAGING_DIR, session.staged_name))
+        session.status = 'aborted'
+        db.session.commit()
+
+
+resumable_uploads = ResumableUploads()
+
+
+class CDNService:
+    """
+    Client for the Hack Club CDN.
+
+    The CDN fetches files from URLs we give it, so each staged file is sent
+    as its own request and several are in flight at once: one large or slow
+    file no longer holds up the rest of the batch, and a single failure only
+    fails that file.
+    """
+
+    def __init__(self):
+        self.api_token = os.environ.get('HC_CDN_TOKEN', 'beans')
+        self.max_workers = int(os.environ.get('HC_CDN_UPLOAD_WORKERS', 4))
+        self.timeout = 60  # Longer timeout for large files
+        self.user_quota_bytes = int(os.environ.get('HC_CDN_USER_QUOTA_BYTES', 1024 * 1024 * 1024))
+        self._session = requests.Session()
+
+    @property
+    def headers(self):
+        return {
+            'Authorization': f'Bearer {self.api_token}',
+            'Content-Type': 'application/json'
+        }
+
+    def upload_url(self, file_url):
+        """Ask the CDN to ingest one URL and return its file info."""
+        response = self._session.post(CDN_API_URL,
+                                      headers=self.headers,
+                                      json=[file_url],  # The API takes an array of URLs
+                                      timeout=self.timeout)
+        if response.status_code != 200:
+            raise RuntimeError(f'CDN API error: {response.status_code} - {response.text[:200]}')
+        return response.json()['files'][0]
+
+    def upload_urls(self, file_urls):
+        """
+        Upload several URLs concurrently. Returns a list in the same order
+        with either the CDN file info or the exception for each URL.
+        """
+        def upload(file_url):
+            try:
+                return self.upload_url(file_url)
+            except Exception as e:
+                logger.error(f"CDN upload failed for {file_url}: {str(e)}")
+                return e
+
+        if len(file_urls) <= 1:
+            return [upload(url) for url in file_urls]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(file_urls))) as pool:
+            return list(pool.map(upload, file_urls))
+
+    def find_existing_uploads(self, user_id, content_hashes):
+        """
+        Map content hashes to an existing UserUpload, preferring the user's own
+        upload over someone else's copy of the same content.
+        """
+        from models import UserUpload
+
+        if not content_hashes:
+            return {}
+        existing = {}
+        for upload in UserUpload.query.filter(UserUpload.content_hash.in_(list(content_hashes))).all():
+            current = existing.get(upload.content_hash)
+            if current is None or (upload.user_id == user_id and current.user_id != user_id):
+                existing[upload.content_hash] = upload
+        return existing
+
+    # Per-user storage accounting. User.storage_used_bytes is adjusted as
+    # uploads are recorded and deleted, so quota checks never scan user_upload.
+
+    def storage_usage(self, user):
+        used = user.storage_used_bytes or 0
+        return {
+            'used_bytes': used,
+            'quota_bytes': self.user_quota_bytes,
+            'remaining_bytes': max(0, self.user_quota_bytes - used)
+        }
+
+    def has_room(self, user, size):
+        """Cheap pre-check before accepting bytes; charge_storage is the authoritative check."""
+        return (user.storage_used_bytes or 0) + size <= self.user_quota_bytes
+
+    def charge_storage(self, user_id, size):
+        """
+        Add size to the user's counter if it stays within quota, in one
+        conditional UPDATE so concurrent uploads cannot both slip under the
+        limit. Commits, and returns False when the quota would be exceeded.
+        """
+        from models import db, User
+
+        if size <= 0:
+            return True
+        charged = User.query.filter(User.id == user_id,
+                                    User.storage_used_bytes + size <= self.user_quota_bytes)\
+            .update({User.storage_used_bytes: User.storage_used_bytes + size}, synchronize_session=False)
+        db.session.commit()
+        return bool(charged)
+
+    def refund_storage(self, user_id, size):
+        """Subtract size from the user's counter as part of the caller's transaction."""
+        from models import db, User
+
+        if not size or size <= 0:
+            return
+        User.query.filter(User.id == user_id).update({
+            User.storage_used_bytes: db.case((User.storage_used_bytes > size, User.storage_used_bytes - size),
+                                             else_=0)
+        }, synchronize_session=False)
+
+    def recount_storage(self, user_id=None):
+        """Rebuild counters from user_upload, for one user or everyone. Only needed to repair drift."""
+        from models import db, User, UserUpload
+
+        totals = db.select(db.func.coalesce(db.func.sum(UserUpload.file_size), 0))\
+            .where(UserUpload.user_id == User.id).scalar_subquery()
+        query = User.query
+        if user_id is not None:
+            query = query.filter(User.id == user_id)
+        updated = query.update({User.storage_used_bytes: totals}, synchronize_session=False)
+        db.session.commit()
+        return updated
+
+
+cdn_service = CDNService()
@@ -0,0 +1,138 @@
+from flask import g, has_request_context
+from flask_login import current_user
+from sqlalchemy import event
+
+LEADER = 'leader'
+CO_LEADER = 'co-leader'
+MEMBER = 'member'
+MANAGER_ROLES = (LEADER, CO_LEADER)
+
+
+class ClubAuthContext:
+    """
+    A user's club roles, loaded with one query and answered from memory
+    afterwards: {club id: 'leader' | 'co-leader' | 'member'}. A club the
+    user leads counts as 'leader' even if they also hold a membership row.
+
+    Clubs an active DeletionJob is removing are left out, so their routes
+    refuse members until the job finishes or fails.
+
+    Use club_auth() for the current user. Contexts live on flask.g, so each
+    request loads them at most once, and they are dropped when a
+    membership or club leader changes during the request.
+    """
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self._roles = None
+
+    @property
+    def roles(self):
+        if self._roles is None:
+            self._roles = self._load_roles()
+        return self._roles
+
+    def _load_roles(self):
+        from models import db, Club, ClubMembership
+        from deletion_service import deletion_service
+
+        if self.user_id is None:
+            return {}
+        closed = deletion_service.closed_club_ids()
+        rows = db.session.execute(db.union_all(
+            db.select(Club.id, db.literal(LEADER)).where(Club.leader_id == self.user_id,
+                                                          Club.id.not_in(closed)),
+            db.select(ClubMembership.club_id, ClubMembership.role).where(ClubMembership.user_id == self.user_id,
+                                                                         ClubMembership.club_id.not_in(closed))
+        )).all()
+        roles = {}
+        for club_id, role in rows:
+            if roles.get(club_id) != LEADER:
+                roles[club_id] = role or MEMBER
+        return roles
+
+    def role(self, club_id):
+        return self.roles.get(int(club_id)) if club_id is not None else None
+
+    def is_member(self, club_id):
+        """Leader, co-leader or member of the club."""
+        return self.role(club_id) is not None
+
+    def is_leader(self, club_id):
+        """The club's leader (owner)."""
+        return self.role(club_id) == LEADER
+
+    def can_manage(self, club_id):
+        """Leader or co-leader of the club."""
+        return self.role(club_id) in MANAGER_ROLES
+
+    def club_ids(self):
+        return set(self.roles)
+
+    def member_club_ids(self):
+        """Clubs the user belongs to through a membership, not the ones they lead."""
+        return {club_id for club_id, role in self.roles.items() if role != LEADER}
+
+    def managed_club_ids(self):
+        return {club_id for club_id, role in self.roles.items() if role in MANAGER_ROLES}
+
+    def primary_club_id(self):
+        """The club to default to: one they lead, else co-lead, else belong to."""
+        for wanted in (LEADER, CO_LEADER, MEMBER):
+            club_ids = sorted(club_id for club_id, role in self.roles.items() if role == wanted)
+            if club_ids:
+                return club_ids[0]
+        return None
+
+    def leads_any(self):
+        """Leads or co-leads at least one club."""
+        return any(role in MANAGER_ROLES for role in self.roles.values())
+
+    def shares_club_with(self, user_id):
+        """Whether user_id leads or belongs to any club this user is in."""
+        return bool(self.club_ids() & club_auth_for(user_id).club_ids())
+
+    def manages_user(self, user_id, club_id=None):
+        """
+        Whether this user leads or co-leads a club that user_id is a member
+        of, optionally limited to one club. A club's leader is not managed
+        by its co-leaders.
+        """
+        managed = self.managed_club_ids()
+        if club_id is not None:
+            managed &= {int(club_id)}
+        return bool(managed & club_auth_for(user_id).member_club_ids())
+
+
+def club_auth_for(user_id):
+    """The memoized ClubAuthContext for a user; a fresh one outside a request."""
+    if not has_request_context():
+        return ClubAuthContext(user_id)
+    contexts = g.setdefault('club_auth', {})
+    context = contexts.get(user_id)
+    if context is None:
+        context = contexts[user_id] = ClubAuthContext(user_id)
+    return context
+
+
+def club_auth():
+    """The current user's ClubAuthContext for this request."""
+    return club_auth_for(current_user.id if current_user.is_authenticated else None)
+
+
+def reset_club_auth():
+    if has_request_context():
+        g.pop('club_auth', None)
+
+
+def register_events():
+    """Drop this request's contexts whenever memberships or club leaders change."""
+    from models import Club, ClubMembership
+
+    def on_change(mapper, connection, target):
+        reset_club_auth()
+
+    for model in (Club, ClubMembership):
+        for name in ('after_insert', 'after_update', 'after_delete'):
+            if not event.contains(model, name, on_change):
+                event.listen(model, name, on_change)
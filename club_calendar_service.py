@@ -0,0 +1,171 @@
+import os
+import hmac
+import time
+import hashlib
+import secrets
+import threading
+from datetime import datetime, timedelta
+
+from club_dashboard_service import club_dashboard_service
+
+PRODID = '-//Hack Club Spaces//Club Meetings//EN'
+DEFAULT_MEETING_LENGTH = timedelta(hours=1)
+
+
+def escape_text(value):
+    """Escape a TEXT value (RFC 5545 3.3.11)."""
+    return (value or '').replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,') \
+        .replace('\r\n', '\\n').replace('\n', '\\n').replace('\r', '\\n')
+
+
+def clean_uri(value):
+    """Drop control characters, CR/LF included, so a URI value cannot start new properties."""
+    return ''.join(ch for ch in value or '' if ch >= ' ' and ch != '\x7f')
+
+
+def fold_line(line):
+    """Fold a content line into 75-octet chunks, continuation lines starting with a space."""
+    raw = line.encode('utf-8')
+    if len(raw) <= 75:
+        return line
+    chunks = []
+    limit = 75
+    while raw:
+        cut = min(limit, len(raw))
+        # Never split a multi-byte character
+        while cut < len(raw) and (raw[cut] & 0xC0) == 0x80:
+            cut -= 1
+        chunks.append(raw[:cut].decode('utf-8'))
+        raw = raw[cut:]
+        limit = 74  # The leading space counts towards the next line's 75
+    return '\r\n '.join(chunks)
+
+
+def format_local(value):
+    """Floating date-time: meetings are stored without a timezone, so clients show them as entered."""
+    return value.strftime('%Y%m%dT%H%M%S')
+
+
+def render_calendar(club_id, club_name, meetings, host):
+    """Render the dashboard's meetings section as a VCALENDAR document."""
+    lines = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        f'PRODID:{PRODID}',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        f'X-WR-CALNAME:{escape_text(club_name)} meetings',
+        'REFRESH-INTERVAL;VALUE=DURATION:PT1H',
+        'X-PUBLISHED-TTL:PT1H',
+    ]
+    for meeting in meetings:
+        start = datetime.fromisoformat(f"{meeting['meeting_date']}T{meeting['start_time']}")
+        end = datetime.fromisoformat(f"{meeting['meeting_date']}T{meeting['end_time']}") \
+            if meeting['end_time'] else start + DEFAULT_MEETING_LENGTH
+        if end <= start:
+            end = start + DEFAULT_MEETING_LENGTH
+        description = meeting['description'] or ''
+        if meeting['meeting_link']:
+            description = f"{description}\n\n{meeting['meeting_link']}".strip()
+
+        lines += [
+            'BEGIN:VEVENT',
+            f"UID:club-{club_id}-meeting-{meeting['id']}@{host}",
+            f"DTSTAMP:{datetime.fromisoformat(meeting['created_at']).strftime('%Y%m%dT%H%M%SZ')}",
+            f'DTSTART:{format_local(start)}',
+            f'DTEND:{format_local(end)}',
+            f"SUMMARY:{escape_text(meeting['title'])}",
+        ]
+        if description:
+            lines.append(f'DESCRIPTION:{escape_text(description)}')
+        if meeting['location']:
+            lines.append(f"LOCATION:{escape_text(meeting['location'])}")
+        if clean_uri(meeting['meeting_link']):
+            lines.append(f"URL:{clean_uri(meeting['meeting_link'])}")
+        lines.append('END:VEVENT')
+    lines.append('END:VCALENDAR')
+    return '\r\n'.join(fold_line(line) for line in lines) + '\r\n'
+
+
+class ClubCalendarService:
+    """
+    Per-club iCalendar feeds of ClubMeeting entries.
+
+    Feeds are rendered from the club dashboard's cached 'meetings' section,
+    which is dropped whenever a meeting is created, updated or deleted, and
+    the rendered document is kept until that section's version changes.
+    The ETag is a hash of the rendered feed. While the meetings section is
+    unchanged, a calendar client polling with If-None-Match gets a 304
+    answered from memory: no query and no render.
+
+    Calendar clients cannot log in, so feed URLs carry a token, an HMAC of
+    the club id and the club's calendar_secret under the app's SECRET_KEY.
+    Members get the URL from /api/clubs/<id>/calendar. Leaders revoke every
+    issued URL by regenerating the secret. A club without one keeps the
+    original id-only token until its first regeneration. Secrets are cached
+    for CLUB_CALENDAR_SECRET_TTL seconds so the 304 path stays query-free;
+    other processes honour a regeneration within that time.
+    """
+
+    def __init__(self):
+        self.secret_ttl = int(os.environ.get('CLUB_CALENDAR_SECRET_TTL', 60))  # seconds
+
+        self._lock = threading.Lock()
+        self._feeds = {}  # club id -> ((meetings section version, club name), etag, body)
+        self._secrets = {}  # club id -> (loaded at, calendar secret)
+
+    def token(self, secret_key, club_id, calendar_secret=None):
+        message = f'club-calendar:{club_id}' + (f':{calendar_secret}' if calendar_secret else '')
+        return hmac.new(secret_key.encode('utf-8'), message.encode('utf-8'), hashlib.sha256).hexdigest()[:32]
+
+    def calendar_secret(self, club_id):
+        """The club's calendar secret, from a short-lived cache."""
+        from models import db, Club
+
+        with self._lock:
+            cached = self._secrets.get(club_id)
+        if cached and time.time() - cached[0] < self.secret_ttl:
+            return cached[1]
+        secret = db.session.query(Club.calendar_secret).filter(Club.id == club_id).scalar()
+        with self._lock:
+            self._secrets[club_id] = (time.time(), secret)
+        return secret
+
+    def verify_token(self, secret_key, club_id, token):
+        return hmac.compare_digest(self.token(secret_key, club_id, self.calendar_secret(club_id)), token or '')
+
+    def regenerate_secret(self, club):
+        """Give the club a new calendar secret, invalidating every feed URL issued so far. Commits."""
+        from models import db
+
+        club.calendar_secret = secrets.token_hex(16)
+        db.session.commit()
+        with self._lock:
+            self._secrets.pop(club.id, None)
+        return club.calendar_secret
+
+    def current_etag(self, club_id):
+        """The ETag of the cached feed if its meetings are unchanged, else None."""
+        version = club_dashboard_service.cached_version(club_id, 'meetings')
+        if version is None:
+            return None
+        with self._lock:
+            feed = self._feeds.get(club_id)
+        return feed[1] if feed and feed[0][0] == version else None
+
+    def feed(self, club, host):
+        """Return (etag, body) for a club's calendar, rendering only when its meetings changed."""
+        version, data = club_dashboard_service.section(club, 'meetings')
+        with self._lock:
+            feed = self._feeds.get(club.id)
+        if feed and feed[0] == (version, club.name):
+            return feed[1], feed[2]
+
+        body = render_calendar(club.id, club.name, data['meetings'], host)
+        etag = hashlib.sha1(body.encode('utf-8')).hexdigest()[:16]
+        with self._lock:
+            self._feeds[club.id] = ((version, club.name), etag, body)
+        return etag, body
+
+
+club_calendar_service = ClubCalendarService()
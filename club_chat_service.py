@@ -0,0 +1,493 @@
+import os
+import json
+import time
+import queue
+import base64
+import select
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+
+logger = logging.getLogger('club_chat')
+
+MAX_MESSAGE_LENGTH = 4000
+# Postgres rejects NOTIFY payloads of 8000 bytes or more
+MAX_NOTIFY_PAYLOAD = 7500
+
+
+def encode_history_cursor(message):
+    raw = f"{message['created_at']}|{message['id']}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_history_cursor(cursor):
+    """Return (created_at, id) from a history cursor, or None if it is malformed."""
+    try:
+        created_at, message_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split('|')
+        return datetime.fromisoformat(created_at), int(message_id)
+    except (ValueError, UnicodeError):
+        return None
+
+
+def message_dict(message, username):
+    return {
+        'id': message.id,
+        'channel_id': message.channel_id,
+        'content': message.content,
+        'created_at': message.created_at.isoformat(),
+        'user': {
+            'id': message.user_id,
+            'username': username
+        }
+    }
+
+
+class Subscription:
+    """
+    One connection's view of a channel: a bounded buffer of events the
+    broker pushes into and the connection drains. A subscriber that falls
+    max_pending events behind is closed rather than buffered without limit;
+    the client reconnects with Last-Event-ID and catches up from history.
+    """
+
+    def __init__(self, channel_id, max_pending):
+        self.channel_id = channel_id
+        self.max_pending = max_pending
+        self.closed = False
+        self._events = deque()
+        self._cond = threading.Condition(threading.Lock())
+
+    def push(self, event):
+        with self._cond:
+            if self.closed:
+                return False
+            if len(self._events) >= self.max_pending:
+                self.closed = True
+                self._cond.notify()
+                return False
+            self._events.append(event)
+            self._cond.notify()
+            return True
+
+    def get(self, timeout=None):
+        """Return every buffered event, [] after timeout, or None once closed."""
+        with self._cond:
+            if not self._events and not self.closed:
+                self._cond.wait(timeout)
+            if self._events:
+                events = list(self._events)
+                self._events.clear()
+                return events
+            return None if self.closed else []
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify()
+
+
+class InProcessBroker:
+    """Fans published events out to this process's subscriptions, keyed by channel id."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._channels = {}  # channel id -> set of Subscription
+
+    def start(self, app):
+        pass
+
+    def subscribe(self, channel_id, max_pending=256):
+        subscription = Subscription(channel_id, max_pending)
+        with self._lock:
+            self._channels.setdefault(channel_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscription.close()
+        with self._lock:
+            subscribers = self._channels.get(subscription.channel_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._channels[subscription.channel_id]
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._channels.values())
+
+    def publish(self, events):
+        """Deliver (channel id, event) pairs. Called by the writer after they are committed."""
+        for channel_id, event in events:
+            self.deliver(channel_id, event)
+
+    def deliver(self, channel_id, event):
+        with self._lock:
+            subscribers = list(self._channels.get(channel_id, ()))
+        for subscription in subscribers:
+            if not subscription.push(event):
+                self.unsubscribe(subscription)
+
+
+class PostgresBroker(InProcessBroker):
+    """
+    Broker for running several web processes: events are published with
+    pg_notify and every process, this one included, delivers them to its own
+    subscriptions from a LISTEN thread. Messages too large for a NOTIFY
+    payload are sent as an id and loaded by each listener.
+    """
+
+    notify_channel = 'club_chat'
+
+    def __init__(self, database_url):
+        super().__init__()
+        self.database_url = database_url
+        self._app = None
+        self._thread = None
+
+    def start(self, app):
+        with self._lock:
+            if self._thread:
+                return
+            self._app = app
+            self._thread = threading.Thread(target=self._listen, name='club-chat-listener', daemon=True)
+            self._thread.start()
+        logger.info("Club chat Postgres listener started")
+
+    def publish(self, events):
+        from models import db
+
+        for channel_id, event in events:
+            payload = json.dumps({'channel_id': channel_id, 'event': event})
+            if len(payload.encode('utf-8')) > MAX_NOTIFY_PAYLOAD:
+                payload = json.dumps({'channel_id': channel_id, 'message_id': event['id']})
+            db.session.execute(db.text("SELECT pg_notify(:channel, :payload)"),
+                               {'channel': self.notify_channel, 'payload': payload})
+        db.session.commit()
+
+    def _listen(self):
+        import psycopg2
+        import psycopg2.extensions
+
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(self.database_url)
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {self.notify_channel};")
+                while True:
+                    if select.select([conn], [], [], 30) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        self._on_notify(json.loads(conn.notifies.pop(0).payload))
+            except Exception as e:
+                logger.error(f"Club chat listener error, reconnecting: {str(e)}")
+                time.sleep(5)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+    def _on_notify(self, payload):
+        event = payload.get('event')
+        if event is None:
+            from models import ClubChatMessage, User
+
+            with self._app.app_context():
+                row = ClubChatMessage.query.join(User, ClubChatMessage.user_id == User.id)\
+                    .with_entities(ClubChatMessage, User.username)\
+                    .filter(ClubChatMessage.id == payload['message_id'])\
+                    .first()
+            if row is None:
+                return
+            event = message_dict(*row)
+        self.deliver(payload['channel_id'], event)
+
+
+class PendingMessage:
+    def __init__(self, channel_id, user_id, username, content):
+        self.channel_id = channel_id
+        self.user_id = user_id
+        self.username = username
+        self.content = content
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ClubChatService:
+    """
+    Realtime club chat.
+
+    Sent messages are queued for a writer thread that inserts whatever has
+    arrived within CLUB_CHAT_FLUSH_INTERVAL (up to CLUB_CHAT_BATCH_SIZE
+    messages) in one transaction, so a busy channel costs one commit per batch
+    rather than per message. The sender waits for its batch to commit, then
+    the batch is handed to the broker, which pushes it to every subscribed
+    connection; clients hold a Server-Sent Events stream instead of polling.
+
+    CLUB_CHAT_BROKER=postgres switches to PostgresBroker so messages reach
+    subscribers connected to other processes; the default in-process broker
+    only serves a single process.
+    """
+
+    def __init__(self):
+        self.batch_size = int(os.environ.get('CLUB_CHAT_BATCH_SIZE', 100))
+        self.flush_interval = float(os.environ.get('CLUB_CHAT_FLUSH_INTERVAL', 0.05))  # seconds
+        self.send_timeout = float(os.environ.get('CLUB_CHAT_SEND_TIMEOUT', 10))  # seconds
+        self.max_subscribers = int(os.environ.get('CLUB_CHAT_MAX_SUBSCRIBERS', 5000))
+        self.max_pending = int(os.environ.get('CLUB_CHAT_MAX_PENDING', 256))
+        self.heartbeat = int(os.environ.get('CLUB_CHAT_HEARTBEAT', 15))  # seconds
+        self.history_page_size = 50
+        self.max_history_page_size = 200
+        self.max_replay = 500
+        # With several processes, pg_notify follows each writer's own commit, so
+        # messages can arrive slightly out of id order; dedupe and replay allow for it
+        self.replay_id_window = int(os.environ.get('CLUB_CHAT_REPLAY_ID_WINDOW', 200))
+        self.delivered_window = 1024
+
+        if os.environ.get('CLUB_CHAT_BROKER', 'memory') == 'postgres':
+            self.broker = PostgresBroker(os.environ.get('DATABASE_URL'))
+        else:
+            self.broker = InProcessBroker()
+
+        self._app = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._queue = queue.Queue()
+
+    def start(self, app):
+        """Start the writer thread and the broker for the given Flask app (idempotent)."""
+        with self._lock:
+            if self._thread:
+                return
+            self._app = app
+            self._thread = threading.Thread(target=self._run, name='club-chat-writer', daemon=True)
+            self._thread.start()
+        self.broker.start(app)
+        logger.info(f"Club chat started ({type(self.broker).__name__})")
+
+    # Writes
+
+    def send(self, channel_id, user, content):
+        """
+        Queue a message and wait for the batch holding it to commit. Returns
+        the message dict; raises ValueError for an empty or oversized message
+        and TimeoutError if the writer does not get to it in time.
+        """
+        content = (content or '').strip()
+        if not content:
+            raise ValueError('Message cannot be empty')
+        if len(content) > MAX_MESSAGE_LENGTH:
+            raise ValueError(f'Message cannot be longer than {MAX_MESSAGE_LENGTH} characters')
+        if not self._thread:
+            from flask import current_app
+            self.start(current_app._get_current_object())
+
+        pending = PendingMessage(channel_id, user.id, user.username, content)
+        self._queue.put(pending)
+        if not pending.done.wait(self.send_timeout):
+            raise TimeoutError('Timed out saving message')
+        if pending.error:
+            raise pending.error
+        return pending.result
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            with self._app.app_context():
+                self._write_batch(batch)
+
+    def _write_batch(self, batch):
+        from models import db, ClubChatMessage
+
+        try:
+            rows = [ClubChatMessage(channel_id=p.channel_id, user_id=p.user_id, content=p.content,
+                                    created_at=datetime.utcnow())
+                    for p in batch]
+            db.session.add_all(rows)
+            db.session.commit()
+            for pending, row in zip(batch, rows):
+                pending.result = message_dict(row, pending.username)
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Failed to save {len(batch)} chat messages: {str(e)}")
+            for pending in batch:
+                pending.error = e
+                pending.done.set()
+            return
+
+        for pending in batch:
+            pending.done.set()
+        try:
+            self.broker.publish([(p.channel_id, p.result) for p in batch])
+        except Exception as e:
+            db.session.rollback()
+            # Already saved; connected clients pick them up from history on reconnect
+            logger.error(f"Failed to publish {len(batch)} chat messages: {str(e)}")
+
+    # Reads
+
+    def history(self, channel_id, cursor=None, limit=None):
+        """
+        Return (messages, next_cursor): the newest page of a channel, or the
+        page before cursor, oldest first. Paged by keyset on
+        (channel_id, created_at, id); an invalid cursor raises ValueError.
+        """
+        from models import db, ClubChatMessage, User
+
+        limit = min(max(limit or self.history_page_size, 1), self.max_history_page_size)
+        query = db.session.query(ClubChatMessage, User.username)\
+            .join(User, ClubChatMessage.user_id == User.id)\
+            .filter(ClubChatMessage.channel_id == channel_id)
+        if cursor:
+            position = decode_history_cursor(cursor)
+            if position is None:
+                raise ValueError('Invalid cursor')
+            created_at, message_id = position
+            query = query.filter(db.or_(
+                ClubChatMessage.created_at < created_at,
+                db.and_(ClubChatMessage.created_at == created_at, ClubChatMessage.id < message_id)
+            ))
+        rows = query.order_by(ClubChatMessage.created_at.desc(), ClubChatMessage.id.desc())\
+            .limit(limit + 1)\
+            .all()
+        has_more = len(rows) > limit
+        messages = [message_dict(message, username) for message, username in reversed(rows[:limit])]
+        return messages, encode_history_cursor(messages[0]) if has_more else None
+
+    def since(self, channel_id, last_id):
+        """
+        Messages for a reconnecting stream to replay, oldest first: those after
+        last_id, plus those up to replay_id_window ids before it, which may have
+        been delivered after last_id and missed. Clients dedupe on the event id.
+        """
+        from models import db, ClubChatMessage, User
+
+        rows = db.session.query(ClubChatMessage, User.username)\
+            .join(User, ClubChatMessage.user_id == User.id)\
+            .filter(ClubChatMessage.channel_id == channel_id,
+                    ClubChatMessage.id > last_id - self.replay_id_window)\
+            .order_by(ClubChatMessage.id)\
+            .limit(self.max_replay)\
+            .all()
+        return [message_dict(message, username) for message, username in rows]
+
+    # Streams
+
+    def subscribe(self, channel_id):
+        """Subscribe to a channel, or return None when this process is at its connection limit."""
+        if self.broker.subscriber_count() >= self.max_subscribers:
+            return None
+        return self.broker.subscribe(channel_id, self.max_pending)
+
+    def stream(self, subscription, replay=()):
+        """
+        Yield Server-Sent Events for a subscription: the replayed messages,
+        then live ones, with a comment line every CLUB_CHAT_HEARTBEAT seconds
+        so proxies keep the connection open. Runs outside the app context.
+        """
+        # Ids already sent on this connection. A message can be both replayed and
+        # delivered live around subscribe time, and live messages from several
+        # processes arrive out of id order, so a high-water mark would drop some.
+        delivered = set()
+        order = deque()
+        try:
+            yield 'retry: 3000\n\n'
+            events = replay
+            while True:
+                for event in events:
+                    if event['id'] in delivered:
+                        continue
+                    delivered.add(event['id'])
+                    order.append(event['id'])
+                    if len(order) > self.delivered_window:
+                        delivered.discard(order.popleft())
+                    yield f"id: {event['id']}\nevent: message\ndata: {json.dumps(event)}\n\n"
+
+                events = subscription.get(self.heartbeat)
+                if events is None:
+                    return
+                if not events:
+                    yield ': keepalive\n\n'
+        finally:
+            self.broker.unsubscribe(subscription)
+
+
+club_chat_service = ClubChatService()
+
+
+if __name__ == '__main__':
+    # Fan-out load test for one process, one thread per connection as under
+    # the threaded dev server:
+    #   python club_chat_service.py --subscribers 5000 --channels 10 --messages 200
+    import argparse
+    import statistics
+
+    parser = argparse.ArgumentParser(description='Load test the in-process club chat broker')
+    parser.add_argument('--subscribers', type=int, default=5000)
+    parser.add_argument('--channels', type=int, default=10)
+    parser.add_argument('--messages', type=int, default=200, help='Messages published per channel')
+    parser.add_argument('--rate', type=float, default=50, help='Messages per second per channel')
+    args = parser.parse_args()
+
+    threading.stack_size(256 * 1024)
+    broker = InProcessBroker()
+    expected = args.messages * args.subscribers
+    latencies = []
+    received = [0]
+    stats_lock = threading.Lock()
+    ready = threading.Barrier(args.subscribers + 1)
+
+    def subscriber(channel_id):
+        subscription = broker.subscribe(channel_id, max_pending=1024)
+        ready.wait()
+        local = []
+        while True:
+            events = subscription.get(5)
+            if not events:
+                break
+            now = time.perf_counter()
+            local.extend(now - event['sent'] for event in events)
+            if len(local) >= args.messages:
+                break
+        with stats_lock:
+            latencies.extend(local)
+            received[0] += len(local)
+        broker.unsubscribe(subscription)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=subscriber, args=(i % args.channels,), daemon=True)
+               for i in range(args.subscribers)]
+    for thread in threads:
+        thread.start()
+    ready.wait()
+    print(f"{broker.subscriber_count()} subscribers on {args.channels} channels "
+          f"(connected in {time.perf_counter() - started:.2f}s)")
+
+    interval = 1 / args.rate
+    publish_started = time.perf_counter()
+    for i in range(args.messages):
+        for channel_id in range(args.channels):
+            broker.publish([(channel_id, {'id': i, 'sent': time.perf_counter()})])
+        time.sleep(max(0, publish_started + (i + 1) * interval - time.perf_counter()))
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - publish_started
+
+    latencies.sort()
+    print(f"Delivered {received[0]}/{expected} events in {elapsed:.2f}s "
+          f"({received[0] / elapsed:,.0f} deliveries/s)")
+    if latencies:
+        print(f"Publish to receive latency: median {statistics.median(latencies) * 1000:.2f}ms, "
+              f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.2f}ms, max {latencies[-1] * 1000:.2f}ms")
@@ -0,0 +1,228 @@
+import os
+import time
+import logging
+import threading
+
+from sqlalchemy import event, inspect
+
+logger = logging.getLogger('club_counters')
+
+COUNTERS = ('member_count', 'project_count', 'active_assignment_count', 'post_count')
+
+
+class ClubCounterService:
+    """
+    Keeps the counter columns on Club (memberships, member projects, active
+    assignments, posts) current so club stats and search read them from the
+    club row instead of counting on every request.
+
+    Counters are adjusted from mapper events with `counter = counter + n`
+    UPDATEs on the flush's own connection. They commit or roll back with
+    the write that caused them, and concurrent writers serialise on the club
+    row instead of overwriting each other's counts.
+
+    The leader's sites are counted once, when the club is created; the
+    leader's own membership row (added as co-leader on every new club)
+    does not change project_count.
+
+    Bulk Query.delete() calls, raw SQL, leader changes and sites moving
+    between owners are not seen incrementally. A reconciliation pass every
+    CLUB_COUNTER_RECONCILE_INTERVAL seconds recounts every club and fixes
+    the rows that drifted. Code that bulk-deletes club rows can call
+    reconcile(club_ids) after committing.
+    """
+
+    def __init__(self):
+        self.interval = int(os.environ.get('CLUB_COUNTER_RECONCILE_INTERVAL', 3600))  # seconds
+        self.batch_size = 500
+
+        self._app = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._events_registered = False
+
+    def start(self, app):
+        """Start the reconciliation thread for the given Flask app (idempotent)."""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._app = app
+            self._thread = threading.Thread(target=self._run, name='club-counters', daemon=True)
+            self._thread.start()
+        logger.info("Club counter reconciliation started")
+
+    def _run(self):
+        while True:
+            try:
+                with self._app.app_context():
+                    fixed = self.reconcile()
+                if fixed:
+                    logger.warning(f"Corrected drifted counters on {fixed} clubs")
+            except Exception as e:
+                logger.error(f"Club counter reconciliation failed: {str(e)}")
+            time.sleep(self.interval)
+
+    # Reconciliation
+
+    def _counts_query(self, club_ids=None):
+        from models import db, Club, ClubMembership, ClubAssignment, ClubPost, Site
+
+        member_ids = db.select(ClubMembership.user_id).where(ClubMembership.club_id == Club.id)
+        query = db.select(
+            Club.id,
+            Club.member_count, Club.project_count, Club.active_assignment_count, Club.post_count,
+            db.select(db.func.count(ClubMembership.id))
+            .where(ClubMembership.club_id == Club.id).scalar_subquery(),
+            db.select(db.func.count(Site.id))
+            .where(db.or_(Site.user_id == Club.leader_id, Site.user_id.in_(member_ids))).scalar_subquery(),
+            db.select(db.func.count(ClubAssignment.id))
+            .where(ClubAssignment.club_id == Club.id, ClubAssignment.is_active == True).scalar_subquery(),
+            db.select(db.func.count(ClubPost.id))
+            .where(ClubPost.club_id == Club.id).scalar_subquery()
+        ).order_by(Club.id)
+        if club_ids is not None:
+            query = query.where(Club.id.in_(list(club_ids)))
+        return query
+
+    def reconcile(self, club_ids=None):
+        """
+        Recount the given clubs (default: all of them, in id batches) and write
+        back the ones whose counters drifted. Returns the number corrected.
+
+        Each batch of club rows is locked before counting. Incremental bumps
+        commit together with an UPDATE of the club row, so once the lock is
+        held the counts include every committed bump, and no new one can
+        commit before the corrected values are written.
+        """
+        from models import db, Club
+
+        if club_ids is not None:
+            club_ids = list(club_ids)
+            if not club_ids:
+                return 0
+        last_id = 0
+        fixed = 0
+        while True:
+            batch = db.select(Club.id).order_by(Club.id).with_for_update()
+            if club_ids is None:
+                batch = batch.where(Club.id > last_id).limit(self.batch_size)
+            else:
+                batch = batch.where(Club.id.in_(club_ids))
+            locked = [row[0] for row in db.session.execute(batch)]
+            if not locked:
+                db.session.commit()
+                break
+            rows = db.session.execute(self._counts_query(locked)).all()
+
+            changes = []
+            for club_id, *values in rows:
+                stored, actual = values[:len(COUNTERS)], values[len(COUNTERS):]
+                if list(stored) != list(actual):
+                    changes.append(dict(zip(COUNTERS, actual), id=club_id))
+            if changes:
+                db.session.execute(db.update(Club), changes)
+            db.session.commit()
+            fixed += len(changes)
+
+            if club_ids is not None:
+                break
+            last_id = locked[-1]
+        return fixed
+
+    def clubs_of_user(self, user_id):
+        """Ids of the clubs a user leads or belongs to, for reconcile() after a bulk delete."""
+        from models import db, Club, ClubMembership
+
+        return [row[0] for row in db.session.execute(db.union(
+            db.select(ClubMembership.club_id).where(ClubMembership.user_id == user_id),
+            db.select(Club.id).where(Club.leader_id == user_id)
+        ))]
+
+    # Incremental updates
+
+    def register_events(self):
+        """Attach the counter updates to the club models' flush events (idempotent)."""
+        from models import db, Club, ClubMembership, ClubAssignment, ClubPost, Site
+
+        with self._lock:
+            if self._events_registered:
+                return
+            self._events_registered = True
+
+        def bump(connection, club_filter, **deltas):
+            values = {name: getattr(Club, name) + delta for name, delta in deltas.items() if delta}
+            if values:
+                connection.execute(db.update(Club.__table__).where(club_filter).values(**values))
+
+        def sites_of(user_id):
+            return db.select(db.func.count(Site.id)).where(Site.user_id == user_id).scalar_subquery()
+
+        def member_sites(user_id):
+            # The leader's sites are already counted through Club.leader_id
+            return db.case((Club.leader_id == user_id, 0), else_=sites_of(user_id))
+
+        def clubs_of(user_id):
+            return db.union(
+                db.select(ClubMembership.club_id).where(ClubMembership.user_id == user_id),
+                db.select(Club.id).where(Club.leader_id == user_id)
+            )
+
+        @event.listens_for(Club, 'before_insert')
+        def club_created(mapper, connection, target):
+            target.member_count = 0
+            target.active_assignment_count = 0
+            target.post_count = 0
+            target.project_count = connection.execute(
+                db.select(db.func.count(Site.id)).where(Site.user_id == target.leader_id)).scalar() or 0
+
+        @event.listens_for(ClubMembership, 'after_insert')
+        def member_added(mapper, connection, target):
+            connection.execute(db.update(Club.__table__).where(Club.id == target.club_id).values(
+                member_count=Club.member_count + 1,
+                project_count=Club.project_count + member_sites(target.user_id)))
+
+        @event.listens_for(ClubMembership, 'after_delete')
+        def member_removed(mapper, connection, target):
+            connection.execute(db.update(Club.__table__).where(Club.id == target.club_id).values(
+                member_count=Club.member_count - 1,
+                project_count=Club.project_count - member_sites(target.user_id)))
+
+        @event.listens_for(Site, 'after_insert')
+        def site_added(mapper, connection, target):
+            bump(connection, Club.id.in_(clubs_of(target.user_id)), project_count=1)
+
+        @event.listens_for(Site, 'after_delete')
+        def site_removed(mapper, connection, target):
+            bump(connection, Club.id.in_(clubs_of(target.user_id)), project_count=-1)
+
+        def is_active(value):
+            # A new assignment is active unless created otherwise (the column defaults to True)
+            return value is not False
+
+        @event.listens_for(ClubAssignment, 'after_insert')
+        def assignment_added(mapper, connection, target):
+            bump(connection, Club.id == target.club_id, active_assignment_count=int(is_active(target.is_active)))
+
+        @event.listens_for(ClubAssignment, 'after_delete')
+        def assignment_removed(mapper, connection, target):
+            bump(connection, Club.id == target.club_id, active_assignment_count=-int(is_active(target.is_active)))
+
+        @event.listens_for(ClubAssignment, 'after_update')
+        def assignment_changed(mapper, connection, target):
+            history = inspect(target).attrs.is_active.history
+            if not history.has_changes():
+                return
+            was_active = is_active(history.deleted[0]) if history.deleted else is_active(None)
+            delta = int(is_active(target.is_active)) - int(was_active)
+            bump(connection, Club.id == target.club_id, active_assignment_count=delta)
+
+        @event.listens_for(ClubPost, 'after_insert')
+        def post_added(mapper, connection, target):
+            bump(connection, Club.id == target.club_id, post_count=1)
+
+        @event.listens_for(ClubPost, 'after_delete')
+        def post_removed(mapper, connection, target):
+            bump(connection, Club.id == target.club_id, post_count=-1)
+
+
+club_counter_service = ClubCounterService()
@@ -0,0 +1,407 @@
+import os
+import json
+import time
+import base64
+import hashlib
+import logging
+import threading
+from datetime import datetime
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+
+logger = logging.getLogger('club_dashboard')
+
+CLUB_FEED_PAGE_SIZE = 20
+MAX_CLUB_FEED_PAGE_SIZE = 50
+
+SECTIONS = ('stats', 'posts', 'assignments', 'resources', 'meetings', 'projects', 'hackatime')
+# Site columns shown in the projects section; other site writes leave the dashboard alone
+SITE_DASHBOARD_FIELDS = ('name', 'slug', 'user_id', 'updated_at')
+
+
+def encode_feed_cursor(post):
+    raw = f"{post.created_at.isoformat()}|{post.id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_feed_cursor(cursor):
+    """Return (created_at, id) from a club feed cursor, or None if it is malformed."""
+    try:
+        created_at, post_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split('|')
+        return datetime.fromisoformat(created_at), int(post_id)
+    except (ValueError, UnicodeError):
+        return None
+
+
+def section_version(data):
+    """Content hash of a section, identical across processes and rebuilds of the same data."""
+    raw = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:12]
+
+
+class ClubDashboardService:
+    """
+    Builds the club dashboard's sections, each with one set-based query, and
+    caches them per club.
+
+    Every section has the same shape as the standalone endpoint that serves
+    it (/api/clubs/<id>/assignments and so on), and those endpoints read
+    from this cache too. A section carries a version, the hash of its
+    content, so a client that already holds a version gets only the sections
+    that changed.
+
+    Cached sections are dropped when SQLAlchemy flushes a write to a model
+    they show; the invalidation is applied once the transaction commits.
+    Bulk Query.update()/delete() calls and writes from other workers do not
+    fire those events, so entries also expire after CLUB_DASHBOARD_CACHE_TTL
+    seconds.
+    """
+
+    def __init__(self):
+        self.ttl = int(os.environ.get('CLUB_DASHBOARD_CACHE_TTL', 300))  # seconds
+
+        self._lock = threading.Lock()
+        self._cache = {}  # (club id, section) -> (built at, version, data)
+        self._generations = {}  # (club id, section) -> invalidation count
+        self._events_registered = False
+        self._builders = {
+            'stats': self._build_stats,
+            'posts': self._build_posts,
+            'assignments': self._build_assignments,
+            'resources': self._build_resources,
+            'meetings': self._build_meetings,
+            'projects': self._build_projects,
+            'hackatime': self._build_hackatime,
+        }
+
+    # Cache
+
+    def section(self, club, name):
+        """Return (version, data) for one section of a club, from the cache when it is fresh."""
+        self._register_events()
+        key = (club.id, name)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached and time.time() - cached[0] < self.ttl:
+                return cached[1], cached[2]
+            generation = self._generations.get(key, 0)
+
+        data = self._builders[name](club)
+        version = section_version(data)
+        with self._lock:
+            # Only cache it if nothing invalidated the section while it was being built
+            if self._generations.get(key, 0) == generation:
+                self._cache[key] = (time.time(), version, data)
+        return version, data
+
+    def cached_version(self, club_id, name):
+        """The version of a cached, fresh section, or None; never touches the database."""
+        with self._lock:
+            cached = self._cache.get((club_id, name))
+            if cached and time.time() - cached[0] < self.ttl:
+                return cached[1]
+        return None
+
+    def sections(self, club, names):
+        return {name: self.section(club, name) for name in names}
+
+    def invalidate(self, club_id, names=SECTIONS):
+        with self._lock:
+            for name in names:
+                key = (club_id, name)
+                self._cache.pop(key, None)
+                self._generations[key] = self._generations.get(key, 0) + 1
+
+    # Sections
+
+    def _member_ids(self, club):
+        """Select of the user ids in a club, the leader included."""
+        from models import db, ClubMembership
+
+        return db.union(
+            db.select(ClubMembership.user_id).where(ClubMembership.club_id == club.id),
+            db.select(db.literal(club.leader_id))
+        )
+
+    def _build_stats(self, club):
+        # Counter columns kept by club_counter_service; the club row is already loaded
+        return {
+            'member_count': club.member_count + 1,  # +1 for the leader
+            'active_assignments': club.active_assignment_count,
+            'project_count': club.project_count,
+            'post_count': club.post_count
+        }
+
+    def _build_posts(self, club):
+        posts, next_cursor = self.feed_page(club.id)
+        return {'posts': posts, 'has_more': next_cursor is not None, 'next_cursor': next_cursor}
+
+    def _build_assignments(self, club):
+        from models import db, ClubAssignment, User
+
+        rows = db.session.query(ClubAssignment, User.username) \
+            .join(User, ClubAssignment.created_by == User.id) \
+            .filter(ClubAssignment.club_id == club.id) \
+            .order_by(ClubAssignment.created_at.desc()).all()
+        return {'assignments': [{
+            'id': assignment.id,
+            'title': assignment.title,
+            'description': assignment.description,
+            'due_date': assignment.due_date.isoformat() if assignment.due_date else None,
+            'created_at': assignment.created_at.isoformat(),
+            'is_active': assignment.is_active,
+            'creator': {
+                'id': assignment.created_by,
+                'username': username
+            }
+        } for assignment, username in rows]}
+
+    def _build_resources(self, club):
+        from models import db, ClubResource, User
+
+        rows = db.session.query(ClubResource, User.username) \
+            .join(User, ClubResource.created_by == User.id) \
+            .filter(ClubResource.club_id == club.id) \
+            .order_by(ClubResource.created_at.desc()).all()
+        return {'resources': [{
+            'id': resource.id,
+            'title': resource.title,
+            'url': resource.url,
+            'description': resource.description,
+            'icon': resource.icon,
+            'created_at': resource.created_at.isoformat(),
+            'creator': {
+                'id': resource.created_by,
+                'username': username
+            }
+        } for resource, username in rows]}
+
+    def _build_meetings(self, club):
+        from models import db, ClubMeeting, User
+
+        rows = db.session.query(ClubMeeting, User.username) \
+            .join(User, ClubMeeting.created_by == User.id) \
+            .filter(ClubMeeting.club_id == club.id) \
+            .order_by(ClubMeeting.meeting_date, ClubMeeting.start_time).all()
+        return {'meetings': [{
+            'id': meeting.id,
+            'title': meeting.title,
+            'description': meeting.description,
+            'meeting_date': meeting.meeting_date.isoformat(),
+            'start_time': meeting.start_time.strftime('%H:%M'),
+            'end_time': meeting.end_time.strftime('%H:%M') if meeting.end_time else None,
+            'location': meeting.location,
+            'meeting_link': meeting.meeting_link,
+            'created_at': meeting.created_at.isoformat(),
+            'creator': {
+                'id': meeting.created_by,
+                'username': username
+            }
+        } for meeting, username in rows]}
+
+    def _build_projects(self, club):
+        from models import db, Site, User, ClubFeaturedProject
+
+        rows = db.session.query(Site.id, Site.name, Site.slug, Site.updated_at, Site.created_at,
+                                User.id, User.username) \
+            .join(User, Site.user_id == User.id) \
+            .filter(Site.user_id.in_(self._member_ids(club))) \
+            .all()
+        featured = {row[0] for row in db.session.query(ClubFeaturedProject.site_id)
+                    .filter(ClubFeaturedProject.club_id == club.id)}
+        return {'projects': [{
+            'id': site_id,
+            'name': name,
+            'slug': slug,
+            'description': '',  # Sites don't have descriptions in current schema
+            'owner': {
+                'id': user_id,
+                'username': username
+            },
+            'featured': site_id in featured,
+            'updated_at': updated_at.isoformat(),
+            'created_at': created_at.isoformat()
+        } for site_id, name, slug, updated_at, created_at, user_id, username in rows]}
+
+    def _build_hackatime(self, club):
+        from models import db, User, ClubMembership, HackatimeSnapshot
+        from hackatime_sync_service import hackatime_sync_service
+        from routes.hackatime_routes import get_empty_hackatime_summary
+
+        # Load the leader and every member together with their stored snapshot
+        rows = (db.session.query(User, HackatimeSnapshot, ClubMembership.role)
+                .outerjoin(ClubMembership, db.and_(ClubMembership.user_id == User.id,
+                                                   ClubMembership.club_id == club.id))
+                .outerjoin(HackatimeSnapshot, HackatimeSnapshot.user_id == User.id)
+                .filter(db.or_(User.id == club.leader_id, ClubMembership.id.isnot(None)))
+                .filter(User.wakatime_api_key.isnot(None))
+                .all())
+
+        # Leader first, then members in join order
+        rows.sort(key=lambda row: row[0].id != club.leader_id)
+
+        members = []
+        seen = set()
+        for member, snapshot, role in rows:
+            if member.id in seen:
+                continue
+            seen.add(member.id)
+            if snapshot:
+                member_stats = snapshot.to_summary()
+            else:
+                # Not synced yet - serve an empty summary and queue the user
+                member_stats = get_empty_hackatime_summary()
+                member_stats['pending_sync'] = True
+                hackatime_sync_service.request_sync(member.id)
+            members.append({
+                'id': member.id,
+                'username': member.username,
+                'role': 'Club Leader' if member.id == club.leader_id else role.capitalize(),
+                'avatar': member.avatar,
+                'stats': member_stats
+            })
+        return {'members': members}
+
+    # Feed
+
+    def feed_page(self, club_id, cursor=None, limit=None):
+        """
+        Return (posts, next_cursor) for a club's feed, newest first, paged by
+        keyset on (created_at, id). Like counts come from the ClubPost.likes
+        counter; user_liked is left to liked_post_ids since it is per viewer.
+        An invalid cursor raises ValueError.
+        """
+        from models import db, ClubPost, User
+
+        limit = min(max(limit or CLUB_FEED_PAGE_SIZE, 1), MAX_CLUB_FEED_PAGE_SIZE)
+        query = db.session.query(ClubPost, User.username).join(User, ClubPost.user_id == User.id) \
+            .filter(ClubPost.club_id == club_id)
+
+        if cursor:
+            position = decode_feed_cursor(cursor)
+            if position is None:
+                raise ValueError('Invalid cursor')
+            created_at, post_id = position
+            query = query.filter(db.or_(
+                ClubPost.created_at < created_at,
+                db.and_(ClubPost.created_at == created_at, ClubPost.id < post_id)
+            ))
+
+        rows = query.order_by(ClubPost.created_at.desc(), ClubPost.id.desc()).limit(limit + 1).all()
+        next_cursor = encode_feed_cursor(rows[limit - 1][0]) if len(rows) > limit else None
+        posts = [{
+            'id': post.id,
+            'content': post.content,
+            'created_at': post.created_at.isoformat(),
+            'updated_at': post.updated_at.isoformat(),
+            'likes': post.likes or 0,
+            'user': {
+                'id': post.user_id,
+                'username': username
+            }
+        } for post, username in rows[:limit]]
+        return posts, next_cursor
+
+    def liked_post_ids(self, user_id, post_ids):
+        """The subset of post_ids the user has liked, in one query."""
+        from models import db, ClubPostLike
+
+        if not post_ids:
+            return set()
+        return {row[0] for row in db.session.query(ClubPostLike.post_id).filter(
+            ClubPostLike.user_id == user_id,
+            ClubPostLike.post_id.in_(list(post_ids)))}
+
+    def with_viewer(self, name, data, user_id):
+        """Add the per-viewer fields a shared, cached section leaves out."""
+        if name != 'posts':
+            return data
+        liked = self.liked_post_ids(user_id, [post['id'] for post in data['posts']])
+        return dict(data, posts=[dict(post, user_liked=post['id'] in liked) for post in data['posts']])
+
+    # Invalidation
+
+    def _register_events(self):
+        from models import (ClubPost, ClubPostLike, ClubAssignment, ClubResource, ClubMeeting,
+                            ClubMembership, ClubFeaturedProject, Site, HackatimeSnapshot)
+
+        with self._lock:
+            if self._events_registered:
+                return
+            self._events_registered = True
+
+        def mark(target, club_ids, names):
+            session = object_session(target)
+            if session is None:
+                return
+            pending = session.info.setdefault('club_dashboard_pending', {})
+            for club_id in club_ids:
+                pending.setdefault(club_id, set()).update(names)
+
+        def clubs_of_user(connection, user_id):
+            from models import db, Club
+
+            if user_id is None:
+                return []
+            return [row[0] for row in connection.execute(db.union(
+                db.select(ClubMembership.club_id).where(ClubMembership.user_id == user_id),
+                db.select(Club.id).where(Club.leader_id == user_id)
+            ))]
+
+        def club_sections(model, names):
+            def on_write(mapper, connection, target):
+                mark(target, [target.club_id], names)
+            for name in ('after_insert', 'after_update', 'after_delete'):
+                event.listen(model, name, on_write)
+
+        def user_sections(model, names, fields=None):
+            def on_write(mapper, connection, target):
+                # An owner change moves the row between clubs; both sides need refreshing
+                user_ids = {target.user_id, *(inspect(target).attrs.user_id.history.deleted or ())}
+                club_ids = set()
+                for user_id in user_ids:
+                    club_ids.update(clubs_of_user(connection, user_id))
+                mark(target, club_ids, names)
+
+            def on_update(mapper, connection, target):
+                state = inspect(target)
+                if fields and not any(state.attrs[field].history.has_changes() for field in fields):
+                    return
+                on_write(mapper, connection, target)
+
+            event.listen(model, 'after_insert', on_write)
+            event.listen(model, 'after_update', on_update)
+            event.listen(model, 'after_delete', on_write)
+
+        def on_like(mapper, connection, target):
+            club_id = connection.execute(
+                ClubPost.__table__.select().with_only_columns(ClubPost.club_id)
+                .where(ClubPost.id == target.post_id)).scalar()
+            if club_id is not None:
+                mark(target, [club_id], ('posts',))
+
+        club_sections(ClubPost, ('posts', 'stats'))
+        club_sections(ClubAssignment, ('assignments', 'stats'))
+        club_sections(ClubResource, ('resources',))
+        club_sections(ClubMeeting, ('meetings',))
+        club_sections(ClubMembership, ('stats', 'projects', 'hackatime'))
+        club_sections(ClubFeaturedProject, ('projects',))
+        user_sections(Site, ('projects', 'stats'), fields=SITE_DASHBOARD_FIELDS)
+        user_sections(HackatimeSnapshot, ('hackatime',))
+        event.listen(ClubPostLike, 'after_insert', on_like)
+        event.listen(ClubPostLike, 'after_delete', on_like)
+
+        def on_commit(session):
+            pending = session.info.pop('club_dashboard_pending', None)
+            for club_id, names in (pending or {}).items():
+                self.invalidate(club_id, names)
+
+        def on_rollback(session, previous_transaction):
+            session.info.pop('club_dashboard_pending', None)
+
+        event.listen(Session, 'after_commit', on_commit)
+        event.listen(Session, 'after_soft_rollback', on_rollback)
+
+
+club_dashboard_service = ClubDashboardService()
@@ -0,0 +1,269 @@
+import logging
+from decimal import Decimal, InvalidOperation
+
+from sqlalchemy.orm.attributes import set_committed_value
+
+logger = logging.getLogger('club_ledger')
+
+ENTRY_TYPES = ('grant', 'adjustment', 'spend')
+CLUB_LEDGER_PAGE_SIZE = 50
+MAX_CLUB_LEDGER_PAGE_SIZE = 200
+MAX_AMOUNT = Decimal('99999999.99')  # Numeric(10, 2)
+CENT = Decimal('0.01')
+
+
+class InsufficientBalanceError(ValueError):
+    pass
+
+
+def parse_amount(value):
+    """Parse a money amount into a Decimal rounded to cents, raising ValueError when invalid."""
+    try:
+        amount = Decimal(str(value)).quantize(CENT)
+    except (InvalidOperation, TypeError):
+        raise ValueError('Invalid amount')
+    if not amount.is_finite() or abs(amount) > MAX_AMOUNT:
+        raise ValueError('Invalid amount')
+    return amount
+
+
+class ClubLedgerService:
+    """
+    Club balances as an append-only ledger: every grant, adjustment and
+    spend is a ClubBalanceEntry, and Club.balance is the materialized
+    running sum of a club's entries.
+
+    An entry is posted with one relative UPDATE on the club row
+    (balance = balance + amount, guarded against going negative for
+    spends) whose RETURNING value becomes the entry's balance_after. The
+    row lock that UPDATE takes is held until the caller commits, so
+    concurrent posts to the same club serialise on the row: none is lost,
+    and in id order every entry's balance_after is the previous one plus
+    its amount.
+
+    post() and set_balance() only flush; the caller commits, so an entry
+    is recorded together with the change that caused it.
+    """
+
+    def post(self, club_id, entry_type, amount, created_by=None, description=None, reference=None):
+        """
+        Append an entry and apply it to the club's balance. Grants and
+        spends take a positive amount (spends are stored negative);
+        adjustments are signed. Raises InsufficientBalanceError when a
+        spend exceeds the balance, ValueError for anything else invalid.
+        """
+        from models import db, Club, ClubBalanceEntry
+
+        if entry_type not in ENTRY_TYPES:
+            raise ValueError(f"Entry type must be one of: {', '.join(ENTRY_TYPES)}")
+        amount = parse_amount(amount)
+        if entry_type == 'adjustment':
+            if amount == 0:
+                raise ValueError('Adjustment amount cannot be zero')
+        elif amount <= 0:
+            raise ValueError('Amount must be positive')
+        elif entry_type == 'spend':
+            amount = -amount
+
+        club_table = Club.__table__
+        update = db.update(club_table).where(club_table.c.id == club_id) \
+            .values(balance=club_table.c.balance + amount) \
+            .returning(club_table.c.balance)
+        if amount < 0:
+            update = update.where(club_table.c.balance + amount >= 0)
+        balance = db.session.execute(update).scalar()
+
+        if balance is None:
+            if db.session.get(Club, club_id) is None:
+                raise ValueError('Club not found')
+            raise InsufficientBalanceError('Insufficient club balance')
+
+        # Keep a club already loaded in this session in step without reloading it
+        club = db.session.identity_map.get(db.session.identity_key(Club, club_id))
+        if club is not None:
+            set_committed_value(club, 'balance', balance)
+
+        entry = ClubBalanceEntry(
+            club_id=club_id,
+            entry_type=entry_type,
+            amount=amount,
+            balance_after=balance,
+            description=description,
+            reference=reference,
+            created_by=created_by
+        )
+        db.session.add(entry)
+        db.session.flush()
+        return entry
+
+    def set_balance(self, club_id, balance, created_by=None, description=None):
+        """
+        Bring a club's balance to an exact figure with an adjustment for the
+        difference, computed under the club row's lock. Returns the entry,
+        or None when the balance already matches.
+        """
+        from models import db, Club
+
+        balance = parse_amount(balance)
+        if balance < 0:
+            raise ValueError('Balance cannot be negative')
+        club_table = Club.__table__
+        current = db.session.execute(
+            db.select(club_table.c.balance).where(club_table.c.id == club_id).with_for_update()
+        ).scalar()
+        if current is None:
+            raise ValueError('Club not found')
+        difference = balance - Decimal(current)
+        if difference == 0:
+            return None
+        return self.post(club_id, 'adjustment', difference, created_by=created_by,
+                         description=description or f'Balance set to ${balance:.2f}')
+
+    def history(self, club_id, cursor=None, limit=None):
+        """
+        One page of a club's entries, newest first, and the cursor for the
+        next page (None on the last page). Keyset on the entry id, which the
+        (club_id, id) index serves directly.
+        """
+        from models import db, ClubBalanceEntry, User
+
+        limit = min(max(limit or CLUB_LEDGER_PAGE_SIZE, 1), MAX_CLUB_LEDGER_PAGE_SIZE)
+        query = db.session.query(ClubBalanceEntry, User.username) \
+            .outerjoin(User, ClubBalanceEntry.created_by == User.id) \
+            .filter(ClubBalanceEntry.club_id == club_id)
+        if cursor:
+            try:
+                query = query.filter(ClubBalanceEntry.id < int(cursor))
+            except ValueError:
+                raise ValueError('Invalid cursor')
+
+        rows = query.order_by(ClubBalanceEntry.id.desc()).limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        entries = [{
+            'id': entry.id,
+            'type': entry.entry_type,
+            'amount': float(entry.amount),
+            'balance_after': float(entry.balance_after),
+            'description': entry.description,
+            'reference': entry.reference,
+            'created_at': entry.created_at.isoformat(),
+            'created_by': {'id': entry.created_by, 'username': username} if entry.created_by else None
+        } for entry, username in rows]
+        return entries, str(rows[-1][0].id) if has_more else None
+
+    def audit(self, club_id):
+        """
+        Compare a club's balance with its ledger. Returns (balance, sum of
+        entries, balance_after of the latest entry); all three agree for a
+        consistent club.
+        """
+        from models import db, Club, ClubBalanceEntry
+
+        balance = db.session.query(Club.balance).filter(Club.id == club_id).scalar()
+        total = db.session.query(db.func.coalesce(db.func.sum(ClubBalanceEntry.amount), 0)) \
+            .filter(ClubBalanceEntry.club_id == club_id).scalar()
+        latest = db.session.query(ClubBalanceEntry.balance_after) \
+            .filter(ClubBalanceEntry.club_id == club_id) \
+            .order_by(ClubBalanceEntry.id.desc()).limit(1).scalar()
+        return Decimal(balance), Decimal(total).quantize(CENT), Decimal(latest if latest is not None else 0)
+
+
+club_ledger_service = ClubLedgerService()
+
+
+if __name__ == '__main__':
+    # Concurrency stress test against the configured DATABASE_URL: many
+    # threads grant and spend on one club at once, then the balance, the
+    # ledger sum and the chain of balance_after values must all agree.
+    #   python club_ledger_service.py --threads 16 --operations 200
+    import random
+    import argparse
+    import threading
+    import time
+
+    from sqlalchemy.exc import OperationalError
+
+    parser = argparse.ArgumentParser(description='Stress test concurrent club ledger posts')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--operations', type=int, default=200, help='Posts per thread')
+    args = parser.parse_args()
+
+    from app import app
+    from models import db, User, Club, ClubBalanceEntry
+
+    with app.app_context():
+        db.create_all()
+        suffix = f'{int(time.time())}-{random.randint(0, 9999)}'
+        user = User(username=f'ledger-test-{suffix}', email=f'ledger-test-{suffix}@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.flush()
+        club = Club(name=f'Ledger test {suffix}', leader_id=user.id)
+        db.session.add(club)
+        db.session.commit()
+        club_id, user_id = club.id, user.id
+
+    expected = [Decimal(0)]
+    outcomes = {'posted': 0, 'insufficient': 0, 'retried': 0}
+    stats_lock = threading.Lock()
+    start = threading.Barrier(args.threads)
+
+    def worker(seed):
+        rng = random.Random(seed)
+        with app.app_context():
+            start.wait()
+            for _ in range(args.operations):
+                entry_type = rng.choice(('grant', 'spend', 'spend'))
+                amount = Decimal(rng.randint(1, 2000)) / 100
+                while True:
+                    try:
+                        club_ledger_service.post(club_id, entry_type, amount, created_by=user_id)
+                        db.session.commit()
+                        delta, outcome = (amount if entry_type == 'grant' else -amount), 'posted'
+                    except InsufficientBalanceError:
+                        db.session.rollback()
+                        delta, outcome = 0, 'insufficient'
+                    except OperationalError:
+                        # SQLite reports lock timeouts instead of waiting for the writer
+                        db.session.rollback()
+                        with stats_lock:
+                            outcomes['retried'] += 1
+                        continue
+                    break
+                with stats_lock:
+                    expected[0] += delta
+                    outcomes[outcome] += 1
+            db.session.remove()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        balance, total, latest = club_ledger_service.audit(club_id)
+        entries = db.session.query(ClubBalanceEntry.amount, ClubBalanceEntry.balance_after) \
+            .filter(ClubBalanceEntry.club_id == club_id).order_by(ClubBalanceEntry.id).all()
+        running = Decimal(0)
+        broken = 0
+        for amount, balance_after in entries:
+            running += amount
+            if running != balance_after or balance_after < 0:
+                broken += 1
+
+        print(f"{outcomes['posted']} entries posted, {outcomes['insufficient']} spends refused, "
+              f"{outcomes['retried']} retries, {elapsed:.2f}s "
+              f"({outcomes['posted'] / elapsed:,.0f} posts/s)")
+        print(f"Expected balance {expected[0]:.2f}; club balance {balance:.2f}; "
+              f"ledger sum {total:.2f}; latest balance_after {latest:.2f}")
+        ok = balance == total == latest == expected[0] and broken == 0 and len(entries) == outcomes['posted']
+        print('OK: no lost updates' if ok else f'FAILED: {broken} entries out of sequence')
+
+        ClubBalanceEntry.query.filter_by(club_id=club_id).delete()
+        Club.query.filter_by(id=club_id).delete()
+        User.query.filter_by(id=user_id).delete()
+        db.session.commit()
+        raise SystemExit(0 if ok else 1)
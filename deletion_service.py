@@ -0,0 +1,524 @@
+import os
+import time
+import uuid
+import queue
+import logging
+import threading
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+logger = logging.getLogger('deletion')
+
+ACTIVE_STATUSES = ('queued', 'running')
+KINDS = ('user', 'club', 'sites')
+
+# One set-based step of a deletion: rows of `table` matching `condition` are
+# deleted, or updated with `values`, `key` column values at a time.
+# on_chunk(keys) runs after each chunk.
+DeletionStep = namedtuple('DeletionStep', 'label table condition values key on_chunk')
+
+
+def step(label, table, condition, values=None, key=None, on_chunk=None):
+    return DeletionStep(label, table, condition, values, key if key is not None else table.c.id, on_chunk)
+
+
+class DeletionService:
+    """
+    Deletes users, clubs and sites together with every row that depends on
+    them, as a sequence of set-based steps run in bounded chunks.
+
+    Each step selects up to DELETION_CHUNK_SIZE keys of one table and
+    deletes (or, for rows that outlive the deletion, updates) them with a
+    single statement. The plan lists children before parents, so no
+    statement ever trips a foreign key, and every step is idempotent: a
+    job interrupted half way is simply run again.
+
+    - Deletions of at most DELETION_SYNC_THRESHOLD rows run inside the
+      request in one transaction, as before.
+    - Larger ones become a DeletionJob run by a background thread. It
+      commits after every chunk, together with the job's progress, so
+      locks are held for one chunk at a time and other writers get in
+      between chunks.
+    - While a job runs, its process refreshes heartbeat_at every
+      DELETION_HEARTBEAT_INTERVAL seconds. Every process sweeps at the
+      same interval: running jobs without a heartbeat for
+      DELETION_STALE_AFTER seconds lost their process and go back to
+      queued, and queued jobs are picked up by whichever process claims
+      them first.
+    - While a job is active, the user it deletes is suspended, and the
+      clubs it deletes (the club, or those the user leads) drop out of
+      club_auth and lose their join code, so nobody can add rows the
+      final deletes would trip over. A failed job undoes both.
+    - Bulk deletes skip the ORM events that maintain the club counters,
+      dashboard caches and gallery search index, so the job repairs those
+      itself once it finishes.
+    """
+
+    def __init__(self):
+        self.chunk_size = int(os.environ.get('DELETION_CHUNK_SIZE', 500))
+        self.sync_threshold = int(os.environ.get('DELETION_SYNC_THRESHOLD', 1000))
+        self.chunk_pause = float(os.environ.get('DELETION_CHUNK_PAUSE', 0.05))  # seconds between chunks
+        self.heartbeat_interval = float(os.environ.get('DELETION_HEARTBEAT_INTERVAL', 15))  # seconds
+        self.stale_after = int(os.environ.get('DELETION_STALE_AFTER', 60))  # seconds without a heartbeat
+
+        self._app = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._queue = queue.Queue()
+        self._queued = set()  # job ids in this process's queue
+        self._running = None  # job id this process is running
+
+    def start(self, app):
+        """Start the worker thread for the given Flask app (idempotent) and resume unfinished jobs."""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._app = app
+            self._thread = threading.Thread(target=self._run, name='deletion', daemon=True)
+            self._thread.start()
+            threading.Thread(target=self._heartbeat, name='deletion-heartbeat', daemon=True).start()
+        logger.info("Deletion worker started")
+
+    def _heartbeat(self):
+        while True:
+            try:
+                with self._app.app_context():
+                    self.beat()
+                    self.resume_jobs()
+            except Exception as e:
+                logger.error(f"Deletion heartbeat failed: {str(e)}")
+            time.sleep(self.heartbeat_interval)
+
+    def beat(self):
+        """Mark the job this process is running as still alive."""
+        from models import db, DeletionJob
+
+        job_id = self._running
+        if job_id:
+            DeletionJob.query.filter_by(id=job_id, status='running').update(
+                {'heartbeat_at': datetime.utcnow()}, synchronize_session=False)
+            db.session.commit()
+
+    def resume_jobs(self):
+        """
+        Re-queue running jobs whose process stopped sending heartbeats, and
+        queue every queued job here; their steps are safe to repeat.
+        """
+        from models import db, DeletionJob
+
+        cutoff = datetime.utcnow() - timedelta(seconds=self.stale_after)
+        try:
+            DeletionJob.query.filter(DeletionJob.status == 'running',
+                                     db.or_(DeletionJob.heartbeat_at < cutoff,
+                                            db.and_(DeletionJob.heartbeat_at.is_(None),
+                                                    DeletionJob.started_at < cutoff))).update(
+                {'status': 'queued'}, synchronize_session=False)
+            db.session.commit()
+            for (job_id,) in db.session.query(DeletionJob.id).filter_by(status='queued'):
+                self._put(job_id)
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Failed to resume deletion jobs: {str(e)}")
+
+    # Plans
+
+    def _tables(self):
+        from models import db
+        return db.metadata.tables
+
+    def _site_steps(self, site_ids):
+        """Steps deleting the sites selected by site_ids (a select of site ids) and their dependents."""
+        from models import db
+        from gallery_search_service import gallery_search_service
+
+        t = self._tables()
+        site_page, gallery_entry, gallery_entry_tag = t['site_page'], t['gallery_entry'], t['gallery_entry_tag']
+        entry_ids = db.select(gallery_entry.c.id).where(gallery_entry.c.site_id.in_(site_ids))
+        return [
+            step('site pages', site_page, site_page.c.site_id.in_(site_ids)),
+            step('gallery tags', gallery_entry_tag, gallery_entry_tag.c.entry_id.in_(entry_ids),
+                 key=gallery_entry_tag.c.entry_id),
+            step('gallery entries', gallery_entry, gallery_entry.c.site_id.in_(site_ids),
+                 on_chunk=gallery_search_service.forget),
+            step('featured projects', t['club_featured_project'], t['club_featured_project'].c.site_id.in_(site_ids)),
+            step('GitHub sync jobs', t['github_sync_job'], t['github_sync_job'].c.site_id.in_(site_ids)),
+            step('GitHub repositories', t['github_repo'], t['github_repo'].c.site_id.in_(site_ids)),
+            # Activities stay in the feed, without the link to the deleted site
+            step('site activity', t['user_activity'], t['user_activity'].c.site_id.in_(site_ids),
+                 values={'site_id': None}),
+            step('sites', t['site'], t['site'].c.id.in_(site_ids)),
+        ]
+
+    def _club_steps(self, club_ids):
+        """Steps deleting the clubs in club_ids (a select or list of club ids) and their dependents."""
+        from models import db
+
+        t = self._tables()
+        club_post, club_chat_channel = t['club_post'], t['club_chat_channel']
+        post_ids = db.select(club_post.c.id).where(club_post.c.club_id.in_(club_ids))
+        channel_ids = db.select(club_chat_channel.c.id).where(club_chat_channel.c.club_id.in_(club_ids))
+        steps = [
+            step('post likes', t['club_post_like'], t['club_post_like'].c.post_id.in_(post_ids)),
+            step('posts', club_post, club_post.c.club_id.in_(club_ids)),
+            step('chat messages', t['club_chat_message'], t['club_chat_message'].c.channel_id.in_(channel_ids)),
+            step('chat channels', club_chat_channel, club_chat_channel.c.club_id.in_(club_ids)),
+        ]
+        for label, name in (('assignments', 'club_assignment'), ('resources', 'club_resource'),
+                            ('meetings', 'club_meeting'), ('featured projects', 'club_featured_project'),
+                            ('balance entries', 'club_balance_entry'), ('memberships', 'club_membership')):
+            steps.append(step(label, t[name], t[name].c.club_id.in_(club_ids)))
+        steps.append(step('clubs', t['club'], t['club'].c.id.in_(club_ids)))
+        return steps
+
+    def _user_steps(self, user_id):
+        """Steps deleting a user, the clubs they lead, their sites and everything else they own."""
+        from models import db
+        from gallery_search_service import gallery_search_service
+
+        t = self._tables()
+        club, site, user_upload = t['club'], t['site'], t['user_upload']
+        club_post, club_post_like = t['club_post'], t['club_post_like']
+        gallery_entry, gallery_entry_tag = t['gallery_entry'], t['gallery_entry_tag']
+
+        steps = self._club_steps(db.select(club.c.id).where(club.c.leader_id == user_id))
+        steps += self._site_steps(db.select(site.c.id).where(site.c.user_id == user_id))
+
+        # Their activity in other clubs
+        own_post_ids = db.select(club_post.c.id).where(club_post.c.user_id == user_id)
+        steps += [
+            step('post likes', club_post_like, db.or_(club_post_like.c.user_id == user_id,
+                                                      club_post_like.c.post_id.in_(own_post_ids))),
+            step('posts', club_post, club_post.c.user_id == user_id),
+            step('chat messages', t['club_chat_message'], t['club_chat_message'].c.user_id == user_id),
+            step('memberships', t['club_membership'], t['club_membership'].c.user_id == user_id),
+        ]
+        # Club content they created stays with the club, handed to its leader
+        for label, name, column in (('assignments', 'club_assignment', 'created_by'),
+                                    ('resources', 'club_resource', 'created_by'),
+                                    ('meetings', 'club_meeting', 'created_by'),
+                                    ('chat channels', 'club_chat_channel', 'created_by'),
+                                    ('featured projects', 'club_featured_project', 'featured_by')):
+            table = t[name]
+            leader = db.select(club.c.leader_id).where(club.c.id == table.c.club_id).scalar_subquery()
+            steps.append(step(f'{label} handed to club leaders', table, table.c[column] == user_id,
+                              values={column: leader}))
+        balance_entry = t['club_balance_entry']
+        steps.append(step('balance entry authors', balance_entry, balance_entry.c.created_by == user_id,
+                          values={'created_by': None}))
+
+        # Gallery entries they made for other people's sites, uploads and the rest of their data
+        entry_ids = db.select(gallery_entry.c.id).where(gallery_entry.c.user_id == user_id)
+        image_variant = t['image_variant']
+        own_urls = db.select(user_upload.c.cdn_url).where(user_upload.c.user_id == user_id)
+        shared_urls = db.select(user_upload.c.cdn_url).where(user_upload.c.user_id != user_id)
+        steps += [
+            step('gallery tags', gallery_entry_tag, gallery_entry_tag.c.entry_id.in_(entry_ids),
+                 key=gallery_entry_tag.c.entry_id),
+            step('gallery entries', gallery_entry, gallery_entry.c.user_id == user_id,
+                 on_chunk=gallery_search_service.forget),
+            # Deduplicated uploads can share a URL with another user; keep those variants
+            step('image variants', image_variant, db.and_(image_variant.c.source_url.in_(own_urls),
+                                                          image_variant.c.source_url.not_in(shared_urls))),
+            step('uploads', user_upload, user_upload.c.user_id == user_id),
+        ]
+        for label, name in (('upload sessions', 'cdn_upload_session'), ('Hackatime stats', 'hackatime_daily_stat'),
+                            ('Hackatime snapshots', 'hackatime_snapshot'), ('GitHub sync jobs', 'github_sync_job'),
+                            ('activities', 'user_activity')):
+            steps.append(step(label, t[name], t[name].c.user_id == user_id))
+        steps.append(step('user', t['user'], t['user'].c.id == user_id))
+        return steps
+
+    def plan(self, kind, target_id, params=None):
+        from models import db
+
+        if kind == 'user':
+            return self._user_steps(target_id)
+        if kind == 'club':
+            return self._club_steps([target_id])
+        if kind == 'sites':
+            site = self._tables()['site']
+            site_ids = db.select(site.c.id).where(site.c.id.in_((params or {}).get('site_ids', [])),
+                                                  site.c.user_id == target_id)
+            return self._site_steps(site_ids)
+        raise ValueError(f'Unknown deletion kind: {kind}')
+
+    # Running plans
+
+    def count(self, steps, limit=None):
+        """Rows the plan touches; with a limit, stop counting once the total exceeds it."""
+        from models import db
+
+        total = 0
+        for s in steps:
+            query = self._keys(s)
+            if limit is not None:
+                query = query.limit(limit - total + 1)
+            total += db.session.execute(db.select(db.func.count()).select_from(query.subquery())).scalar()
+            if limit is not None and total > limit:
+                break
+        return total
+
+    def _keys(self, s):
+        from models import db
+
+        query = db.select(s.key).where(s.condition)
+        # Only tables keyed by something other than their own id can repeat a key
+        return query if s.key is s.table.c.get('id') else query.distinct()
+
+    def execute(self, steps, on_chunk=None):
+        """
+        Run the steps in chunks. on_chunk(step, rows) is called after each
+        chunk; without it nothing is committed and the caller's transaction
+        holds the whole deletion. Returns {step label: rows}.
+        """
+        from models import db
+
+        removed = {}
+        for s in steps:
+            updated = set()
+            while True:
+                keys = [row[0] for row in db.session.execute(self._keys(s).limit(self.chunk_size))]
+                if not keys:
+                    break
+                if s.values is None:
+                    statement = db.delete(s.table).where(s.key.in_(keys))
+                else:
+                    # An update must take rows out of its own condition, or this would never end
+                    if updated.intersection(keys):
+                        raise RuntimeError(f'Updating {s.label} did not converge')
+                    updated.update(keys)
+                    statement = db.update(s.table).where(s.key.in_(keys)).values(**s.values)
+                rows = db.session.execute(statement).rowcount
+                removed[s.label] = removed.get(s.label, 0) + rows
+                if s.on_chunk:
+                    s.on_chunk(keys)
+                if on_chunk:
+                    on_chunk(s, rows)
+        return removed
+
+    def _affected_clubs(self, kind, target_id, params):
+        """Surviving clubs whose counters and dashboards the deletion changes."""
+        from models import db, Club
+        from club_counter_service import club_counter_service
+
+        if kind == 'user':
+            led = {row[0] for row in db.session.query(Club.id).filter(Club.leader_id == target_id)}
+            return [club_id for club_id in club_counter_service.clubs_of_user(target_id) if club_id not in led]
+        if kind == 'sites':
+            return club_counter_service.clubs_of_user(target_id)
+        return []
+
+    def _finish(self, affected_clubs, removed):
+        """Repair what the bulk deletes bypassed, after they committed."""
+        from models import db, ClubPost, ClubPostLike
+        from club_counter_service import club_counter_service
+        from club_dashboard_service import club_dashboard_service
+        from hackatime_leaderboard import invalidate_club_leaderboard
+        from gallery_service import gallery_service
+
+        if affected_clubs:
+            # Likes by a deleted user were removed from posts in the clubs they belonged to
+            db.session.execute(db.update(ClubPost.__table__)
+                               .where(ClubPost.__table__.c.club_id.in_(affected_clubs))
+                               .values(likes=db.select(db.func.count(ClubPostLike.id))
+                                       .where(ClubPostLike.post_id == ClubPost.__table__.c.id)
+                                       .scalar_subquery()))
+            db.session.commit()
+        club_counter_service.reconcile(affected_clubs)
+        for club_id in affected_clubs:
+            club_dashboard_service.invalidate(club_id)
+            invalidate_club_leaderboard(club_id)
+        if removed.get('gallery entries') or removed.get('gallery tags'):
+            gallery_service.invalidate_tag_cloud()
+
+    def submit(self, kind, target_id, params=None, requested_by=None):
+        """
+        Delete a user, club or the given sites of a user (params={'site_ids': [...]},
+        target_id is their owner). Small deletions run now and return None;
+        larger ones return the queued DeletionJob, or the one already
+        running for the same target.
+        """
+        from models import db, DeletionJob, User
+
+        if kind not in KINDS:
+            raise ValueError(f'Unknown deletion kind: {kind}')
+        params = dict(params or {})
+        if kind != 'sites':
+            active = DeletionJob.query.filter(DeletionJob.kind == kind, DeletionJob.target_id == target_id,
+                                              DeletionJob.status.in_(ACTIVE_STATUSES)).first()
+            if active:
+                if active.status == 'running' and self._is_stale(active):
+                    # Its process is gone; run it again instead of waiting for the sweep
+                    DeletionJob.query.filter_by(id=active.id, status='running').update(
+                        {'status': 'queued'}, synchronize_session=False)
+                    db.session.commit()
+                    db.session.refresh(active)
+                if active.status == 'queued':
+                    self._enqueue(active.id)
+                return active
+
+        steps = self.plan(kind, target_id, params)
+        affected_clubs = self._affected_clubs(kind, target_id, params)
+        if self.count(steps, limit=self.sync_threshold) <= self.sync_threshold:
+            removed = self.execute(steps)
+            db.session.commit()
+            self._finish(affected_clubs, removed)
+            return None
+
+        params['affected_clubs'] = affected_clubs
+        params['join_codes'] = self._close_clubs(kind, target_id)
+        if kind == 'user':
+            # Keep them from adding content while their data is removed
+            params['was_suspended'] = bool(db.session.query(User.is_suspended)
+                                           .filter(User.id == target_id).scalar())
+            db.session.query(User).filter(User.id == target_id).update(
+                {'is_suspended': True}, synchronize_session=False)
+        job = DeletionJob(id=uuid.uuid4().hex,
+                          kind=kind,
+                          target_id=target_id,
+                          params=params,
+                          requested_by=requested_by,
+                          status='queued')
+        db.session.add(job)
+        db.session.commit()
+
+        self._enqueue(job.id)
+        return job
+
+    def _is_stale(self, job):
+        cutoff = datetime.utcnow() - timedelta(seconds=self.stale_after)
+        return (job.heartbeat_at or job.started_at or job.created_at) < cutoff
+
+    def closed_club_ids(self):
+        """Select of the clubs an active job deletes, directly or with their leader."""
+        from models import db, Club, DeletionJob
+
+        active = DeletionJob.status.in_(ACTIVE_STATUSES)
+        users = db.select(DeletionJob.target_id).where(DeletionJob.kind == 'user', active)
+        return db.union(
+            db.select(DeletionJob.target_id).where(DeletionJob.kind == 'club', active),
+            db.select(Club.id).where(Club.leader_id.in_(users))
+        )
+
+    def _close_clubs(self, kind, target_id):
+        """Disable joining the clubs a job deletes; returns {club id: join code} to restore on failure."""
+        from models import db, Club
+
+        if kind == 'club':
+            query = db.session.query(Club.id, Club.join_code).filter(Club.id == target_id)
+        elif kind == 'user':
+            query = db.session.query(Club.id, Club.join_code).filter(Club.leader_id == target_id)
+        else:
+            return {}
+        join_codes = {str(club_id): code for club_id, code in query if code}
+        if join_codes:
+            db.session.query(Club).filter(Club.id.in_([int(club_id) for club_id in join_codes])).update(
+                {'join_code': None}, synchronize_session=False)
+        return join_codes
+
+    def _reopen(self, job):
+        """Undo what submit() locked for a job that failed."""
+        from models import db, Club, User
+
+        params = job.params or {}
+        for club_id, code in (params.get('join_codes') or {}).items():
+            db.session.query(Club).filter(Club.id == int(club_id), Club.join_code.is_(None)).update(
+                {'join_code': code}, synchronize_session=False)
+        if job.kind == 'user' and not params.get('was_suspended'):
+            db.session.query(User).filter(User.id == job.target_id).update(
+                {'is_suspended': False}, synchronize_session=False)
+        db.session.commit()
+
+    def _enqueue(self, job_id):
+        if not (self._thread and self._thread.is_alive()):
+            from flask import current_app
+            self.start(current_app._get_current_object())
+        self._put(job_id)
+
+    def _put(self, job_id):
+        with self._lock:
+            if job_id in self._queued or job_id == self._running:
+                return
+            self._queued.add(job_id)
+        self._queue.put(job_id)
+
+    def _run(self):
+        while True:
+            job_id = self._queue.get()
+            with self._lock:
+                self._queued.discard(job_id)
+                self._running = job_id
+            try:
+                with self._app.app_context():
+                    self.run_job(job_id)
+            except Exception as e:
+                logger.error(f"Deletion job {job_id} crashed: {str(e)}")
+            finally:
+                with self._lock:
+                    self._running = None
+
+    def run_job(self, job_id):
+        from models import db, DeletionJob
+
+        # Claim the job atomically; every process queues the queued jobs it sees
+        claimed = DeletionJob.query.filter_by(id=job_id, status='queued').update(
+            {'status': 'running',
+             'attempts': DeletionJob.attempts + 1,
+             'started_at': datetime.utcnow(),
+             'heartbeat_at': datetime.utcnow()},
+            synchronize_session=False)
+        db.session.commit()
+        if not claimed:
+            return
+
+        job = DeletionJob.query.get(job_id)
+        params = job.params or {}
+        try:
+            steps = self.plan(job.kind, job.target_id, params)
+            job.progress_total = self.count(steps)
+            job.progress_done = 0
+            db.session.commit()
+
+            def progress(s, rows):
+                # Committed with the chunk it describes
+                job.progress_done += rows
+                job.progress_total = max(job.progress_total, job.progress_done)
+                job.current_step = s.label
+                job.heartbeat_at = datetime.utcnow()
+                db.session.commit()
+                if self.chunk_pause:
+                    time.sleep(self.chunk_pause)
+
+            removed = self.execute(steps, on_chunk=progress)
+            self._finish(params.get('affected_clubs', []), removed)
+            status, error, result = 'succeeded', None, removed
+        except Exception as e:
+            db.session.rollback()
+            status, error, result = 'failed', str(e), None
+
+        values = {'status': status,
+                  'error': error,
+                  'result': result,
+                  'current_step': None,
+                  'finished_at': datetime.utcnow()}
+        if status == 'succeeded':
+            # The count adds up steps that overlap (gallery rows, content handed to leaders)
+            values['progress_total'] = DeletionJob.progress_done
+        # Only if still ours; a sweep may have handed the job to another process
+        finished = DeletionJob.query.filter_by(id=job_id, status='running').update(
+            values, synchronize_session=False)
+        db.session.commit()
+        if not finished:
+            return
+
+        job = DeletionJob.query.get(job_id)
+        if status == 'failed':
+            try:
+                self._reopen(job)
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Failed to reopen after deletion job {job.id}: {str(e)}")
+            logger.warning(f"Deletion of {job.kind} {job.target_id} (job {job.id}) failed: {error}")
+
+
+deletion_service = DeletionService()
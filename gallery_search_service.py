@@ -0,0 +1,321 @@
+import re
+import html
+import bisect
+import heapq
+import logging
+import math
+import threading
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session, object_session
+
+logger = logging.getLogger('gallery_search')
+
+MAX_QUERY_TERMS = 8
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+# Field weights; Postgres uses the matching setweight labels A, B and C
+FIELD_WEIGHTS = (('title', 3.0), ('tags', 2.0), ('description', 1.0))
+SNIPPET_LENGTH = 160
+
+
+def tokenize(text_value):
+    return TOKEN_RE.findall((text_value or '').lower())
+
+
+def query_terms(q):
+    """Unique search terms in order, capped so a pasted paragraph cannot build a huge query."""
+    terms = []
+    for term in tokenize(q):
+        if term not in terms:
+            terms.append(term)
+    return terms[:MAX_QUERY_TERMS]
+
+
+def highlight(text_value, terms, snippet=False):
+    """
+    HTML-escape text and wrap words starting with any search term in <mark>.
+    With snippet, long text is cut to a window around the first match.
+    """
+    text_value = text_value or ''
+    pattern = re.compile(r'\b(' + '|'.join(re.escape(t) for t in terms) + r')\w*', re.IGNORECASE | re.UNICODE) \
+        if terms else None
+
+    if snippet and len(text_value) > SNIPPET_LENGTH:
+        match = pattern.search(text_value) if pattern else None
+        start = max(0, match.start() - SNIPPET_LENGTH // 3) if match else 0
+        end = start + SNIPPET_LENGTH
+        text_value = ('…' if start else '') + text_value[start:end] + ('…' if end < len(text_value) else '')
+
+    if not pattern:
+        return html.escape(text_value)
+    parts = []
+    last = 0
+    for match in pattern.finditer(text_value):
+        parts.append(html.escape(text_value[last:match.start()]))
+        parts.append(f'<mark>{html.escape(match.group(0))}</mark>')
+        last = match.end()
+    parts.append(html.escape(text_value[last:]))
+    return ''.join(parts)
+
+
+class InvertedIndex:
+    """
+    In-process inverted index over gallery entries, used when the database
+    has no full-text support (SQLite in development).
+
+    Postings map token -> {entry id: field-weighted term frequency}. The
+    vocabulary is kept sorted so a prefix expands to a contiguous range
+    found with bisect. Queries AND their terms, treat every term as a
+    prefix, and rank with weight * idf.
+    """
+
+    def __init__(self):
+        self.postings = {}
+        self.vocab = []
+        self.docs = {}  # entry id -> (tokens, added_at timestamp)
+
+    def add(self, entry_id, title, description, tags, added_at=0):
+        self.remove(entry_id)
+        values = {'title': title, 'tags': tags, 'description': description}
+        weights = {}
+        for field, field_weight in FIELD_WEIGHTS:
+            for token in tokenize(values[field]):
+                weights[token] = weights.get(token, 0) + field_weight
+        for token, weight in weights.items():
+            posting = self.postings.get(token)
+            if posting is None:
+                posting = self.postings[token] = {}
+                bisect.insort(self.vocab, token)
+            posting[entry_id] = weight
+        self.docs[entry_id] = (tuple(weights), added_at)
+
+    def remove(self, entry_id):
+        doc = self.docs.pop(entry_id, None)
+        if not doc:
+            return
+        for token in doc[0]:
+            posting = self.postings.get(token)
+            if posting is None:
+                continue
+            posting.pop(entry_id, None)
+            if not posting:
+                del self.postings[token]
+                i = bisect.bisect_left(self.vocab, token)
+                if i < len(self.vocab) and self.vocab[i] == token:
+                    self.vocab.pop(i)
+
+    def _prefix_tokens(self, prefix):
+        start = bisect.bisect_left(self.vocab, prefix)
+        end = bisect.bisect_left(self.vocab, prefix + '\U0010ffff')
+        return self.vocab[start:end]
+
+    def search(self, terms, limit):
+        """Return [(entry id, score)] for documents matching every term, best first."""
+        total = len(self.docs) or 1
+        expanded = []
+        for term in terms:
+            postings = [self.postings[token] for token in self._prefix_tokens(term)]
+            if not postings:
+                return []
+            expanded.append((sum(len(p) for p in postings), postings))
+        # Start from the rarest term so later terms only probe its candidates
+        expanded.sort(key=lambda item: item[0])
+
+        scores = None
+        for size, postings in expanded:
+            weighted = [(posting, math.log(1 + total / len(posting))) for posting in postings]
+            if scores is not None and len(scores) * len(weighted) < size:
+                probed = {}
+                for entry_id, score in scores.items():
+                    best = max((posting[entry_id] * idf for posting, idf in weighted if entry_id in posting),
+                               default=0)
+                    if best:
+                        probed[entry_id] = score + best
+                scores = probed
+            else:
+                term_scores = {}
+                for posting, idf in weighted:
+                    for entry_id, weight in posting.items():
+                        score = weight * idf
+                        if score > term_scores.get(entry_id, 0):
+                            term_scores[entry_id] = score
+                scores = term_scores if scores is None else \
+                    {entry_id: score + term_scores[entry_id]
+                     for entry_id, score in scores.items() if entry_id in term_scores}
+            if not scores:
+                return []
+        return heapq.nlargest(limit, scores.items(),
+                              key=lambda item: (item[1], self.docs[item[0]][1], item[0]))
+
+
+class GallerySearchService:
+    """
+    Ranked full-text search over gallery titles, tags and descriptions with
+    prefix matching and highlighted results.
+
+    On Postgres it queries the generated, GIN-indexed gallery_entry.search_vector
+    column (see migrations/add_gallery_search.py), which the database keeps
+    current on every insert and update. Elsewhere, or before that migration
+    has run, an InvertedIndex is built on first use and kept current from
+    SQLAlchemy flush events applied on commit. That index only sees writes
+    from its own process, which is fine for the single-process SQLite setup
+    it exists for.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._backend = None
+        self._index = None
+        self._events_registered = False
+
+    def backend(self):
+        if self._backend is None:
+            self._backend = 'postgres' if self._has_search_vector() else 'memory'
+            logger.info(f"Gallery search backend: {self._backend}")
+        return self._backend
+
+    def _has_search_vector(self):
+        from models import db
+
+        if db.engine.dialect.name != 'postgresql':
+            return False
+        return db.session.execute(text("""
+            SELECT 1 FROM information_schema.columns
+            WHERE table_name = 'gallery_entry' AND column_name = 'search_vector'
+        """)).first() is not None
+
+    def search(self, q, limit=20):
+        """Return [(entry id, score)] best first for a free-text query."""
+        terms = query_terms(q)
+        if not terms:
+            return []
+        if self.backend() == 'postgres':
+            return self._search_postgres(terms, limit)
+        index = self._memory_index()
+        with self._lock:
+            return index.search(terms, limit)
+
+    def _search_postgres(self, terms, limit):
+        from models import db
+
+        # Terms are \w+ only, so they need no tsquery escaping
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        rows = db.session.execute(text("""
+            SELECT id, ts_rank_cd(search_vector, query) AS rank
+            FROM gallery_entry, to_tsquery('simple', :tsquery) AS query
+            WHERE search_vector @@ query
+            ORDER BY rank DESC, added_at DESC, id DESC
+            LIMIT :limit
+        """), {'tsquery': tsquery, 'limit': limit}).all()
+        return [(row.id, float(row.rank)) for row in rows]
+
+    def forget(self, entry_ids):
+        """Drop entries removed with bulk deletes, which the flush events never see."""
+        with self._lock:
+            if self._index is None:
+                return
+            for entry_id in entry_ids:
+                self._index.remove(entry_id)
+
+    # In-process index
+
+    def _memory_index(self):
+        with self._lock:
+            if self._index is not None:
+                return self._index
+        self._register_events()
+
+        from models import GalleryEntry
+
+        index = InvertedIndex()
+        for entry_id, title, description, tags, added_at in GalleryEntry.query.with_entities(
+                GalleryEntry.id, GalleryEntry.title, GalleryEntry.description,
+                GalleryEntry.tags, GalleryEntry.added_at):
+            index.add(entry_id, title, description, tags, added_at.timestamp() if added_at else 0)
+        with self._lock:
+            if self._index is None:
+                self._index = index
+            return self._index
+
+    def _register_events(self):
+        from models import GalleryEntry
+
+        with self._lock:
+            if self._events_registered:
+                return
+            self._events_registered = True
+
+        def pending(target):
+            session = object_session(target)
+            return session.info.setdefault('gallery_search_pending', {}) if session is not None else {}
+
+        def on_change(mapper, connection, target):
+            pending(target)[target.id] = (target.title, target.description, target.tags,
+                                          target.added_at.timestamp() if target.added_at else 0)
+
+        def on_delete(mapper, connection, target):
+            pending(target)[target.id] = None
+
+        def on_commit(session):
+            changes = session.info.pop('gallery_search_pending', None)
+            if not changes:
+                return
+            with self._lock:
+                if self._index is None:
+                    return
+                for entry_id, doc in changes.items():
+                    if doc is None:
+                        self._index.remove(entry_id)
+                    else:
+                        self._index.add(entry_id, *doc)
+
+        def on_rollback(session, previous_transaction):
+            session.info.pop('gallery_search_pending', None)
+
+        event.listen(GalleryEntry, 'after_insert', on_change)
+        event.listen(GalleryEntry, 'after_update', on_change)
+        event.listen(GalleryEntry, 'after_delete', on_delete)
+        event.listen(Session, 'after_commit', on_commit)
+        event.listen(Session, 'after_soft_rollback', on_rollback)
+
+
+gallery_search_service = GallerySearchService()
+
+
+if __name__ == '__main__':
+    # Query latency of the in-process index at gallery scale:
+    #   python gallery_search_service.py --entries 100000
+    import argparse
+    import random
+    import time
+
+    parser = argparse.ArgumentParser(description='Benchmark the in-process gallery search index')
+    parser.add_argument('--entries', type=int, default=100_000)
+    args = parser.parse_args()
+
+    random.seed(7)
+    words = [''.join(random.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(random.randint(3, 9)))
+             for _ in range(20_000)]
+    tags = ['game', 'gamedev', 'web', 'portfolio', 'art', 'music', 'tool', 'ai', 'blog', 'hackathon']
+
+    index = InvertedIndex()
+    started = time.perf_counter()
+    for i in range(args.entries):
+        index.add(i,
+                  ' '.join(random.choices(words, k=4)),
+                  ' '.join(random.choices(words, k=30)),
+                  ', '.join(random.sample(tags, 2)),
+                  i)
+    print(f"Indexed {args.entries} entries in {time.perf_counter() - started:.1f}s "
+          f"({len(index.vocab)} distinct tokens)")
+
+    queries = ['game', 'gam', 'web portfolio'] + [random.choice(words)[:4] for _ in range(20)] + \
+              [f"{random.choice(words)} {random.choice(tags)}" for _ in range(20)]
+    timings = []
+    for q in queries:
+        started = time.perf_counter()
+        results = index.search(query_terms(q), 20)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    print(f"{len(queries)} queries: median {timings[len(timings) // 2]:.2f}ms, "
+          f"p95 {timings[int(len(timings) * 0.95)]:.2f}ms, max {timings[-1]:.2f}ms")
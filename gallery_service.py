@@ -0,0 +1,216 @@
+import os
+import time
+import base64
+import logging
+import threading
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+
+logger = logging.getLogger('gallery')
+
+MAX_TAG_LENGTH = 50
+MAX_TAGS_PER_ENTRY = 10
+SORTS = ('recent', 'trending')
+
+
+def normalize_tag(tag):
+    """Lowercase, trim and collapse whitespace so 'Game Dev ' and 'game  dev' are one tag."""
+    return ' '.join(tag.lower().split())[:MAX_TAG_LENGTH].strip()
+
+
+def normalize_tags(raw):
+    """Split a comma separated tags string into unique normalized tags, keeping their order."""
+    tags = []
+    for tag in (raw or '').split(','):
+        tag = normalize_tag(tag)
+        if tag and tag not in tags:
+            tags.append(tag)
+    return tags[:MAX_TAGS_PER_ENTRY]
+
+
+def encode_cursor(sort, entry):
+    """Opaque cursor for the position after entry in the given sort order."""
+    key = repr(entry.trending_score) if sort == 'trending' else entry.added_at.isoformat()
+    raw = f"{sort}|{key}|{entry.id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor, sort):
+    """Return (sort key, id) from a cursor, or None if it is malformed or for another sort."""
+    try:
+        cursor_sort, key, entry_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split('|')
+        if cursor_sort != sort:
+            return None
+        key = float(key) if sort == 'trending' else datetime.fromisoformat(key)
+        return key, int(entry_id)
+    except (ValueError, UnicodeError):
+        return None
+
+
+class GalleryService:
+    """
+    Gallery listing and tag index.
+
+    Tags are normalized into gallery_tag / gallery_entry_tag so filtering is an
+    exact, indexed match instead of LIKE over the comma separated string.
+    Listings are paged by keyset on (added_at, id), newest first, or on
+    (trending_score, id) for the trending sort.
+
+    The tag cloud is kept in memory as name -> entry count. Submits and
+    removals in this process adjust it directly; it is reloaded with one
+    GROUP BY over gallery_entry_tag every GALLERY_TAG_CLOUD_TTL seconds to
+    pick up changes made by other workers or cascaded site deletions.
+    """
+
+    def __init__(self):
+        self.page_size = int(os.environ.get('GALLERY_PAGE_SIZE', 24))
+        self.featured_limit = int(os.environ.get('GALLERY_FEATURED_LIMIT', 12))
+        self.tag_cloud_ttl = int(os.environ.get('GALLERY_TAG_CLOUD_TTL', 300))  # seconds
+
+        self._lock = threading.Lock()
+        self._tag_counts = None  # name -> number of entries
+        self._tag_counts_loaded_at = 0
+
+    # Tag index
+
+    def _get_or_create_tags(self, names):
+        from models import db, GalleryTag
+
+        tags = {tag.name: tag for tag in GalleryTag.query.filter(GalleryTag.name.in_(names)).all()}
+        for name in names:
+            if name in tags:
+                continue
+            try:
+                with db.session.begin_nested():
+                    tag = GalleryTag(name=name)
+                    db.session.add(tag)
+            except IntegrityError:
+                # Created concurrently by another request
+                tag = GalleryTag.query.filter_by(name=name).one()
+            tags[name] = tag
+        return tags
+
+    def set_tags(self, entry, raw_tags):
+        """
+        Point an entry's tag links at the tags in raw_tags and store the
+        normalized display string. Returns (added, removed) tag names to pass
+        to tags_changed once the caller has committed.
+        """
+        from models import db, GalleryEntryTag
+
+        names = normalize_tags(raw_tags)
+        entry.tags = ', '.join(names)
+
+        current = {link.tag.name: link for link in entry.tag_links}
+        added = [name for name in names if name not in current]
+        removed = [name for name in current if name not in names]
+
+        for name in removed:
+            entry.tag_links.remove(current[name])
+        if added:
+            tags = self._get_or_create_tags(added)
+            for name in added:
+                entry.tag_links.append(GalleryEntryTag(tag_id=tags[name].id))
+        db.session.flush()
+        return added, removed
+
+    def remove_entry(self, entry):
+        """Delete an entry with its tag links. Returns the removed tag names for tags_changed."""
+        from models import db
+
+        removed = [link.tag.name for link in entry.tag_links]
+        db.session.delete(entry)
+        return removed
+
+    # Tag cloud
+
+    def tags_changed(self, added=(), removed=()):
+        """Apply a committed tag change to the cached tag cloud."""
+        with self._lock:
+            if self._tag_counts is None:
+                return
+            for name in added:
+                self._tag_counts[name] = self._tag_counts.get(name, 0) + 1
+            for name in removed:
+                count = self._tag_counts.get(name, 0) - 1
+                if count > 0:
+                    self._tag_counts[name] = count
+                else:
+                    self._tag_counts.pop(name, None)
+
+    def _load_tag_counts(self):
+        from models import db, GalleryTag, GalleryEntryTag
+
+        rows = db.session.query(GalleryTag.name, db.func.count(GalleryEntryTag.entry_id))\
+            .join(GalleryEntryTag, GalleryEntryTag.tag_id == GalleryTag.id)\
+            .group_by(GalleryTag.name)\
+            .all()
+        return {name: count for name, count in rows}
+
+    def tag_cloud(self):
+        """Return [(tag, entry count)] sorted by name, from the cache when it is fresh."""
+        with self._lock:
+            fresh = self._tag_counts is not None and \
+                time.time() - self._tag_counts_loaded_at < self.tag_cloud_ttl
+            counts = dict(self._tag_counts) if fresh else None
+
+        if counts is None:
+            counts = self._load_tag_counts()
+            with self._lock:
+                self._tag_counts = dict(counts)
+                self._tag_counts_loaded_at = time.time()
+
+        return sorted(counts.items())
+
+    def invalidate_tag_cloud(self):
+        with self._lock:
+            self._tag_counts = None
+
+    # Listings
+
+    def page(self, tag=None, cursor=None, featured=False, limit=None, sort='recent'):
+        """
+        Return (rows, next_cursor) where rows are (GalleryEntry, Site, User),
+        newest first or, with sort='trending', by the precomputed trending
+        score. next_cursor is None on the last page; an invalid cursor raises
+        ValueError.
+        """
+        from models import db, GalleryEntry, GalleryEntryTag, GalleryTag, Site, User
+
+        limit = limit or self.page_size
+        if sort not in SORTS:
+            raise ValueError('Invalid sort')
+        sort_column = GalleryEntry.trending_score if sort == 'trending' else GalleryEntry.added_at
+        query = db.session.query(GalleryEntry, Site, User)\
+            .join(Site, GalleryEntry.site_id == Site.id)\
+            .join(User, GalleryEntry.user_id == User.id)
+
+        if featured:
+            query = query.filter(GalleryEntry.is_featured == True)
+
+        if tag:
+            tag_ids = db.session.query(GalleryTag.id).filter(GalleryTag.name == normalize_tag(tag))
+            query = query.join(GalleryEntryTag, GalleryEntryTag.entry_id == GalleryEntry.id)\
+                .filter(GalleryEntryTag.tag_id.in_(tag_ids.scalar_subquery()))
+
+        if cursor:
+            position = decode_cursor(cursor, sort)
+            if position is None:
+                raise ValueError('Invalid cursor')
+            key, entry_id = position
+            query = query.filter(db.or_(
+                sort_column < key,
+                db.and_(sort_column == key, GalleryEntry.id < entry_id)
+            ))
+
+        rows = query.order_by(sort_column.desc(), GalleryEntry.id.desc())\
+            .limit(limit + 1)\
+            .all()
+        if len(rows) > limit:
+            rows = rows[:limit]
+            return rows, encode_cursor(sort, rows[-1][0])
+        return rows, None
+
+
+gallery_service = GalleryService()
@@ -0,0 +1,125 @@
+import os
+import math
+import time
+import logging
+import threading
+from datetime import datetime
+
+logger = logging.getLogger('gallery_trending')
+
+
+def decay_heat(view_heat, new_views, hours_elapsed, half_life_hours):
+    """Age the previous view heat by the time since the last run and add the new views."""
+    return (view_heat or 0.0) * 0.5 ** (max(hours_elapsed, 0.0) / half_life_hours) + max(new_views, 0)
+
+
+def trending_score(view_heat, is_featured, added_at, now, featured_boost, new_boost, new_half_life_hours):
+    """
+    Log-scaled recent views plus a featured boost plus a boost for new
+    projects that halves every new_half_life_hours. Views are already
+    time-decayed in view_heat, so an old project with a burst of views can
+    still trend, while new projects get a chance before they have views.
+    """
+    age_hours = max((now - added_at).total_seconds() / 3600, 0) if added_at else 0
+    return math.log2(1 + (view_heat or 0.0)) + \
+        (featured_boost if is_featured else 0) + \
+        new_boost * 0.5 ** (age_hours / new_half_life_hours)
+
+
+class GalleryTrendingService:
+    """
+    Periodically recomputes GalleryEntry.trending_score so /gallery?sort=trending
+    is an index scan on (trending_score, id) instead of a sort computed per
+    request.
+
+    Site.view_count is a lifetime total, so each pass takes the views gained
+    since the previous pass (views_seen) and folds them into view_heat, which
+    halves every GALLERY_TRENDING_HALF_LIFE hours. Entries are processed in
+    id order in batches, each written with one bulk UPDATE.
+    """
+
+    def __init__(self):
+        self.interval = int(os.environ.get('GALLERY_TRENDING_INTERVAL', 600))  # seconds
+        self.half_life_hours = float(os.environ.get('GALLERY_TRENDING_HALF_LIFE', 24))
+        self.featured_boost = float(os.environ.get('GALLERY_TRENDING_FEATURED_BOOST', 2))
+        self.new_boost = float(os.environ.get('GALLERY_TRENDING_NEW_BOOST', 4))
+        self.new_half_life_hours = float(os.environ.get('GALLERY_TRENDING_NEW_HALF_LIFE', 48))
+        self.batch_size = 1000
+
+        self._app = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self, app):
+        """Start the ranking thread for the given Flask app (idempotent)."""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._app = app
+            self._thread = threading.Thread(target=self._run, name='gallery-trending', daemon=True)
+            self._thread.start()
+        logger.info("Gallery trending worker started")
+
+    def _run(self):
+        while True:
+            started = time.time()
+            try:
+                with self._app.app_context():
+                    count = self.recompute()
+                logger.info(f"Recomputed trending scores for {count} gallery entries "
+                            f"in {time.time() - started:.2f}s")
+            except Exception as e:
+                logger.error(f"Trending recompute failed: {str(e)}")
+            time.sleep(self.interval)
+
+    def score(self, view_heat, is_featured, added_at, now=None):
+        return trending_score(view_heat, is_featured, added_at, now or datetime.utcnow(),
+                              self.featured_boost, self.new_boost, self.new_half_life_hours)
+
+    def score_entry(self, entry):
+        """Give a new or just (un)featured entry its score without waiting for the next pass."""
+        entry.trending_score = self.score(entry.view_heat, entry.is_featured, entry.added_at or datetime.utcnow())
+
+    def recompute(self):
+        """Recompute every entry's score. Returns the number of entries updated."""
+        from models import db, GalleryEntry, Site
+
+        now = datetime.utcnow()
+        last_id = 0
+        updated = 0
+        while True:
+            rows = db.session.query(GalleryEntry.id, GalleryEntry.added_at, GalleryEntry.is_featured,
+                                    GalleryEntry.view_heat, GalleryEntry.views_seen,
+                                    GalleryEntry.trending_updated_at, Site.view_count)\
+                .join(Site, GalleryEntry.site_id == Site.id)\
+                .filter(GalleryEntry.id > last_id)\
+                .order_by(GalleryEntry.id)\
+                .limit(self.batch_size)\
+                .all()
+            if not rows:
+                break
+
+            changes = []
+            for entry_id, added_at, is_featured, view_heat, views_seen, updated_at, view_count in rows:
+                view_count = view_count or 0
+                # view_count can be reset from the analytics page; start counting again from there
+                new_views = view_count - views_seen if views_seen is not None and view_count >= views_seen \
+                    else view_count
+                hours = (now - updated_at).total_seconds() / 3600 if updated_at else 0
+                heat = decay_heat(view_heat, new_views, hours, self.half_life_hours)
+                changes.append({
+                    'id': entry_id,
+                    'view_heat': heat,
+                    'views_seen': view_count,
+                    'trending_score': self.score(heat, is_featured, added_at, now),
+                    'trending_updated_at': now
+                })
+
+            db.session.execute(db.update(GalleryEntry), changes)
+            db.session.commit()
+            updated += len(changes)
+            last_id = rows[-1][0]
+        return updated
+
+
+gallery_trending_service = GalleryTrendingService()
@@ -0,0 +1,190 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+from github import Github
+
+logger = logging.getLogger('github_client')
+
+
+def token_fingerprint(access_token):
+    """Stable, non-reversible key for an access token so tokens never sit in cache keys."""
+    return hashlib.sha256(access_token.encode('utf-8')).hexdigest()[:16]
+
+
+class GitHubClientService:
+    """
+    Shares GitHub API clients and connection-status lookups between requests.
+
+    - One PyGithub client per token (LRU bounded), so the HTTP connection and
+      the rate-limit bookkeeping survive across editor loads.
+    - The authenticated user and repositories are kept and revalidated with
+      ETag conditional requests; a 304 does not count against GitHub quota.
+    - github_status payloads are cached per (user, site) for a short TTL,
+      keeping the GITHUB_STATUS_CACHE_SIZE most recently used.
+    - X-RateLimit-Remaining is tracked per token. When it drops below the
+      reserve, non-urgent calls are deferred until the window resets and
+      callers fall back to what is already cached.
+    """
+
+    def __init__(self):
+        self.max_clients = int(os.environ.get('GITHUB_CLIENT_POOL_SIZE', 256))
+        self.status_ttl = int(os.environ.get('GITHUB_STATUS_TTL', 60))  # seconds
+        self.max_statuses = int(os.environ.get('GITHUB_STATUS_CACHE_SIZE', 4096))
+        self.revalidate_after = int(os.environ.get('GITHUB_REVALIDATE_AFTER', 30))  # seconds
+        self.quota_reserve = int(os.environ.get('GITHUB_RATE_LIMIT_RESERVE', 100))
+
+        self._lock = threading.Lock()
+        self._clients = OrderedDict()  # fingerprint -> Github
+        self._objects = OrderedDict()  # (fingerprint, key) -> (checked_at, PyGithub object)
+        self._rate_limits = {}  # fingerprint -> (remaining, limit, reset_epoch)
+        self._status = OrderedDict()  # (user_id, site_id) -> (expires_at, payload)
+
+    def get_client(self, access_token):
+        """Return the shared client for a token, creating it on first use."""
+        fingerprint = token_fingerprint(access_token)
+        with self._lock:
+            client = self._clients.get(fingerprint)
+            if client is not None:
+                self._clients.move_to_end(fingerprint)
+                return client
+
+            client = Github(access_token)
+            self._clients[fingerprint] = client
+            while len(self._clients) > self.max_clients:
+                evicted, _ = self._clients.popitem(last=False)
+                self._drop_objects(evicted)
+            return client
+
+    def forget_token(self, access_token):
+        """Drop everything cached for a token (revoked, invalid or disconnected)."""
+        fingerprint = token_fingerprint(access_token)
+        with self._lock:
+            self._clients.pop(fingerprint, None)
+            self._rate_limits.pop(fingerprint, None)
+            self._drop_objects(fingerprint)
+
+    def _drop_objects(self, fingerprint):
+        for key in [k for k in self._objects if k[0] == fingerprint]:
+            del self._objects[key]
+
+    # Rate limit tracking
+
+    def _record_client_rate_limit(self, access_token, client):
+        """Copy the rate-limit headers PyGithub saw on its last response."""
+        remaining, limit = client.rate_limiting
+        with self._lock:
+            self._rate_limits[token_fingerprint(access_token)] = (
+                remaining, limit, client.rate_limiting_resettime)
+
+    def record_rate_limit_headers(self, access_token, headers):
+        """Record X-RateLimit-* headers from a response made outside PyGithub."""
+        if 'X-RateLimit-Remaining' not in headers:
+            return
+        try:
+            state = (int(headers['X-RateLimit-Remaining']),
+                     int(headers.get('X-RateLimit-Limit', -1)),
+                     int(headers.get('X-RateLimit-Reset', 0)))
+        except (TypeError, ValueError):
+            return
+        with self._lock:
+            self._rate_limits[token_fingerprint(access_token)] = state
+
+    def get_rate_limit(self, access_token):
+        """Return (remaining, limit, reset_epoch) last seen for a token, or None."""
+        with self._lock:
+            return self._rate_limits.get(token_fingerprint(access_token))
+
+    def should_defer(self, access_token, urgent=False):
+        """
+        True when a non-urgent call should wait: the token is below its quota
+        reserve and the rate-limit window has not reset yet.
+        """
+        if urgent:
+            return False
+        state = self.get_rate_limit(access_token)
+        if not state:
+            return False
+        remaining, _, reset_at = state
+        return remaining < self.quota_reserve and reset_at > time.time()
+
+    # Conditional revalidation
+
+    def _get_revalidated(self, access_token, key, fetch, urgent):
+        fingerprint = token_fingerprint(access_token)
+        with self._lock:
+            cached = self._objects.get((fingerprint, key))
+
+        now = time.time()
+        if cached:
+            checked_at, obj = cached
+            if now - checked_at < self.revalidate_after or self.should_defer(access_token, urgent):
+                return obj
+            # Sends If-None-Match with the stored ETag; a 304 leaves obj as is
+            obj.update()
+        else:
+            obj = fetch(self.get_client(access_token))
+
+        self._record_client_rate_limit(access_token, self.get_client(access_token))
+        with self._lock:
+            self._objects[(fingerprint, key)] = (now, obj)
+            self._objects.move_to_end((fingerprint, key))
+            while len(self._objects) > self.max_clients * 4:
+                self._objects.popitem(last=False)
+        return obj
+
+    def get_user(self, access_token, urgent=False):
+        """Return the authenticated user, revalidated with a conditional request."""
+        def fetch(client):
+            user = client.get_user()
+            user.login  # complete the lazy object so it carries an ETag
+            return user
+        return self._get_revalidated(access_token, 'user', fetch, urgent)
+
+    def get_repo(self, access_token, full_name, urgent=False):
+        """Return a repository, revalidated with a conditional request."""
+        return self._get_revalidated(access_token, f'repo:{full_name}',
+                                     lambda client: client.get_repo(full_name), urgent)
+
+    def forget_repo(self, access_token, full_name):
+        """Drop a cached repository, e.g. after it was deleted or disconnected."""
+        with self._lock:
+            self._objects.pop((token_fingerprint(access_token), f'repo:{full_name}'), None)
+
+    # github_status cache
+
+    def get_status(self, user_id, site_id, allow_stale=False):
+        """Return a cached status payload, or None once it expired (unless allow_stale)."""
+        with self._lock:
+            cached = self._status.get((user_id, site_id))
+            if cached:
+                self._status.move_to_end((user_id, site_id))
+        if not cached:
+            return None
+        expires_at, payload = cached
+        if expires_at > time.time() or allow_stale:
+            return payload
+        return None
+
+    def set_status(self, user_id, site_id, payload):
+        with self._lock:
+            self._status[(user_id, site_id)] = (time.time() + self.status_ttl, payload)
+            self._status.move_to_end((user_id, site_id))
+            # Keys include the raw site_id query value, so bound them like the other caches
+            while len(self._status) > self.max_statuses:
+                self._status.popitem(last=False)
+
+    def invalidate_status(self, user_id, site_id=None):
+        """Forget cached status for one of a user's sites, or for all of them."""
+        with self._lock:
+            if site_id is not None:
+                self._status.pop((user_id, site_id), None)
+            else:
+                for key in [k for k in self._status if k[0] == user_id]:
+                    del self._status[key]
+
+
+github_client_service = GitHubClientService()
@@ -1,10 +1,13 @@
 from flask import Blueprint, jsonify, request, redirect, url_for, session, flash
 from flask_login import current_user, login_required, login_user
-from github import Github, GithubException
+from github import GithubException
 from dotenv import load_dotenv
-from models import db, GitHubRepo, Site, User, SitePage, UserActivity
-from github_routes_helper import get_file_extension
+from models import db, GitHubRepo, GitHubSyncJob, Site, User, SitePage, UserActivity
+from github_client_service import github_client_service
+from github_sync_service import github_sync_service
+from github_webhook_service import github_webhook_service, verify_signature
 import os
+import json
 import requests
 import time
 
@@ -22,6 +25,12 @@ print(f"GitHub Auth Config - Client Secret: {'Set' if GITHUB_CLIENT_SECRET else
 print(f"GitHub Auth Config - Callback URL: {GITHUB_CALLBACK_URL or 'MISSING'}")
 
 
+def get_idempotency_key():
+    """Client supplied key that makes retried push/pull/create requests return the original job"""
+    key = request.headers.get('Idempotency-Key') or (request.get_json(silent=True) or {}).get('idempotency_key')
+    return key[:64] if key else None
+
+
 @github_bp.route('/api/github/status')
 @login_required
 def github_status():
@@ -38,62 +47,55 @@ def github_status():
     if not access_token:
         return jsonify({'connected': False, 'repo_connected': False})
 
+    site_id = request.args.get('site_id') or session.get('current_site_id')
+
+    # Editor loads hit this constantly; serve recent results from cache, and keep
+    # serving older ones while the token is short on quota
+    cached = github_client_service.get_status(current_user.id, site_id)
+    if cached is None and github_client_service.should_defer(access_token):
+        cached = github_client_service.get_status(current_user.id, site_id, allow_stale=True)
+    if cached is not None:
+        return jsonify(cached)
+
     try:
-        g = Github(access_token)
-        user = g.get_user()
+        user = github_client_service.get_user(access_token)
+        status = {
+            'connected': True,
+            'repo_connected': False,
+            'username': user.login
+        }
 
-        site_id = request.args.get('site_id') or session.get('current_site_id')
         if site_id and site_id not in ['null', 'undefined']:
             try:
-                site_id = int(site_id)
-                site = Site.query.get(site_id)
+                site = Site.query.get(int(site_id))
                 if not site:
                     return jsonify({'error': 'Site not found'}), 404
             except (ValueError, TypeError):
                 # Invalid site_id format (not an integer)
-                return jsonify({
-                    'connected': True,
-                    'repo_connected': False,
-                    'username': user.login
-                })
+                return jsonify(status)
 
             repo = GitHubRepo.query.filter_by(site_id=site.id).first()
-            if site and repo:
+            if repo:
                 # Validate that repo still exists on GitHub
                 try:
-                    gh_repo = g.get_repo(repo.repo_name)
-                    return jsonify({
-                        'connected':
-                        True,
-                        'repo_connected':
-                        True,
-                        'username':
-                        user.login,
-                        'repo_name':
-                        repo.repo_name,
-                        'repo_url':
-                        repo.repo_url,
-                        'is_private':
-                        repo.is_private,
-                        'created_at':
-                        repo.created_at.isoformat()
-                        if repo.created_at else None
+                    github_client_service.get_repo(access_token, repo.repo_name)
+                    status.update({
+                        'repo_connected': True,
+                        'repo_name': repo.repo_name,
+                        'repo_url': repo.repo_url,
+                        'is_private': repo.is_private,
+                        'created_at': repo.created_at.isoformat() if repo.created_at else None
                     })
+                    github_client_service.set_status(current_user.id, site_id, status)
+                    return jsonify(status)
                 except GithubException as e:
                     if e.status == 404:
                         # Repository no longer exists on GitHub
+                        github_client_service.forget_repo(access_token, repo.repo_name)
                         db.session.delete(repo)
                         db.session.commit()
-                        return jsonify({
-                            'connected':
-                            True,
-                            'repo_connected':
-                            False,
-                            'username':
-                            user.login,
-                            'error':
-                            'Repository no longer exists on GitHub'
-                        })
+                        status['error'] = 'Repository no longer exists on GitHub'
+                        return jsonify(status)
                     raise
 
         # Ensure token is synchronized between session and database
@@ -104,13 +106,11 @@ def github_status():
         elif not session.get('github_token') and access_token:
             session['github_token'] = access_token
 
-        return jsonify({
-            'connected': True,
-            'repo_connected': False,
-            'username': user.login
-        })
+        github_client_service.set_status(current_user.id, site_id, status)
+        return jsonify(status)
     except GithubException as e:
         if e.status == 401:
+            github_client_service.forget_token(access_token)
             if current_user.github_token:
                 current_user.github_token = None
                 db.session.commit()
@@ -184,7 +184,7 @@ def github_callback():
             access_token = data['access_token']
             session['github_token'] = access_token
 
-            g = Github(access_token)
+            g = github_client_service.get_client(access_token)
             gh_user = g.get_user()
 
             user = None
@@ -323,65 +323,19 @@ def create_repo():
         has_projects = data.get('has_projects', True)
         has_wiki = data.get('has_wiki', True)
 
-        g = Github(access_token)
-        user = g.get_user()
-
-        # Check if repo with this name already exists
-        try:
-            existing = user.get_repo(name)
-            if existing:
-                return jsonify(
-                    {'error':
-                     f'You already have a repository named "{name}"'}), 400
-        except GithubException:
-            pass  # Repo doesn't exist, which is what we want
-
-        # Create the repo
-        repo = user.create_repo(name=name,
-                                description=description,
-                                private=private,
-                                has_issues=has_issues,
-                                has_projects=has_projects,
-                                has_wiki=has_wiki,
-                                auto_init=True)
-
-        # Add attribution text to README.md
-        try:
-            readme_content = f"# {name}\n\n{description}\n\nMade with Hack Club Spaces 💖"
-            readme = repo.get_contents("README.md")
-            repo.update_file("README.md", "Update README with attribution",
-                             readme_content, readme.sha)
-        except Exception as e:
-            print(f"Error updating README: {str(e)}")
-
-        github_repo = GitHubRepo(repo_name=repo.full_name,
-                                 repo_url=repo.html_url,
-                                 is_private=private,
-                                 site_id=site_id)
-
-        db.session.add(github_repo)
-
-        # Record activity
-        activity = UserActivity(
-            activity_type="github_repo_creation",
-            message=
-            f'User {current_user.username} created GitHub repository "{repo.full_name}"',
-            username=current_user.username,
-            user_id=current_user.id,
-            site_id=site_id)
-        db.session.add(activity)
-        db.session.commit()
-
-        return jsonify({
-            'message': 'Repository created successfully',
-            'repo_name': repo.full_name,
-            'repo_url': repo.html_url,
-            'is_private': private
-        })
+        # Creating the repository, the README and the link row happens in the background
+        job, _ = github_sync_service.submit(current_user.id, site.id, 'create_repo', access_token,
+                                            params={
+                                                'name': name,
+                                                'description': description,
+                                                'private': private,
+                                                'has_issues': has_issues,
+                                                'has_projects': has_projects,
+                                                'has_wiki': has_wiki
+                                            },
+                                            idempotency_key=get_idempotency_key())
+        return jsonify(job.to_dict()), 202
 
-    except GithubException as e:
-        error_message = f"GitHub Error: {e.data.get('message', str(e))}"
-        return jsonify({'error': error_message}), e.status
     except Exception as e:
         print(f'Error creating repository: {str(e)}')
         db.session.rollback()
@@ -421,17 +375,22 @@ def repo_info():
             }), 401
 
         try:
-            g = Github(access_token)
-            repo = g.get_repo(github_repo.repo_name)
+            repo = github_client_service.get_repo(access_token, github_repo.repo_name)
 
             # Update repo URL if it changed
             if repo.html_url != github_repo.repo_url:
                 github_repo.repo_url = repo.html_url
                 db.session.commit()
 
+            # Listing contributors and commits is the expensive part; skip it
+            # while this token is low on quota
+            deferred = github_client_service.should_defer(access_token)
+
             # Get contributor stats
             contributors = None
             try:
+                if deferred:
+                    raise RuntimeError('Deferred until the rate limit resets')
                 contributors = list(repo.get_contributors())
                 contributor_count = len(contributors)
             except:
@@ -440,6 +399,8 @@ def repo_info():
             # Get commit stats
             commits = None
             try:
+                if deferred:
+                    raise RuntimeError('Deferred until the rate limit resets')
                 commits = list(repo.get_commits())
                 commit_count = len(commits)
                 last_commit_date = commits[0].commit.author.date.isoformat(
@@ -472,7 +433,9 @@ def repo_info():
                 'has_wiki':
                 repo.has_wiki,
                 'default_branch':
-                repo.default_branch
+                repo.default_branch,
+                'stats_deferred':
+                deferred
             })
 
         except GithubException as e:
@@ -485,6 +448,7 @@ def repo_info():
                 }), 404
             elif e.status == 401:
                 # Clear invalid token
+                github_client_service.forget_token(access_token)
                 if current_user.github_token:
                     current_user.github_token = None
                     db.session.commit()
@@ -531,114 +495,14 @@ def push_changes():
             return jsonify({'error':
                             'No repository connected to this site'}), 404
 
-        data = request.json
+        data = request.json or {}
         commit_message = data.get('message', 'Update from Hack Club Spaces')
 
-        g = Github(access_token)
-        repo = g.get_repo(github_repo.repo_name)
-
-        # Get all site files
-        files_to_update = {}
+        job, _ = github_sync_service.submit(current_user.id, site.id, 'push', access_token,
+                                            params={'message': commit_message},
+                                            idempotency_key=get_idempotency_key())
+        return jsonify(job.to_dict()), 202
 
-        if site.site_type == 'python' or site.site_type == 'code':
-            # For all code spaces including Python
-            extension = '.py' if site.site_type == 'python' or site.language == 'python' else get_file_extension(site.language)
-            files_to_update[f'main{extension}'] = site.language_content or ''
-
-            # Add requirements.txt for Python projects
-            if site.site_type == 'python' or site.language == 'python':
-                try:
-                    req_file = repo.get_contents("requirements.txt")
-                    files_to_update['requirements.txt'] = "# Python dependencies\n" + \
-                                                      "flask\n" + \
-                                                      "requests\n" + \
-                                                    "python-dotenv\n"
-                except:
-                    # Create requirements.txt
-                    files_to_update['requirements.txt'] = "# Python dependencies\n" + \
-                                                        "flask\n" + \
-                                                        "requests\n" + \
-                                                        "PyGithub\n" + \
-                                                    "python-dotenv\n"
-        else:
-            # For web sites, get all pages
-            site_pages = SitePage.query.filter_by(site_id=site.id).all()
-
-            # Always include main HTML content
-            files_to_update['index.html'] = site.html_content or ''
-
-            # Add all site pages
-            for page in site_pages:
-                if page.filename != 'index.html':  # Avoid duplicate
-                    files_to_update[page.filename] = page.content or ''
-
-        # Collect success and errors
-        results = {
-            'updated': [],
-            'created': [],
-            'errors': [],
-            'summary': 'Changes pushed successfully'
-        }
-
-        for file_path, content in files_to_update.items():
-            try:
-                try:
-                    file = repo.get_contents(file_path)
-                    repo.update_file(file_path, commit_message, content,
-                                     file.sha)
-                    results['updated'].append(file_path)
-                except GithubException as e:
-                    if e.status == 404:
-                        repo.create_file(file_path, commit_message, content)
-                        results['created'].append(file_path)
-                    else:
-                        results['errors'].append({
-                            'file': file_path,
-                            'error': str(e)
-                        })
-            except Exception as file_error:
-                print(f'Error updating file {file_path}: {str(file_error)}')
-                results['errors'].append({
-                    'file': file_path,
-                    'error': str(file_error)
-                })
-
-        # Record activity
-        activity = UserActivity(
-            activity_type="github_push",
-            message=
-            f'User {current_user.username} pushed {len(results["updated"])} updates and {len(results["created"])} new files to "{github_repo.repo_name}"',
-            username=current_user.username,
-            user_id=current_user.id,
-            site_id=site_id)
-        db.session.add(activity)
-        db.session.commit()
-
-        # Generate a summary
-        if not results['errors']:
-            if results['updated'] and results['created']:
-                results[
-                    'summary'] = f"Updated {len(results['updated'])} files and created {len(results['created'])} new files"
-            elif results['updated']:
-                results['summary'] = f"Updated {len(results['updated'])} files"
-            elif results['created']:
-                results[
-                    'summary'] = f"Created {len(results['created'])} new files"
-        else:
-            results[
-                'summary'] = f"Completed with {len(results['errors'])} errors"
-
-        return jsonify({
-            'message': 'Changes pushed successfully',
-            'repo_url': github_repo.repo_url,
-            'results': results,
-            'timestamp': time.time()
-        })
-
-    except GithubException as e:
-        print(f'GitHub error: {str(e)}')
-        error_message = f"GitHub Error: {e.data.get('message', str(e))}"
-        return jsonify({'error': error_message}), e.status
     except Exception as e:
         print(f'Error pushing changes: {str(e)}')
         return jsonify({'error': 'Failed to push changes: ' + str(e)}), 500
@@ -682,7 +546,7 @@ def delete_repo():
                 'Please type "delete" to confirm repository deletion'
             }), 400
 
-        g = Github(access_token)
+        g = github_client_service.get_client(access_token)
         try:
             repo = g.get_repo(github_repo.repo_name)
             repo.delete()
@@ -692,6 +556,8 @@ def delete_repo():
 
         # Always remove from our database regardless of GitHub status
         db.session.delete(github_repo)
+        github_client_service.forget_repo(access_token, repo_name)
+        github_client_service.invalidate_status(current_user.id)
 
         # Record activity
         activity = UserActivity(
@@ -743,6 +609,7 @@ def disconnect_repo():
         repo_url = github_repo.repo_url
 
         db.session.delete(github_repo)
+        github_client_service.invalidate_status(current_user.id)
 
         # Record activity
         activity = UserActivity(
@@ -776,6 +643,8 @@ def disconnect_account():
         if not current_user.github_token:
             return jsonify({'error': 'No GitHub account connected'}), 400
 
+        github_client_service.forget_token(current_user.github_token)
+        github_client_service.invalidate_status(current_user.id)
         current_user.github_token = None
         current_user.github_username = None
 
@@ -806,8 +675,6 @@ def disconnect_account():
 def pull_changes():
     """Pull latest changes from GitHub repository"""
     try:
-        from datetime import datetime
-
         access_token = session.get('github_token')
         if not access_token:
             if current_user.github_token:
@@ -830,106 +697,87 @@ def pull_changes():
         if not github_repo:
             return jsonify({'error': 'No repository connected to this site'}), 404
 
-        g = Github(access_token)
-        repo = g.get_repo(github_repo.repo_name)
+        job, _ = github_sync_service.submit(current_user.id, site.id, 'pull', access_token,
+                                            idempotency_key=get_idempotency_key())
+        return jsonify(job.to_dict()), 202
 
-        # Get all site files from GitHub
-        files_pulled = []
-        files_updated = []
-        errors = []
+    except Exception as e:
+        print(f'Error pulling changes: {str(e)}')
+        return jsonify({'error': 'Failed to pull changes: ' + str(e)}), 500
 
-        try:
-            # First, get the list of files from the repository
-            contents = repo.get_contents("")
-
-            for content in contents:
-                if content.type == "file":
-                    try:
-                        file_content = content.decoded_content.decode('utf-8')
-                        file_path = content.path
-
-                        # Update site content based on file type
-                        if site.site_type == 'python':
-                            # Always update the content and mark it as updated
-                            site.python_content = file_content
-                            files_updated.append(file_path)
-                        elif site.site_type == 'web':
-                            # For other files, check if they exist
-                            page = SitePage.query.filter_by(site_id=site.id, filename=file_path).first()
-                            if page:
-                                # Always update the content and mark it as updated
-                                page.content = file_content
-                                page.updated_at = datetime.utcnow()
-                                files_updated.append(file_path)
-                            else:
-                                # Determine file_type based on extension
-                                file_ext = file_path.split('.')[-1].lower() if '.' in file_path else ''
-                                file_type = 'html' if file_ext == 'html' else \
-                                           'css' if file_ext == 'css' else \
-                                           'js' if file_ext in ['js', 'jsx'] else \
-                                           'txt'
-                                new_page = SitePage(site_id=site.id, filename=file_path, content=file_content, file_type=file_type)
-                                db.session.add(new_page)
-                                files_pulled.append(file_path)
-                    except Exception as e:
-                        errors.append({"file": content.path, "error": str(e)})
-                elif content.type == "dir":
-                    try:
-                        # Handle nested directories
-                        dir_contents = repo.get_contents(content.path)
-                        for dir_content in dir_contents:
-                            if dir_content.type == "file":
-                                try:
-                                    file_content = dir_content.decoded_content.decode('utf-8')
-                                    file_path = dir_content.path
-
-                                    # Check if file exists
-                                    page = SitePage.query.filter_by(site_id=site.id, filename=file_path).first()
-                                    if page:
-                                        # Always update the content and mark it as updated
-                                        page.content = file_content
-                                        page.updated_at = datetime.utcnow()
-                                        files_updated.append(file_path)
-                                    else:
-                                        # Determine file_type based on extension
-                                        file_ext = file_path.split('.')[-1].lower() if '.' in file_path else ''
-                                        file_type = 'html' if file_ext == 'html' else \
-                                                'css' if file_ext == 'css' else \
-                                                'js' if file_ext in ['js', 'jsx'] else \
-                                                'txt'
-                                        new_page = SitePage(site_id=site.id, filename=file_path, content=file_content, file_type=file_type)
-                                        db.session.add(new_page)
-                                        files_pulled.append(file_path)
-                                except Exception as e:
-                                    errors.append({"file": dir_content.path, "error": str(e)})
-                    except Exception as e:
-                        errors.append({"dir": content.path, "error": str(e)})
-
-        except Exception as e:
-            return jsonify({'error': 'Failed to fetch repository contents: ' + str(e)}), 500
-
-        # Commit all changes
-        db.session.commit()
 
-        # Record activity
-        total_files = len(files_pulled) + len(files_updated)
-        activity = UserActivity(
-            activity_type="github_pull",
-            message=f'User {current_user.username} pulled {len(files_pulled)} new files and updated {len(files_updated)} existing files from "{github_repo.repo_name}"',
-            username=current_user.username,
-            user_id=current_user.id,
-            site_id=site.id)
-        db.session.add(activity)
-        db.session.commit()
+@github_bp.route('/api/github/jobs/<job_id>')
+@login_required
+def get_sync_job(job_id):
+    """Report the status and progress of a background push, pull or repo creation"""
+    job = GitHubSyncJob.query.get(job_id)
+    if not job or job.user_id != current_user.id:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
 
-        return jsonify({
-            'message': 'Changes pulled successfully',
-            'files_pulled': files_pulled,
-            'files_updated': files_updated,
-            'errors': errors,
-            'files_count': total_files
-        })
 
+@github_bp.route('/api/github/jobs/<job_id>/cancel', methods=['POST'])
+@login_required
+def cancel_sync_job(job_id):
+    """Cancel a queued or running job"""
+    job = GitHubSyncJob.query.get(job_id)
+    if not job or job.user_id != current_user.id:
+        return jsonify({'error': 'Job not found'}), 404
+    try:
+        job = github_sync_service.cancel(job)
+        return jsonify(job.to_dict())
     except Exception as e:
-        print(f'Error pulling changes: {str(e)}')
-        return jsonify({'error': 'Failed to pull changes: ' + str(e)}), 500
\ No newline at end of file
+        db.session.rollback()
+        print(f'Error cancelling job: {str(e)}')
+        return jsonify({'error': 'Failed to cancel job: ' + str(e)}), 500
+
+
+@github_bp.route('/api/github/jobs/<job_id>/retry', methods=['POST'])
+@login_required
+def retry_sync_job(job_id):
+    """Run a failed or cancelled job again"""
+    job = GitHubSyncJob.query.get(job_id)
+    if not job or job.user_id != current_user.id:
+        return jsonify({'error': 'Job not found'}), 404
+    if job.status not in ('failed', 'cancelled'):
+        return jsonify({'error': f'Only failed or cancelled jobs can be retried (job is {job.status})'}), 400
+
+    access_token = session.get('github_token') or current_user.github_token
+    if not access_token:
+        return jsonify({'error': 'No GitHub account connected'}), 401
+
+    try:
+        job = github_sync_service.retry(job, access_token)
+        return jsonify(job.to_dict()), 202
+    except Exception as e:
+        db.session.rollback()
+        print(f'Error retrying job: {str(e)}')
+        return jsonify({'error': 'Failed to retry job: ' + str(e)}), 500
+
+
+@github_bp.route('/api/github/webhook', methods=['POST'])
+def github_webhook():
+    """Receive push events from GitHub and sync the changed files into connected sites"""
+    if not github_webhook_service.secret:
+        return jsonify({'error': 'GitHub webhook secret is not configured'}), 503
+
+    body = request.get_data()
+    if not verify_signature(github_webhook_service.secret, body,
+                            request.headers.get('X-Hub-Signature-256')):
+        return jsonify({'error': 'Invalid signature'}), 401
+
+    event = request.headers.get('X-GitHub-Event')
+    if event == 'ping':
+        return jsonify({'message': 'pong'})
+    if event != 'push':
+        return jsonify({'message': f'Ignored {event} event'})
+
+    try:
+        payload = json.loads(body)
+        result, status = github_webhook_service.handle_push(
+            payload, request.headers.get('X-GitHub-Delivery'))
+        return jsonify(result), status
+    except Exception as e:
+        db.session.rollback()
+        print(f'GitHub webhook error: {str(e)}')
+        return jsonify({'error': 'Failed to process webhook: ' + str(e)}), 500
@@ -1,3 +1,22 @@
+import os
+import hashlib
+import tarfile
+import requests
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from github import GithubException, InputGitTreeElement
+from github_client_service import github_client_service
+
+# Overridable so webhook syncs can be exercised against a local stand-in for the API
+GITHUB_API_URL = os.environ.get('GITHUB_API_URL', 'https://api.github.com').rstrip('/')
+
+# Files larger than this, or repositories whose text files add up to more than
+# MAX_PULL_TOTAL_SIZE, are not imported into a site
+MAX_PULL_FILE_SIZE = 1024 * 1024
+MAX_PULL_TOTAL_SIZE = 20 * 1024 * 1024
+
+
 # Helper function for file extensions
 def get_file_extension(language):
     """Get the appropriate file extension for a language."""
@@ -82,3 +101,314 @@ def get_file_extension(language):
         return ".cs"
     
     return extension_map.get(language, ".txt")
+
+
+def git_blob_sha(content):
+    """Compute the SHA git assigns to a blob with this content."""
+    data = content.encode('utf-8') if isinstance(content, str) else content
+    header = f"blob {len(data)}\0".encode()
+    return hashlib.sha1(header + data).hexdigest()
+
+
+def get_site_files(site, remote_paths=()):
+    """Build the {path: content} mapping that represents a site in its repository."""
+    from models import SitePage
+
+    files = {}
+
+    if site.site_type == 'python' or site.site_type == 'code':
+        # For all code spaces including Python
+        is_python = site.site_type == 'python' or site.language == 'python'
+        extension = '.py' if is_python else get_file_extension(site.language)
+        files[f'main{extension}'] = site.language_content or ''
+
+        # Add requirements.txt for Python projects
+        if is_python:
+            if 'requirements.txt' in remote_paths:
+                files['requirements.txt'] = "# Python dependencies\n" + \
+                                            "flask\n" + \
+                                            "requests\n" + \
+                                            "python-dotenv\n"
+            else:
+                files['requirements.txt'] = "# Python dependencies\n" + \
+                                            "flask\n" + \
+                                            "requests\n" + \
+                                            "PyGithub\n" + \
+                                            "python-dotenv\n"
+    else:
+        # Always include main HTML content
+        files['index.html'] = site.html_content or ''
+
+        # Add all site pages
+        for page in SitePage.query.filter_by(site_id=site.id).all():
+            if page.filename != 'index.html':  # Avoid duplicate
+                files[page.filename] = page.content or ''
+
+    return files
+
+
+def push_site_files(repo, site, commit_message, progress=None):
+    """
+    Push a site to a repository as a single commit using the Git Data API.
+
+    Blob SHAs are computed locally and compared to the remote tree, so only
+    changed files are uploaded. The branch ref is moved without force, so a
+    concurrent push to the same branch makes this one fail instead of being
+    overwritten.
+
+    progress, if given, is called as progress(done, total, path) before each
+    file and once more before the commit is created. Raising from it aborts
+    the push without touching the branch.
+    """
+    branch = repo.default_branch or 'main'
+    results = {
+        'updated': [],
+        'created': [],
+        'unchanged': [],
+        'errors': [],
+        'commit_sha': None
+    }
+
+    try:
+        ref = repo.get_git_ref(f'heads/{branch}')
+    except GithubException as e:
+        # 404/409 means the repository has no commits yet
+        if e.status not in (404, 409):
+            raise
+        ref = None
+
+    remote_shas = {}
+    parents = []
+    base_tree = None
+    if ref:
+        head = repo.get_git_commit(ref.object.sha)
+        parents = [head]
+        base_tree = repo.get_git_tree(head.tree.sha, recursive=True)
+        remote_shas = {entry.path: entry.sha for entry in base_tree.tree if entry.type == 'blob'}
+
+    files = get_site_files(site, remote_shas)
+
+    tree_elements = []
+    for done, (path, content) in enumerate(files.items()):
+        if progress:
+            progress(done, len(files), path)
+        if remote_shas.get(path) == git_blob_sha(content):
+            results['unchanged'].append(path)
+            continue
+        # A failed upload raises before anything is committed, keeping the push atomic
+        blob = repo.create_git_blob(content, 'utf-8')
+        tree_elements.append(InputGitTreeElement(path, '100644', 'blob', sha=blob.sha))
+        results['updated' if path in remote_shas else 'created'].append(path)
+
+    if progress:
+        progress(len(files), len(files), None)
+    if not tree_elements:
+        return results
+
+    if base_tree is not None:
+        tree = repo.create_git_tree(tree_elements, base_tree)
+    else:
+        tree = repo.create_git_tree(tree_elements)
+    commit = repo.create_git_commit(commit_message, tree, parents)
+
+    if ref:
+        ref.edit(commit.sha, force=False)
+    else:
+        repo.create_git_ref(f'refs/heads/{branch}', commit.sha)
+
+    results['commit_sha'] = commit.sha
+    return results
+
+
+def get_page_file_type(path):
+    """Determine the SitePage file_type for a repository path."""
+    file_ext = path.rsplit('.', 1)[-1].lower() if '.' in path else ''
+    if file_ext == 'html':
+        return 'html'
+    if file_ext == 'css':
+        return 'css'
+    if file_ext in ['js', 'jsx']:
+        return 'js'
+    return 'txt'
+
+
+def decode_text_file(data):
+    """Return file contents as text, or None if the file looks binary."""
+    if b'\0' in data[:8192]:
+        return None
+    try:
+        return data.decode('utf-8')
+    except UnicodeDecodeError:
+        return None
+
+
+def download_repo_files(repo_full_name, access_token, ref=None, progress=None):
+    """
+    Download a repository as one tarball and stream-extract its text files.
+
+    Returns (files, skipped) where files maps repository paths to text content
+    and skipped lists {'file', 'reason'} entries for binaries and oversize files.
+    progress, if given, is called as progress(done, path) for every file read.
+    """
+    url = f"{GITHUB_API_URL}/repos/{repo_full_name}/tarball"
+    if ref:
+        url = f"{url}/{ref}"
+
+    response = requests.get(url,
+                            headers={
+                                'Authorization': f'Bearer {access_token}',
+                                'Accept': 'application/vnd.github+json'
+                            },
+                            stream=True,
+                            timeout=30)
+    github_client_service.record_rate_limit_headers(access_token, response.headers)
+    if response.status_code >= 400:
+        raise GithubException(response.status_code, {'message': response.text[:200]}, None)
+
+    files = {}
+    skipped = []
+    total_size = 0
+
+    with response, tarfile.open(fileobj=response.raw, mode='r|gz') as archive:
+        for member in archive:
+            if not member.isfile():
+                continue
+
+            # Entries are prefixed with a single "<owner>-<repo>-<sha>/" directory
+            parts = member.name.split('/', 1)
+            if len(parts) < 2 or not parts[1]:
+                continue
+            path = parts[1]
+            if progress:
+                progress(len(files) + len(skipped), path)
+
+            if member.size > MAX_PULL_FILE_SIZE:
+                skipped.append({'file': path, 'reason': 'too large'})
+                continue
+            if total_size + member.size > MAX_PULL_TOTAL_SIZE:
+                skipped.append({'file': path, 'reason': 'repository size limit reached'})
+                continue
+
+            content = decode_text_file(archive.extractfile(member).read())
+            if content is None:
+                skipped.append({'file': path, 'reason': 'binary'})
+                continue
+
+            files[path] = content
+            total_size += member.size
+
+    return files, skipped
+
+
+def fetch_repo_files(repo_full_name, access_token, ref, paths, progress=None, max_workers=8):
+    """
+    Fetch only the given paths at a commit through the contents API.
+
+    Returns (files, skipped) like download_repo_files. Paths that no longer
+    exist at ref are left out of files. progress, if given, is called as
+    progress(done, total, path) as each file arrives.
+    """
+    paths = sorted(set(paths))
+    files = {}
+    skipped = []
+    http = requests.Session()
+    http.headers.update({
+        'Authorization': f'Bearer {access_token}',
+        'Accept': 'application/vnd.github.raw'
+    })
+
+    def fetch(path):
+        url = f"{GITHUB_API_URL}/repos/{repo_full_name}/contents/{quote(path)}"
+        response = http.get(url, params={'ref': ref}, timeout=15)
+        github_client_service.record_rate_limit_headers(access_token, response.headers)
+        if response.status_code == 404:
+            return path, None, None
+        if response.status_code >= 400:
+            raise GithubException(response.status_code, {'message': response.text[:200]}, None)
+        if len(response.content) > MAX_PULL_FILE_SIZE:
+            return path, None, 'too large'
+        content = decode_text_file(response.content)
+        return path, content, None if content is not None else 'binary'
+
+    with http, ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for done, (path, content, reason) in enumerate(pool.map(fetch, paths), 1):
+            if reason:
+                skipped.append({'file': path, 'reason': reason})
+            elif content is not None:
+                files[path] = content
+            if progress:
+                progress(done, len(paths), path)
+
+    return files, skipped
+
+
+def apply_repo_files(site, files, deleted_paths=()):
+    """
+    Write repository files into a site in a single transaction.
+
+    Files whose content hash matches what the site already has are left
+    alone; everything else is written with one bulk upsert on SitePage.
+    The caller is responsible for committing.
+    Returns a dict with created, updated, unchanged and deleted paths.
+    """
+    from models import db, SitePage
+
+    results = {'created': [], 'updated': [], 'unchanged': [], 'deleted': []}
+    now = datetime.utcnow()
+
+    # Code spaces keep their main file on the site itself
+    main_file = None
+    if site.site_type == 'python' or site.site_type == 'code':
+        is_python = site.site_type == 'python' or site.language == 'python'
+        main_file = 'main' + ('.py' if is_python else get_file_extension(site.language or ''))
+
+        if main_file in files:
+            if git_blob_sha(files[main_file]) == git_blob_sha(site.language_content or ''):
+                results['unchanged'].append(main_file)
+            else:
+                site.language_content = files[main_file]
+                results['updated'].append(main_file)
+    elif 'index.html' in files and files['index.html'] != (site.html_content or ''):
+        site.html_content = files['index.html']
+
+    existing_hashes = {
+        row.filename: git_blob_sha(row.content or '')
+        for row in db.session.query(SitePage.filename, SitePage.content).filter_by(site_id=site.id).all()
+    }
+
+    rows = []
+    for path, content in files.items():
+        if path == main_file:
+            continue
+        if existing_hashes.get(path) == git_blob_sha(content):
+            results['unchanged'].append(path)
+            continue
+
+        results['updated' if path in existing_hashes else 'created'].append(path)
+        rows.append({
+            'site_id': site.id,
+            'filename': path,
+            'content': content,
+            'file_type': get_page_file_type(path),
+            'now': now
+        })
+
+    if rows:
+        db.session.execute(
+            db.text("""
+                INSERT INTO site_page (site_id, filename, content, file_type, created_at, updated_at)
+                VALUES (:site_id, :filename, :content, :file_type, :now, :now)
+                ON CONFLICT (site_id, filename) DO UPDATE
+                SET content = EXCLUDED.content, file_type = EXCLUDED.file_type, updated_at = EXCLUDED.updated_at
+            """), rows)
+
+    to_delete = [path for path in deleted_paths if path in existing_hashes and path not in files]
+    if to_delete:
+        SitePage.query.filter(SitePage.site_id == site.id,
+                              SitePage.filename.in_(to_delete)).delete(synchronize_session=False)
+        results['deleted'] = to_delete
+
+    if results['created'] or results['updated'] or results['deleted']:
+        site.updated_at = now
+
+    return results
@@ -0,0 +1,532 @@
+import os
+import time
+import uuid
+import queue
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from github import GithubException
+
+from github_client_service import github_client_service
+from github_routes_helper import push_site_files, download_repo_files, fetch_repo_files, apply_repo_files
+
+logger = logging.getLogger('github_sync')
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+
+class JobCancelled(Exception):
+    """Raised from a progress callback once a cancellation has been requested."""
+
+
+def summarize_push(results):
+    """Build the human readable summary shown in the editor after a push."""
+    if results['errors']:
+        return f"Completed with {len(results['errors'])} errors"
+    if not results['commit_sha']:
+        return 'Everything up to date'
+    if results['updated'] and results['created']:
+        return f"Updated {len(results['updated'])} files and created {len(results['created'])} new files"
+    if results['updated']:
+        return f"Updated {len(results['updated'])} files"
+    if results['created']:
+        return f"Created {len(results['created'])} new files"
+    return 'Changes pushed successfully'
+
+
+class GitHubSyncService:
+    """
+    Runs GitHub push, pull and repository creation outside the HTTP request.
+
+    Jobs live in the github_sync_job table so any web worker can report their
+    status, and they are executed by a small pool of daemon threads. Access
+    tokens are only kept in memory for the queued job and never stored.
+
+    - A request carrying an Idempotency-Key that was already used returns the
+      original job, and a second push/pull/create for a site while one is
+      still queued or running returns the active job instead of a new one.
+    - Progress is written at most every GITHUB_SYNC_PROGRESS_INTERVAL seconds;
+      the same write picks up cancellation requests made from other workers.
+    - Queued and running jobs belong to the process that holds their token,
+      which refreshes their heartbeat_at every GITHUB_SYNC_HEARTBEAT_INTERVAL
+      seconds. An active job without a heartbeat for GITHUB_SYNC_STALE_AFTER
+      seconds lost its process; every process's sweep fails it, and it is
+      never coalesced with.
+    - Retrying a push never double-commits: the push diffs against the remote
+      tree, and a job that already recorded its commit SHA is not re-run.
+    """
+
+    def __init__(self):
+        self.worker_count = int(os.environ.get('GITHUB_SYNC_WORKERS', 2))
+        self.progress_interval = float(os.environ.get('GITHUB_SYNC_PROGRESS_INTERVAL', 0.5))
+        self.heartbeat_interval = float(os.environ.get('GITHUB_SYNC_HEARTBEAT_INTERVAL', 15))  # seconds
+        self.stale_after = int(os.environ.get('GITHUB_SYNC_STALE_AFTER', 60))  # seconds without a heartbeat
+        self.worker_id = uuid.uuid4().hex
+
+        self._app = None
+        self._lock = threading.Lock()
+        self._threads = []
+        self._queue = queue.Queue()
+        self._tokens = {}  # job_id -> access token, in memory only
+        self._site_locks = {}  # site_id -> Lock, so webhook syncs for a site apply in order
+        self._runners = {
+            'push': self.run_push,
+            'pull': self.run_pull,
+            'create_repo': self.run_create_repo,
+            'webhook_sync': self.run_webhook_sync,
+        }
+
+    def start(self, app):
+        """Start the worker threads for the given Flask app (idempotent)."""
+        with self._lock:
+            if self._threads:
+                return
+            self._app = app
+            for i in range(self.worker_count):
+                thread = threading.Thread(target=self._run, name=f'github-sync-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            thread = threading.Thread(target=self._heartbeat, name='github-sync-heartbeat', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"GitHub sync workers started ({self.worker_count})")
+
+    def heartbeat_cutoff(self):
+        """Active jobs whose heartbeat_at is older than this lost the process holding them."""
+        return datetime.utcnow() - timedelta(seconds=self.stale_after)
+
+    def _heartbeat(self):
+        while True:
+            try:
+                with self._app.app_context():
+                    self.beat()
+                    self.fail_stale_jobs()
+            except Exception as e:
+                logger.error(f"GitHub sync heartbeat failed: {str(e)}")
+            time.sleep(self.heartbeat_interval)
+
+    def beat(self):
+        """Mark every active job this process holds as still alive."""
+        from models import db, GitHubSyncJob
+
+        GitHubSyncJob.query.filter(GitHubSyncJob.worker_id == self.worker_id,
+                                   GitHubSyncJob.status.in_(ACTIVE_STATUSES)).update(
+            {'heartbeat_at': datetime.utcnow()}, synchronize_session=False)
+        db.session.commit()
+
+    def fail_stale_jobs(self):
+        """Jobs whose process stopped sending heartbeats can never finish; mark them failed."""
+        from models import db, GitHubSyncJob
+
+        cutoff = self.heartbeat_cutoff()
+        try:
+            GitHubSyncJob.query.filter(GitHubSyncJob.status.in_(ACTIVE_STATUSES),
+                                       db.or_(GitHubSyncJob.heartbeat_at < cutoff,
+                                              db.and_(GitHubSyncJob.heartbeat_at.is_(None),
+                                                      GitHubSyncJob.created_at < cutoff))).update(
+                {'status': 'failed', 'error': 'Interrupted before it could finish', 'finished_at': datetime.utcnow()},
+                synchronize_session=False)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Failed to clean up stale GitHub sync jobs: {str(e)}")
+
+    def submit(self, user_id, site_id, kind, access_token, params=None, idempotency_key=None, coalesce=True):
+        """
+        Queue a job and return (job, created). An existing job is returned
+        instead when the idempotency key was seen before or, with coalesce,
+        when the same kind of job is already active for the site and its
+        process is still alive.
+        """
+        from models import db, GitHubSyncJob
+
+        if idempotency_key:
+            existing = GitHubSyncJob.query.filter_by(user_id=user_id, idempotency_key=idempotency_key).first()
+            if existing:
+                return existing, False
+
+        if coalesce:
+            active = GitHubSyncJob.query.filter(GitHubSyncJob.site_id == site_id,
+                                                GitHubSyncJob.kind == kind,
+                                                GitHubSyncJob.status.in_(ACTIVE_STATUSES),
+                                                GitHubSyncJob.heartbeat_at >= self.heartbeat_cutoff()).first()
+            if active:
+                return active, False
+
+        job = GitHubSyncJob(id=uuid.uuid4().hex,
+                            user_id=user_id,
+                            site_id=site_id,
+                            kind=kind,
+                            status='queued',
+                            idempotency_key=idempotency_key,
+                            params=params or {},
+                            worker_id=self.worker_id,
+                            heartbeat_at=datetime.utcnow())
+        db.session.add(job)
+        db.session.commit()
+
+        self._enqueue(job.id, access_token)
+        return job, True
+
+    def cancel(self, job):
+        """
+        Request cancellation. Queued jobs, and running ones whose process is
+        gone, stop immediately; running ones stop at the next file. Only
+        active jobs are touched, so a job that finished in the meantime keeps
+        its outcome.
+        """
+        from models import db, GitHubSyncJob
+
+        active = GitHubSyncJob.query.filter(GitHubSyncJob.id == job.id,
+                                            GitHubSyncJob.status.in_(ACTIVE_STATUSES))
+        stopped = active.filter(db.or_(GitHubSyncJob.status == 'queued',
+                                       GitHubSyncJob.heartbeat_at.is_(None),
+                                       GitHubSyncJob.heartbeat_at < self.heartbeat_cutoff())).update(
+            {'status': 'cancelled', 'cancel_requested': True, 'finished_at': datetime.utcnow()},
+            synchronize_session=False)
+        if not stopped:
+            active.update({'cancel_requested': True}, synchronize_session=False)
+        db.session.commit()
+        db.session.refresh(job)
+        return job
+
+    def retry(self, job, access_token):
+        """Re-queue a failed or cancelled job, keeping whatever result it already recorded."""
+        from models import db
+
+        if job.status not in ('failed', 'cancelled'):
+            return job
+        job.status = 'queued'
+        job.error = None
+        job.cancel_requested = False
+        job.finished_at = None
+        job.progress_done = 0
+        job.current_file = None
+        job.worker_id = self.worker_id
+        job.heartbeat_at = datetime.utcnow()
+        db.session.commit()
+
+        self._enqueue(job.id, access_token)
+        return job
+
+    def _enqueue(self, job_id, access_token):
+        if not self._threads:
+            from flask import current_app
+            self.start(current_app._get_current_object())
+        with self._lock:
+            self._tokens[job_id] = access_token
+        self._queue.put(job_id)
+
+    def _run(self):
+        while True:
+            job_id = self._queue.get()
+            try:
+                with self._app.app_context():
+                    self.run_job(job_id)
+            except Exception as e:
+                logger.error(f"GitHub sync job {job_id} crashed: {str(e)}")
+
+    def run_job(self, job_id):
+        from models import db, GitHubSyncJob
+
+        # Claim the job atomically; a retried job can be in the queue twice
+        claimed = GitHubSyncJob.query.filter_by(id=job_id, status='queued').update(
+            {'status': 'running',
+             'attempts': GitHubSyncJob.attempts + 1,
+             'started_at': datetime.utcnow()},
+            synchronize_session=False)
+        db.session.commit()
+        if not claimed:
+            return
+
+        job = GitHubSyncJob.query.get(job_id)
+        with self._lock:
+            access_token = self._tokens.pop(job_id, None)
+
+        try:
+            if not access_token:
+                raise RuntimeError('No GitHub token available for this job')
+            result = self._runners[job.kind](job, access_token)
+            status, error = 'succeeded', None
+        except JobCancelled:
+            db.session.rollback()
+            result, status, error = None, 'cancelled', None
+        except GithubException as e:
+            db.session.rollback()
+            message = e.data.get('message', str(e)) if isinstance(e.data, dict) else str(e)
+            result, status, error = None, 'failed', f"GitHub Error: {message}"
+            if e.status == 401:
+                github_client_service.forget_token(access_token)
+        except Exception as e:
+            db.session.rollback()
+            result, status, error = None, 'failed', str(e)
+
+        # Only a job still running is ours to finish; a cancel may have closed it already
+        values = {'status': status, 'error': error, 'finished_at': datetime.utcnow()}
+        if result is not None:
+            values['result'] = result
+        finished = GitHubSyncJob.query.filter_by(id=job_id, status='running').update(
+            values, synchronize_session=False)
+        db.session.commit()
+        if not finished:
+            return
+
+        if status == 'failed':
+            logger.warning(f"GitHub {job.kind} job {job.id} failed: {error}")
+
+    def _progress(self, job):
+        """Return a progress(done, total, path) callback that persists progress and honours cancel."""
+        from models import db, GitHubSyncJob
+
+        state = {'written_at': 0.0}
+
+        def report(done, total, path):
+            job.progress_done = done
+            job.progress_total = max(total, done)
+            job.current_file = path[:255] if path else None
+
+            now = time.monotonic()
+            finished = total and done >= total
+            if now - state['written_at'] < self.progress_interval and not finished:
+                return
+            state['written_at'] = now
+            db.session.commit()
+
+            cancelled = db.session.query(GitHubSyncJob.cancel_requested).filter_by(id=job.id).scalar()
+            if cancelled:
+                raise JobCancelled()
+
+        return report
+
+    def _load_site_repo(self, job):
+        from models import Site, GitHubRepo
+
+        site = Site.query.get(job.site_id)
+        if not site:
+            raise RuntimeError('Site not found')
+        github_repo = GitHubRepo.query.filter_by(site_id=site.id).first()
+        return site, github_repo
+
+    def run_push(self, job, access_token):
+        from models import db, User, UserActivity
+
+        # A previous attempt already moved the branch; pushing again would be a no-op at best
+        if job.result and job.result.get('results', {}).get('commit_sha'):
+            return job.result
+
+        site, github_repo = self._load_site_repo(job)
+        if not github_repo:
+            raise RuntimeError('No repository connected to this site')
+
+        repo = github_client_service.get_repo(access_token, github_repo.repo_name, urgent=True)
+        commit_message = (job.params or {}).get('message') or 'Update from Hack Club Spaces'
+
+        results = push_site_files(repo, site, commit_message, progress=self._progress(job))
+        results['summary'] = summarize_push(results)
+
+        user = User.query.get(job.user_id)
+        activity = UserActivity(
+            activity_type="github_push",
+            message=
+            f'User {user.username} pushed {len(results["updated"])} updates and {len(results["created"])} new files to "{github_repo.repo_name}"',
+            username=user.username,
+            user_id=user.id,
+            site_id=site.id)
+        db.session.add(activity)
+        db.session.commit()
+
+        return {
+            'message': 'Changes pushed successfully',
+            'repo_url': github_repo.repo_url,
+            'results': results,
+            'timestamp': time.time()
+        }
+
+    def run_pull(self, job, access_token):
+        from models import db, User, UserActivity
+
+        site, github_repo = self._load_site_repo(job)
+        if not github_repo:
+            raise RuntimeError('No repository connected to this site')
+
+        report = self._progress(job)
+        files, skipped = download_repo_files(github_repo.repo_name, access_token,
+                                             progress=lambda done, path: report(done, 0, path))
+
+        # Last chance to cancel; from here the pull is applied in one transaction
+        report(len(files), len(files), None)
+        results = apply_repo_files(site, files)
+        files_pulled = results['created']
+        files_updated = results['updated']
+
+        user = User.query.get(job.user_id)
+        activity = UserActivity(
+            activity_type="github_pull",
+            message=f'User {user.username} pulled {len(files_pulled)} new files and updated {len(files_updated)} existing files from "{github_repo.repo_name}"',
+            username=user.username,
+            user_id=user.id,
+            site_id=site.id)
+        db.session.add(activity)
+        db.session.commit()
+
+        return {
+            'message': 'Changes pulled successfully',
+            'files_pulled': files_pulled,
+            'files_updated': files_updated,
+            'files_unchanged': len(results['unchanged']),
+            'skipped': skipped,
+            'errors': [],
+            'files_count': len(files_pulled) + len(files_updated)
+        }
+
+    def run_create_repo(self, job, access_token):
+        from models import db, User, GitHubRepo, UserActivity
+
+        params = job.params or {}
+        name = params['name']
+        private = params.get('private', True)
+        site, github_repo = self._load_site_repo(job)
+
+        gh_user = github_client_service.get_client(access_token).get_user()
+        created_name = (job.result or {}).get('repo_name')
+
+        if created_name:
+            # Retry after the repository was already created on GitHub: adopt it
+            repo = github_client_service.get_client(access_token).get_repo(created_name)
+        else:
+            # Check if repo with this name already exists
+            try:
+                gh_user.get_repo(name).full_name
+                raise RuntimeError(f'You already have a repository named "{name}"')
+            except GithubException:
+                pass  # Repo doesn't exist, which is what we want
+
+            repo = gh_user.create_repo(name=name,
+                                       description=params.get('description', ''),
+                                       private=private,
+                                       has_issues=params.get('has_issues', True),
+                                       has_projects=params.get('has_projects', True),
+                                       has_wiki=params.get('has_wiki', True),
+                                       auto_init=True)
+
+            # Remember the repository right away so a retry does not try to create it again
+            job.result = {'repo_name': repo.full_name}
+            db.session.commit()
+
+            # Add attribution text to README.md
+            try:
+                readme_content = f"# {name}\n\n{params.get('description', '')}\n\nMade with Hack Club Spaces 💖"
+                readme = repo.get_contents("README.md")
+                repo.update_file("README.md", "Update README with attribution",
+                                 readme_content, readme.sha)
+            except Exception as e:
+                print(f"Error updating README: {str(e)}")
+
+            # Let pushes made on GitHub flow back into the site
+            webhook_url = os.environ.get('GITHUB_WEBHOOK_URL')
+            webhook_secret = os.environ.get('GITHUB_WEBHOOK_SECRET')
+            if webhook_url and webhook_secret:
+                try:
+                    repo.create_hook('web', {
+                        'url': webhook_url,
+                        'content_type': 'json',
+                        'secret': webhook_secret
+                    }, events=['push'], active=True)
+                except Exception as e:
+                    print(f"Error creating webhook: {str(e)}")
+
+        if not github_repo:
+            db.session.add(GitHubRepo(repo_name=repo.full_name,
+                                      repo_url=repo.html_url,
+                                      is_private=private,
+                                      site_id=site.id))
+
+        user = User.query.get(job.user_id)
+        activity = UserActivity(
+            activity_type="github_repo_creation",
+            message=
+            f'User {user.username} created GitHub repository "{repo.full_name}"',
+            username=user.username,
+            user_id=user.id,
+            site_id=site.id)
+        db.session.add(activity)
+        db.session.commit()
+        github_client_service.invalidate_status(user.id)
+
+        return {
+            'message': 'Repository created successfully',
+            'repo_name': repo.full_name,
+            'repo_url': repo.html_url,
+            'is_private': private
+        }
+
+    def _site_lock(self, site_id):
+        with self._lock:
+            return self._site_locks.setdefault(site_id, threading.Lock())
+
+    def run_webhook_sync(self, job, access_token):
+        """Apply the files a GitHub push webhook reported as changed or removed."""
+        from models import db, GitHubSyncJob, User, UserActivity
+
+        with self._site_lock(job.site_id):
+            site, github_repo = self._load_site_repo(job)
+            if not github_repo:
+                raise RuntimeError('No repository connected to this site')
+
+            params = dict(job.params or {})
+            # Jobs can reach the lock out of order. When a newer push was applied
+            # first, sync this job's paths at that push's commit instead, so older
+            # content never overwrites newer; a path gone there is deleted.
+            newer_refs = [(newer.result or {}).get('ref') for newer in GitHubSyncJob.query
+                          .filter(GitHubSyncJob.site_id == job.site_id,
+                                  GitHubSyncJob.kind == 'webhook_sync',
+                                  GitHubSyncJob.status.in_(('running', 'succeeded')),
+                                  GitHubSyncJob.created_at > job.created_at)
+                          .order_by(GitHubSyncJob.created_at.desc())]
+            applied_ref = next((ref for ref in newer_refs if ref), None)
+            if applied_ref:
+                params['changed'] = sorted(set(params.get('changed', [])) | set(params.get('removed', [])))
+                params['removed'] = []
+                params['ref'] = applied_ref
+
+            report = self._progress(job)
+            if params.get('full'):
+                files, skipped = download_repo_files(github_repo.repo_name, access_token, ref=params.get('ref'),
+                                                     progress=lambda done, path: report(done, 0, path))
+                removed = []
+            else:
+                files, skipped = fetch_repo_files(github_repo.repo_name, access_token, params['ref'],
+                                                  params.get('changed', []), progress=report)
+                # A path listed as changed that is gone at ref was removed by a later commit
+                skipped_paths = {item['file'] for item in skipped}
+                removed = params.get('removed', []) + [path for path in params.get('changed', [])
+                                                       if path not in files and path not in skipped_paths]
+
+            report(len(files), len(files), None)
+            results = apply_repo_files(site, files, deleted_paths=removed)
+
+            user = User.query.get(job.user_id)
+            activity = UserActivity(
+                activity_type="github_webhook_sync",
+                message=f'GitHub push to "{github_repo.repo_name}" synced {len(results["created"])} new, {len(results["updated"])} updated and {len(results["deleted"])} deleted files',
+                username=user.username,
+                user_id=user.id,
+                site_id=site.id)
+            db.session.add(activity)
+            # Committed with the files, so later jobs see which commit the site is at
+            job.result = {'ref': params.get('ref')}
+            db.session.commit()
+
+        return {
+            'ref': params.get('ref'),
+            'full': bool(params.get('full')),
+            'files_pulled': results['created'],
+            'files_updated': results['updated'],
+            'files_deleted': results['deleted'],
+            'files_unchanged': len(results['unchanged']),
+            'skipped': skipped
+        }
+
+
+github_sync_service = GitHubSyncService()
@@ -0,0 +1,218 @@
+import os
+import hmac
+import json
+import hashlib
+import logging
+
+logger = logging.getLogger('github_webhook')
+
+# GitHub lists at most this many commits in a push payload; longer pushes
+# are synced from a full tarball instead of the per-commit path lists
+MAX_PAYLOAD_COMMITS = 20
+NULL_SHA = '0' * 40
+
+
+def sign_payload(secret, body):
+    """Return the X-Hub-Signature-256 value GitHub would send for a body."""
+    digest = hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+    return f'sha256={digest}'
+
+
+def verify_signature(secret, body, signature_header):
+    """Check an X-Hub-Signature-256 header against the raw request body."""
+    if not secret or not signature_header:
+        return False
+    return hmac.compare_digest(sign_payload(secret, body), signature_header)
+
+
+def collect_changed_paths(payload):
+    """
+    Fold the commits of a push payload into the paths to fetch and to delete.
+
+    Commits are applied in order, so a file added then removed ends up only in
+    removed and a file removed then re-added only in changed. Returns
+    (changed, removed, complete) where complete is False when the payload
+    cannot be trusted to list every change (force pushes, truncated lists).
+    """
+    commits = payload.get('commits') or []
+    complete = not payload.get('forced') and 0 < len(commits) < MAX_PAYLOAD_COMMITS
+
+    changed = set()
+    removed = set()
+    for commit in commits:
+        for path in (commit.get('added') or []) + (commit.get('modified') or []):
+            changed.add(path)
+            removed.discard(path)
+        for path in commit.get('removed') or []:
+            removed.add(path)
+            changed.discard(path)
+
+    return changed, removed, complete
+
+
+def merge_paths(params, changed, removed):
+    """Merge a newer push's paths into the params of a job that has not started yet."""
+    merged_changed = (set(params.get('changed', [])) - removed) | changed
+    merged_removed = (set(params.get('removed', [])) - changed) | removed
+    return sorted(merged_changed), sorted(merged_removed)
+
+
+class GitHubWebhookService:
+    """
+    Turns GitHub push webhooks into incremental syncs of the connected sites.
+
+    Only the default branch is synced. Each push becomes a webhook_sync job on
+    github_sync_service that fetches just the added and modified files and
+    applies them, together with deletions, in one transaction. A push that
+    arrives while an earlier one for the same site is still queued is merged
+    into it, so sites never apply pushes out of order.
+    """
+
+    @property
+    def secret(self):
+        return os.environ.get('GITHUB_WEBHOOK_SECRET')
+
+    def handle_push(self, payload, delivery_id=None):
+        """Queue syncs for every site connected to the pushed repository. Returns (body, status)."""
+        from models import GitHubRepo, Site, User
+
+        repository = payload.get('repository') or {}
+        full_name = repository.get('full_name')
+        default_branch = repository.get('default_branch') or 'main'
+
+        if payload.get('deleted') or payload.get('after') in (None, NULL_SHA):
+            return {'message': 'Branch deletion ignored'}, 200
+        if payload.get('ref') != f'refs/heads/{default_branch}':
+            return {'message': f'Only pushes to {default_branch} are synced'}, 200
+
+        changed, removed, complete = collect_changed_paths(payload)
+
+        rows = (GitHubRepo.query
+                .join(Site, Site.id == GitHubRepo.site_id)
+                .join(User, User.id == Site.user_id)
+                .with_entities(GitHubRepo, Site, User)
+                .filter(GitHubRepo.repo_name == full_name)
+                .all())
+
+        jobs = []
+        for github_repo, site, owner in rows:
+            if not owner.github_token:
+                logger.info(f"Skipping webhook sync for site {site.id}: owner has no GitHub token")
+                continue
+            job = self.queue_site_sync(site, owner, payload['after'], changed, removed,
+                                       full=not complete, delivery_id=delivery_id)
+            jobs.append(job.id)
+
+        return {'message': f'Queued {len(jobs)} site syncs', 'jobs': jobs}, 202
+
+    def queue_site_sync(self, site, owner, ref, changed, removed, full=False, delivery_id=None):
+        """Queue a webhook_sync job, folding it into a not-yet-started one for the site if possible."""
+        from models import db, GitHubSyncJob
+        from github_sync_service import github_sync_service
+
+        idempotency_key = f'webhook:{delivery_id}:{site.id}'[:64] if delivery_id else None
+        if idempotency_key:
+            existing = GitHubSyncJob.query.filter_by(user_id=owner.id, idempotency_key=idempotency_key).first()
+            if existing:
+                return existing
+
+        pending = GitHubSyncJob.query.filter(GitHubSyncJob.site_id == site.id,
+                                             GitHubSyncJob.kind == 'webhook_sync',
+                                             GitHubSyncJob.status == 'queued',
+                                             GitHubSyncJob.heartbeat_at >= github_sync_service.heartbeat_cutoff()).first()
+        if pending:
+            params = dict(pending.params or {})
+            params['changed'], params['removed'] = merge_paths(params, changed, removed)
+            params['full'] = bool(params.get('full')) or full
+            params['ref'] = ref
+            # Only merge if no worker claimed the job in the meantime
+            merged = GitHubSyncJob.query.filter_by(id=pending.id, status='queued').update(
+                {'params': params}, synchronize_session=False)
+            db.session.commit()
+            if merged:
+                return pending
+
+        job, _ = github_sync_service.submit(owner.id, site.id, 'webhook_sync', owner.github_token,
+                                            params={
+                                                'ref': ref,
+                                                'changed': sorted(changed),
+                                                'removed': sorted(removed),
+                                                'full': full
+                                            },
+                                            idempotency_key=idempotency_key,
+                                            coalesce=False)
+        return job
+
+
+github_webhook_service = GitHubWebhookService()
+
+
+if __name__ == '__main__':
+    # Replay a recorded push payload against a local stand-in for the GitHub
+    # contents API and print what a sync would apply:
+    #   python github_webhook_service.py payload.json --files ./repo-checkout
+    import argparse
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import urlparse, unquote
+
+    import github_routes_helper
+
+    parser = argparse.ArgumentParser(description='Replay a GitHub push webhook payload')
+    parser.add_argument('payload', help='Recorded push event JSON')
+    parser.add_argument('--files', default='.', help='Directory served as the repository contents')
+    parser.add_argument('--api-url', help='Use an already running API stand-in instead of starting one')
+    parser.add_argument('--secret', default='replay-secret')
+    args = parser.parse_args()
+
+    with open(args.payload, 'rb') as f:
+        body = f.read()
+
+    signature = sign_payload(args.secret, body)
+    print(f"Signature valid: {verify_signature(args.secret, body, signature)}")
+    print(f"Tampered body rejected: {not verify_signature(args.secret, body + b' ', signature)}")
+
+    api_url = args.api_url
+    if not api_url:
+        root = os.path.abspath(args.files)
+
+        class ContentsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                # /repos/<owner>/<repo>/contents/<path>
+                parts = unquote(urlparse(self.path).path).split('/', 5)
+                path = os.path.normpath(os.path.join(root, parts[5] if len(parts) > 5 else ''))
+                if not path.startswith(root) or not os.path.isfile(path):
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                with open(path, 'rb') as fh:
+                    data = fh.read()
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(data)))
+                self.send_header('X-RateLimit-Remaining', '4999')
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *log_args):
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), ContentsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        api_url = f'http://127.0.0.1:{server.server_address[1]}'
+    github_routes_helper.GITHUB_API_URL = api_url.rstrip('/')
+
+    payload = json.loads(body)
+    changed, removed, complete = collect_changed_paths(payload)
+    print(f"Changed: {sorted(changed)}")
+    print(f"Removed: {sorted(removed)}")
+    if not complete:
+        print("Payload is incomplete (forced or truncated); a full tarball sync would run")
+
+    files, skipped = github_routes_helper.fetch_repo_files(
+        payload['repository']['full_name'], 'replay-token', payload['after'], changed)
+    for path, content in sorted(files.items()):
+        print(f"  fetch {path} ({len(content)} chars, blob {github_routes_helper.git_blob_sha(content)[:10]})")
+    for item in skipped:
+        print(f"  skip  {item['file']} ({item['reason']})")
+    for path in sorted(removed | (changed - set(files) - {item['file'] for item in skipped})):
+        print(f"  delete {path}")
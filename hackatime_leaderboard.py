@@ -0,0 +1,299 @@
+import os
+import time
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+
+# How many days of daily stats the leaderboard looks at (streaks, month, week)
+HISTORY_DAYS = 365
+PERIOD_DAYS = {'weekly': 7, 'monthly': 30}
+CACHE_TTL = int(os.environ.get('HACKATIME_LEADERBOARD_TTL', 300))  # seconds
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def format_duration(seconds):
+    """Format seconds the way Hackatime does for human readable totals."""
+    seconds = int(seconds or 0)
+    hours, remainder = divmod(seconds, 3600)
+    minutes = remainder // 60
+    if hours:
+        return f"{hours} hrs {minutes} mins"
+    return f"{minutes} mins"
+
+
+def competition_ranks(values):
+    """Return 1-based ranks where ties share the best rank (1, 2, 2, 4)."""
+    values = np.asarray(values, dtype=np.float64)
+    return np.searchsorted(np.sort(-values), -values, side='left') + 1
+
+
+def _trailing_true(matrix):
+    """Length of the run of True values at the start of every row."""
+    if matrix.shape[1] == 0:
+        return np.zeros(matrix.shape[0], dtype=np.int64)
+    first_false = np.argmin(matrix, axis=1)
+    return np.where(matrix.all(axis=1), matrix.shape[1], first_false)
+
+
+def compute_streaks(active):
+    """
+    Compute current and longest streaks for a (users x days) boolean matrix
+    whose last column is today.
+
+    The current streak still counts if the user has not coded yet today.
+    """
+    users, days = active.shape
+    reversed_days = active[:, ::-1]
+    current = np.where(reversed_days[:, 0],
+                       _trailing_true(reversed_days),
+                       _trailing_true(reversed_days[:, 1:]))
+
+    # Pad every row with a False on both sides so runs never cross rows,
+    # then find run boundaries on the flattened array in one pass.
+    padded = np.zeros((users, days + 2), dtype=np.int8)
+    padded[:, 1:-1] = active
+    edges = np.diff(padded.ravel())
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+
+    longest = np.zeros(users, dtype=np.int64)
+    if starts.size:
+        np.maximum.at(longest, starts // (days + 2), ends - starts)
+    return current, longest
+
+
+def build_matrices(user_ids, start_day, days, total_rows, language_rows):
+    """
+    Turn daily stat rows into dense arrays.
+
+    total_rows are (user_id, day, seconds) and language_rows are
+    (user_id, day, language, seconds) tuples. Returns a dict with a
+    (users x days) totals matrix plus flat per-row language arrays.
+    """
+    user_ids = np.asarray(sorted(user_ids), dtype=np.int64)
+
+    def positions(rows):
+        if not rows:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, np.zeros(0)
+        count = len(rows)
+        user_pos = np.searchsorted(user_ids, np.fromiter((r[0] for r in rows), np.int64, count))
+        offsets = np.fromiter((r[1].toordinal() for r in rows), np.int64, count) - start_day.toordinal()
+        seconds = np.fromiter((r[-1] for r in rows), np.float64, count)
+        return user_pos, offsets, seconds
+
+    user_pos, day_pos, seconds = positions(total_rows)
+    totals = np.bincount(user_pos * days + day_pos, weights=seconds,
+                         minlength=len(user_ids) * days).reshape(len(user_ids), days)
+
+    lang_user, lang_day, lang_seconds = positions(language_rows)
+    # Dictionary-encode language names; a dict lookup per row beats np.unique on strings
+    codes = {}
+    language_codes = np.fromiter((codes.setdefault(r[2], len(codes)) for r in language_rows),
+                                 np.int64, len(language_rows))
+    language_names = np.asarray(list(codes), dtype=object)
+
+    return {
+        'user_ids': user_ids,
+        'days': days,
+        'totals': totals,
+        'language_user': lang_user,
+        'language_day': lang_day,
+        'language_code': language_codes,
+        'language_seconds': lang_seconds,
+        'language_names': language_names,
+    }
+
+
+def compute_leaderboard(matrices, all_time_seconds=None):
+    """
+    Compute weekly, monthly and all-time rankings, streaks and language
+    breakdowns from the arrays produced by build_matrices.
+
+    all_time_seconds maps user_id -> lifetime seconds (from the snapshot);
+    users without one fall back to the seconds in the daily history.
+    """
+    user_ids = matrices['user_ids']
+    days = matrices['days']
+    totals = matrices['totals']
+    users = len(user_ids)
+    n_languages = len(matrices['language_names'])
+
+    period_seconds = {
+        period: totals[:, max(days - span, 0):].sum(axis=1)
+        for period, span in PERIOD_DAYS.items()
+    }
+    history_seconds = totals.sum(axis=1)
+    if all_time_seconds:
+        lifetime = np.asarray([all_time_seconds.get(int(uid), np.nan) for uid in user_ids])
+        period_seconds['all_time'] = np.where(np.isnan(lifetime), history_seconds, lifetime)
+    else:
+        period_seconds['all_time'] = history_seconds
+
+    current_streak, longest_streak = compute_streaks(totals > 0)
+
+    # (users x languages) seconds per period, via one bincount per window
+    languages = {}
+    for period, span in list(PERIOD_DAYS.items()) + [('all_time', days)]:
+        mask = matrices['language_day'] >= days - span
+        flat = matrices['language_user'][mask] * max(n_languages, 1) + matrices['language_code'][mask]
+        languages[period] = np.bincount(flat, weights=matrices['language_seconds'][mask],
+                                        minlength=users * max(n_languages, 1)
+                                        ).reshape(users, max(n_languages, 1))[:, :n_languages]
+
+    result = {}
+    for period, seconds in period_seconds.items():
+        by_language = languages[period]
+        top_language = (np.where(by_language.max(axis=1) > 0, by_language.argmax(axis=1), -1)
+                        if n_languages else np.full(users, -1))
+        club_languages = by_language.sum(axis=0)
+        language_order = np.argsort(-club_languages, kind='stable')
+
+        result[period] = {
+            'user_ids': user_ids,
+            'seconds': seconds,
+            'ranks': competition_ranks(seconds),
+            'order': np.lexsort((user_ids, -seconds)),
+            'top_language': top_language,
+            'languages': [
+                (str(matrices['language_names'][i]), float(club_languages[i]))
+                for i in language_order if club_languages[i] > 0
+            ],
+        }
+    result['current_streak'] = current_streak
+    result['longest_streak'] = longest_streak
+    result['language_names'] = matrices['language_names']
+    return result
+
+
+def load_club_leaderboard(club_id):
+    """Query the stored daily stats for a club and compute its leaderboard payload."""
+    from models import db, User, Club, ClubMembership, HackatimeSnapshot, HackatimeDailyStat
+
+    club = Club.query.get(club_id)
+    member_ids = {row.user_id for row in
+                  db.session.query(ClubMembership.user_id).filter_by(club_id=club_id).all()}
+    if club:
+        member_ids.add(club.leader_id)
+
+    users = {u.id: u for u in
+             User.query.filter(User.id.in_(member_ids), User.wakatime_api_key.isnot(None)).all()}
+    if not users:
+        return {'periods': {}, 'languages': {}, 'generated_at': datetime.utcnow().isoformat()}
+
+    today = datetime.utcnow().date()
+    start_day = today - timedelta(days=HISTORY_DAYS - 1)
+
+    rows = (db.session.query(HackatimeDailyStat.user_id, HackatimeDailyStat.day,
+                             HackatimeDailyStat.dimension, HackatimeDailyStat.name,
+                             HackatimeDailyStat.seconds)
+            .filter(HackatimeDailyStat.user_id.in_(users.keys()),
+                    HackatimeDailyStat.day >= start_day,
+                    HackatimeDailyStat.dimension.in_(['total', 'language']))
+            .all())
+    total_rows = [(r.user_id, r.day, r.seconds) for r in rows if r.dimension == 'total']
+    language_rows = [(r.user_id, r.day, r.name, r.seconds) for r in rows if r.dimension == 'language']
+
+    snapshots = (db.session.query(HackatimeSnapshot.user_id, HackatimeSnapshot.total_seconds,
+                                  HackatimeSnapshot.top_language, HackatimeSnapshot.languages)
+                 .filter(HackatimeSnapshot.user_id.in_(users.keys())).all())
+    all_time = {row.user_id: row.total_seconds for row in snapshots}
+
+    # All-time seconds are lifetime totals, so the all-time languages are too,
+    # rather than the HISTORY_DAYS window the other periods are built from
+    lifetime_top_language = {row.user_id: row.top_language for row in snapshots}
+    lifetime_languages = {}
+    for row in snapshots:
+        for language in row.languages or []:
+            name = language.get('name')
+            if name:
+                lifetime_languages[name] = lifetime_languages.get(name, 0) + (language.get('total_seconds') or 0)
+
+    matrices = build_matrices(users.keys(), start_day, HISTORY_DAYS, total_rows, language_rows)
+    computed = compute_leaderboard(matrices, all_time)
+
+    periods = {}
+    languages = {}
+    for period in ('weekly', 'monthly', 'all_time'):
+        data = computed[period]
+        entries = []
+        for i in data['order']:
+            user = users[int(data['user_ids'][i])]
+            top = data['top_language'][i]
+            top_language = str(computed['language_names'][top]) if top >= 0 else None
+            if period == 'all_time' and user.id in lifetime_top_language:
+                top_language = lifetime_top_language[user.id]
+            entries.append({
+                'rank': int(data['ranks'][i]),
+                'user_id': user.id,
+                'username': user.username,
+                'avatar': user.avatar,
+                'total_seconds': float(data['seconds'][i]),
+                'human_readable_total': format_duration(data['seconds'][i]),
+                'top_language': top_language,
+                'current_streak': int(computed['current_streak'][i]),
+                'longest_streak': int(computed['longest_streak'][i])
+            })
+        periods[period] = entries
+        period_languages = data['languages']
+        if period == 'all_time' and snapshots:
+            period_languages = sorted(((name, float(seconds)) for name, seconds in lifetime_languages.items()
+                                       if seconds > 0), key=lambda item: -item[1])
+        languages[period] = [{'name': name, 'total_seconds': seconds,
+                              'human_readable_total': format_duration(seconds)}
+                             for name, seconds in period_languages]
+
+    return {'periods': periods, 'languages': languages, 'generated_at': datetime.utcnow().isoformat()}
+
+
+def get_club_leaderboard(club_id):
+    """Return the cached leaderboard for a club, recomputing it once the TTL expires."""
+    now = time.time()
+    with _cache_lock:
+        cached = _cache.get(club_id)
+        if cached and cached[0] > now:
+            return cached[1]
+
+    payload = load_club_leaderboard(club_id)
+    with _cache_lock:
+        _cache[club_id] = (now + CACHE_TTL, payload)
+    return payload
+
+
+def invalidate_club_leaderboard(club_id=None):
+    """Drop the cached leaderboard for one club, or for every club."""
+    with _cache_lock:
+        if club_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(club_id, None)
+
+
+if __name__ == '__main__':
+    # Benchmark: 10k users x 365 days with a handful of languages per user
+    rng = np.random.default_rng(42)
+    n_users, n_days = 10000, HISTORY_DAYS
+    language_pool = ['Python', 'JavaScript', 'TypeScript', 'HTML', 'CSS', 'Rust', 'Go', 'Java', 'C', 'Ruby']
+    start = datetime.utcnow().date() - timedelta(days=n_days - 1)
+    day_list = [start + timedelta(days=d) for d in range(n_days)]
+
+    active = rng.random((n_users, n_days)) < 0.3
+    user_idx, day_idx = np.nonzero(active)
+    seconds = rng.integers(60, 4 * 3600, size=user_idx.size).astype(np.float64)
+    total_rows = [(int(u) + 1, day_list[d], s) for u, d, s in zip(user_idx, day_idx, seconds)]
+    language_choice = rng.integers(0, len(language_pool), size=user_idx.size)
+    language_rows = [(int(u) + 1, day_list[d], language_pool[l], s)
+                     for u, d, l, s in zip(user_idx, day_idx, language_choice, seconds)]
+    print(f"{len(total_rows)} daily totals, {len(language_rows)} language rows")
+
+    started = time.perf_counter()
+    matrices = build_matrices(range(1, n_users + 1), start, n_days, total_rows, language_rows)
+    built = time.perf_counter()
+    compute_leaderboard(matrices)
+    finished = time.perf_counter()
+
+    print(f"build_matrices:      {(built - started) * 1000:.1f} ms")
+    print(f"compute_leaderboard: {(finished - built) * 1000:.1f} ms")
@@ -1,146 +1,20 @@
 import os
+import sys
 import time
-import logging
-import requests
-import json
-from datetime import datetime
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler()
-    ]
-)
-logger = logging.getLogger('hackatime_service')
-
-def send_heartbeat(api_key, heartbeat_data):
-    """
-    Send a heartbeat to the Hackatime API with detailed heartbeat data
-    """
-    try:
-        if not api_key:
-            logger.warning("No API key provided. Cannot send heartbeat.")
-            return False
-
-        api_url = "https://hackatime.hackclub.com/api/hackatime/v1/users/current/heartbeats"
-
-        # Prepare heartbeat payload
-        current_time = int(time.time())
-        user_agent = "Hack Club Spaces/1.0 Python/3.10"
-
-        # Format any array data correctly for PostgreSQL
-        # If 'dependencies' is a comma-separated string, properly format it as a PostgreSQL array string
-        if isinstance(heartbeat_data, dict) and 'dependencies' in heartbeat_data and isinstance(heartbeat_data['dependencies'], str):
-            # Convert "bootstrap,jquery" to "{bootstrap,jquery}"
-            deps = heartbeat_data['dependencies']
-            if deps and not deps.startswith('{') and not deps.endswith('}'):
-                heartbeat_data['dependencies'] = "{" + deps + "}"
-
-        # Use default values if not provided
-        default_heartbeat = {
-            "entity": "main.py",
-            "type": "file",
-            "time": current_time,
-            "category": "coding",
-            "project": "Hack Club Spaces",
-            "branch": "main",
-            "language": "Python",
-            "is_write": True,
-            "lines": 150,
-            "lineno": 1,
-            "cursorpos": 0,
-            "line_additions": 0,
-            "line_deletions": 0
-        }
-
-        # Process input data and ensure all required fields
-        if isinstance(heartbeat_data, dict):
-            # Single heartbeat
-            complete_heartbeat = default_heartbeat.copy()
-            complete_heartbeat.update(heartbeat_data)
-            heartbeat_payload = [complete_heartbeat]
-        elif isinstance(heartbeat_data, list):
-            # Multiple heartbeats
-            heartbeat_payload = []
-            for hb in heartbeat_data:
-                if isinstance(hb, dict):
-                    complete_hb = default_heartbeat.copy()
-                    complete_hb.update(hb)
-                    heartbeat_payload.append(complete_hb)
-                else:
-                    # Invalid item in list
-                    complete_hb = default_heartbeat.copy()
-                    heartbeat_payload.append(complete_hb)
-        else:
-            # Fallback to default if data format is unexpected
-            heartbeat_payload = [default_heartbeat]
-
-        # Set up headers
-        headers = {
-            'Authorization': f'Bearer {api_key}',
-            'Content-Type': 'application/json',
-            'User-Agent': user_agent
-        }
-
-        # Log detailed request information
-        logger.info(f"Sending heartbeat to Hackatime API: {api_url}")
-        # Format headers for better readability in logs
-        formatted_headers = {
-            'Authorization': f'Bearer {api_key[:5]}...{api_key[-5:]}',  # Mask most of the API key for security
-            'Content-Type': headers['Content-Type'],
-            'User-Agent': headers['User-Agent']
-        }
-        logger.info(f"Request Headers: {formatted_headers}")
-        logger.info(f"Payload: {heartbeat_payload}")
-
-        response = requests.post(
-            api_url,
-            headers=headers,
-            json=heartbeat_payload,
-            timeout=10
-        )
-
-        if response.status_code >= 400:
-            logger.error(f"Failed to send heartbeat: {response.status_code}")
-            logger.error(f"Response: {response.text}")
-            return False
-
-        logger.info("Heartbeat sent successfully")
-        logger.debug(f"Response: {response.text}")
-        return True
-    except Exception as e:
-        logger.error(f"Error sending heartbeat: {str(e)}")
-        return False
-
-def poll_hackatime_data():
-    """Main function to poll for Hackatime data and send heartbeats"""
-    # Poll logic would go here
-    pass
-
-if __name__ == "__main__":
-    logger.info("Hackatime service started")
-    # Service startup logic would go here
-
-
-import os
-import time
+import asyncio
 import hashlib
 import logging
-import requests
-from flask import Flask, request, jsonify
-from functools import wraps
-from flask_cors import CORS
+import argparse
+from aiohttp import web, ClientSession, ClientTimeout, TCPConnector, ClientError
 
 # Set up logging
-logging.basicConfig(level=logging.INFO, 
+logging.basicConfig(level=logging.INFO,
                    format='[%(asctime)s] [%(levelname)s] %(message)s',
                    datefmt='%Y-%m-%d %H:%M:%S')
 logger = logging.getLogger('hackatime_service')
 
-app = Flask(__name__)
-CORS(app)  # Enable CORS for all routes
+HACKATIME_BULK_URL = "https://hackatime.hackclub.com/api/hackatime/v1/users/current/heartbeat.bulk"
+
 
 # Rate limiter for API endpoints
 class RateLimiter:
@@ -150,289 +24,365 @@ class RateLimiter:
             'default': {'requests': 4500, 'window': 60},  # 4500 requests per minute
             'heartbeat': {'requests': 3000, 'window': 60}  # 3000 heartbeats per minute
         }
+        self.last_pruned = time.time()
 
-    def is_rate_limited(self, key, limit_type='default'):
+    def prune(self, current_time):
+        """Forget keys with no requests left in the longest window, so idle keys don't pile up."""
+        window = max(limit['window'] for limit in self.limits.values())
+        self.requests = {key: times for key, times in self.requests.items()
+                         if times and current_time - times[-1] < window}
+        self.last_pruned = current_time
+
+    def is_rate_limited(self, key, limit_type='default', cost=1):
         current_time = time.time()
         limit_config = self.limits.get(limit_type, self.limits['default'])
 
-        if key not in self.requests:
-            self.requests[key] = []
+        if current_time - self.last_pruned >= limit_config['window']:
+            self.prune(current_time)
 
         # Remove old requests outside the window
-        self.requests[key] = [t for t in self.requests[key] 
-                            if current_time - t < limit_config['window']]
+        recent = [t for t in self.requests.get(key, ())
+                  if current_time - t < limit_config['window']]
 
         # Check if exceeded limit
-        if len(self.requests[key]) >= limit_config['requests']:
+        if len(recent) + cost > limit_config['requests']:
+            self.requests[key] = recent
             return True
 
         # Add current request
-        self.requests[key].append(current_time)
+        recent.extend([current_time] * cost)
+        self.requests[key] = recent
         return False
 
-rate_limiter = RateLimiter()
 
-def rate_limit(limit_type='default'):
-    def decorator(f):
-        @wraps(f)
-        def decorated_function(*args, **kwargs):
-            ip_address = request.remote_addr
-
-            if rate_limiter.is_rate_limited(ip_address, limit_type):
-                logger.warning(f"Rate limit exceeded for IP: {ip_address}")
-                return jsonify({
-                    'success': False, 
-                    'message': 'Rate limit exceeded. Please try again later.'
-                }), 429
-
-            return f(*args, **kwargs)
-        return decorated_function
-    return decorator
-
-@app.route('/health', methods=['GET'])
-def health_check():
-    """Simple health check endpoint"""
-    return jsonify({'status': 'ok', 'service': 'hackatime-service'}), 200
+def key_fingerprint(api_key):
+    """Short, non-reversible identifier for an API key, used for limits and logs."""
+    return hashlib.sha256(api_key.encode()).hexdigest()[:12]
+
+
+def build_heartbeats(data, user_agent, machine_id):
+    """Apply default values to a single heartbeat or a list of heartbeats."""
+    current_time = int(time.time())
+
+    # Default values for heartbeat
+    default_heartbeat = {
+        "entity": "main.py",
+        "type": "file",
+        "time": current_time,
+        "category": "coding",
+        "project": "Hack Club Spaces",
+        "branch": "main",
+        "language": "Python",
+        "is_write": True,
+        "lines": 150,
+        "lineno": 1,
+        "cursorpos": 0,
+        "line_additions": 0,
+        "line_deletions": 0,
+        "project_root_count": 1,
+        "dependencies": "flask,sqlalchemy,python-dotenv",
+        "machine": machine_id,
+        "editor": "Spaces",
+        "operating_system": "Web",
+        "user_agent": user_agent
+    }
+
+    items = [data] if isinstance(data, dict) else data
+    heartbeats = []
+    for hb in items:
+        complete_hb = default_heartbeat.copy()
+        if isinstance(hb, dict):
+            complete_hb.update(hb)
 
-@app.route('/status', methods=['GET'])
-def hackatime_status():
-    """Check if user has a Hackatime API key connected"""
-    try:
-        # This would normally check the database
-        # For this simplified version, we'll check if the API key exists in the request
-        api_key = request.headers.get('X-Hackatime-Key')
-
-        if api_key:
-            # Validate by making a simple request to Hackatime API
-            return jsonify({'success': True, 'connected': True})
-        else:
-            return jsonify({'success': True, 'connected': False})
-    except Exception as e:
-        logger.error(f'Error checking Hackatime status: {str(e)}')
-        return jsonify({
-            'success': False,
-            'connected': False,
-            'message': f'Failed to check Hackatime status: {str(e)}'
-        })
-
-@app.route('/heartbeat', methods=['POST'])
-@rate_limit('heartbeat')
-def hackatime_heartbeat():
-    """Send a heartbeat to Hackatime API with metadata"""
-    try:
-        # Get API key from headers
-        api_key = request.headers.get('X-Hackatime-Key')
-        if not api_key:
-            logger.warning("Attempted to send heartbeat without API key")
-            return jsonify({
-                'success': False,
-                'message': 'No Hackatime API key provided'
-            }), 403
-
-        # Get heartbeat data from request
-        data = request.get_json()
-        if not data:
-            return jsonify({
-                'success': False,
-                'message': 'No heartbeat data provided'
-            }), 400
-
-        # Prepare the heartbeat data
-        if isinstance(data, dict):
-            heartbeat_payload = [data]  # Single heartbeat
-        elif isinstance(data, list):
-            heartbeat_payload = data    # Multiple heartbeats
-        else:
-            return jsonify({
-                'success': False,
-                'message': 'Invalid heartbeat data format'
-            }), 400
-
-        # Ensure all heartbeats have required fields
-        current_time = int(time.time())
-        machine_id = f"machine_{hashlib.md5(request.remote_addr.encode()).hexdigest()[:8]}"
-        user_agent = request.headers.get('User-Agent', 'Spaces IDE')
-
-        # Default values for heartbeat
-        default_heartbeat = {
-            "entity": "main.py",
-            "type": "file",
-            "time": current_time,
-            "category": "coding",
-            "project": "Hack Club Spaces",
-            "branch": "main",
-            "language": "Python",
-            "is_write": True,
-            "lines": 150,
-            "lineno": 1,
-            "cursorpos": 0,
-            "line_additions": 0,
-            "line_deletions": 0,
-            "project_root_count": 1,
-            "dependencies": "flask,sqlalchemy,python-dotenv",
-            "machine": machine_id,
-            "editor": "Spaces",
-            "operating_system": "Web",
-            "user_agent": user_agent
-        }
+        # Format comma-separated dependencies as a PostgreSQL array string
+        deps = complete_hb.get('dependencies')
+        if isinstance(deps, str) and deps and not deps.startswith('{'):
+            complete_hb['dependencies'] = "{" + deps + "}"
 
-        # Apply default values to each heartbeat
-        for i, hb in enumerate(heartbeat_payload):
-            complete_hb = default_heartbeat.copy()
-            complete_hb.update(hb)
-            heartbeat_payload[i] = complete_hb
+        heartbeats.append(complete_hb)
+    return heartbeats
 
-        # Send heartbeat to Hackatime API
-        api_url = "https://hackatime.hackclub.com/api/hackatime/v1/users/current/heartbeat.bulk"
 
+class HeartbeatRelay:
+    """
+    Buffers heartbeats per API key and forwards them to Hackatime in bulk.
+
+    A fixed pool of workers drains keys that have pending heartbeats. A key is
+    only ever handled by one worker at a time, so heartbeats for one user are
+    delivered in order, and anything that arrives while a batch is in flight is
+    coalesced into that key's next bulk request. All upstream calls share one
+    pooled keep-alive ClientSession.
+    """
+
+    def __init__(self, upstream_url=HACKATIME_BULK_URL, workers=20, max_batch=25,
+                 max_queue=50000, max_attempts=3):
+        self.upstream_url = upstream_url
+        self.workers = workers
+        self.max_batch = max_batch
+        self.max_queue = max_queue
+        self.max_attempts = max_attempts
+
+        self.buffers = {}  # api_key -> list of (heartbeat, user_agent)
+        self.queue_depth = 0
+        self.scheduled = set()  # keys that are queued for or held by a worker
+        self.ready = None
+        self.session = None
+        self.tasks = []
+        self.stats = {'accepted': 0, 'sent': 0, 'failed': 0, 'requests': 0, 'retries': 0}
+
+    async def start(self):
+        self.ready = asyncio.Queue()
+        connector = TCPConnector(limit=self.workers, keepalive_timeout=60, ttl_dns_cache=300)
+        self.session = ClientSession(connector=connector, timeout=ClientTimeout(total=10))
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"Heartbeat relay started with {self.workers} workers -> {self.upstream_url}")
+
+    async def stop(self, drain_timeout=5):
+        """Give pending heartbeats a chance to flush, then close the connection pool."""
+        deadline = time.monotonic() + drain_timeout
+        while self.scheduled and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        if self.session:
+            await self.session.close()
+        if self.queue_depth:
+            logger.warning(f"Dropping {self.queue_depth} undelivered heartbeats on shutdown")
+
+    def enqueue(self, api_key, heartbeats, user_agent):
+        """Queue heartbeats for delivery. Returns False when the relay is full."""
+        if self.queue_depth + len(heartbeats) > self.max_queue:
+            return False
+
+        buffer = self.buffers.setdefault(api_key, [])
+        buffer.extend((hb, user_agent) for hb in heartbeats)
+        self.queue_depth += len(heartbeats)
+        self.stats['accepted'] += len(heartbeats)
+
+        if api_key not in self.scheduled:
+            self.scheduled.add(api_key)
+            self.ready.put_nowait(api_key)
+        return True
+
+    async def _worker(self):
+        while True:
+            api_key = await self.ready.get()
+            buffer = self.buffers.get(api_key, [])
+            batch, self.buffers[api_key] = buffer[:self.max_batch], buffer[self.max_batch:]
+            self.queue_depth -= len(batch)
+
+            try:
+                if batch:
+                    await self._send(api_key, batch)
+            except Exception as e:
+                logger.error(f"Unexpected relay error for key {key_fingerprint(api_key)}: {str(e)}")
+                self.stats['failed'] += len(batch)
+            finally:
+                if self.buffers.get(api_key):
+                    self.ready.put_nowait(api_key)
+                else:
+                    self.buffers.pop(api_key, None)
+                    self.scheduled.discard(api_key)
+
+    async def _send(self, api_key, batch):
         headers = {
             'Authorization': f'Bearer {api_key}',
             'Content-Type': 'application/json',
-            'User-Agent': user_agent
+            'User-Agent': batch[-1][1]
         }
+        payload = [hb for hb, _ in batch]
+
+        for attempt in range(1, self.max_attempts + 1):
+            retry_after = 2 ** attempt / 4
+            try:
+                self.stats['requests'] += 1
+                async with self.session.post(self.upstream_url, json=payload, headers=headers) as response:
+                    if response.status < 400:
+                        await response.read()
+                        self.stats['sent'] += len(payload)
+                        return True
+
+                    body = (await response.text())[:200]
+                    if response.status != 429 and response.status < 500:
+                        # Client errors (bad key, bad payload) will not succeed on retry
+                        logger.error(f"Hackatime rejected {len(payload)} heartbeats for key "
+                                     f"{key_fingerprint(api_key)}: {response.status} - {body}")
+                        break
+                    retry_after = float(response.headers.get('Retry-After', retry_after))
+                    logger.warning(f"Hackatime returned {response.status}, retrying in {retry_after}s")
+            except (ClientError, asyncio.TimeoutError) as e:
+                logger.warning(f"Error sending heartbeats (attempt {attempt}): {str(e)}")
+
+            if attempt < self.max_attempts:
+                self.stats['retries'] += 1
+                await asyncio.sleep(retry_after)
+
+        self.stats['failed'] += len(payload)
+        return False
 
-        # Log detailed request information
-        logger.info(f"Sending heartbeat to Hackatime API: {api_url}")
-        # Format headers for better readability in logs
-        formatted_headers = {
-            'Authorization': f'Bearer {api_key[:5]}...{api_key[-5:]}',  # Mask most of the API key for security
-            'Content-Type': headers['Content-Type'],
-            'User-Agent': headers['User-Agent']
-        }
-        logger.info(f"Request Headers: {formatted_headers}")
-        logger.info(f"Payload: {heartbeat_payload}")
-
-        response = requests.post(
-            api_url,
-            headers=headers,
-            json=heartbeat_payload,
-            timeout=10
-        )
-
-        logger.info(f"Hackatime API response status: {response.status_code}")
-        logger.info(f"Response headers: {dict(response.headers)}")
-        logger.info(f"Response content: {response.text[:500]}")
-
-        if response.status_code >= 400:
-            error_text = response.text
-            logger.error(f"Hackatime heartbeat failed: {response.status_code} - {error_text}")
-            return jsonify({
-                'success': False,
-                'message': f'Heartbeat failed with status code {response.status_code}',
-                'details': error_text
-            }), response.status_code
-
-        # Try to parse the response
-        try:
-            response_data = response.json()
-            return jsonify({
-                'success': True,
-                'message': 'Heartbeat sent successfully',
-                'response': response_data
-            })
-        except:
-            # If we can't parse JSON but status code was good, still return success
-            return jsonify({
-                'success': True,
-                'message': 'Heartbeat sent successfully'
-            })
-
-    except Exception as e:
-        logger.error(f'Error sending Hackatime heartbeat: {str(e)}')
-        return jsonify({
-            'success': False,
-            'message': f'Failed to send heartbeat: {str(e)}'
-        }), 500
 
-@app.route('/connect', methods=['POST'])
-def hackatime_connect():
-    """Connect Hackatime account by validating API key"""
-    try:
-        data = request.get_json()
-        api_key = data.get('api_key')
+rate_limiter = RateLimiter()
 
-        if not api_key:
-            return jsonify({
-                'success': False,
-                'message': 'API key is required'
-            })
 
-        # Validate the API key by making a request to the Hackatime API
-        api_url = "https://hackatime.hackclub.com/api/hackatime/v1/users/current/heartbeats"
+async def health_check(request):
+    """Simple health check endpoint"""
+    return web.json_response({'status': 'ok', 'service': 'hackatime-service'})
 
-        headers = {
-            'Authorization': f'Bearer {api_key}',
-            'Content-Type': 'application/json'
-        }
 
-        # Simple test heartbeat
-        current_time = int(time.time())
-        test_data = [{
-            "type": "file",
-            "time": current_time,
-            "entity": "test.txt",
-            "language": "Text"
-        }]
-
-        logger.info(f"Testing Hackatime API key")
-
-        response = requests.post(
-            api_url,
-            headers=headers,
-            json=test_data,
-            timeout=5
-        )
-
-        logger.info(f"API validation response: {response.status_code}")
-
-        if response.status_code >= 400:
-            # Try an alternative endpoint as backup validation
-            alternative_endpoint = "https://hackatime.hackclub.com/api/hackatime/v1/users/current"
-            alternative_response = requests.get(
-                alternative_endpoint,
-                headers=headers,
-                timeout=5
-            )
-
-            if alternative_response.status_code >= 400:
-                logger.error(f"API key validation failed")
-                return jsonify({
-                    'success': False,
-                    'message': 'Invalid API key. Please check your API key and try again.'
-                })
-
-        # If we get here, the API key is valid
-        logger.info(f"API key validation successful")
-
-        return jsonify({
-            'success': True,
-            'message': 'Hackatime account connected successfully'
-        })
-
-    except Exception as e:
-        logger.error(f'Error connecting Hackatime: {str(e)}')
-        return jsonify({
+async def relay_status(request):
+    """Report queue depth and delivery counters"""
+    relay = request.app['relay']
+    return web.json_response({
+        'success': True,
+        'queue_depth': relay.queue_depth,
+        'active_keys': len(relay.scheduled),
+        'stats': relay.stats
+    })
+
+
+async def hackatime_heartbeat(request):
+    """Accept a heartbeat or a batch of heartbeats and queue them for delivery"""
+    relay = request.app['relay']
+
+    # Get API key from headers
+    api_key = request.headers.get('X-Hackatime-Key')
+    if not api_key:
+        logger.warning("Attempted to send heartbeat without API key")
+        return web.json_response({
             'success': False,
-            'message': f'Failed to connect Hackatime: {str(e)}'
-        })
+            'message': 'No Hackatime API key provided'
+        }, status=403)
 
-@app.route('/disconnect', methods=['POST'])
-def hackatime_disconnect():
-    """Disconnect Hackatime account"""
     try:
-        # In a real app, this would remove the API key from the database
-        return jsonify({
-            'success': True,
-            'message': 'Hackatime account disconnected successfully'
-        })
-    except Exception as e:
-        logger.error(f'Error disconnecting Hackatime: {str(e)}')
-        return jsonify({
+        data = await request.json()
+    except ValueError:
+        data = None
+
+    if not data or not isinstance(data, (dict, list)):
+        return web.json_response({
+            'success': False,
+            'message': 'No heartbeat data provided'
+        }, status=400)
+
+    count = 1 if isinstance(data, dict) else len(data)
+    if rate_limiter.is_rate_limited(key_fingerprint(api_key), 'heartbeat', cost=count):
+        logger.warning(f"Rate limit exceeded for key {key_fingerprint(api_key)}")
+        return web.json_response({
+            'success': False,
+            'message': 'Rate limit exceeded. Please try again later.'
+        }, status=429)
+
+    user_agent = request.headers.get('User-Agent', 'Spaces IDE')
+    machine_id = request.headers.get('X-Machine-Id') or \
+        f"machine_{hashlib.md5((request.remote or '').encode()).hexdigest()[:8]}"
+    heartbeats = build_heartbeats(data, user_agent, machine_id)
+
+    if not relay.enqueue(api_key, heartbeats, user_agent):
+        return web.json_response({
             'success': False,
-            'message': f'Failed to disconnect Hackatime: {str(e)}'
-        })
+            'message': 'Heartbeat queue is full. Please try again later.'
+        }, status=503)
+
+    return web.json_response({
+        'success': True,
+        'message': 'Heartbeats queued',
+        'queued': len(heartbeats),
+        'queue_depth': relay.queue_depth
+    }, status=202)
+
+
+def create_app(upstream_url=HACKATIME_BULK_URL, workers=None):
+    """Build the relay application."""
+    app = web.Application(client_max_size=1024 * 1024)
+    app['relay'] = HeartbeatRelay(
+        upstream_url=upstream_url,
+        workers=workers or int(os.environ.get('HACKATIME_RELAY_WORKERS', 20))
+    )
+
+    async def on_startup(app):
+        await app['relay'].start()
+
+    async def on_cleanup(app):
+        await app['relay'].stop()
+
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+
+    app.router.add_get('/health', health_check)
+    app.router.add_get('/status', relay_status)
+    app.router.add_post('/heartbeat', hackatime_heartbeat)
+    return app
+
+
+async def run_benchmark(requests_count=20000, keys=500, concurrency=200, upstream_delay=0.005):
+    """
+    Measure relay throughput against a local stub of the Hackatime bulk endpoint.
+
+    The stub sleeps for upstream_delay per call to stand in for network latency.
+    """
+    received = {'heartbeats': 0, 'requests': 0}
+
+    async def stub_bulk(request):
+        payload = await request.json()
+        await asyncio.sleep(upstream_delay)
+        received['requests'] += 1
+        received['heartbeats'] += len(payload)
+        return web.json_response({'responses': [[{}, 201]] * len(payload)}, status=201)
+
+    stub = web.Application()
+    stub.router.add_post('/heartbeat.bulk', stub_bulk)
+    stub_runner = web.AppRunner(stub, access_log=None)
+    await stub_runner.setup()
+    stub_site = web.TCPSite(stub_runner, '127.0.0.1', 0)
+    await stub_site.start()
+    stub_port = stub_site._server.sockets[0].getsockname()[1]
+
+    relay_runner = web.AppRunner(create_app(f"http://127.0.0.1:{stub_port}/heartbeat.bulk"), access_log=None)
+    await relay_runner.setup()
+    relay_site = web.TCPSite(relay_runner, '127.0.0.1', 0)
+    await relay_site.start()
+    relay_port = relay_site._server.sockets[0].getsockname()[1]
+    relay_url = f'http://127.0.0.1:{relay_port}/heartbeat'
+
+    semaphore = asyncio.Semaphore(concurrency)
+    async with ClientSession(connector=TCPConnector(limit=concurrency)) as client:
+        async def post(i):
+            async with semaphore:
+                headers = {'X-Hackatime-Key': f'bench-key-{i % keys}'}
+                async with client.post(relay_url, json={'entity': f'file{i}.py'}, headers=headers) as r:
+                    await r.read()
+                    return r.status
+
+        started = time.perf_counter()
+        statuses = await asyncio.gather(*(post(i) for i in range(requests_count)))
+        accepted_at = time.perf_counter()
+        while received['heartbeats'] < statuses.count(202):
+            await asyncio.sleep(0.01)
+        delivered_at = time.perf_counter()
+
+    await relay_runner.cleanup()
+    await stub_runner.cleanup()
+
+    print(f"{requests_count} heartbeats from {keys} keys, client concurrency {concurrency}, "
+          f"stub latency {upstream_delay * 1000:.0f} ms")
+    print(f"accepted:  {statuses.count(202)} in {accepted_at - started:.2f}s "
+          f"({statuses.count(202) / (accepted_at - started):.0f}/s)")
+    print(f"delivered: {received['heartbeats']} in {delivered_at - started:.2f}s "
+          f"({received['heartbeats'] / (delivered_at - started):.0f}/s) "
+          f"using {received['requests']} upstream requests")
+
 
 if __name__ == '__main__':
-    port = int(os.environ.get('PORT', 3001))
-    logger.info(f"Starting Hackatime service on port {port}")
-    app.run(host='0.0.0.0', port=port, debug=True)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Hackatime heartbeat relay')
+    parser.add_argument('--benchmark', action='store_true', help='run a throughput benchmark against a local stub')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        asyncio.run(run_benchmark())
+        sys.exit(0)
+
+    host = os.environ.get('HACKATIME_SERVICE_HOST', '127.0.0.1')
+    port = int(os.environ.get('HACKATIME_SERVICE_PORT', 3001))
+    logger.info(f"Starting Hackatime service on {host}:{port}")
+    web.run_app(create_app(), host=host, port=port, print=None)
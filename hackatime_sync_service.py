@@ -0,0 +1,262 @@
+import os
+import time
+import logging
+import threading
+import requests
+from datetime import datetime, timedelta
+
+logger = logging.getLogger('hackatime_sync')
+
+HACKATIME_STATS_URL = "https://hackatime.hackclub.com/api/v1/users/my/stats"
+
+
+def fetch_hackatime_stats(api_key, features='projects,languages', timeout=5):
+    """
+    Fetch raw stats for a user from the Hackatime API.
+
+    Returns a tuple of (data, error). Exactly one of them is set.
+    """
+    try:
+        url = HACKATIME_STATS_URL
+        if features:
+            url = f"{url}?features={features}"
+
+        headers = {
+            "Authorization": f"Bearer {api_key}"
+        }
+
+        response = requests.get(url, headers=headers, timeout=timeout)
+
+        if response.status_code == 200:
+            return response.json().get('data', {}), None
+        return None, f'Hackatime API error: {response.status_code}'
+    except Exception as e:
+        return None, f'Failed to get stats: {str(e)}'
+
+
+def day_shares(start, end):
+    """
+    Split the interval from start to end into UTC days. Returns
+    [(date, fraction of the interval on that date)], which sums to 1.
+    """
+    if start is None or start >= end:
+        return [(end.date(), 1.0)]
+    total = (end - start).total_seconds()
+    shares = []
+    day_start = start
+    while day_start < end:
+        day_end = min(datetime.combine(day_start.date() + timedelta(days=1), datetime.min.time()), end)
+        shares.append((day_start.date(), (day_end - day_start).total_seconds() / total))
+        day_start = day_end
+    return shares
+
+
+class HackatimeSyncService:
+    """
+    Background worker that keeps HackatimeSnapshot rows fresh.
+
+    Each pass picks the users whose snapshot is missing or stale (oldest first),
+    so a restart or a slow upstream only delays the tail of the queue rather than
+    re-fetching everyone. Upstream calls are spaced to stay under the configured
+    requests-per-minute budget.
+    """
+
+    def __init__(self):
+        self.requests_per_minute = int(os.environ.get('HACKATIME_SYNC_RPM', 30))
+        self.stale_after = int(os.environ.get('HACKATIME_SYNC_INTERVAL', 900))  # seconds
+        self.batch_size = int(os.environ.get('HACKATIME_SYNC_BATCH', 50))
+        self.max_gap_days = int(os.environ.get('HACKATIME_SYNC_MAX_GAP_DAYS', 30))
+        self.idle_sleep = 30
+        self.enabled = os.environ.get('HACKATIME_SYNC_ENABLED', 'true').lower() != 'false'
+
+        self._app = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._priority_user_ids = set()
+        self._last_request_at = 0.0
+
+    @property
+    def min_interval(self):
+        """Minimum number of seconds between two upstream requests."""
+        return 60.0 / max(self.requests_per_minute, 1)
+
+    def start(self, app):
+        """Start the sync worker thread for the given Flask app (idempotent)."""
+        if not self.enabled:
+            logger.info("Hackatime sync disabled via HACKATIME_SYNC_ENABLED")
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._app = app
+            self._thread = threading.Thread(target=self._run, name='hackatime-sync', daemon=True)
+            self._thread.start()
+        logger.info("Hackatime sync worker started")
+
+    def request_sync(self, user_id):
+        """Ask the worker to refresh a user's snapshot ahead of the regular schedule."""
+        with self._lock:
+            self._priority_user_ids.add(user_id)
+        self._wake.set()
+
+    def _pace(self):
+        """Sleep just long enough to respect the upstream rate budget."""
+        wait = self._last_request_at + self.min_interval - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        self._last_request_at = time.monotonic()
+
+    def _run(self):
+        while True:
+            try:
+                with self._app.app_context():
+                    synced = self.run_once()
+            except Exception as e:
+                logger.error(f"Hackatime sync pass failed: {str(e)}")
+                synced = 0
+
+            if synced == 0:
+                self._wake.wait(self.idle_sleep)
+                self._wake.clear()
+
+    def _take_priority_ids(self):
+        with self._lock:
+            user_ids = list(self._priority_user_ids)
+            self._priority_user_ids.clear()
+        return user_ids
+
+    def get_due_users(self, limit=None):
+        """Return users with an API key whose snapshot is missing or stale, oldest first."""
+        from models import db, User, HackatimeSnapshot
+
+        cutoff = datetime.utcnow() - timedelta(seconds=self.stale_after)
+        return (User.query
+                .outerjoin(HackatimeSnapshot, HackatimeSnapshot.user_id == User.id)
+                .filter(User.wakatime_api_key.isnot(None))
+                .filter(db.or_(HackatimeSnapshot.synced_at.is_(None),
+                               HackatimeSnapshot.synced_at < cutoff))
+                .order_by(HackatimeSnapshot.synced_at.asc().nullsfirst())
+                .limit(limit or self.batch_size)
+                .all())
+
+    def run_once(self):
+        """Sync one batch of users. Returns the number of users processed."""
+        from models import User
+
+        users = []
+        priority_ids = self._take_priority_ids()
+        if priority_ids:
+            users.extend(User.query.filter(User.id.in_(priority_ids),
+                                           User.wakatime_api_key.isnot(None)).all())
+        seen = {u.id for u in users}
+        users.extend(u for u in self.get_due_users() if u.id not in seen)
+
+        for user in users:
+            self._pace()
+            self.sync_user(user)
+        return len(users)
+
+    def sync_user(self, user):
+        """Fetch stats for a single user and upsert their snapshot."""
+        from models import db, HackatimeSnapshot
+
+        data, error = fetch_hackatime_stats(user.wakatime_api_key)
+
+        # Lock the snapshot so a concurrent sync of the same user (the worker and
+        # an inline refresh) waits and then diffs against the totals this one stores
+        snapshot = (HackatimeSnapshot.query.filter_by(user_id=user.id)
+                    .populate_existing().with_for_update().first())
+        if not snapshot:
+            snapshot = HackatimeSnapshot(user_id=user.id)
+            db.session.add(snapshot)
+
+        now = datetime.utcnow()
+        if data is not None:
+            if snapshot.languages is not None:
+                # Only attribute time to days once a successful sync gave us a baseline
+                self.record_daily_deltas(user.id, snapshot, data,
+                                         since=snapshot.stats_synced_at or snapshot.synced_at, now=now)
+
+            languages = data.get('languages', [])
+            snapshot.username = data.get('username', '')
+            snapshot.total_seconds = data.get('total_seconds', 0)
+            snapshot.daily_average = data.get('daily_average', 0)
+            snapshot.human_readable_total = data.get('human_readable_total', '0 hrs')
+            snapshot.human_readable_daily_average = data.get('human_readable_daily_average', '0 mins')
+            snapshot.top_language = languages[0]['name'] if languages else None
+            snapshot.languages = languages
+            snapshot.projects = data.get('projects', [])
+            snapshot.last_error = None
+            snapshot.stats_synced_at = now
+        else:
+            # Keep the last good numbers, but record why this refresh failed
+            snapshot.last_error = error[:255]
+            logger.warning(f"Hackatime sync failed for user {user.id}: {error}")
+
+        snapshot.synced_at = now
+
+        try:
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Failed to store Hackatime snapshot for user {user.id}: {str(e)}")
+            return None
+        return snapshot
+
+    def record_daily_deltas(self, user_id, snapshot, data, since=None, now=None):
+        """
+        Add the growth between the stored snapshot and fresh stats to the
+        HackatimeDailyStat rows of the days since the last successful sync.
+        The stats endpoint only returns running totals, so growth across a
+        gap (worker down, rate limiting) is spread over the days in
+        proportion to the time each covers, rather than credited to today.
+        Gaps longer than max_gap_days are spread over the last max_gap_days.
+        Shrinking totals (e.g. deleted upstream data) are ignored rather
+        than recorded as negative time.
+        """
+        from models import db, HackatimeDailyStat
+
+        deltas = {}
+
+        total_delta = (data.get('total_seconds') or 0) - (snapshot.total_seconds or 0)
+        if total_delta > 0:
+            deltas[('total', '')] = total_delta
+
+        for dimension, new_items, old_items in (
+                ('language', data.get('languages', []), snapshot.languages or []),
+                ('project', data.get('projects', []), snapshot.projects or [])):
+            previous = {item.get('name'): item.get('total_seconds') or 0 for item in old_items}
+            for item in new_items:
+                name = (item.get('name') or '')[:200]
+                delta = (item.get('total_seconds') or 0) - previous.get(item.get('name'), 0)
+                if delta > 0:
+                    deltas[(dimension, name)] = delta
+
+        if not deltas:
+            return
+
+        now = now or datetime.utcnow()
+        if since is not None:
+            since = max(since, now - timedelta(days=self.max_gap_days))
+        shares = day_shares(since, now)
+
+        existing = {
+            (row.day, row.dimension, row.name): row
+            for row in HackatimeDailyStat.query.filter(HackatimeDailyStat.user_id == user_id,
+                                                       HackatimeDailyStat.day >= shares[0][0],
+                                                       HackatimeDailyStat.day <= shares[-1][0]).all()
+        }
+        for (dimension, name), delta in deltas.items():
+            for day, share in shares:
+                seconds = delta * share
+                row = existing.get((day, dimension, name))
+                if row:
+                    row.seconds = (row.seconds or 0) + seconds
+                else:
+                    row = existing[(day, dimension, name)] = HackatimeDailyStat(
+                        user_id=user_id, day=day, dimension=dimension, name=name, seconds=seconds)
+                    db.session.add(row)
+
+
+hackatime_sync_service = HackatimeSyncService()
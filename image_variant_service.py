@@ -0,0 +1,332 @@
+import io
+import os
+import time
+import queue
+import socket
+import hashlib
+import logging
+import ipaddress
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urljoin, urlsplit
+
+import requests
+from PIL import Image, ImageOps
+
+logger = logging.getLogger('image_variants')
+
+VARIANT_WIDTHS = (320, 640, 1280)
+VARIANT_FORMATS = ('webp', 'jpeg')
+VARIANT_QUALITY = {'webp': 80, 'jpeg': 82}
+# Bump when the resize or encode settings change so old variants get new keys
+PIPELINE_VERSION = 1
+
+MAX_SOURCE_BYTES = 25 * 1024 * 1024
+MAX_SOURCE_PIXELS = 50_000_000
+MAX_SOURCE_REDIRECTS = 3
+# Animated and vector images are left alone
+SKIPPED_TYPES = ('image/gif', 'image/svg+xml')
+
+Image.MAX_IMAGE_PIXELS = MAX_SOURCE_PIXELS
+
+
+def source_key(url):
+    """Stable key for a source image, derived from its URL."""
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+
+def variant_key(src_key, width, fmt):
+    """
+    Deterministic cache key for one variant. The same source, size, format and
+    pipeline settings always map to the same key, so re-running the pipeline
+    never produces duplicates and keys can be cached forever.
+    """
+    raw = f"{src_key}:{width}:{fmt}:q{VARIANT_QUALITY[fmt]}:v{PIPELINE_VERSION}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:40]
+
+
+def check_source_url(url):
+    """
+    Raise ValueError unless url is http(s) on a host that resolves only to
+    public addresses. Gallery thumbnails are user supplied, so without this
+    the server could be made to fetch internal services or cloud metadata.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise ValueError('Only http and https image URLs are fetched')
+    try:
+        addresses = socket.getaddrinfo(parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80),
+                                       proto=socket.IPPROTO_TCP)
+    except (socket.gaierror, UnicodeError, ValueError):
+        raise ValueError(f'Cannot resolve {parts.hostname}')
+    for address in addresses:
+        ip = ipaddress.ip_address(address[4][0].split('%')[0])
+        if ip.version == 6 and ip.ipv4_mapped:
+            ip = ip.ipv4_mapped
+        if not ip.is_global or ip.is_multicast:
+            raise ValueError(f'{parts.hostname} resolves to a non-public address')
+
+
+def is_variant_candidate(file_type):
+    return bool(file_type) and file_type.startswith('image/') and file_type not in SKIPPED_TYPES
+
+
+def render_variants(data, widths=VARIANT_WIDTHS, formats=VARIANT_FORMATS):
+    """
+    Decode an image once and encode every width/format variant of it.
+
+    Runs inside the process pool, so it only takes and returns plain bytes.
+    Widths at or above the source width are skipped; an image narrower than
+    the smallest width gets a single variant at its own width. Returns a list
+    of (width, height, format, encoded bytes).
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        # Image.open only reads the header; refuse huge images before decoding them
+        # (Pillow itself only errors at twice MAX_IMAGE_PIXELS)
+        if image.width * image.height > MAX_SOURCE_PIXELS:
+            raise ValueError(f'Source image larger than {MAX_SOURCE_PIXELS} pixels')
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+            image = image.convert('RGBA')
+            flattened = Image.new('RGB', image.size, (255, 255, 255))
+            flattened.paste(image, mask=image.getchannel('A'))
+        else:
+            image = image.convert('RGB')
+            flattened = image
+
+        targets = [w for w in widths if w < image.width] or [image.width]
+        variants = []
+        for width in targets:
+            height = max(1, round(image.height * width / image.width))
+            for fmt in formats:
+                source = image if fmt == 'webp' else flattened
+                resized = source if width == source.width else source.resize((width, height), Image.LANCZOS)
+                out = io.BytesIO()
+                if fmt == 'webp':
+                    resized.save(out, 'WEBP', quality=VARIANT_QUALITY[fmt], method=4)
+                else:
+                    resized.save(out, 'JPEG', quality=VARIANT_QUALITY[fmt], optimize=True, progressive=True)
+                variants.append((width, height, fmt, out.getvalue()))
+        return variants
+
+
+class ImageVariantService:
+    """
+    Generates resized WebP and JPEG variants of uploaded images and gallery
+    thumbnails so pages can serve a srcset instead of the original.
+
+    Sources are queued by URL. A dispatcher thread downloads each source and
+    hands the decode/resize/encode work to a process pool (the work is CPU
+    bound, so threads would serialise on the GIL). Finished variants are
+    staged, sent to the CDN and recorded in image_variant under deterministic
+    keys, which makes re-queuing an already processed source a no-op.
+    """
+
+    def __init__(self):
+        self.process_count = int(os.environ.get('IMAGE_VARIANT_PROCESSES', os.cpu_count() or 1))
+        self.max_pending = self.process_count * 2
+
+        self._app = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pool = None
+        self._queue = queue.Queue()
+        self._queued = set()  # source keys queued or in flight
+        self._failed = {}  # source key -> time of the last failure
+        self.retry_failed_after = 3600  # seconds
+
+    def start(self, app):
+        """Start the dispatcher thread and process pool (idempotent)."""
+        with self._lock:
+            if self._thread:
+                return
+            self._app = app
+            # Spawned workers do not inherit the web process's threads or DB connections
+            self._pool = ProcessPoolExecutor(max_workers=self.process_count,
+                                             mp_context=multiprocessing.get_context('spawn'))
+            self._thread = threading.Thread(target=self._run, name='image-variants', daemon=True)
+            self._thread.start()
+        logger.info(f"Image variant pipeline started ({self.process_count} processes)")
+
+    def enqueue(self, url, file_type=None):
+        """Queue a source image for variant generation. Returns False if it was skipped."""
+        if not url or (file_type and not is_variant_candidate(file_type)):
+            return False
+        key = source_key(url)
+        with self._lock:
+            if key in self._queued:
+                return True
+            failed_at = self._failed.get(key)
+            if failed_at and time.time() - failed_at < self.retry_failed_after:
+                return False
+            self._queued.add(key)
+        if not self._thread:
+            from flask import current_app
+            self.start(current_app._get_current_object())
+        self._queue.put((key, url))
+        return True
+
+    def enqueue_missing(self, urls):
+        """Queue every URL that has no variants yet."""
+        from models import ImageVariant
+
+        urls = [url for url in set(urls) if url]
+        if not urls:
+            return 0
+        keys = {source_key(url): url for url in urls}
+        done = {row[0] for row in ImageVariant.query.with_entities(ImageVariant.source_key)
+                .filter(ImageVariant.source_key.in_(list(keys))).distinct()}
+        return sum(1 for key, url in keys.items() if key not in done and self.enqueue(url))
+
+    def srcsets(self, urls):
+        """
+        Map source URLs to their srcset strings in one query:
+        {url: {'webp': '... 320w, ...', 'jpeg': '... 320w, ...'}}.
+        URLs without variants are left out, so callers fall back to the original.
+        """
+        from models import ImageVariant
+
+        keys = {source_key(url): url for url in set(urls) if url}
+        if not keys:
+            return {}
+        result = {}
+        rows = ImageVariant.query.filter(ImageVariant.source_key.in_(list(keys)))\
+            .order_by(ImageVariant.width).all()
+        for variant in rows:
+            entry = result.setdefault(keys[variant.source_key], {})
+            candidate = f"{variant.cdn_url} {variant.width}w"
+            entry[variant.format] = f"{entry[variant.format]}, {candidate}" if variant.format in entry else candidate
+        return result
+
+    def _run(self):
+        pending = {}  # future -> (source key, url)
+        while True:
+            # Keep the pool busy without buffering every queued download in memory
+            while len(pending) < self.max_pending:
+                try:
+                    key, url = self._queue.get(block=not pending)
+                except queue.Empty:
+                    break
+                try:
+                    data = self._download(url)
+                    pending[self._pool.submit(render_variants, data)] = (key, url)
+                except Exception as e:
+                    self._mark_failed(key, url, e)
+
+            done, _ = wait(list(pending), timeout=0.1, return_when=FIRST_COMPLETED)
+            for future in done:
+                key, url = pending.pop(future)
+                try:
+                    with self._app.app_context():
+                        self._record(key, url, future.result())
+                    with self._lock:
+                        self._queued.discard(key)
+                except Exception as e:
+                    self._mark_failed(key, url, e)
+
+    def _mark_failed(self, key, url, error):
+        logger.warning(f"Could not generate variants for {url}: {str(error)}")
+        with self._lock:
+            self._queued.discard(key)
+            self._failed[key] = time.time()
+
+    def _download(self, url):
+        # Follow redirects by hand so every hop is checked before it is fetched
+        for _ in range(MAX_SOURCE_REDIRECTS + 1):
+            check_source_url(url)
+            response = requests.get(url, stream=True, timeout=30, allow_redirects=False)
+            if not response.is_redirect:
+                break
+            url = urljoin(url, response.headers['Location'])
+            response.close()
+        else:
+            raise ValueError('Too many redirects')
+        response.raise_for_status()
+        data = io.BytesIO()
+        for chunk in response.iter_content(chunk_size=256 * 1024):
+            data.write(chunk)
+            if data.tell() > MAX_SOURCE_BYTES:
+                raise ValueError(f'Source image larger than {MAX_SOURCE_BYTES} bytes')
+        return data.getvalue()
+
+    def _record(self, key, url, variants):
+        """Stage the encoded variants, send them to the CDN and record them."""
+        from models import db, ImageVariant
+        from cdn_service import cdn_service, staging_janitor, stage_stream
+
+        existing = {row[0] for row in ImageVariant.query.with_entities(ImageVariant.variant_key)
+                    .filter_by(source_key=key)}
+        todo = [(variant_key(key, width, fmt), width, height, fmt, data)
+                for width, height, fmt, data in variants
+                if variant_key(key, width, fmt) not in existing]
+        if not todo:
+            return
+
+        staged = [stage_stream(io.BytesIO(data), f"{vkey}.{'jpg' if fmt == 'jpeg' else fmt}")
+                  for vkey, _, _, fmt, data in todo]
+        app_url = (self._app.config.get('APP_URL') or os.environ.get('APP_URL', '')).rstrip('/')
+        try:
+            results = cdn_service.upload_urls([f"{app_url}/cdn/temp/{f.staged_name}" for f in staged])
+            for (vkey, width, height, fmt, data), staged_file, result in zip(todo, staged, results):
+                if isinstance(result, Exception):
+                    raise result
+                db.session.add(ImageVariant(source_key=key,
+                                            source_url=url[:500],
+                                            variant_key=vkey,
+                                            width=width,
+                                            height=height,
+                                            format=fmt,
+                                            file_size=len(data),
+                                            cdn_url=result['deployedUrl']))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            for staged_file in staged:
+                staging_janitor.release(staged_file.path)
+
+
+image_variant_service = ImageVariantService()
+
+
+if __name__ == '__main__':
+    # Benchmark the resize/encode stage on its own:
+    #   python image_variant_service.py [images...] --processes 4
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark image variant generation')
+    parser.add_argument('images', nargs='*', help='Source images (defaults to synthetic 2400x1600 screenshots)')
+    parser.add_argument('--count', type=int, default=48, help='Number of synthetic images')
+    parser.add_argument('--processes', type=int, nargs='+', default=[1, os.cpu_count() or 1])
+    args = parser.parse_args()
+
+    if args.images:
+        sources = []
+        for path in args.images:
+            with open(path, 'rb') as f:
+                sources.append(f.read())
+    else:
+        # Noise plus flat regions, roughly the entropy of a real screenshot
+        sources = []
+        for i in range(args.count):
+            image = Image.effect_noise((2400, 1600), 40 + i % 20).convert('RGB')
+            image.paste((30 * (i % 8), 120, 200), (0, 0, 2400, 400))
+            out = io.BytesIO()
+            image.save(out, 'PNG')
+            sources.append(out.getvalue())
+
+    print(f"{len(sources)} images, {sum(len(s) for s in sources) / 1024 / 1024:.1f}MB, "
+          f"widths {VARIANT_WIDTHS}, formats {VARIANT_FORMATS}")
+    sample = render_variants(sources[0])
+    print(f"Variant sizes for first image: {', '.join(f'{w}w {fmt} {len(d) // 1024}KB' for w, _, fmt, d in sample)}")
+
+    for processes in args.processes:
+        with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn')) as pool:
+            list(pool.map(render_variants, sources[:processes]))  # warm up the workers
+            started = time.perf_counter()
+            list(pool.map(render_variants, sources))
+            elapsed = time.perf_counter() - started
+        rate = len(sources) / elapsed
+        print(f"{processes} processes: {rate:.1f} images/s, {rate / processes:.1f} images/s per core")
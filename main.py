@@ -1,4 +1,5 @@
 import os
+import sys
 import logging
 import subprocess
 import signal
@@ -50,9 +51,7 @@ def start_hackatime_service():
     try:
         app.logger.info("Starting Hackatime service...")
         hackatime_process = subprocess.Popen(
-            ['python', 'hackatime_service.py'],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
+            [sys.executable, 'hackatime_service.py']
         )
         app.logger.info(f"Hackatime service started with PID {hackatime_process.pid}")
     except Exception as e:
@@ -403,13 +402,45 @@ if __name__ == '__main__':
     except Exception as e:
         app.logger.warning(f"Database initialization error: {e}")
 
-    # Start Hackatime service
-    start_hackatime_service()
+    # With the reloader, this module runs in a watcher process and again in
+    # the process that serves; start the background workers only in the latter
+    debug = True
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        # Start Hackatime service
+        start_hackatime_service()
 
-    # Register the cleanup function to stop Hackatime service on exit
-    atexit.register(stop_hackatime_service)
+        # Register the cleanup function to stop Hackatime service on exit
+        atexit.register(stop_hackatime_service)
+
+        # Keep local Hackatime snapshots fresh in the background
+        from hackatime_sync_service import hackatime_sync_service
+        hackatime_sync_service.start(app)
+
+        # Run GitHub push/pull/create-repo jobs off the request thread
+        from github_sync_service import github_sync_service
+        github_sync_service.start(app)
+
+        # Resize uploaded images and gallery thumbnails in a process pool
+        from image_variant_service import image_variant_service
+        image_variant_service.start(app)
+
+        # Recompute gallery trending scores periodically
+        from gallery_trending_service import gallery_trending_service
+        gallery_trending_service.start(app)
+
+        # Batch club chat writes and fan messages out to open streams
+        from club_chat_service import club_chat_service
+        club_chat_service.start(app)
+
+        # Correct any drift in the club counter columns
+        from club_counter_service import club_counter_service
+        club_counter_service.start(app)
+
+        # Run large user, club and site deletions in chunks
+        from deletion_service import deletion_service
+        deletion_service.start(app)
 
     # Start the main Flask application
     port = int(os.environ.get('PORT', 3000))
     app.logger.info(f"Server running on http://0.0.0.0:{port}")
-    app.run(host='0.0.0.0', port=port, debug=True)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=port, debug=debug)
\ No newline at end of file
@@ -0,0 +1,61 @@
+import os
+import psycopg2
+
+def run_migration():
+    """Create the club_balance_entry ledger table and open it with each club's current balance"""
+    database_url = os.environ.get('DATABASE_URL')
+    if not database_url:
+        print("DATABASE_URL not found in environment variables")
+        return False
+
+    try:
+        conn = psycopg2.connect(database_url)
+        cur = conn.cursor()
+
+        # db.create_all() may already have created the table; the opening entries are still needed
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS club_balance_entry (
+                id SERIAL PRIMARY KEY,
+                club_id INTEGER NOT NULL REFERENCES club(id) ON DELETE CASCADE,
+                entry_type VARCHAR(20) NOT NULL,
+                amount NUMERIC(10,2) NOT NULL,
+                balance_after NUMERIC(10,2) NOT NULL,
+                description VARCHAR(500),
+                reference VARCHAR(100),
+                created_by INTEGER REFERENCES "user"(id) ON DELETE SET NULL,
+                created_at TIMESTAMP NOT NULL DEFAULT (NOW() AT TIME ZONE 'utc')
+            );
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS ix_club_balance_entry_club_id
+            ON club_balance_entry (club_id, id);
+        """)
+
+        # Balances set before the ledger existed become an opening adjustment,
+        # so every club's balance equals the sum of its entries
+        cur.execute("""
+            INSERT INTO club_balance_entry (club_id, entry_type, amount, balance_after, description, created_at)
+            SELECT c.id, 'adjustment', c.balance, c.balance, 'Opening balance', NOW() AT TIME ZONE 'utc'
+            FROM club c
+            WHERE c.balance <> 0
+              AND NOT EXISTS (SELECT 1 FROM club_balance_entry e WHERE e.club_id = c.id);
+        """)
+        opened = cur.rowcount
+
+        conn.commit()
+        print(f"Club balance ledger ready; opened {opened} club balances")
+        return True
+
+    except Exception as e:
+        print(f"Error running migration: {str(e)}")
+        if 'conn' in locals():
+            conn.rollback()
+        return False
+    finally:
+        if 'cur' in locals():
+            cur.close()
+        if 'conn' in locals():
+            conn.close()
+
+if __name__ == "__main__":
+    run_migration()
@@ -0,0 +1,46 @@
+import os
+import psycopg2
+
+def run_migration():
+    """Add calendar_secret to the club table so leaders can revoke calendar feed URLs"""
+    database_url = os.environ.get('DATABASE_URL')
+    if not database_url:
+        print("DATABASE_URL not found in environment variables")
+        return False
+
+    try:
+        conn = psycopg2.connect(database_url)
+        cur = conn.cursor()
+
+        cur.execute("""
+            SELECT column_name
+            FROM information_schema.columns
+            WHERE table_name='club' AND column_name='calendar_secret';
+        """)
+
+        if cur.fetchone():
+            print("calendar_secret column already exists in club table")
+        else:
+            # Left NULL: existing feed URLs keep working until a leader resets the link
+            cur.execute("""
+                ALTER TABLE club
+                ADD COLUMN calendar_secret VARCHAR(64);
+            """)
+            print("Successfully added calendar_secret column to club table")
+
+        conn.commit()
+        return True
+
+    except Exception as e:
+        print(f"Error running migration: {str(e)}")
+        if 'conn' in locals():
+            conn.rollback()
+        return False
+    finally:
+        if 'cur' in locals():
+            cur.close()
+        if 'conn' in locals():
+            conn.close()
+
+if __name__ == "__main__":
+    run_migration()
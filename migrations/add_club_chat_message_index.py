@@ -0,0 +1,47 @@
+import os
+import psycopg2
+
+def run_migration():
+    """Add the (channel_id, created_at, id) index used to page club chat history"""
+    database_url = os.environ.get('DATABASE_URL')
+    if not database_url:
+        print("DATABASE_URL not found in environment variables")
+        return False
+    
+    try:
+        conn = psycopg2.connect(database_url)
+        cur = conn.cursor()
+        
+        # Check if the index already exists
+        cur.execute("""
+            SELECT indexname 
+            FROM pg_indexes 
+            WHERE tablename='club_chat_message' AND indexname='ix_club_chat_message_channel_created';
+        """)
+        
+        if cur.fetchone():
+            print("ix_club_chat_message_channel_created index already exists on club_chat_message table")
+            return True
+        
+        cur.execute("""
+            CREATE INDEX ix_club_chat_message_channel_created 
+            ON club_chat_message (channel_id, created_at, id);
+        """)
+        
+        conn.commit()
+        print("Successfully added chat history index to club_chat_message table")
+        return True
+        
+    except Exception as e:
+        print(f"Error running migration: {str(e)}")
+        if 'conn' in locals():
+            conn.rollback()
+        return False
+    finally:
+        if 'cur' in locals():
+            cur.close()
+        if 'conn' in locals():
+            conn.close()
+
+if __name__ == "__main__":
+    run_migration()
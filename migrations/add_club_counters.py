@@ -0,0 +1,65 @@
+import os
+import psycopg2
+
+def run_migration():
+    """Add member/project/active assignment/post counter columns to the club table and backfill them"""
+    database_url = os.environ.get('DATABASE_URL')
+    if not database_url:
+        print("DATABASE_URL not found in environment variables")
+        return False
+    
+    try:
+        conn = psycopg2.connect(database_url)
+        cur = conn.cursor()
+        
+        # Check if member_count column already exists
+        cur.execute("""
+            SELECT column_name 
+            FROM information_schema.columns 
+            WHERE table_name='club' AND column_name='member_count';
+        """)
+        
+        if cur.fetchone():
+            print("Counter columns already exist in club table")
+            return True
+        
+        cur.execute("""
+            ALTER TABLE club 
+            ADD COLUMN member_count INTEGER NOT NULL DEFAULT 0,
+            ADD COLUMN project_count INTEGER NOT NULL DEFAULT 0,
+            ADD COLUMN active_assignment_count INTEGER NOT NULL DEFAULT 0,
+            ADD COLUMN post_count INTEGER NOT NULL DEFAULT 0;
+        """)
+        
+        # Backfill from the current rows; member_count excludes the leader
+        cur.execute("""
+            UPDATE club c SET
+                member_count = (SELECT COUNT(*) FROM club_membership m WHERE m.club_id = c.id),
+                project_count = (
+                    SELECT COUNT(*) FROM site s
+                    WHERE s.user_id = c.leader_id
+                       OR s.user_id IN (SELECT m.user_id FROM club_membership m WHERE m.club_id = c.id)
+                ),
+                active_assignment_count = (
+                    SELECT COUNT(*) FROM club_assignment a WHERE a.club_id = c.id AND a.is_active
+                ),
+                post_count = (SELECT COUNT(*) FROM club_post p WHERE p.club_id = c.id);
+        """)
+        
+        conn.commit()
+        print("Successfully added counter columns to club table")
+        return True
+        
+    except Exception as e:
+        print(f"Error running migration: {str(e)}")
+        if 'conn' in locals():
+            conn.rollback()
+        return False
+    finally:
+        if 'cur' in locals():
+            cur.close()
+        if 'conn' in locals():
+            conn.close()
+
+if __name__ == "__main__":
+    run_migration()
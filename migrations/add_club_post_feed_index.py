@@ -0,0 +1,54 @@
+import os
+import psycopg2
+
+def run_migration():
+    """Add the (club_id, created_at, id) index used to page club feeds"""
+    database_url = os.environ.get('DATABASE_URL')
+    if not database_url:
+        print("DATABASE_URL not found in environment variables")
+        return False
+    
+    try:
+        conn = psycopg2.connect(database_url)
+        cur = conn.cursor()
+        
+        # Check if the index already exists
+        cur.execute("""
+            SELECT indexname 
+            FROM pg_indexes 
+            WHERE tablename='club_post' AND indexname='ix_club_post_club_created';
+        """)
+        
+        if cur.fetchone():
+            print("ix_club_post_club_created index already exists on club_post table")
+            return True
+        
+        cur.execute("""
+            CREATE INDEX ix_club_post_club_created 
+            ON club_post (club_id, created_at, id);
+        """)
+        
+        # Bring like counters written before toggle_post_like kept them in sync up to date
+        cur.execute("""
+            UPDATE club_post p
+            SET likes = (SELECT COUNT(*) FROM club_post_like l WHERE l.post_id = p.id)
+            WHERE COALESCE(p.likes, -1) <> (SELECT COUNT(*) FROM club_post_like l WHERE l.post_id = p.id);
+        """)
+        
+        conn.commit()
+        print("Successfully added club feed index to club_post table")
+        return True
+        
+    except Exception as e:
+        print(f"Error running migration: {str(e)}")
+        if 'conn' in locals():
+            conn.rollback()
+        return False
+    finally:
+        if 'cur' in locals():
+            cur.close()
+        if 'conn' in locals():
+            conn.close()
+
+if __name__ == "__main__":
+    run_migration()
@@ -0,0 +1,42 @@
+import os
+import psycopg2
+
+def run_migration():
+    """Add heartbeat_at to deletion_job so jobs of a dead process can be re-queued"""
+    database_url = os.environ.get('DATABASE_URL')
+    if not database_url:
+        print("DATABASE_URL not found in environment variables")
+        return False
+
+    try:
+        conn = psycopg2.connect(database_url)
+        cur = conn.cursor()
+
+        cur.execute("""
+            SELECT column_name
+            FROM information_schema.columns
+            WHERE table_name='deletion_job' AND column_name='heartbeat_at';
+        """)
+
+        if cur.fetchone():
+            print("heartbeat_at column already exists in deletion_job table")
+        else:
+            cur.execute("ALTER TABLE deletion_job ADD COLUMN heartbeat_at TIMESTAMP;")
+            print("Successfully added heartbeat_at column to deletion_job table")
+
+        conn.commit()
+        return True
+
+    except Exception as e:
+        print(f"Error running migration: {str(e)}")
+        if 'conn' in locals():
+            conn.rollback()
+        return False
+    finally:
+        if 'cur' in locals():
+            cur.close()
+        if 'conn' in locals():
+            conn.close()
+
+if __name__ == "__main__":
+    run_migration()
@@ -0,0 +1,59 @@
+import os
+import psycopg2
+
+def run_migration():
+    """Add a generated full-text search vector with a GIN index to gallery_entry"""
+    database_url = os.environ.get('DATABASE_URL')
+    if not database_url:
+        print("DATABASE_URL not found in environment variables")
+        return False
+    
+    try:
+        conn = psycopg2.connect(database_url)
+        cur = conn.cursor()
+        
+        # Check if search_vector column already exists
+        cur.execute("""
+            SELECT column_name 
+            FROM information_schema.columns 
+            WHERE table_name='gallery_entry' AND column_name='search_vector';
+        """)
+        
+        if cur.fetchone():
+            print("search_vector column already exists in gallery_entry table")
+            return True
+        
+        # Generated, so Postgres keeps it current on every insert and update.
+        # 'simple' (no stemming) keeps prefix queries predictable; the weights
+        # match FIELD_WEIGHTS in gallery_search_service.
+        cur.execute("""
+            ALTER TABLE gallery_entry 
+            ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+                setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+                setweight(to_tsvector('simple', coalesce(tags, '')), 'B') ||
+                setweight(to_tsvector('simple', coalesce(description, '')), 'C')
+            ) STORED;
+        """)
+        
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS ix_gallery_entry_search_vector 
+            ON gallery_entry USING GIN (search_vector);
+        """)
+        
+        conn.commit()
+        print("Successfully added search_vector column to gallery_entry table")
+        return True
+        
+    except Exception as e:
+        print(f"Error running migration: {str(e)}")
+        if 'conn' in locals():
+            conn.rollback()
+        return False
+    finally:
+        if 'cur' in locals():
+            cur.close()
+        if 'conn' in locals():
+            conn.close()
+
+if __name__ == "__main__":
+    run_migration()
@@ -0,0 +1,82 @@
+import os
+import psycopg2
+
+def run_migration():
+    """Create the normalized gallery tag tables, backfill them and add gallery listing indexes"""
+    database_url = os.environ.get('DATABASE_URL')
+    if not database_url:
+        print("DATABASE_URL not found in environment variables")
+        return False
+    
+    try:
+        conn = psycopg2.connect(database_url)
+        cur = conn.cursor()
+        
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS gallery_tag (
+                id SERIAL PRIMARY KEY,
+                name VARCHAR(50) NOT NULL UNIQUE
+            );
+        """)
+        
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS gallery_entry_tag (
+                entry_id INTEGER NOT NULL REFERENCES gallery_entry(id) ON DELETE CASCADE,
+                tag_id INTEGER NOT NULL REFERENCES gallery_tag(id) ON DELETE CASCADE,
+                PRIMARY KEY (entry_id, tag_id)
+            );
+        """)
+        
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS ix_gallery_entry_tag_tag 
+            ON gallery_entry_tag (tag_id, entry_id);
+        """)
+        
+        # Split the comma separated tags the same way gallery_service.normalize_tag does
+        cur.execute("""
+            INSERT INTO gallery_tag (name)
+            SELECT DISTINCT left(btrim(regexp_replace(lower(raw.tag), '\\s+', ' ', 'g')), 50)
+            FROM gallery_entry e
+            CROSS JOIN LATERAL regexp_split_to_table(e.tags, ',') AS raw(tag)
+            WHERE e.tags IS NOT NULL
+              AND btrim(raw.tag) <> ''
+            ON CONFLICT (name) DO NOTHING;
+        """)
+        
+        cur.execute("""
+            INSERT INTO gallery_entry_tag (entry_id, tag_id)
+            SELECT DISTINCT e.id, t.id
+            FROM gallery_entry e
+            CROSS JOIN LATERAL regexp_split_to_table(e.tags, ',') AS raw(tag)
+            JOIN gallery_tag t ON t.name = left(btrim(regexp_replace(lower(raw.tag), '\\s+', ' ', 'g')), 50)
+            WHERE e.tags IS NOT NULL
+            ON CONFLICT DO NOTHING;
+        """)
+        
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS ix_gallery_entry_added 
+            ON gallery_entry (added_at, id);
+        """)
+        
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS ix_gallery_entry_featured_added 
+            ON gallery_entry (is_featured, added_at, id);
+        """)
+        
+        conn.commit()
+        print("Successfully created and backfilled gallery tag tables")
+        return True
+        
+    except Exception as e:
+        print(f"Error running migration: {str(e)}")
+        if 'conn' in locals():
+            conn.rollback()
+        return False
+    finally:
+        if 'cur' in locals():
+            cur.close()
+        if 'conn' in locals():
+            conn.close()
+
+if __name__ == "__main__":
+    run_migration()
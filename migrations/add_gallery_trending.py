@@ -0,0 +1,55 @@
+import os
+import psycopg2
+
+def run_migration():
+    """Add trending score columns and their index to the gallery_entry table"""
+    database_url = os.environ.get('DATABASE_URL')
+    if not database_url:
+        print("DATABASE_URL not found in environment variables")
+        return False
+    
+    try:
+        conn = psycopg2.connect(database_url)
+        cur = conn.cursor()
+        
+        # Check if trending_score column already exists
+        cur.execute("""
+            SELECT column_name 
+            FROM information_schema.columns 
+            WHERE table_name='gallery_entry' AND column_name='trending_score';
+        """)
+        
+        if cur.fetchone():
+            print("trending_score column already exists in gallery_entry table")
+            return True
+        
+        cur.execute("""
+            ALTER TABLE gallery_entry 
+            ADD COLUMN trending_score DOUBLE PRECISION NOT NULL DEFAULT 0,
+            ADD COLUMN view_heat DOUBLE PRECISION NOT NULL DEFAULT 0,
+            ADD COLUMN views_seen INTEGER,
+            ADD COLUMN trending_updated_at TIMESTAMP;
+        """)
+        
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS ix_gallery_entry_trending 
+            ON gallery_entry (trending_score, id);
+        """)
+        
+        conn.commit()
+        print("Successfully added trending columns to gallery_entry table")
+        return True
+        
+    except Exception as e:
+        print(f"Error running migration: {str(e)}")
+        if 'conn' in locals():
+            conn.rollback()
+        return False
+    finally:
+        if 'cur' in locals():
+            cur.close()
+        if 'conn' in locals():
+            conn.close()
+
+if __name__ == "__main__":
+    run_migration()
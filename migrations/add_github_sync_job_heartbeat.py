@@ -0,0 +1,43 @@
+import os
+import psycopg2
+
+def run_migration():
+    """Add worker_id and heartbeat_at to github_sync_job so jobs of a dead process can be detected"""
+    database_url = os.environ.get('DATABASE_URL')
+    if not database_url:
+        print("DATABASE_URL not found in environment variables")
+        return False
+
+    try:
+        conn = psycopg2.connect(database_url)
+        cur = conn.cursor()
+
+        for column, definition in (('worker_id', 'VARCHAR(32)'), ('heartbeat_at', 'TIMESTAMP')):
+            cur.execute("""
+                SELECT column_name
+                FROM information_schema.columns
+                WHERE table_name='github_sync_job' AND column_name=%s;
+            """, (column,))
+
+            if cur.fetchone():
+                print(f"{column} column already exists in github_sync_job table")
+            else:
+                cur.execute(f"ALTER TABLE github_sync_job ADD COLUMN {column} {definition};")
+                print(f"Successfully added {column} column to github_sync_job table")
+
+        conn.commit()
+        return True
+
+    except Exception as e:
+        print(f"Error running migration: {str(e)}")
+        if 'conn' in locals():
+            conn.rollback()
+        return False
+    finally:
+        if 'cur' in locals():
+            cur.close()
+        if 'conn' in locals():
+            conn.close()
+
+if __name__ == "__main__":
+    run_migration()
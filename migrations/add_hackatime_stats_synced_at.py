@@ -0,0 +1,52 @@
+import os
+import psycopg2
+
+def run_migration():
+    """Add stats_synced_at to hackatime_snapshot, the time of the last successful Hackatime fetch"""
+    database_url = os.environ.get('DATABASE_URL')
+    if not database_url:
+        print("DATABASE_URL not found in environment variables")
+        return False
+
+    try:
+        conn = psycopg2.connect(database_url)
+        cur = conn.cursor()
+
+        cur.execute("""
+            SELECT column_name
+            FROM information_schema.columns
+            WHERE table_name='hackatime_snapshot' AND column_name='stats_synced_at';
+        """)
+
+        if cur.fetchone():
+            print("stats_synced_at column already exists in hackatime_snapshot table")
+        else:
+            cur.execute("""
+                ALTER TABLE hackatime_snapshot
+                ADD COLUMN stats_synced_at TIMESTAMP;
+            """)
+
+            # Snapshots whose last refresh succeeded hold numbers from synced_at
+            cur.execute("""
+                UPDATE hackatime_snapshot
+                SET stats_synced_at = synced_at
+                WHERE last_error IS NULL AND languages IS NOT NULL;
+            """)
+            print("Successfully added stats_synced_at column to hackatime_snapshot table")
+
+        conn.commit()
+        return True
+
+    except Exception as e:
+        print(f"Error running migration: {str(e)}")
+        if 'conn' in locals():
+            conn.rollback()
+        return False
+    finally:
+        if 'cur' in locals():
+            cur.close()
+        if 'conn' in locals():
+            conn.close()
+
+if __name__ == "__main__":
+    run_migration()
@@ -0,0 +1,47 @@
+import os
+import psycopg2
+
+def run_migration():
+    """Add the (user_id, id) index used to list and page sites by owner"""
+    database_url = os.environ.get('DATABASE_URL')
+    if not database_url:
+        print("DATABASE_URL not found in environment variables")
+        return False
+    
+    try:
+        conn = psycopg2.connect(database_url)
+        cur = conn.cursor()
+        
+        # Check if the index already exists
+        cur.execute("""
+            SELECT indexname 
+            FROM pg_indexes 
+            WHERE tablename='site' AND indexname='ix_site_user_id';
+        """)
+        
+        if cur.fetchone():
+            print("ix_site_user_id index already exists on site table")
+            return True
+        
+        cur.execute("""
+            CREATE INDEX ix_site_user_id 
+            ON site (user_id, id);
+        """)
+        
+        conn.commit()
+        print("Successfully added owner index to site table")
+        return True
+        
+    except Exception as e:
+        print(f"Error running migration: {str(e)}")
+        if 'conn' in locals():
+            conn.rollback()
+        return False
+    finally:
+        if 'cur' in locals():
+            cur.close()
+        if 'conn' in locals():
+            conn.close()
+
+if __name__ == "__main__":
+    run_migration()
@@ -0,0 +1,53 @@
+
+import os
+import psycopg2
+
+def run_migration():
+    """Add content_hash column to user_upload table for upload deduplication"""
+    database_url = os.environ.get('DATABASE_URL')
+    if not database_url:
+        print("DATABASE_URL not found in environment variables")
+        return False
+    
+    try:
+        conn = psycopg2.connect(database_url)
+        cur = conn.cursor()
+        
+        # Check if content_hash column already exists
+        cur.execute("""
+            SELECT column_name 
+            FROM information_schema.columns 
+            WHERE table_name='user_upload' AND column_name='content_hash';
+        """)
+        
+        if cur.fetchone():
+            print("content_hash column already exists in user_upload table")
+            return True
+        
+        cur.execute("""
+            ALTER TABLE user_upload 
+            ADD COLUMN content_hash VARCHAR(64);
+        """)
+        
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS ix_user_upload_content_hash 
+            ON user_upload (content_hash);
+        """)
+        
+        conn.commit()
+        print("Successfully added content_hash column to user_upload table")
+        return True
+        
+    except Exception as e:
+        print(f"Error running migration: {str(e)}")
+        if 'conn' in locals():
+            conn.rollback()
+        return False
+    finally:
+        if 'cur' in locals():
+            cur.close()
+        if 'conn' in locals():
+            conn.close()
+
+if __name__ == "__main__":
+    run_migration()
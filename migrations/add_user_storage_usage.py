@@ -0,0 +1,63 @@
+import os
+import psycopg2
+
+def run_migration():
+    """Add storage_used_bytes to the user table and the index used for paging uploads"""
+    database_url = os.environ.get('DATABASE_URL')
+    if not database_url:
+        print("DATABASE_URL not found in environment variables")
+        return False
+    
+    try:
+        conn = psycopg2.connect(database_url)
+        cur = conn.cursor()
+        
+        # Check if storage_used_bytes column already exists
+        cur.execute("""
+            SELECT column_name 
+            FROM information_schema.columns 
+            WHERE table_name='user' AND column_name='storage_used_bytes';
+        """)
+        
+        if cur.fetchone():
+            print("storage_used_bytes column already exists in user table")
+        else:
+            cur.execute("""
+                ALTER TABLE "user" 
+                ADD COLUMN storage_used_bytes BIGINT NOT NULL DEFAULT 0;
+            """)
+            
+            # One-time backfill; from here on the counter is kept incrementally
+            cur.execute("""
+                UPDATE "user" u
+                SET storage_used_bytes = totals.used
+                FROM (
+                    SELECT user_id, COALESCE(SUM(file_size), 0) AS used
+                    FROM user_upload
+                    GROUP BY user_id
+                ) totals
+                WHERE totals.user_id = u.id;
+            """)
+            print("Successfully added storage_used_bytes column to user table")
+        
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS ix_user_upload_user_uploaded 
+            ON user_upload (user_id, uploaded_at, id);
+        """)
+        
+        conn.commit()
+        return True
+        
+    except Exception as e:
+        print(f"Error running migration: {str(e)}")
+        if 'conn' in locals():
+            conn.rollback()
+        return False
+    finally:
+        if 'cur' in locals():
+            cur.close()
+        if 'conn' in locals():
+            conn.close()
+
+if __name__ == "__main__":
+    run_migration()
@@ -34,6 +34,13 @@ class Club(db.Model):
     location = db.Column(db.String(200), nullable=True)
     join_code = db.Column(db.String(16), unique=True, nullable=True)
     balance = db.Column(db.Numeric(10, 2), default=0.00, nullable=False)
+    # Mixed into calendar feed tokens; leaders regenerate it to revoke old feed URLs
+    calendar_secret = db.Column(db.String(64), nullable=True)
+    # Maintained by club_counter_service; member_count excludes the leader
+    member_count = db.Column(db.Integer, default=0, nullable=False, server_default='0')
+    project_count = db.Column(db.Integer, default=0, nullable=False, server_default='0')
+    active_assignment_count = db.Column(db.Integer, default=0, nullable=False, server_default='0')
+    post_count = db.Column(db.Integer, default=0, nullable=False, server_default='0')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -85,6 +92,8 @@ class ClubPost(db.Model):
     club = db.relationship('Club', backref=db.backref('posts', lazy=True, order_by='desc(ClubPost.created_at)'))
     user = db.relationship('User', backref=db.backref('club_posts', lazy=True))
 
+    __table_args__ = (db.Index('ix_club_post_club_created', 'club_id', 'created_at', 'id'),)
+
     def __repr__(self):
         return f'<ClubPost {self.id} by {self.user.username} in {self.club.name}>'
 
@@ -171,6 +180,8 @@ class ClubChatMessage(db.Model):
     channel = db.relationship('ClubChatChannel', backref=db.backref('messages', lazy=True, order_by='ClubChatMessage.created_at'))
     user = db.relationship('User', backref=db.backref('chat_messages', lazy=True))
 
+    __table_args__ = (db.Index('ix_club_chat_message_channel_created', 'channel_id', 'created_at', 'id'),)
+
     def __repr__(self):
         return f'<ClubChatMessage by {self.user.username} in {self.channel.name}>'
 
@@ -197,6 +208,25 @@ class ClubMeeting(db.Model):
         return f'<ClubMeeting {self.title} on {self.meeting_date}>'
 
 
+class ClubBalanceEntry(db.Model):
+    """Append-only ledger of a club's balance; written only through club_ledger_service."""
+    __tablename__ = 'club_balance_entry'
+    id = db.Column(db.Integer, primary_key=True)
+    club_id = db.Column(db.Integer, db.ForeignKey('club.id', ondelete='CASCADE'), nullable=False)
+    entry_type = db.Column(db.String(20), nullable=False)  # grant, adjustment, spend
+    amount = db.Column(db.Numeric(10, 2), nullable=False)  # Signed; spends are negative
+    balance_after = db.Column(db.Numeric(10, 2), nullable=False)  # Club.balance once this entry applied
+    description = db.Column(db.String(500), nullable=True)
+    reference = db.Column(db.String(100), nullable=True)  # e.g. an external grant or order id
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='SET NULL'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (db.Index('ix_club_balance_entry_club_id', 'club_id', 'id'),)
+
+    def __repr__(self):
+        return f'<ClubBalanceEntry {self.entry_type} {self.amount} for club {self.club_id}>'
+
+
 class GalleryEntry(db.Model):
     __tablename__ = 'gallery_entry'
     id = db.Column(db.Integer, primary_key=True)
@@ -208,14 +238,46 @@ class GalleryEntry(db.Model):
     tags = db.Column(db.String(200), nullable=True)
     added_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_featured = db.Column(db.Boolean, default=False)
+    # Maintained by gallery_trending_service
+    trending_score = db.Column(db.Float, default=0, nullable=False)
+    view_heat = db.Column(db.Float, default=0, nullable=False)  # Site views, decayed over time
+    views_seen = db.Column(db.Integer, nullable=True)  # Site.view_count at the last recompute
+    trending_updated_at = db.Column(db.DateTime, nullable=True)
 
     site = db.relationship('Site', backref=db.backref('gallery_entries', lazy=True, cascade='all, delete-orphan'))
     user = db.relationship('User', backref=db.backref('gallery_entries', lazy=True))
+    tag_links = db.relationship('GalleryEntryTag', backref='entry', lazy=True, cascade='all, delete-orphan')
+
+    __table_args__ = (
+        db.Index('ix_gallery_entry_added', 'added_at', 'id'),
+        db.Index('ix_gallery_entry_featured_added', 'is_featured', 'added_at', 'id'),
+        db.Index('ix_gallery_entry_trending', 'trending_score', 'id'),
+    )
 
     def __repr__(self):
         return f'<GalleryEntry {self.title} for site {self.site_id}>'
 
 
+class GalleryTag(db.Model):
+    """A normalized gallery tag; GalleryEntry.tags keeps the display string."""
+    __tablename__ = 'gallery_tag'
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), unique=True, nullable=False)
+
+    def __repr__(self):
+        return f'<GalleryTag {self.name}>'
+
+
+class GalleryEntryTag(db.Model):
+    __tablename__ = 'gallery_entry_tag'
+    entry_id = db.Column(db.Integer, db.ForeignKey('gallery_entry.id', ondelete='CASCADE'), primary_key=True)
+    tag_id = db.Column(db.Integer, db.ForeignKey('gallery_tag.id', ondelete='CASCADE'), primary_key=True)
+
+    tag = db.relationship('GalleryTag')
+
+    __table_args__ = (db.Index('ix_gallery_entry_tag_tag', 'tag_id', 'entry_id'),)
+
+
 class User(UserMixin, db.Model):
     __tablename__ = 'user'
 
@@ -241,13 +303,13 @@ class User(UserMixin, db.Model):
     profile_banner = db.Column(db.String(500), nullable=True)
     is_profile_public = db.Column(db.Boolean, default=False)
     is_staff = db.Column(db.Boolean, default=False)
+    storage_used_bytes = db.Column(db.BigInteger, default=0, nullable=False)  # Sum of UserUpload.file_size, kept incrementally
 
     @property
     def is_club_leader(self):
         """Return True if the user has club leader role or is a club leader/co-leader."""
-        return self.is_club_leader_role or \
-               Club.query.filter_by(leader_id=self.id).first() is not None or \
-               ClubMembership.query.filter_by(user_id=self.id, role='co-leader').first() is not None
+        from club_auth import club_auth_for
+        return bool(self.is_club_leader_role) or club_auth_for(self.id).leads_any()
 
     def set_password(self, password):
         self.password_hash = generate_password_hash(password, method='pbkdf2:sha256:150000')
@@ -314,6 +376,8 @@ class Site(db.Model):
     view_count = db.Column(db.Integer, default=0)
     analytics_enabled = db.Column(db.Boolean, default=False)
 
+    __table_args__ = (db.Index('ix_site_user_id', 'user_id', 'id'),)
+
     def __init__(self, *args, **kwargs):
         if 'slug' not in kwargs and 'name' in kwargs:
             # Create our own slug without relying on the external slugify function
@@ -415,8 +479,243 @@ class UserUpload(db.Model):
     cdn_url = db.Column(db.String(500), nullable=False)
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
     sha = db.Column(db.String(100), nullable=True)
+    content_hash = db.Column(db.String(64), nullable=True, index=True)  # sha256 of the file, for dedupe
 
     user = db.relationship('User', backref=db.backref('uploads', lazy=True))
 
+    __table_args__ = (
+        db.Index('ix_user_upload_user_uploaded', 'user_id', 'uploaded_at', 'id'),
+    )
+
+    def __repr__(self):
+        return f'<UserUpload {self.original_filename}>'
+
+
+class ImageVariant(db.Model):
+    """A resized copy of an uploaded image or gallery thumbnail, stored on the CDN."""
+    __tablename__ = 'image_variant'
+    id = db.Column(db.Integer, primary_key=True)
+    source_key = db.Column(db.String(64), nullable=False, index=True)  # sha256 of source_url
+    source_url = db.Column(db.String(500), nullable=False)
+    variant_key = db.Column(db.String(40), unique=True, nullable=False)
+    width = db.Column(db.Integer, nullable=False)
+    height = db.Column(db.Integer, nullable=False)
+    format = db.Column(db.String(10), nullable=False)  # webp, jpeg
+    file_size = db.Column(db.Integer, nullable=False)
+    cdn_url = db.Column(db.String(500), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ImageVariant {self.width}w {self.format} of {self.source_url}>'
+
+
+class CDNUploadSession(db.Model):
+    """State of a chunked, resumable CDN upload; the bytes live in the staging directory."""
+    __tablename__ = 'cdn_upload_session'
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False, index=True)
+    filename = db.Column(db.String(255), nullable=False)
+    content_type = db.Column(db.String(100), nullable=True)
+    total_size = db.Column(db.BigInteger, nullable=False)
+    received_bytes = db.Column(db.BigInteger, default=0, nullable=False)
+    status = db.Column(db.String(20), default='uploading', nullable=False)  # uploading, assembled, completed, aborted
+    staged_name = db.Column(db.String(300), nullable=True)
+    content_hash = db.Column(db.String(64), nullable=True)
+    result = db.Column(db.JSON, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'upload_id': self.id,
+            'filename': self.filename,
+            'total_size': self.total_size,
+            'received_bytes': self.received_bytes,
+            'status': self.status,
+            'result': self.result
+        }
+
+    def __repr__(self):
+        return f'<CDNUploadSession {self.id} {self.received_bytes}/{self.total_size}>'
+
+
+class HackatimeSnapshot(db.Model):
+    """Locally cached copy of a user's Hackatime stats, refreshed by the sync worker."""
+    __tablename__ = 'hackatime_snapshot'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), unique=True, nullable=False, index=True)
+    username = db.Column(db.String(100), nullable=True)
+    total_seconds = db.Column(db.Float, default=0, nullable=False)
+    daily_average = db.Column(db.Float, default=0, nullable=False)
+    human_readable_total = db.Column(db.String(100), default='0 hrs')
+    human_readable_daily_average = db.Column(db.String(100), default='0 mins')
+    top_language = db.Column(db.String(100), nullable=True)
+    languages = db.Column(db.JSON, nullable=True)
+    projects = db.Column(db.JSON, nullable=True)
+    last_error = db.Column(db.String(255), nullable=True)
+    synced_at = db.Column(db.DateTime, nullable=True, index=True)
+    # When the stored numbers were fetched; synced_at also moves on failed refreshes
+    stats_synced_at = db.Column(db.DateTime, nullable=True)
+
+    user = db.relationship('User', backref=db.backref('hackatime_snapshot', uselist=False, lazy=True))
+
+    def to_summary(self):
+        """Return the same shape as the live Hackatime summary response."""
+        summary = {
+            'total_seconds': self.total_seconds or 0,
+            'human_readable_total': self.human_readable_total or '0 hrs',
+            'daily_average': self.daily_average or 0,
+            'human_readable_daily_average': self.human_readable_daily_average or '0 mins',
+            'top_language': self.top_language,
+            'synced_at': self.synced_at.isoformat() if self.synced_at else None
+        }
+        if self.last_error:
+            summary['error'] = self.last_error
+        return summary
+
+    def to_detailed(self):
+        """Return the same shape as the live detailed Hackatime stats response."""
+        return {
+            'username': self.username or '',
+            'total_seconds': self.total_seconds or 0,
+            'human_readable_total': self.human_readable_total or '0 hrs',
+            'daily_average': self.daily_average or 0,
+            'human_readable_daily_average': self.human_readable_daily_average or '0 mins',
+            'projects': self.projects or [],
+            'languages': self.languages or [],
+            'synced_at': self.synced_at.isoformat() if self.synced_at else None
+        }
+
+    def get_project_seconds(self, project_name):
+        """Return tracked seconds for a project by name, or None if unknown."""
+        for project in self.projects or []:
+            if project.get('name') == project_name:
+                return project.get('total_seconds', 0)
+        return None
+
+    def __repr__(self):
+        return f'<HackatimeSnapshot user_id={self.user_id} synced_at={self.synced_at}>'
+
+
+class HackatimeDailyStat(db.Model):
+    """Coding seconds a user logged on one day, broken down by total, language or project."""
+    __tablename__ = 'hackatime_daily_stat'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    dimension = db.Column(db.String(20), nullable=False)  # total, language, project
+    name = db.Column(db.String(200), nullable=False, default='')
+    seconds = db.Column(db.Float, default=0, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'day', 'dimension', 'name', name='uix_hackatime_daily_stat'),
+        db.Index('idx_hackatime_daily_stat_day_user', 'day', 'user_id'),
+    )
+
+    def __repr__(self):
+        return f'<HackatimeDailyStat user_id={self.user_id} {self.day} {self.dimension}:{self.name}>'
+
+class GitHubSyncJob(db.Model):
+    """A push, pull or repository creation run in the background by github_sync_service."""
+    __tablename__ = 'github_sync_job'
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False, index=True)
+    site_id = db.Column(db.Integer, db.ForeignKey('site.id', ondelete='CASCADE'), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # push, pull, create_repo
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, succeeded, failed, cancelled
+    idempotency_key = db.Column(db.String(64), nullable=True)
+    params = db.Column(db.JSON, nullable=True)
+    result = db.Column(db.JSON, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    progress_done = db.Column(db.Integer, default=0, nullable=False)
+    progress_total = db.Column(db.Integer, default=0, nullable=False)
+    current_file = db.Column(db.String(255), nullable=True)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    cancel_requested = db.Column(db.Boolean, default=False, nullable=False)
+    # The process holding the job (and its token) and when it last said it is alive
+    worker_id = db.Column(db.String(32), nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'idempotency_key', name='uix_github_sync_job_idempotency'),
+        db.Index('idx_github_sync_job_site_status', 'site_id', 'status'),
+    )
+
+    @property
+    def is_finished(self):
+        return self.status in ('succeeded', 'failed', 'cancelled')
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'kind': self.kind,
+            'site_id': self.site_id,
+            'status': self.status,
+            'progress': {
+                'done': self.progress_done,
+                'total': self.progress_total,
+                'current_file': self.current_file
+            },
+            'attempts': self.attempts,
+            'cancel_requested': self.cancel_requested,
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+    def __repr__(self):
+        return f'<GitHubSyncJob {self.id} {self.kind} {self.status}>'
+
+
+class DeletionJob(db.Model):
+    """A user, club or site deletion run in chunks in the background by deletion_service."""
+    __tablename__ = 'deletion_job'
+    id = db.Column(db.String(32), primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # user, club, sites
+    target_id = db.Column(db.Integer, nullable=False)  # The user, club, or owner of the sites
+    params = db.Column(db.JSON, nullable=True)
+    requested_by = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='SET NULL'), nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, succeeded, failed
+    result = db.Column(db.JSON, nullable=True)  # Rows removed per step
+    error = db.Column(db.Text, nullable=True)
+    progress_done = db.Column(db.Integer, default=0, nullable=False)
+    progress_total = db.Column(db.Integer, default=0, nullable=False)
+    current_step = db.Column(db.String(100), nullable=True)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)  # Refreshed while a worker runs the job
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (db.Index('idx_deletion_job_target_status', 'kind', 'target_id', 'status'),)
+
+    @property
+    def is_finished(self):
+        return self.status in ('succeeded', 'failed')
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'kind': self.kind,
+            'target_id': self.target_id,
+            'status': self.status,
+            'progress': {
+                'done': self.progress_done,
+                'total': self.progress_total,
+                'current_step': self.current_step
+            },
+            'attempts': self.attempts,
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
     def __repr__(self):
-        return f'<UserUpload {self.original_filename}>'
\ No newline at end of file
+        return f'<DeletionJob {self.id} {self.kind} {self.target_id} {self.status}>'
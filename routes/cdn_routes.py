@@ -7,9 +7,13 @@ import tempfile
 import os
 import time
 from datetime import datetime
-from models import db, UserUpload, User
+from models import db, UserUpload, User, CDNUploadSession
+from cdn_service import cdn_service, staging_janitor, stage_stream, StagingFull, STAGING_DIR, CDN_API_URL, \
+    resumable_uploads, UploadOffsetMismatch
+from image_variant_service import image_variant_service
 from sqlalchemy import desc
 import mimetypes
+import base64
 
 cdn_bp = Blueprint('cdn', __name__, url_prefix='/cdn')
 
@@ -32,165 +36,149 @@ def cdn_page():
 def upload_files():
     """Handle file uploads to the Hack Club CDN"""
     current_app.logger.info("CDN upload request received")
-    current_app.logger.info(f"Request files: {request.files}")
-    current_app.logger.info(f"Request form: {request.form}")
-    current_app.logger.info(f"Request data: {request.data}")
 
     if 'files' not in request.files:
         current_app.logger.error("No files found in request")
         return jsonify({'success': False, 'message': 'No files provided'})
 
-    files = request.files.getlist('files')
+    files = [file for file in request.files.getlist('files') if file.filename != '']
     current_app.logger.info(f"Files count: {len(files)}")
 
-    for file in files:
-        current_app.logger.info(f"File: {file.filename}, Content-Type: {file.content_type}, Size: {file.content_length}")
-
     if len(files) == 0:
         current_app.logger.error("Empty files list")
-        return jsonify({'success': False, 'message': 'No files provided'})
-
-    # Hardcoded API token
-    api_token = "beans"
-    current_app.logger.info(f"Using API token: {api_token}")
-
-    # Prepare URLs for the CDN API
-    file_urls = []
-
-    # Create a temporary directory for storing uploaded files
-    import tempfile
-    import os
-    import uuid
-    from werkzeug.utils import secure_filename
-
-    # Create temp directory if it doesn't exist
-    temp_dir = os.path.join(tempfile.gettempdir(), 'hc_cdn_temp')
-    os.makedirs(temp_dir, exist_ok=True)
-
-    # Clean up old files (older than 5 minutes)
-    current_time = time.time()
-    for temp_file in os.listdir(temp_dir):
-        file_path = os.path.join(temp_dir, temp_file)
-        if os.path.isfile(file_path) and (current_time - os.path.getmtime(file_path)) > 300:  # 300 seconds = 5 minutes
-            try:
-                os.remove(file_path)
-                current_app.logger.info(f"Removed old temp file: {file_path}")
-            except Exception as e:
-                current_app.logger.error(f"Error removing old temp file {file_path}: {str(e)}")
+        return jsonify({'success': False, 'message': 'No valid files to upload'})
 
+    # 1. Stream every file to staging, hashing it in the same pass.
+    # Old staged files are expired by staging_janitor, not on this path.
+    staged = []
     for file in files:
-        if file.filename == '':
-            continue
-
         try:
-            # 1. Save file to temporary storage
-            secure_name = secure_filename(file.filename)
-            unique_filename = f"{uuid.uuid4()}_{secure_name}"
-            temp_file_path = os.path.join(temp_dir, unique_filename)
-            file.save(temp_file_path)
-            current_app.logger.info(f"Saved file to temporary location: {temp_file_path}")
-
-            # 2. Get a URL that can be accessed by the CDN API
-            # Construct the temporary URL using the app's URL
-            app_url = current_app.config.get('APP_URL')
-            if not app_url:
-                # Try to get the URL from request
-                host = request.host_url.rstrip('/')
-                app_url = host
-                current_app.logger.info(f"Using host from request: {app_url}")
-            
-            file_url = f"{app_url}/cdn/temp/{unique_filename}"
-            file_urls.append(file_url)
-            current_app.logger.info(f"Added URL for file: {file_url}")
+            staged.append(stage_stream(file.stream, file.filename))
+        except StagingFull as e:
+            for staged_file in staged:
+                staging_janitor.release(staged_file.path)
+            current_app.logger.warning(f"CDN staging full: {staging_janitor.stats()}")
+            return jsonify({'success': False, 'message': str(e)}), 507
         except Exception as e:
             current_app.logger.error(f"Error processing file {file.filename}: {str(e)}")
             return jsonify({'success': False, 'message': f'Error processing file {file.filename}'})
 
-    if len(file_urls) == 0:
-        return jsonify({'success': False, 'message': 'No valid files to upload'})
-
+    charged = 0
     try:
-        # Make request to the Hack Club CDN API
-        current_app.logger.info(f"Sending CDN API request with URLs: {file_urls}")
+        # 2. Content we already have on the CDN never leaves the server again
+        existing = cdn_service.find_existing_uploads(current_user.id, {f.content_hash for f in staged})
 
-        # Store the actual request data for debugging
-        global last_cdn_request
-        headers = {
-            'Authorization': f'Bearer {api_token}',
-            'Content-Type': 'application/json'
-        }
+        to_upload = []
+        for staged_file in staged:
+            if staged_file.content_hash in existing or \
+                    any(f.content_hash == staged_file.content_hash for f in to_upload):
+                continue
+            to_upload.append(staged_file)
+
+        # Charge the quota once for every file that will get its own record
+        chargeable = {}
+        for staged_file in staged:
+            previous = existing.get(staged_file.content_hash)
+            if previous is None or previous.user_id != current_user.id:
+                chargeable[staged_file.content_hash] = staged_file.size
+        charged = sum(chargeable.values())
+        if not cdn_service.charge_storage(current_user.id, charged):
+            for staged_file in staged:
+                staging_janitor.release(staged_file.path)
+            return jsonify({
+                'success': False,
+                'message': 'Storage quota exceeded',
+                'storage': cdn_service.storage_usage(current_user)
+            }), 413
+
+        for staged_file in staged:
+            if staged_file not in to_upload:
+                staging_janitor.release(staged_file.path)
+
+        # 3. Send the remaining files to the CDN concurrently
+        app_url = current_app.config.get('APP_URL') or request.host_url.rstrip('/')
+        file_urls = [f"{app_url}/cdn/temp/{f.staged_name}" for f in to_upload]
 
-        # Save the full request details
+        global last_cdn_request
         last_cdn_request = {
-            "headers": dict(headers),  # Convert to dict to make it JSON serializable
-            "data": file_urls,  # This is the actual payload we're sending
-            "url": 'https://cdn.hackclub.com/api/v3/new',
+            "headers": dict(cdn_service.headers),
+            "data": file_urls,
+            "url": CDN_API_URL,
             "method": "POST"
         }
-
-        current_app.logger.info(f"Request data: {json.dumps(file_urls)}")
-        current_app.logger.info(f"Request headers: {headers}")
-
-        response = requests.post(
-            'https://cdn.hackclub.com/api/v3/new',
-            headers=headers,
-            json=file_urls,  # This should be an array, not an object
-            timeout=60  # Longer timeout for large files
-        )
-
-        current_app.logger.info(f"CDN API response status: {response.status_code}")
-        current_app.logger.info(f"CDN API response headers: {response.headers}")
-        current_app.logger.info(f"CDN API response body: {response.text}")
-
-        if response.status_code != 200:
-            current_app.logger.error(f"CDN API error: {response.status_code} - {response.text}")
-            return jsonify({'success': False, 'message': f'CDN API error: {response.status_code}'})
-
-        # Process the CDN response
-        cdn_response = response.json()
-
-        # Save the uploaded files information to database
-        for i, file in enumerate(files):
-            if file.filename == '':
-                continue
-
-            if i >= len(cdn_response['files']):
-                break
-
-            file_info = cdn_response['files'][i]
-            file_size = file.content_length
+        if file_urls:
+            current_app.logger.info(f"Sending {len(file_urls)} files to the CDN")
+
+        uploaded = {}
+        errors = []
+        for staged_file, result in zip(to_upload, cdn_service.upload_urls(file_urls)):
+            if isinstance(result, Exception):
+                # The CDN may still be fetching after a timeout; leave it to the janitor
+                errors.append({'file': staged_file.original_filename, 'error': str(result)})
+            else:
+                # The CDN has its copy, so staging space can be freed right away
+                staging_janitor.release(staged_file.path)
+                uploaded[staged_file.content_hash] = result
+
+        # 4. Record an upload for every file the user does not already own
+        results = []
+        images = []
+        recorded = set()
+        for staged_file, file in zip(staged, files):
             file_type = file.content_type or mimetypes.guess_type(file.filename)[0]
+            previous = existing.get(staged_file.content_hash)
+
+            if previous is not None:
+                file_info = {
+                    'file': previous.filename,
+                    'deployedUrl': previous.cdn_url,
+                    'sha': previous.sha,
+                    'size': staged_file.size,
+                    'deduplicated': True
+                }
+                owned = previous.user_id == current_user.id
+            elif staged_file.content_hash in uploaded:
+                file_info = uploaded[staged_file.content_hash]
+                owned = False
+            else:
+                continue
 
-            # Check if this file (by sha) was already uploaded by this user in the last minute
-            # This prevents duplicate entries if the same file is uploaded twice
-            recent_upload = UserUpload.query.filter_by(
-                user_id=current_user.id,
-                sha=file_info['sha']
-            ).order_by(desc(UserUpload.uploaded_at)).first()
-            
-            if recent_upload and (datetime.utcnow() - recent_upload.uploaded_at).total_seconds() < 60:
-                current_app.logger.info(f"Skipping duplicate upload for {file.filename} with SHA {file_info['sha']}")
+            results.append(file_info)
+            images.append((file_info['deployedUrl'], file_type))
+            if owned or staged_file.content_hash in recorded:
                 continue
+            recorded.add(staged_file.content_hash)
 
-            # Create database record
-            upload = UserUpload(
+            db.session.add(UserUpload(
                 user_id=current_user.id,
                 filename=file_info['file'],
                 original_filename=file.filename,
                 file_type=file_type,
-                file_size=file_size,
+                file_size=staged_file.size,
                 cdn_url=file_info['deployedUrl'],
-                sha=file_info['sha']
-            )
-
-            db.session.add(upload)
+                sha=file_info.get('sha'),
+                content_hash=staged_file.content_hash
+            ))
 
+        # Give back what was charged for files the CDN did not take
+        cdn_service.refund_storage(current_user.id, charged - sum(chargeable[h] for h in recorded))
         db.session.commit()
 
+        for cdn_url, file_type in images:
+            image_variant_service.enqueue(cdn_url, file_type)
+
+        if not results:
+            return jsonify({
+                'success': False,
+                'message': f"CDN upload failed: {errors[0]['error']}" if errors else 'No files uploaded',
+                'errors': errors
+            })
+
         return jsonify({
             'success': True,
-            'message': 'Files uploaded successfully',
-            'files': cdn_response['files']
+            'message': 'Files uploaded successfully' if not errors else f'Uploaded {len(results)} files, {len(errors)} failed',
+            'files': results,
+            'errors': errors
         })
 
     except Exception as e:
@@ -199,6 +187,8 @@ def upload_files():
         current_app.logger.error(f"Error in CDN upload: {str(e)}")
         current_app.logger.error(f"Traceback: {error_traceback}")
         db.session.rollback()
+        cdn_service.refund_storage(current_user.id, charged)
+        db.session.commit()
 
         # Include more detailed error information for debugging
         return jsonify({
@@ -210,20 +200,238 @@ def upload_files():
             }
         }), 500
         
+def get_upload_session(upload_id):
+    """Load one of the current user's upload sessions, locking it for the request."""
+    return CDNUploadSession.query.filter_by(id=upload_id, user_id=current_user.id)\
+        .with_for_update().first()
+
+@cdn_bp.route('/uploads', methods=['POST'])
+@login_required
+def create_upload_session():
+    """Start a resumable chunked upload for a large file"""
+    data = request.get_json() or {}
+    filename = (data.get('filename') or '').strip()
+    try:
+        total_size = int(data.get('size', 0))
+    except (TypeError, ValueError):
+        total_size = 0
+
+    if not filename:
+        return jsonify({'success': False, 'message': 'Filename is required'}), 400
+    if not cdn_service.has_room(current_user, total_size):
+        return jsonify({
+            'success': False,
+            'message': 'Storage quota exceeded',
+            'storage': cdn_service.storage_usage(current_user)
+        }), 413
+
+    try:
+        session = resumable_uploads.create(current_user.id, filename, total_size, data.get('content_type'))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except StagingFull as e:
+        return jsonify({'success': False, 'message': str(e)}), 507
+
+    return jsonify({'success': True, 'chunk_size': resumable_uploads.chunk_size, **session.to_dict()}), 201
+
+@cdn_bp.route('/uploads/<upload_id>', methods=['GET'])
+@login_required
+def get_upload_session_status(upload_id):
+    """Report how many bytes have been received so a client can resume"""
+    session = CDNUploadSession.query.filter_by(id=upload_id, user_id=current_user.id).first()
+    if not session:
+        return jsonify({'success': False, 'message': 'Upload not found'}), 404
+    return jsonify({'success': True, 'chunk_size': resumable_uploads.chunk_size, **session.to_dict()})
+
+@cdn_bp.route('/uploads/<upload_id>', methods=['PUT'])
+@login_required
+def upload_chunk(upload_id):
+    """Receive the chunk starting at ?offset=N as the raw request body"""
+    session = get_upload_session(upload_id)
+    if not session:
+        return jsonify({'success': False, 'message': 'Upload not found'}), 404
+    if session.status != 'uploading':
+        db.session.rollback()
+        return jsonify({'success': False, 'message': f'Upload is {session.status}', **session.to_dict()}), 409
+
+    offset = request.args.get('offset', request.headers.get('Upload-Offset'), type=int)
+    if offset is None or offset < 0:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': 'A non-negative offset is required'}), 400
+
+    try:
+        session = resumable_uploads.write_chunk(session, offset, request.stream)
+    except UploadOffsetMismatch as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e), 'received_bytes': e.received_bytes}), 409
+    except StagingFull as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 507
+    except FileNotFoundError as e:
+        session.status = 'aborted'
+        db.session.commit()
+        return jsonify({'success': False, 'message': str(e)}), 410
+
+    return jsonify({'success': True, **session.to_dict()})
+
+@cdn_bp.route('/uploads/<upload_id>/finalize', methods=['POST'])
+@login_required
+def finalize_upload(upload_id):
+    """Assemble a fully received upload, hand it to the CDN and record it"""
+    session = get_upload_session(upload_id)
+    if not session:
+        return jsonify({'success': False, 'message': 'Upload not found'}), 404
+    if session.status == 'completed':
+        db.session.rollback()
+        return jsonify({'success': True, 'message': 'File uploaded successfully', 'files': [session.result]})
+    if session.status == 'aborted':
+        db.session.rollback()
+        return jsonify({'success': False, 'message': 'Upload was aborted'}), 410
+
+    try:
+        staged_file = resumable_uploads.assemble(session)
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e), **session.to_dict()}), 409
+    except FileNotFoundError as e:
+        session.status = 'aborted'
+        db.session.commit()
+        return jsonify({'success': False, 'message': str(e)}), 410
+
+    try:
+        previous = cdn_service.find_existing_uploads(current_user.id, {staged_file.content_hash})\
+            .get(staged_file.content_hash)
+        charged = 0
+        if previous is None or previous.user_id != current_user.id:
+            if not cdn_service.charge_storage(current_user.id, staged_file.size):
+                return jsonify({
+                    'success': False,
+                    'message': 'Storage quota exceeded',
+                    'storage': cdn_service.storage_usage(current_user)
+                }), 413
+            charged = staged_file.size
+        session = get_upload_session(upload_id)
+
+        if previous is not None:
+            staging_janitor.release(staged_file.path)
+            file_info = {
+                'file': previous.filename,
+                'deployedUrl': previous.cdn_url,
+                'sha': previous.sha,
+                'size': staged_file.size,
+                'deduplicated': True
+            }
+            owned = previous.user_id == current_user.id
+        else:
+            app_url = current_app.config.get('APP_URL') or request.host_url.rstrip('/')
+            try:
+                file_info = cdn_service.upload_url(f"{app_url}/cdn/temp/{staged_file.staged_name}")
+            except Exception as e:
+                # Keep the assembled file so finalize can simply be retried
+                current_app.logger.error(f"CDN upload failed for session {upload_id}: {str(e)}")
+                cdn_service.refund_storage(current_user.id, charged)
+                db.session.commit()
+                return jsonify({'success': False, 'message': f'CDN upload failed: {str(e)}'}), 502
+            staging_janitor.release(staged_file.path)
+            owned = False
+
+        if not owned:
+            db.session.add(UserUpload(
+                user_id=current_user.id,
+                filename=file_info['file'],
+                original_filename=session.filename,
+                file_type=session.content_type or mimetypes.guess_type(session.filename)[0],
+                file_size=staged_file.size,
+                cdn_url=file_info['deployedUrl'],
+                sha=file_info.get('sha'),
+                content_hash=staged_file.content_hash
+            ))
+
+        session.status = 'completed'
+        session.result = file_info
+        db.session.commit()
+
+        image_variant_service.enqueue(file_info['deployedUrl'],
+                                      session.content_type or mimetypes.guess_type(session.filename)[0])
+
+        return jsonify({'success': True, 'message': 'File uploaded successfully', 'files': [file_info]})
+    except Exception as e:
+        current_app.logger.error(f"Error finalizing upload {upload_id}: {str(e)}")
+        db.session.rollback()
+        return jsonify({'success': False, 'message': f'Error uploading to CDN: {str(e)}'}), 500
+
+@cdn_bp.route('/uploads/<upload_id>', methods=['DELETE'])
+@login_required
+def abort_upload(upload_id):
+    """Abandon a resumable upload and free its staging space"""
+    session = get_upload_session(upload_id)
+    if not session:
+        return jsonify({'success': False, 'message': 'Upload not found'}), 404
+    if session.status == 'completed':
+        db.session.rollback()
+        return jsonify({'success': False, 'message': 'Upload already completed'}), 409
+
+    resumable_uploads.abort(session)
+    return jsonify({'success': True, 'message': 'Upload aborted'})
+
 @cdn_bp.route('/temp/<filename>')
 def serve_temp_file(filename):
     """Serve temporary files from the hc_cdn_temp directory."""
-    temp_dir = os.path.join(tempfile.gettempdir(), 'hc_cdn_temp')
-    return send_from_directory(temp_dir, filename)
+    return send_from_directory(STAGING_DIR, filename)
+
+FILES_PAGE_SIZE = 50
+MAX_FILES_PAGE_SIZE = 200
+
+def encode_files_cursor(upload):
+    raw = f"{upload.uploaded_at.isoformat()}|{upload.id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def decode_files_cursor(cursor):
+    """Return (uploaded_at, id) from a cursor, or None if it is malformed."""
+    try:
+        uploaded_at, upload_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split('|')
+        return datetime.fromisoformat(uploaded_at), int(upload_id)
+    except (ValueError, UnicodeError):
+        return None
 
 @cdn_bp.route('/files')
 @login_required
 def get_user_files():
-    """Get all files uploaded by the current user"""
+    """
+    Get a page of the current user's files, newest first.
+
+    Paged by keyset on (uploaded_at, id) so later pages cost the same as the
+    first: pass the returned next_cursor as ?cursor= to continue. ?type=image
+    matches every image/* file, ?type=image/png only that type.
+    """
     try:
-        uploads = UserUpload.query.filter_by(user_id=current_user.id)\
-            .order_by(desc(UserUpload.uploaded_at))\
+        limit = min(max(request.args.get('limit', FILES_PAGE_SIZE, type=int), 1), MAX_FILES_PAGE_SIZE)
+        query = UserUpload.query.filter_by(user_id=current_user.id)
+
+        file_type = request.args.get('type', '').strip()
+        if file_type:
+            if '/' in file_type:
+                query = query.filter(UserUpload.file_type == file_type)
+            else:
+                query = query.filter(UserUpload.file_type.like(f"{file_type}/%"))
+
+        cursor = request.args.get('cursor')
+        if cursor:
+            position = decode_files_cursor(cursor)
+            if position is None:
+                return jsonify({'success': False, 'message': 'Invalid cursor'}), 400
+            uploaded_at, upload_id = position
+            query = query.filter(db.or_(
+                UserUpload.uploaded_at < uploaded_at,
+                db.and_(UserUpload.uploaded_at == uploaded_at, UserUpload.id < upload_id)
+            ))
+
+        uploads = query.order_by(desc(UserUpload.uploaded_at), desc(UserUpload.id))\
+            .limit(limit + 1)\
             .all()
+        has_more = len(uploads) > limit
+        uploads = uploads[:limit]
+        srcsets = image_variant_service.srcsets(upload.cdn_url for upload in uploads)
 
         files = []
         for upload in uploads:
@@ -235,17 +443,29 @@ def get_user_files():
                 'file_size': upload.file_size,
                 'cdn_url': upload.cdn_url,
                 'uploaded_at': upload.uploaded_at.isoformat(),
-                'sha': upload.sha
+                'sha': upload.sha,
+                'srcset': srcsets.get(upload.cdn_url)
             })
 
         return jsonify({
             'success': True,
-            'files': files
+            'files': files,
+            'has_more': has_more,
+            'next_cursor': encode_files_cursor(uploads[-1]) if has_more else None,
+            'storage': cdn_service.storage_usage(current_user)
         })
     except Exception as e:
         current_app.logger.error(f"Error getting user files: {str(e)}")
         return jsonify({'success': False, 'message': f'Error getting files: {str(e)}'})
 
+@cdn_bp.route('/staging/stats')
+@login_required
+def staging_stats():
+    """Disk usage of the CDN staging directory (admin only)"""
+    if not current_user.is_admin:
+        return jsonify({'success': False, 'message': 'Admin access required'}), 403
+    return jsonify({'success': True, 'staging': staging_janitor.stats()})
+
 @cdn_bp.route('/debug-last-request')
 @login_required
 def debug_last_request():
@@ -266,6 +486,7 @@ def delete_file(file_id):
 
         # Delete the file record from the database
         db.session.delete(upload)
+        cdn_service.refund_storage(upload.user_id, upload.file_size)
         db.session.commit()
 
         # Note: The actual file on the CDN cannot be deleted through the API
@@ -0,0 +1,100 @@
+from flask import Blueprint, jsonify, request, Response, current_app
+from flask_login import login_required, current_user
+from models import db, Club, ClubChatChannel
+from club_chat_service import club_chat_service
+from club_auth import club_auth
+
+club_chat_bp = Blueprint('club_chat', __name__, url_prefix='/api/clubs')
+
+def get_member_channel(club_id, channel_id):
+    """Return (channel, None) if the current user can use the channel, else (None, error response)."""
+    if not club_auth().is_member(club_id):
+        Club.query.get_or_404(club_id)
+        return None, (jsonify({'error': 'You are not a member of this club'}), 403)
+    if channel_id is None:
+        return None, None
+    channel = ClubChatChannel.query.filter_by(id=channel_id, club_id=club_id).first()
+    if not channel:
+        return None, (jsonify({'error': 'Channel not found in this club'}), 404)
+    return channel, None
+
+@club_chat_bp.route('/<int:club_id>/chat/channels')
+@login_required
+def list_channels(club_id):
+    """List a club's chat channels."""
+    _, error = get_member_channel(club_id, None)
+    if error:
+        return error
+    channels = ClubChatChannel.query.filter_by(club_id=club_id).order_by(ClubChatChannel.name).all()
+    return jsonify({'channels': [{
+        'id': channel.id,
+        'name': channel.name,
+        'description': channel.description
+    } for channel in channels]})
+
+@club_chat_bp.route('/<int:club_id>/chat/channels/<int:channel_id>/messages', methods=['GET', 'POST'])
+@login_required
+def channel_messages(club_id, channel_id):
+    """
+    GET a page of channel history, oldest first. The newest page comes
+    without a cursor; pass the returned next_cursor as ?cursor= for older
+    messages. POST {"content": ...} sends a message to the channel.
+    """
+    channel, error = get_member_channel(club_id, channel_id)
+    if error:
+        return error
+
+    if request.method == 'GET':
+        try:
+            messages, next_cursor = club_chat_service.history(channel.id,
+                                                              cursor=request.args.get('cursor'),
+                                                              limit=request.args.get('limit', type=int))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify({'messages': messages, 'next_cursor': next_cursor})
+
+    data = request.get_json(silent=True) or {}
+    try:
+        message = club_chat_service.send(channel.id, current_user, data.get('content'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f'Error sending chat message: {str(e)}')
+        return jsonify({'error': 'Failed to send message'}), 500
+    return jsonify({'message': message}), 201
+
+@club_chat_bp.route('/<int:club_id>/chat/channels/<int:channel_id>/stream')
+@login_required
+def channel_stream(club_id, channel_id):
+    """
+    Server-Sent Events stream of new messages in a channel. EventSource
+    sends Last-Event-ID when it reconnects, and anything sent since that
+    message (plus a small window before it, as messages can arrive out of
+    id order) is replayed before live delivery resumes. Clients dedupe on
+    the event id.
+    """
+    channel, error = get_member_channel(club_id, channel_id)
+    if error:
+        return error
+
+    last_id = request.headers.get('Last-Event-ID', request.args.get('last_id', ''))
+    try:
+        last_id = int(last_id) if last_id else None
+    except ValueError:
+        return jsonify({'error': 'Invalid Last-Event-ID'}), 400
+
+    # Subscribe before reading the backlog so nothing sent in between is missed
+    subscription = club_chat_service.subscribe(channel.id)
+    if subscription is None:
+        return jsonify({'error': 'Too many open chat connections, try again shortly'}), 503
+    try:
+        replay = club_chat_service.since(channel.id, last_id) if last_id is not None else []
+    except Exception:
+        club_chat_service.broker.unsubscribe(subscription)
+        raise
+    # The stream holds no database connection while it is open
+    db.session.remove()
+
+    return Response(club_chat_service.stream(subscription, replay),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
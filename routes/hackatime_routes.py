@@ -1,8 +1,10 @@
-
 from flask import Blueprint, jsonify, request
 from flask_login import login_required, current_user
-import requests
-from models import db, User, Club, ClubMembership
+from models import db, User, Club, HackatimeSnapshot
+from hackatime_sync_service import fetch_hackatime_stats, hackatime_sync_service
+from hackatime_leaderboard import get_club_leaderboard
+from club_dashboard_service import club_dashboard_service
+from club_auth import club_auth
 
 hackatime_bp = Blueprint('hackatime', __name__, url_prefix='/api/hackatime')
 
@@ -14,59 +16,53 @@ def get_club_hackatime_members(club_id):
         club = Club.query.get_or_404(club_id)
         
         # Check if user is a member of the club
-        is_member = ClubMembership.query.filter_by(club_id=club_id, user_id=current_user.id).first()
-        if not is_member and club.leader_id != current_user.id:
+        if not club_auth().is_member(club_id):
             return jsonify({'error': 'You are not a member of this club'}), 403
             
-        # Get all users in the club with Hackatime API keys
-        members = []
-        
-        # Track processed user IDs to avoid duplicates
-        processed_user_ids = set()
-        
-        # Get leader
-        leader = User.query.get(club.leader_id)
-        if leader and leader.wakatime_api_key:
-            # Get basic stats summary for leader
-            leader_stats = get_user_hackatime_summary(leader.wakatime_api_key)
-            
-            members.append({
-                'id': leader.id,
-                'username': leader.username,
-                'role': 'Club Leader',
-                'avatar': leader.avatar,
-                'stats': leader_stats
-            })
-            processed_user_ids.add(leader.id)
-        
-        # Get members
-        memberships = ClubMembership.query.filter_by(club_id=club_id).all()
-        for membership in memberships:
-            # Skip if we already processed this user (e.g., if leader is also listed as a member)
-            if membership.user_id in processed_user_ids:
-                continue
-                
-            member = User.query.get(membership.user_id)
-            if member and member.wakatime_api_key:
-                # Get basic stats summary
-                member_stats = get_user_hackatime_summary(member.wakatime_api_key)
-                
-                members.append({
-                    'id': member.id,
-                    'username': member.username,
-                    'role': membership.role.capitalize(),
-                    'avatar': member.avatar,
-                    'stats': member_stats
-                })
-                processed_user_ids.add(member.id)
-        
-        return jsonify({'members': members})
+        # Built with the club dashboard and cached alongside it
+        _, data = club_dashboard_service.section(club, 'hackatime')
+        return jsonify(data)
     except Exception as e:
         import traceback
         error_details = traceback.format_exc()
         print(f"Error in get_club_hackatime_members: {str(e)}\n{error_details}")
         return jsonify({'error': f'Failed to get club hackatime members: {str(e)}', 'members': []}), 500
 
+@hackatime_bp.route('/club/<int:club_id>/leaderboard', methods=['GET'])
+@login_required
+def get_club_hackatime_leaderboard(club_id):
+    """Get weekly, monthly and all-time coding leaderboards for a club."""
+    try:
+        club = Club.query.get_or_404(club_id)
+
+        # Check if user is a member of the club
+        if not club_auth().is_member(club_id) and not current_user.is_admin:
+            return jsonify({'error': 'You are not a member of this club'}), 403
+
+        period = request.args.get('period')
+        if period and period not in ('weekly', 'monthly', 'all_time'):
+            return jsonify({'error': 'Invalid period. Must be one of: weekly, monthly, all_time'}), 400
+
+        try:
+            limit = min(max(int(request.args.get('limit', 50)), 1), 200)
+        except ValueError:
+            limit = 50
+
+        leaderboard = get_club_leaderboard(club_id)
+        periods = [period] if period else list(leaderboard['periods'].keys())
+
+        return jsonify({
+            'club_id': club_id,
+            'generated_at': leaderboard['generated_at'],
+            'leaderboards': {p: leaderboard['periods'].get(p, [])[:limit] for p in periods},
+            'languages': {p: leaderboard['languages'].get(p, []) for p in periods}
+        })
+    except Exception as e:
+        import traceback
+        error_details = traceback.format_exc()
+        print(f"Error in get_club_hackatime_leaderboard: {str(e)}\n{error_details}")
+        return jsonify({'error': f'Failed to get club leaderboard: {str(e)}'}), 500
+
 @hackatime_bp.route('/user/<int:user_id>/projects', methods=['GET'])
 @login_required
 def get_user_hackatime_projects(user_id):
@@ -75,27 +71,8 @@ def get_user_hackatime_projects(user_id):
         # Check if user is allowed to see stats (must be in same club)
         user = User.query.get_or_404(user_id)
         
-        # Find the clubs that both users are members of
-        current_user_memberships = ClubMembership.query.filter_by(user_id=current_user.id).all()
-        current_user_club_ids = [m.club_id for m in current_user_memberships]
-        # Add clubs where current user is leader
-        leader_clubs = Club.query.filter_by(leader_id=current_user.id).all()
-        current_user_club_ids.extend([c.id for c in leader_clubs])
-        
-        # Check if target user is in any of these clubs
-        target_user_memberships = ClubMembership.query.filter(
-            ClubMembership.user_id == user_id,
-            ClubMembership.club_id.in_(current_user_club_ids)
-        ).first()
-        
-        # Also check if target user is leader of a club the current user is in
-        target_user_clubs = Club.query.filter_by(leader_id=user_id).all()
-        target_user_club_ids = [c.id for c in target_user_clubs]
-        
-        is_in_same_club = (
-            target_user_memberships is not None or 
-            any(club_id in target_user_club_ids for club_id in current_user_club_ids)
-        )
+        # Members and leaders of a shared club can see each other's stats
+        is_in_same_club = club_auth().shares_club_with(user_id)
         
         # Allow admins to see all
         if not is_in_same_club and not current_user.is_admin:
@@ -108,8 +85,13 @@ def get_user_hackatime_projects(user_id):
         # Search query param
         search_query = request.args.get('q', '').lower()
         
-        # Get detailed stats with projects
-        stats = get_user_hackatime_detailed_stats(user.wakatime_api_key)
+        # Get detailed stats with projects, preferring the locally synced snapshot
+        snapshot = HackatimeSnapshot.query.filter_by(user_id=user.id).first()
+        if snapshot and (snapshot.projects or not snapshot.last_error):
+            stats = snapshot.to_detailed()
+        else:
+            stats = get_user_hackatime_detailed_stats(user.wakatime_api_key)
+            hackatime_sync_service.request_sync(user.id)
         
         # Filter projects by search query if provided
         if search_query and 'projects' in stats:
@@ -119,74 +101,50 @@ def get_user_hackatime_projects(user_id):
     except Exception as e:
         return jsonify({'error': f'Failed to get user hackatime projects: {str(e)}'}), 500
 
+def get_empty_hackatime_summary():
+    """Summary used when no stats are available for a user."""
+    return {
+        'total_seconds': 0,
+        'human_readable_total': '0 hrs',
+        'daily_average': 0,
+        'human_readable_daily_average': '0 mins',
+        'top_language': None
+    }
+
 def get_user_hackatime_summary(api_key):
-    """Get a summary of Hackatime stats for a user."""
-    try:
-        url = "https://hackatime.hackclub.com/api/v1/users/my/stats"
-        
-        headers = {
-            "Authorization": f"Bearer {api_key}"
-        }
-        
-        response = requests.get(url, headers=headers, timeout=5)
-        
-        if response.status_code == 200:
-            data = response.json().get('data', {})
-            
-            # Extract top language
-            languages = data.get('languages', [])
-            top_language = languages[0]['name'] if languages else None
-            
-            return {
-                'total_seconds': data.get('total_seconds', 0),
-                'human_readable_total': data.get('human_readable_total', '0 hrs'),
-                'daily_average': data.get('daily_average', 0),
-                'human_readable_daily_average': data.get('human_readable_daily_average', '0 mins'),
-                'top_language': top_language
-            }
-        else:
-            return {
-                'total_seconds': 0,
-                'human_readable_total': '0 hrs',
-                'daily_average': 0,
-                'human_readable_daily_average': '0 mins',
-                'top_language': None,
-                'error': f'API error: {response.status_code}'
-            }
-    except Exception as e:
-        return {
-            'total_seconds': 0,
-            'human_readable_total': '0 hrs',
-            'daily_average': 0,
-            'human_readable_daily_average': '0 mins',
-            'top_language': None,
-            'error': str(e)
-        }
+    """Get a summary of Hackatime stats for a user directly from the API."""
+    data, error = fetch_hackatime_stats(api_key, features=None)
+
+    if data is None:
+        summary = get_empty_hackatime_summary()
+        summary['error'] = error
+        return summary
+
+    # Extract top language
+    languages = data.get('languages', [])
+    top_language = languages[0]['name'] if languages else None
+
+    return {
+        'total_seconds': data.get('total_seconds', 0),
+        'human_readable_total': data.get('human_readable_total', '0 hrs'),
+        'daily_average': data.get('daily_average', 0),
+        'human_readable_daily_average': data.get('human_readable_daily_average', '0 mins'),
+        'top_language': top_language
+    }
 
 def get_user_hackatime_detailed_stats(api_key):
-    """Get detailed Hackatime stats for a user, including projects."""
-    try:
-        url = "https://hackatime.hackclub.com/api/v1/users/my/stats?features=projects,languages"
-        
-        headers = {
-            "Authorization": f"Bearer {api_key}"
-        }
-        
-        response = requests.get(url, headers=headers, timeout=5)
-        
-        if response.status_code == 200:
-            data = response.json().get('data', {})
-            
-            return {
-                'username': data.get('username', ''),
-                'total_seconds': data.get('total_seconds', 0),
-                'human_readable_total': data.get('human_readable_total', '0 hrs'),
-                'daily_average': data.get('daily_average', 0),
-                'human_readable_daily_average': data.get('human_readable_daily_average', '0 mins'),
-                'projects': data.get('projects', []),
-                'languages': data.get('languages', [])
-            }
-        else:
-            return {'error': f'Hackatime API error: {response.status_code}'}
-    except Exception as e:
-        return {'error': f'Failed to get stats: {str(e)}'}
+    """Get detailed Hackatime stats for a user directly from the API, including projects."""
+    data, error = fetch_hackatime_stats(api_key)
+
+    if data is None:
+        return {'error': error}
+
+    return {
+        'username': data.get('username', ''),
+        'total_seconds': data.get('total_seconds', 0),
+        'human_readable_total': data.get('human_readable_total', '0 hrs'),
+        'daily_average': data.get('daily_average', 0),
+        'human_readable_daily_average': data.get('human_readable_daily_average', '0 mins'),
+        'projects': data.get('projects', []),
+        'languages': data.get('languages', [])
+    }
@@ -5,6 +5,8 @@ import os
 import time
 from datetime import datetime
 from airtable_service import airtable_service
+from club_auth import club_auth
+from hackatime_sync_service import hackatime_sync_service
 
 pizza_grants_bp = Blueprint('pizza_grants', __name__, url_prefix='/api/pizza-grants')
 
@@ -39,8 +41,6 @@ def save_submissions(submissions):
 def submit_pizza_grant():
     """Submit a new pizza grant request"""
     try:
-        from models import Club, ClubMembership
-
         # Get request data
         data = request.get_json()
 
@@ -94,48 +94,46 @@ def submit_pizza_grant():
             
         # Validate submitter is authorized (either submitting for self or as club leader/co-leader)
         is_authorized = False
-        target_user_id = int(data['user_id'])
+        try:
+            target_user_id = int(data['user_id'])
+            club_id = int(data['club_id'])
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'message': 'Invalid user_id or club_id'}), 400
 
         if target_user_id == current_user.id or current_user.is_admin:
             is_authorized = True
         else:
-            # Check if current user is a club leader for this club
-            club = Club.query.filter_by(
-                id=data['club_id'],
-                leader_id=current_user.id
-            ).first()
-
-            if club:
-                # Verify target user is a member of this club
-                membership = ClubMembership.query.filter_by(
-                    club_id=club.id,
-                    user_id=target_user_id
-                ).first()
-
-                if membership:
-                    is_authorized = True
-
-            # If not a leader, check if co-leader
-            if not is_authorized:
-                coleader_membership = ClubMembership.query.filter_by(
-                    club_id=data['club_id'],
-                    user_id=current_user.id,
-                    role='co-leader'
-                ).first()
-
-                if coleader_membership:
-                    # Verify target user is a member of this club
-                    membership = ClubMembership.query.filter_by(
-                        club_id=data['club_id'],
-                        user_id=target_user_id
-                    ).first()
-
-                    if membership:
-                        is_authorized = True
+            # Club leaders and co-leaders can submit for members of that club
+            is_authorized = club_auth().manages_user(target_user_id, club_id=club_id)
 
         if not is_authorized:
             return jsonify({'success': False, 'message': 'Unauthorized to submit for this user'}), 403
 
+        # Verify the claimed hours against the locally synced Hackatime snapshot
+        from models import HackatimeSnapshot, User
+        snapshot = HackatimeSnapshot.query.filter_by(user_id=target_user_id).first()
+        if snapshot and snapshot.get_project_seconds(data['project_name']) is not None:
+            try:
+                claimed_hours = float(data['project_hours'])
+            except (TypeError, ValueError):
+                return jsonify({'success': False, 'message': 'Invalid project hours'}), 400
+
+            tracked_hours = round(snapshot.get_project_seconds(data['project_name']) / 3600, 2)
+            if claimed_hours > tracked_hours + 0.01:
+                # The snapshot can be a sync interval old; refresh it before refusing
+                target_user = User.query.get(target_user_id)
+                if target_user and target_user.wakatime_api_key:
+                    snapshot = hackatime_sync_service.sync_user(target_user) or snapshot
+                    project_seconds = snapshot.get_project_seconds(data['project_name'])
+                    if project_seconds is not None:
+                        tracked_hours = round(project_seconds / 3600, 2)
+
+            if claimed_hours > tracked_hours + 0.01:
+                return jsonify({
+                    'success': False,
+                    'message': f'Project hours exceed tracked Hackatime time ({tracked_hours} hrs)'
+                }), 400
+
         # Add additional metadata
         data['submitted_by'] = current_user.id
         data['submitted_by_username'] = current_user.username
@@ -189,8 +187,6 @@ def submit_pizza_grant():
 def get_user_submissions(user_id):
     """Get all submissions for a specific user"""
     try:
-        from models import Club, ClubMembership
-
         # Validate that the requested user_id matches the current user
         # or current user is an admin/club leader
         is_authorized = False
@@ -198,34 +194,8 @@ def get_user_submissions(user_id):
         if user_id == current_user.id or current_user.is_admin:
             is_authorized = True
         else:
-            # Check if current user is a club leader
-            led_clubs = Club.query.filter_by(leader_id=current_user.id).all()
-            for club in led_clubs:
-                # Check if requested user is a member of this club
-                membership = ClubMembership.query.filter_by(
-                    club_id=club.id,
-                    user_id=user_id
-                ).first()
-                if membership:
-                    is_authorized = True
-                    break
-
-            # Check if current user is a co-leader
-            if not is_authorized:
-                coleader_memberships = ClubMembership.query.filter_by(
-                    user_id=current_user.id,
-                    role='co-leader'
-                ).all()
-
-                for membership in coleader_memberships:
-                    # Check if requested user is a member of this club
-                    user_membership = ClubMembership.query.filter_by(
-                        club_id=membership.club_id,
-                        user_id=user_id
-                    ).first()
-                    if user_membership:
-                        is_authorized = True
-                        break
+            # Club leaders and co-leaders can see their members' submissions
+            is_authorized = club_auth().manages_user(user_id)
 
         if not is_authorized:
             return jsonify({'success': False, 'message': 'Unauthorized to view these submissions'}), 403
@@ -247,7 +217,8 @@ def get_user_submissions(user_id):
 def get_club_submissions(club_id):
     """Get all submissions for a specific club"""
     try:
-        # TODO: Check if current user is club leader or admin
+        if not (club_auth().can_manage(club_id) or current_user.is_admin):
+            return jsonify({'success': False, 'message': 'Unauthorized to view these submissions'}), 403
 
         # Load all submissions
         all_submissions = load_submissions()
@@ -20,18 +20,15 @@ def run_hackatime_service():
     try:
         logger.info("Starting Hackatime service...")
         process = subprocess.Popen(
-            [sys.executable, 'hackatime_service.py'],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
+            [sys.executable, 'hackatime_service.py']
         )
         
         # Wait a moment to make sure it starts
         time.sleep(2)
         
         if process.poll() is not None:
-            # Process terminated immediately
-            stdout, stderr = process.communicate()
-            logger.error(f"Failed to start Hackatime service. Error: {stderr.decode()}")
+            # Process terminated immediately; its error output is already on our stderr
+            logger.error(f"Failed to start Hackatime service. Exit code: {process.returncode}")
             return None
         
         logger.info(f"Hackatime service started with PID {process.pid}")
@@ -71,9 +68,7 @@ if __name__ == "__main__":
                 time.sleep(1)
             
             # Process terminated unexpectedly
-            stdout, stderr = process.communicate()
             logger.error(f"Hackatime service terminated unexpectedly. Exit code: {process.returncode}")
-            logger.error(f"Error output: {stderr.decode()}")
         else:
             logger.error("Failed to start Hackatime service")
             sys.exit(1)
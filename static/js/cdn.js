@@ -130,6 +130,21 @@ document.addEventListener('DOMContentLoaded', function() {
             return;
         }
 
+        // Large files go through resumable chunked uploads, the rest in one request
+        const largeFiles = Array.from(files).filter(file => file.size > CHUNKED_UPLOAD_THRESHOLD);
+        files = Array.from(files).filter(file => file.size <= CHUNKED_UPLOAD_THRESHOLD);
+        if (largeFiles.length > 0) {
+            uploadLargeFiles(largeFiles).then(() => {
+                if (files.length === 0) {
+                    fileInput.value = '';
+                    selectedFiles.innerHTML = '';
+                }
+            });
+            if (files.length === 0) {
+                return;
+            }
+        }
+
         const formData = new FormData();
 
         // Append files to FormData
@@ -262,20 +277,135 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
-    // Load user's files
-    function loadUserFiles() {
-        filesList.innerHTML = `
-            <div class="loading-files">
-                <i class="fas fa-spinner fa-spin"></i>
-                <span>Loading your files...</span>
-            </div>
-        `;
+    const CHUNKED_UPLOAD_THRESHOLD = 20 * 1024 * 1024;
+    const MAX_CHUNK_RETRIES = 5;
+
+    function csrfHeaders(extra = {}) {
+        const meta = document.querySelector('meta[name="csrf-token"]');
+        return Object.assign({'X-CSRFToken': meta ? meta.getAttribute('content') : ''}, extra);
+    }
+
+    function sleep(ms) {
+        return new Promise(resolve => setTimeout(resolve, ms));
+    }
+
+    // Upload large files one after another through the chunked upload API
+    async function uploadLargeFiles(files) {
+        uploadProgress.style.display = 'block';
+        let uploaded = 0;
+
+        for (const file of files) {
+            try {
+                await uploadInChunks(file, (sent) => {
+                    const percentComplete = Math.round((sent / file.size) * 100);
+                    progressBarFill.style.width = percentComplete + '%';
+                    progressText.textContent = `Uploading ${file.name}... ${percentComplete}%`;
+                });
+                uploaded++;
+            } catch (error) {
+                console.error('Chunked upload failed:', error);
+                progressText.textContent = 'Upload failed: ' + error.message;
+                showToast(`Failed to upload ${file.name}: ${error.message}`, 'error');
+            }
+        }
+
+        if (uploaded > 0) {
+            progressText.textContent = 'Upload complete!';
+            showToast(`${uploaded} large file${uploaded === 1 ? '' : 's'} uploaded successfully`, 'success');
+            setTimeout(() => {
+                uploadProgress.style.display = 'none';
+                loadUserFiles();
+            }, 2000);
+        }
+    }
+
+    // Send a file in chunks, resuming from the server's offset after any failure
+    async function uploadInChunks(file, onProgress) {
+        const initResponse = await fetch('/cdn/uploads', {
+            method: 'POST',
+            headers: csrfHeaders({'Content-Type': 'application/json'}),
+            body: JSON.stringify({filename: file.name, size: file.size, content_type: file.type})
+        });
+        const session = await initResponse.json();
+        if (!session.success) {
+            throw new Error(session.message);
+        }
+
+        const uploadUrl = `/cdn/uploads/${session.upload_id}`;
+        const chunkSize = session.chunk_size;
+        let offset = 0;
+        let failures = 0;
+
+        while (offset < file.size) {
+            try {
+                const response = await fetch(`${uploadUrl}?offset=${offset}`, {
+                    method: 'PUT',
+                    headers: csrfHeaders({'Content-Type': 'application/octet-stream'}),
+                    body: file.slice(offset, offset + chunkSize)
+                });
+                const data = await response.json();
+                if (response.status === 409 && data.received_bytes !== undefined) {
+                    offset = data.received_bytes;  // Server has a different offset; continue from there
+                } else if (!data.success) {
+                    if (response.status < 500) {
+                        throw Object.assign(new Error(data.message), {fatal: true});
+                    }
+                    throw new Error(data.message);
+                } else {
+                    offset = data.received_bytes;
+                    failures = 0;
+                }
+                onProgress(offset);
+            } catch (error) {
+                if (error.fatal || ++failures > MAX_CHUNK_RETRIES) {
+                    throw error;
+                }
+                await sleep(Math.min(1000 * 2 ** failures, 30000));
+                // Ask the server how much it actually received before retrying
+                try {
+                    const status = await (await fetch(uploadUrl)).json();
+                    if (status.success) {
+                        offset = status.received_bytes;
+                    }
+                } catch (statusError) {
+                    // Still offline; retry the same chunk after the next backoff
+                }
+            }
+        }
 
-        fetch('/cdn/files')
+        for (let attempt = 0; ; attempt++) {
+            const response = await fetch(`${uploadUrl}/finalize`, {method: 'POST', headers: csrfHeaders()});
+            const data = await response.json();
+            if (data.success) {
+                return data.files[0];
+            }
+            if (response.status < 500 || attempt >= MAX_CHUNK_RETRIES) {
+                throw new Error(data.message);
+            }
+            await sleep(Math.min(1000 * 2 ** (attempt + 1), 30000));
+        }
+    }
+
+    // Load user's files, one page at a time; pass the previous page's cursor to append the next
+    function loadUserFiles(cursor = null) {
+        const existingLoadMore = document.getElementById('loadMoreFiles');
+        if (existingLoadMore) {
+            existingLoadMore.remove();
+        }
+        if (!cursor) {
+            filesList.innerHTML = `
+                <div class="loading-files">
+                    <i class="fas fa-spinner fa-spin"></i>
+                    <span>Loading your files...</span>
+                </div>
+            `;
+        }
+
+        fetch(cursor ? `/cdn/files?cursor=${encodeURIComponent(cursor)}` : '/cdn/files')
             .then(response => response.json())
             .then(data => {
                 if (data.success) {
-                    if (data.files.length === 0) {
+                    if (data.files.length === 0 && !cursor) {
                         filesList.innerHTML = `
                             <div class="no-files">
                                 <p>You haven't uploaded any files yet.</p>
@@ -284,7 +414,9 @@ document.addEventListener('DOMContentLoaded', function() {
                         return;
                     }
 
-                    filesList.innerHTML = '';
+                    if (!cursor) {
+                        filesList.innerHTML = '';
+                    }
 
                     data.files.forEach(file => {
                         const fileElement = document.createElement('div');
@@ -337,6 +469,15 @@ document.addEventListener('DOMContentLoaded', function() {
                         filesList.appendChild(fileElement);
                     });
 
+                    if (data.has_more) {
+                        const loadMore = document.createElement('button');
+                        loadMore.id = 'loadMoreFiles';
+                        loadMore.className = 'btn btn-secondary load-more-files';
+                        loadMore.textContent = 'Load more';
+                        loadMore.addEventListener('click', () => loadUserFiles(data.next_cursor));
+                        filesList.appendChild(loadMore);
+                    }
+
                     // Add event listeners for file actions
                     attachFileActionHandlers();
                 } else {
@@ -360,7 +501,9 @@ document.addEventListener('DOMContentLoaded', function() {
     // Attach event handlers for file actions
     function attachFileActionHandlers() {
         // Copy URL button
-        document.querySelectorAll('.copy-url').forEach(btn => {
+        // Only buttons from the page just added; earlier pages are already bound
+        document.querySelectorAll('.copy-url:not([data-bound])').forEach(btn => {
+            btn.dataset.bound = 'true';
             btn.addEventListener('click', function() {
                 const url = this.getAttribute('data-url');
                 const filename = this.getAttribute('data-filename');
@@ -394,14 +537,16 @@ document.addEventListener('DOMContentLoaded', function() {
         });
 
         // Open file button
-        document.querySelectorAll('.open-file').forEach(btn => {
+        document.querySelectorAll('.open-file:not([data-bound])').forEach(btn => {
+            btn.dataset.bound = 'true';
             btn.addEventListener('click', function() {
                 window.open(this.getAttribute('data-url'), '_blank');
             });
         });
 
         // Delete file button
-        document.querySelectorAll('.delete-file').forEach(btn => {
+        document.querySelectorAll('.delete-file:not([data-bound])').forEach(btn => {
+            btn.dataset.bound = 'true';
             btn.addEventListener('click', function() {
                 const fileId = this.getAttribute('data-id');
                 const fileElement = this.closest('.file-item');
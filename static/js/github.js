@@ -301,24 +301,10 @@ const GitHubManager = {
 
     this.showLoading('Creating repository...');
 
-    fetch(`/api/github/create-repo?site_id=${siteId}`, {
-      method: 'POST',
-      headers: {
-        'Content-Type': 'application/json'
-      },
-      body: JSON.stringify({
-        name: repoName,
-        description: repoDesc,
-        private: repoPrivate
-      })
-    })
-    .then(response => {
-      if (!response.ok) {
-        return response.json().then(data => {
-          throw new Error(data.error || 'Failed to create repository');
-        });
-      }
-      return response.json();
+    this.runJob(`/api/github/create-repo?site_id=${siteId}`, {
+      name: repoName,
+      description: repoDesc,
+      private: repoPrivate
     })
     .then(data => {
       this.showSuccess(`Repository "${data.repo_name}" created successfully`);
@@ -328,20 +314,8 @@ const GitHubManager = {
       
       const commitMsg = 'Initial commit from Hack Club Spaces';
       
-      fetch('/api/github/push?site_id=' + this.currentSiteId, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json'
-        },
-        body: JSON.stringify({ message: commitMsg })
-      })
-      .then(response => response.json())
+      this.runJob('/api/github/push?site_id=' + this.currentSiteId, { message: commitMsg })
       .then(pushData => {
-        if (pushData.error) {
-          this.showError(pushData.error);
-          return;
-        }
-        
         const pushStatus = document.getElementById('pushStatus');
         if (pushStatus) {
           pushStatus.innerHTML = `
@@ -355,7 +329,7 @@ const GitHubManager = {
         this.showSuccess(`Initial files pushed to GitHub successfully`);
       })
       .catch(error => {
-        this.showError('Failed to push initial changes: ' + error);
+        this.showError('Failed to push initial changes: ' + error.message);
       })
       .finally(() => {
         this.checkGitHubStatus();
@@ -378,26 +352,10 @@ const GitHubManager = {
 
     this.showPushStatus('Pushing changes to GitHub...', 'info');
 
-    const data = {
-      message: commitMsg
-    };
-
-    fetch('/api/github/push?site_id=' + this.currentSiteId, {
-      method: 'POST',
-      headers: {
-        'Content-Type': 'application/json'
-      },
-      body: JSON.stringify(data)
+    this.runJob('/api/github/push?site_id=' + this.currentSiteId, { message: commitMsg }, progress => {
+      this.showPushStatus(this.progressText('Pushing changes to GitHub...', progress), 'info');
     })
-    .then(response => response.json())
     .then(data => {
-      if (data.error) {
-        this.showError(data.error);
-        return;
-      }
-
-
-
       const pushStatus = document.getElementById('pushStatus');
       if (pushStatus) {
         pushStatus.innerHTML = `
@@ -413,11 +371,98 @@ const GitHubManager = {
       }, 3000);
     })
     .catch(error => {
-      this.showError('Failed to push changes: ' + error);
+      this.showError('Failed to push changes: ' + error.message);
     });
   },
 
 
+  newIdempotencyKey: function() {
+    return Date.now().toString(36) + Math.random().toString(36).slice(2, 10);
+  },
+
+
+  // Push, pull and repository creation run as background jobs on the server.
+  // Start one and resolve with its result once it has finished.
+  runJob: function(url, body, onProgress) {
+    return fetch(url, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        'Idempotency-Key': this.newIdempotencyKey()
+      },
+      body: JSON.stringify(body || {})
+    })
+    .then(response => response.json().then(data => {
+      if (!response.ok || data.error) {
+        throw new Error(data.error || `Request failed with status ${response.status}`);
+      }
+      return this.pollJob(data.job_id, onProgress);
+    }));
+  },
+
+
+  pollJob: function(jobId, onProgress) {
+    this.currentJobId = jobId;
+    this.cancelRequested = false;
+
+    return new Promise((resolve, reject) => {
+      const poll = () => {
+        fetch(`/api/github/jobs/${jobId}`)
+          .then(response => response.json())
+          .then(job => {
+            if (!job.status) {
+              reject(new Error(job.error || 'GitHub job not found'));
+            } else if (job.status === 'succeeded') {
+              this.currentJobId = null;
+              resolve(job.result);
+            } else if (job.status === 'failed') {
+              this.currentJobId = null;
+              reject(new Error(job.error || 'GitHub job failed'));
+            } else if (job.status === 'cancelled') {
+              this.currentJobId = null;
+              reject(new Error('Cancelled'));
+            } else {
+              this.cancelRequested = this.cancelRequested || job.cancel_requested;
+              if (onProgress) onProgress(job.progress);
+              setTimeout(poll, 1000);
+            }
+          })
+          .catch(reject);
+      };
+      poll();
+    });
+  },
+
+
+  // A queued job is cancelled right away; a running one stops after the file it is on
+  cancelJob: function() {
+    if (!this.currentJobId || this.cancelRequested) return;
+    this.cancelRequested = true;
+    this.showPushStatus('Cancelling...', 'info');
+
+    fetch(`/api/github/jobs/${this.currentJobId}/cancel`, { method: 'POST' })
+      .then(response => response.json())
+      .then(job => {
+        if (job.error) throw new Error(job.error);
+      })
+      .catch(error => {
+        this.cancelRequested = false;
+        this.showError('Failed to cancel: ' + error.message);
+      });
+  },
+
+
+  progressText: function(message, progress) {
+    if (progress && progress.total) {
+      return `${message} (${progress.done}/${progress.total} files)`;
+    }
+    if (progress && progress.done) {
+      return `${message} (${progress.done} files)`;
+    }
+    return message;
+  },
+
+
   showPushStatus: function(message, type) {
     const pushStatus = document.getElementById('pushStatus');
     if (!pushStatus) return;
@@ -425,9 +470,17 @@ const GitHubManager = {
     const className = type === 'success' ? 'success-banner' : 
                      type === 'error' ? 'error-banner' : 'info-banner';
 
+    // While a job is in flight, offer to cancel it
+    let cancel = '';
+    if (type === 'info' && this.currentJobId) {
+      cancel = this.cancelRequested
+        ? ' <span class="text-muted">(cancelling)</span>'
+        : ` <button onclick="GitHubManager.cancelJob()" class="btn btn-outline-warning btn-sm">Cancel</button>`;
+    }
+
     pushStatus.innerHTML = `
       <div class="${className}">
-        ${message}
+        ${message}${cancel}
       </div>
     `;
   },
@@ -536,19 +589,10 @@ const GitHubManager = {
       return;
     }
     
-    fetch('/api/github/pull?site_id=' + siteId, {
-      method: 'POST',
-      headers: {
-        'Content-Type': 'application/json'
-      }
+    this.runJob('/api/github/pull?site_id=' + siteId, {}, progress => {
+      this.showPushStatus(this.progressText('Pulling changes from GitHub...', progress), 'info');
     })
-    .then(response => response.json())
     .then(data => {
-      if (data.error) {
-        this.showError(data.error);
-        return;
-      }
-      
       const pushStatus = document.getElementById('pushStatus');
       if (pushStatus) {
         let newFilesText = data.files_pulled && data.files_pulled.length > 0 ? 
@@ -574,7 +618,7 @@ const GitHubManager = {
       }, 2000);
     })
     .catch(error => {
-      this.showError('Failed to pull changes: ' + error);
+      this.showError('Failed to pull changes: ' + error.message);
     });
   },
   
@@ -598,44 +642,24 @@ const GitHubManager = {
     let pushData = null;
 
     // First push local changes to GitHub
-    fetch('/api/github/push?site_id=' + siteId, {
-      method: 'POST',
-      headers: {
-        'Content-Type': 'application/json'
-      },
-      body: JSON.stringify({ message: commitMsg })
+    this.runJob('/api/github/push?site_id=' + siteId, { message: commitMsg }, progress => {
+      this.showPushStatus(this.progressText('Pushing changes to GitHub...', progress), 'info');
     })
-    .then(response => {
-      if (!response.ok) {
-        throw new Error(`Push request failed with status ${response.status}`);
-      }
-      return response.json();
+    .catch(error => {
+      throw new Error('Push failed: ' + error.message);
     })
     .then(data => {
       pushData = data;
-      if (data.error) {
-        throw new Error('Push failed: ' + data.error);
-      }
 
       // Then pull any remote changes
-      return fetch('/api/github/pull?site_id=' + siteId, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json'
-        }
+      return this.runJob('/api/github/pull?site_id=' + siteId, {}, progress => {
+        this.showPushStatus(this.progressText('Pulling changes from GitHub...', progress), 'info');
+      })
+      .catch(error => {
+        throw new Error('Pull failed: ' + error.message);
       });
     })
-    .then(response => {
-      if (!response.ok) {
-        throw new Error(`Pull request failed with status ${response.status}`);
-      }
-      return response.json();
-    })
     .then(pullData => {
-      if (pullData.error) {
-        throw new Error('Pull failed: ' + pullData.error);
-      }
-      
       const pushStatus = document.getElementById('pushStatus');
       if (pushStatus) {
         let newFilesText = pullData.files_pulled && pullData.files_pulled.length > 0 ? 
@@ -672,7 +696,7 @@ const GitHubManager = {
       }, 2000);
     })
     .catch(error => {
-      this.showError('Failed to sync changes: ' + error);
+      this.showError('Failed to sync changes: ' + error.message);
       // Clear the loading status
       const pushStatus = document.getElementById('pushStatus');
       if (pushStatus) {